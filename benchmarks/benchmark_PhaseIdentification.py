@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+ benchmark_PhaseIdentification.py
+
+This script benchmarks the co-association matrix ensemble phase identification
+pipeline on synthetic feeders of increasing size.  The synthetic AMI data is 
+created with ChangepointUtils.CreateSyntheticFeederData.  Each feeder size is
+run in a separate Python process so the peak memory (RSS) is measured for that
+size only.  For each size the wall time, peak RSS, and the time spent in each
+stage of the pipeline are written to a JSON results file.  A results file from
+a previous release can be used as a baseline with --compare; sizes whose wall
+time or peak memory grew by more than --tolerance are reported as regressions 
+and the script exits with a non-zero status.
+
+Example:
+    python benchmarks/benchmark_PhaseIdentification.py --sizes 100 1000 5000 --output results.json
+    python benchmarks/benchmark_PhaseIdentification.py --compare results.json
+
+   Function List
+     - GetPeakRSS
+     - RunSingleBenchmark
+     - RunBenchmarkSubprocess
+     - CompareToBaseline
+     - main
+
+"""
+
+##############################################################################
+# Import Python Libraries
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import scipy
+import sklearn
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Allow the script to be run from a source checkout without installing sdsmc
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from sdsmc.CommonUtils import PreprocessingUtils
+from sdsmc.OnlinePhaseChangePoint import ChangepointUtils as CPUtils
+from sdsmc.PhaseIdentification import PhaseIdent_Utils as PIUtils
+from sdsmc.PhaseIdentification import CA_Ensemble_Funcs as CAE
+
+
+# Settings which must match for results to be comparable to a baseline
+COMPARISON_SETTINGS = ['numMeas','windowSize','kVector','kFinal','percentMultiPhase','percentMissing',
+                       'numJobs','storageMode','finalClusterMode','windowAffinityMode','randomSeed']
+
+
+##############################################################################
+#
+#       GetPeakRSS
+#
+def GetPeakRSS():
+    """ This function returns the peak resident set size of the current 
+        process in MB, or -1 if it is not available on this platform
+
+    Returns
+    -------
+        peakRSS: float - the peak resident set size in MB
+    """
+    if resource is None:
+        return -1
+    peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peakRSS / 1024**2
+    return peakRSS / 1024
+# End of GetPeakRSS
+
+
+##############################################################################
+#
+#       RunSingleBenchmark
+#
+def RunSingleBenchmark(numCust,settings):
+    """ This function creates a synthetic feeder with numCust customers and
+        runs the phase identification pipeline on it, timing each stage.  The
+        stages match the steps in PhaseIdentification_CAEnsemble.run, without
+        reading and writing files.
+
+    Parameters
+    ---------
+        numCust: int - the number of customers in the synthetic feeder
+        settings: dict - the benchmark settings, see COMPARISON_SETTINGS
+
+    Returns
+    -------
+        result: dict - the number of customers and datastreams, the wall 
+            time of the pipeline, the peak RSS of the process, the time for
+            each stage, and the accuracy of the predicted phases
+    """
+    stages = {}
+    startTime = time.perf_counter()
+    voltage, custID, phaseLabels, numPhasesInput = CPUtils.CreateSyntheticFeederData(numCust,settings['numMeas'],
+                                                        percentMultiPhase=settings['percentMultiPhase'],
+                                                        percentMissing=settings['percentMissing'],
+                                                        randomSeed=settings['randomSeed'])
+    stages['dataGeneration'] = time.perf_counter() - startTime
+
+    pipelineStart = time.perf_counter()
+    stageStart = pipelineStart
+    vNDV,totalFilt,filtPerCust = PreprocessingUtils.PreprocessVoltage(voltage,voltageLevels=PIUtils.VOLTAGE_LEVELS)
+    stages['preprocessing'] = time.perf_counter() - stageStart
+
+    stageStart = time.perf_counter()
+    custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custID,phaseLabels,numPhasesInput=numPhasesInput)
+    stages['uniqueIDs'] = time.perf_counter() - stageStart
+
+    stageStart = time.perf_counter()
+    ensState = CAE.CreateEnsembleState(custIDUnique,settings['kVector'],settings['windowSize'],numPhases=numPhases,
+                                       randomSeed=settings['randomSeed'],windowAffinityMode=settings['windowAffinityMode'],
+                                       storageMode=settings['storageMode'])
+    ensState = CAE.UpdateEnsembleState(ensState,vNDV,numJobs=settings['numJobs'])
+    stages['ensembleWindows'] = time.perf_counter() - stageStart
+
+    stageStart = time.perf_counter()
+    finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = CAE.ClusterEnsembleState(ensState,settings['kFinal'],
+                                                                                           finalClusterMode=settings['finalClusterMode'],
+                                                                                           printLowWinWarningFlag=False)
+    stages['finalClustering'] = time.perf_counter() - stageStart
+
+    stageStart = time.perf_counter()
+    clusteredPhaseLabels = np.delete(phaseLabels,noVotesIndex,axis=1)
+    predictedPhases = PIUtils.CalcPredictedPhaseNoLabels(finalClusterLabels,clusteredPhaseLabels,clusteredIDs)
+    stages['predictedPhases'] = time.perf_counter() - stageStart
+
+    stageStart = time.perf_counter()
+    allSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,settings['kFinal'])
+    stages['silhouette'] = time.perf_counter() - stageStart
+
+    stageStart = time.perf_counter()
+    PIUtils.CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabels,finalClusterLabels,clusteredIDs,custIDUnique,noVotesIDs,predictedPhases,allSC)
+    stages['resultAssembly'] = time.perf_counter() - stageStart
+    wallTime = time.perf_counter() - pipelineStart
+
+    result = {'numCust':numCust,
+              'numDatastreams':len(custID),
+              'wallTime':wallTime,
+              'peakRSS_MB':GetPeakRSS(),
+              'stages':stages,
+              'accuracy':float(np.mean(predictedPhases == clusteredPhaseLabels)),
+              'numOmitted':len(noVotesIndex)}
+    return result
+# End of RunSingleBenchmark
+
+
+##############################################################################
+#
+#       RunBenchmarkSubprocess
+#
+def RunBenchmarkSubprocess(numCust,settings,timeout=None):
+    """ This function runs RunSingleBenchmark in a new Python process so the
+        peak RSS only reflects the feeder size being benchmarked
+
+    Parameters
+    ---------
+        numCust: int - the number of customers in the synthetic feeder
+        settings: dict - the benchmark settings
+        timeout: float - the time limit in seconds, None for no limit
+
+    Returns
+    -------
+        result: dict - the result from RunSingleBenchmark, or a dict with
+            numCust and an 'error' message if the run failed
+    """
+    command = [sys.executable,str(Path(__file__).resolve()),'--single',str(numCust),'--settings',json.dumps(settings)]
+    try:
+        completed = subprocess.run(command,capture_output=True,text=True,timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'numCust':numCust,'error':'timeout after ' + str(timeout) + ' seconds'}
+    if completed.returncode != 0:
+        errorLines = completed.stderr.strip().splitlines()
+        errorMessage = errorLines[-1] if len(errorLines) > 0 else 'exit code ' + str(completed.returncode)
+        return {'numCust':numCust,'error':errorMessage}
+    # The result is the last line printed, anything before it is output from the pipeline
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+# End of RunBenchmarkSubprocess
+
+
+##############################################################################
+#
+#       CompareToBaseline
+#
+def CompareToBaseline(results,baseline,tolerance):
+    """ This function compares the wall time and peak RSS for each feeder 
+        size against a baseline results file and prints a summary table
+
+    Parameters
+    ---------
+        results: dict - the current benchmark results
+        baseline: dict - the baseline benchmark results
+        tolerance: float - the allowed ratio of current to baseline, i.e.
+            1.25 allows a 25% increase before reporting a regression
+
+    Returns
+    -------
+        regressions: list of str - a description of each regression found
+    """
+    for key in COMPARISON_SETTINGS:
+        if results['settings'].get(key) != baseline['settings'].get(key):
+            print('Warning: setting ' + key + ' differs from the baseline (' + str(baseline['settings'].get(key)) + 
+                  ' vs ' + str(results['settings'].get(key)) + '), the comparison may not be meaningful')
+    baselineRuns = {run['numCust']:run for run in baseline['results']}
+    regressions = []
+    print('')
+    print('{:>10} {:>12} {:>12} {:>8} {:>12} {:>12} {:>8}'.format('numCust','base time','time','ratio','base MB','MB','ratio'))
+    for run in results['results']:
+        if run['numCust'] not in baselineRuns:
+            continue
+        baseRun = baselineRuns[run['numCust']]
+        if 'error' in run or 'error' in baseRun:
+            print('{:>10} {}'.format(run['numCust'],'baseline: ' + baseRun.get('error','ok') + ', current: ' + run.get('error','ok')))
+            if 'error' in run and 'error' not in baseRun:
+                regressions.append(str(run['numCust']) + ' customers: ' + run['error'])
+            continue
+        timeRatio = run['wallTime'] / baseRun['wallTime']
+        memRatio = run['peakRSS_MB'] / baseRun['peakRSS_MB'] if baseRun['peakRSS_MB'] > 0 else np.nan
+        print('{:>10} {:>12.2f} {:>12.2f} {:>8.2f} {:>12.1f} {:>12.1f} {:>8.2f}'.format(run['numCust'],baseRun['wallTime'],run['wallTime'],
+                                                                              timeRatio,baseRun['peakRSS_MB'],run['peakRSS_MB'],memRatio))
+        if timeRatio > tolerance:
+            regressions.append(str(run['numCust']) + ' customers: wall time ratio ' + '{:.2f}'.format(timeRatio))
+        if memRatio > tolerance:
+            regressions.append(str(run['numCust']) + ' customers: peak RSS ratio ' + '{:.2f}'.format(memRatio))
+    return regressions
+# End of CompareToBaseline
+
+
+##############################################################################
+#
+#       main
+#
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CA ensemble phase identification on synthetic feeders')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[100,500,1000,2000,5000,10000,20000],
+                        help='the numbers of customers to benchmark')
+    parser.add_argument('--numMeas',type=int,default=8*384+1,help='the number of measurements per datastream')
+    parser.add_argument('--windowSize',type=int,default=384)
+    parser.add_argument('--kVector',type=int,nargs='+',default=[6,12,15,30])
+    parser.add_argument('--kFinal',type=int,default=7)
+    parser.add_argument('--percentMultiPhase',type=float,default=10)
+    parser.add_argument('--percentMissing',type=float,default=1)
+    parser.add_argument('--numJobs',type=int,default=1)
+    parser.add_argument('--storageMode',default='dense',choices=['dense','packed'])
+    parser.add_argument('--finalClusterMode',default='dense',choices=['dense','knn'])
+    parser.add_argument('--windowAffinityMode',default='rbf',choices=['rbf','knn'])
+    parser.add_argument('--randomSeed',type=int,default=0)
+    parser.add_argument('--timeout',type=float,default=None,help='the time limit in seconds for each size')
+    parser.add_argument('--output',default='benchmark_PhaseIdentification_results.json',help='the JSON file for the results')
+    parser.add_argument('--compare',default=None,help='a baseline JSON results file to compare against')
+    parser.add_argument('--tolerance',type=float,default=1.25,help='the allowed ratio of current to baseline wall time and peak RSS')
+    parser.add_argument('--single',type=int,default=None,help=argparse.SUPPRESS)
+    parser.add_argument('--settings',default=None,help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        # Child process - run one size and print the result as the last line
+        result = RunSingleBenchmark(args.single,json.loads(args.settings))
+        print(json.dumps(result))
+        return 0
+
+    settings = {key:getattr(args,key) for key in COMPARISON_SETTINGS}
+    results = {'metadata':{'date':datetime.datetime.now().isoformat(timespec='seconds'),
+                           'python':platform.python_version(),
+                           'numpy':np.__version__,
+                           'scipy':scipy.__version__,
+                           'sklearn':sklearn.__version__,
+                           'platform':platform.platform(),
+                           'processor':platform.processor(),
+                           'cpuCount':os.cpu_count()},
+               'settings':settings,
+               'results':[]}
+    for numCust in args.sizes:
+        print('Benchmarking ' + str(numCust) + ' customers')
+        run = RunBenchmarkSubprocess(numCust,settings,timeout=args.timeout)
+        if 'error' in run:
+            print('    Failed: ' + run['error'])
+        else:
+            print('    Wall time: {:.2f} s, peak RSS: {:.1f} MB, accuracy: {:.3f}'.format(run['wallTime'],run['peakRSS_MB'],run['accuracy']))
+        results['results'].append(run)
+        # Write after each size so partial results are kept if a large size fails
+        with open(args.output,'w') as outFile:
+            json.dump(results,outFile,indent=2)
+    print('Results written to ' + args.output)
+
+    if args.compare is not None:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = CompareToBaseline(results,baseline,args.tolerance)
+        if len(regressions) > 0:
+            print('')
+            print('Regressions compared to ' + args.compare + ':')
+            for regression in regressions:
+                print('    ' + regression)
+            return 1
+        print('No regressions compared to ' + args.compare)
+    return 0
+# End of main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+
+
+ DataIOUtils.py
+
+This file contains the functions used to load the input data for the run()
+functions, and to convert the CSV input files into binary formats.  Parsing
+the wide CSV files with pandas dominates the runtime of the ingest stage for
+large datasets and holds both the DataFrame and the numpy copy in memory.
+The loaders here accept the CSV files as before, along with .npy and .npz
+files, which are memory mapped, and Parquet and Arrow IPC (Feather) files,
+which are copied column by column into a single preallocated array.  The
+format is chosen by the file extension.  ConvertInputFile converts the
+existing CSV layouts into any of these formats once, reading the CSV in
+chunks.
+
+Parquet and Arrow IPC files require the optional pyarrow package.
+
+    Functions:
+        -  GetFileFormat
+        -  ImportPyArrow
+        -  MemmapNPZArray
+        -  ArrowTableToArray
+        -  ReadArrowTable
+        -  LoadArray
+        -  LoadIDs
+        -  LoadSingleFileAMI
+        -  ConvertInputFile
+
+"""
+
+
+# Import - Python Libraries
+import os
+import io
+import itertools
+import struct
+import zipfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+
+# The file extensions recognized by the loaders, anything else is read as CSV
+ARROW_SUFFIXES = ['.arrow','.feather','.ipc']
+PARQUET_SUFFIXES = ['.parquet','.pq']
+
+
+
+##############################################################################
+#
+#       GetFileFormat
+#
+
+def GetFileFormat(filePath):
+    """ This function returns the format of an input file based on its
+        extension
+
+            Parameters
+            ---------
+                filePath: str or Path - the input file
+
+            Returns
+            -------
+                fileFormat: str - 'npy', 'npz', 'parquet', 'arrow', or 'csv'
+            """
+
+    suffix = Path(filePath).suffix.lower()
+    if suffix == '.npy':
+        return 'npy'
+    elif suffix == '.npz':
+        return 'npz'
+    elif suffix in PARQUET_SUFFIXES:
+        return 'parquet'
+    elif suffix in ARROW_SUFFIXES:
+        return 'arrow'
+    else:
+        return 'csv'
+# End of GetFileFormat
+
+
+
+##############################################################################
+#
+#       ImportPyArrow
+#
+
+def ImportPyArrow(filePath):
+    """ This function imports pyarrow, which is required to read and write
+        Parquet and Arrow IPC files, and prints an error naming the file if
+        it is not installed
+
+            Parameters
+            ---------
+                filePath: str or Path - the file being read or written
+
+            Returns
+            -------
+                pa: module - pyarrow
+            """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        print('Error!  Reading or writing ' + str(filePath) + ' requires the pyarrow package, which is not installed.  Use a .csv, .npy, or .npz file instead')
+        raise
+    return pa
+# End of ImportPyArrow
+
+
+
+##############################################################################
+#
+#       MemmapNPZArray
+#
+
+def MemmapNPZArray(npzPath,arrayName,mmapMode='c'):
+    """ This function memory maps one array stored in a .npz file.  numpy
+        ignores mmap_mode for .npz files and reads the whole array, but
+        arrays saved with np.savez (not np.savez_compressed) are stored
+        uncompressed in the zip file and can be mapped directly.  Compressed
+        arrays are read into memory.
+
+            Parameters
+            ---------
+                npzPath: str or Path - the .npz file
+                arrayName: str - the name of the array in the file
+                mmapMode: str - the numpy memmap mode.  The default 'c' is
+                    copy-on-write, so the array can be modified in memory
+                    without changing the file
+
+            Returns
+            -------
+                array: numpy memmap or numpy array - the array
+            """
+
+    with zipfile.ZipFile(npzPath) as npzFile:
+        memberInfo = npzFile.getinfo(arrayName + '.npy')
+    if memberInfo.compress_type != zipfile.ZIP_STORED:
+        with np.load(npzPath) as npzData:
+            return npzData[arrayName]
+    with open(npzPath,'rb') as file:
+        # The zip local file header is 30 bytes followed by the file name
+        #   and an extra field, whose lengths are stored at bytes 26-29
+        file.seek(memberInfo.header_offset)
+        localHeader = file.read(30)
+        nameLength, extraLength = struct.unpack('<HH',localHeader[26:30])
+        file.seek(memberInfo.header_offset + 30 + nameLength + extraLength)
+        version = np.lib.format.read_magic(file)
+        if version == (1,0):
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+    if dtype.hasobject:
+        with np.load(npzPath,allow_pickle=True) as npzData:
+            return npzData[arrayName]
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape,dtype=dtype)
+    return np.memmap(npzPath,dtype=dtype,mode=mmapMode,offset=offset,shape=shape,order='F' if fortranOrder else 'C')
+# End of MemmapNPZArray
+
+
+
+##############################################################################
+#
+#       ArrowTableToArray
+#
+
+def ArrowTableToArray(table,rowStart=0,dtype=-1):
+    """ This function copies a pyarrow Table into a 2D numpy array with one
+        column per table column.  The output is allocated once and filled one
+        column at a time, so the peak memory is the output plus one column
+        rather than two full copies of the data.
+
+            Parameters
+            ---------
+                table: pyarrow Table - the table to convert
+                rowStart: int - the first row to include
+                dtype: numpy dtype - the dtype of the output.  The default
+                    (-1) uses the common dtype of the table columns
+
+            Returns
+            -------
+                array: numpy array (rows,columns) - the table data
+            """
+
+    if type(dtype) == int:
+        dtype = np.result_type(*[field.type.to_pandas_dtype() for field in table.schema])
+    array = np.empty((table.num_rows-rowStart,table.num_columns),dtype=dtype)
+    for colCtr in range(0,table.num_columns):
+        column = table.column(colCtr).slice(rowStart)
+        array[:,colCtr] = column.to_numpy()
+    return array
+# End of ArrowTableToArray
+
+
+
+##############################################################################
+#
+#       ReadArrowTable
+#
+
+def ReadArrowTable(filePath):
+    """ This function reads a Parquet or Arrow IPC file into a pyarrow Table.
+        Both are read through a memory map, so an uncompressed Arrow IPC file
+        is not copied until it is converted to numpy.
+
+            Parameters
+            ---------
+                filePath: str or Path - the .parquet or .arrow/.feather file
+
+            Returns
+            -------
+                table: pyarrow Table - the file contents
+            """
+
+    pa = ImportPyArrow(filePath)
+    if GetFileFormat(filePath) == 'parquet':
+        return pa.parquet.read_table(str(filePath),memory_map=True)
+    # The table buffers keep the memory map open
+    source = pa.memory_map(str(filePath),'r')
+    return pa.ipc.open_file(source).read_all()
+# End of ReadArrowTable
+
+
+
+##############################################################################
+#
+#       LoadArray
+#
+
+def LoadArray(filePath,mmapMode='c'):
+    """ This function loads a 2D numeric input file (voltage, real power,
+        reactive power, labels, etc.).  CSV files are read exactly as
+        ConvertCSVtoNPY reads them (no header row).  .npy files, and arrays
+        saved uncompressed in .npz files, are memory mapped.  .npz files use
+        the array named 'data' if present, otherwise the first array.
+        Parquet and Arrow IPC files are read with one column per CSV column.
+
+            Parameters
+            ---------
+                filePath: str or Path - the input file
+                mmapMode: str - the numpy memmap mode for .npy and .npz
+                    files.  The default 'c' is copy-on-write, so the data
+                    can be modified in memory without changing the file.
+                    Use None to read the whole file into memory
+
+            Returns
+            -------
+                array: numpy array or numpy memmap - the file contents
+            """
+
+    fileFormat = GetFileFormat(filePath)
+    if fileFormat == 'npy':
+        return np.load(filePath,mmap_mode=mmapMode)
+    elif fileFormat == 'npz':
+        with np.load(filePath) as npzData:
+            arrayNames = npzData.files
+        arrayName = 'data' if 'data' in arrayNames else arrayNames[0]
+        if mmapMode is None:
+            with np.load(filePath) as npzData:
+                return npzData[arrayName]
+        return MemmapNPZArray(filePath,arrayName,mmapMode=mmapMode)
+    elif fileFormat in ['parquet','arrow']:
+        return ArrowTableToArray(ReadArrowTable(filePath))
+    else:
+        dataSet = pd.read_csv(filePath,header=None)
+        return np.array(pd.DataFrame(dataSet).values)
+# End of LoadArray
+
+
+
+##############################################################################
+#
+#       LoadIDs
+#
+
+def LoadIDs(filePath):
+    """ This function loads a list of IDs (customer IDs, sensor IDs, etc.).
+        Text/CSV files have one ID per line, as the run() functions have
+        always read them.  .npy/.npz files hold a 1D array of strings, and
+        Parquet/Arrow IPC files use the first column.
+
+            Parameters
+            ---------
+                filePath: str or Path - the input file
+
+            Returns
+            -------
+                idList: list of str - the IDs
+            """
+
+    fileFormat = GetFileFormat(filePath)
+    if fileFormat in ['npy','npz']:
+        ids = LoadArray(filePath,mmapMode=None)
+        return [str(x) for x in np.ravel(ids)]
+    elif fileFormat in ['parquet','arrow']:
+        table = ReadArrowTable(filePath)
+        return [str(x) for x in table.column(0).to_pylist()]
+    else:
+        with open(filePath,'r') as file:
+            idList = [x.rstrip() for x in file]
+        return idList
+# End of LoadIDs
+
+
+
+##############################################################################
+#
+#       LoadSingleFileAMI
+#
+
+def LoadSingleFileAMI(filePath,mmapMode='c'):
+    """ This function loads the single-file AMI layout used by
+        PhaseIdentification_CAEnsemble.  In the CSV layout the header row
+        holds the customer IDs, the first data row holds the phase labels,
+        and the remaining rows hold the voltage measurements.  Parquet and
+        Arrow IPC files use the same layout with the customer IDs as the
+        column names.  .npz files hold the arrays 'voltage', 'phaseLabels',
+        and 'custID', and the voltage is memory mapped.
+
+            Parameters
+            ---------
+                filePath: str or Path - the input file
+                mmapMode: str - the numpy memmap mode for the voltage in
+                    .npz files
+
+            Returns
+            -------
+                voltage: numpy array of float (measurements,customers) - the
+                    voltage timeseries
+                phaseLabels: numpy array of int (1,customers) - the phase
+                    labels
+                custID: list of str - the customer IDs
+            """
+
+    fileFormat = GetFileFormat(filePath)
+    if fileFormat == 'npz':
+        voltage = MemmapNPZArray(filePath,'voltage',mmapMode=mmapMode)
+        with np.load(filePath) as npzData:
+            phaseLabels = np.array(npzData['phaseLabels'],dtype=int).reshape(1,-1)
+            custID = [str(x) for x in npzData['custID']]
+    elif fileFormat in ['parquet','arrow']:
+        table = ReadArrowTable(filePath)
+        voltage = ArrowTableToArray(table,rowStart=1,dtype=float)
+        phaseLabels = ArrowTableToArray(table.slice(0,1),dtype=int)
+        custID = list(table.column_names)
+    else:
+        raw_data = pd.read_csv(filePath)
+        voltage = raw_data.iloc[1:].to_numpy(dtype=float)
+        phaseLabels = raw_data.iloc[0].to_numpy(dtype=int).reshape(1,voltage.shape[1])
+        custID = list(raw_data.columns)
+    return voltage, phaseLabels, custID
+# End of LoadSingleFileAMI
+
+
+
+##############################################################################
+#
+#       ConvertInputFile
+#
+
+def ConvertInputFile(csvPath,outputPath,layout='array',chunkRows=10000):
+    """ This function converts one of the CSV input files into a .npy, .npz,
+        Parquet, or Arrow IPC file, chosen by the extension of outputPath.
+        The CSV is read in chunks of chunkRows rows, so files larger than
+        memory can be converted.  The CSV is read twice for the numeric
+        layouts, once to find the number of rows and the dtype and once to
+        write the output.
+
+            Parameters
+            ---------
+                csvPath: str or Path - the CSV file to convert
+                outputPath: str or Path - the output file
+                layout: str - 'array' for the headerless numeric files
+                    (voltage, real power, labels, etc.), 'ids' for the ID
+                    lists with one ID per line, or 'singleFile' for the
+                    layout read by LoadSingleFileAMI.  Use .npz for
+                    'singleFile' when writing numpy files
+                chunkRows: int - the number of CSV rows read at a time
+
+            Returns
+            -------
+                outputPath: Path - the output file
+            """
+
+    outputPath = Path(outputPath)
+    fileFormat = GetFileFormat(outputPath)
+    if layout not in ['array','ids','singleFile']:
+        print('Error!  Unknown layout ' + str(layout) + ', use array, ids, or singleFile')
+        return outputPath
+    if fileFormat == 'csv':
+        print('Error!  The output file ' + str(outputPath) + ' must be .npy, .npz, .parquet, or .arrow')
+        return outputPath
+
+    if layout == 'ids':
+        idList = LoadIDs(csvPath)
+        if fileFormat == 'npy':
+            np.save(outputPath,np.array(idList,dtype=str))
+        elif fileFormat == 'npz':
+            np.savez(outputPath,data=np.array(idList,dtype=str))
+        else:
+            pa = ImportPyArrow(outputPath)
+            table = pa.table({'ID':idList})
+            if fileFormat == 'parquet':
+                pa.parquet.write_table(table,str(outputPath))
+            else:
+                with pa.OSFile(str(outputPath),'wb') as sink:
+                    with pa.ipc.new_file(sink,table.schema) as writer:
+                        writer.write_table(table)
+        return outputPath
+
+    if layout == 'singleFile':
+        header = pd.read_csv(csvPath,nrows=1)
+        columnNames = [str(name) for name in header.columns]
+        phaseLabels = header.iloc[0].to_numpy(dtype=int)
+        readArgs = {'skiprows':2,'header':None}
+    else:
+        readArgs = {'header':None}
+
+    # First pass: the size of the output and the dtype of the whole file
+    numRows = 0
+    numCols = len(columnNames) if layout == 'singleFile' else 0
+    chunkDtypes = []
+    for chunk in pd.read_csv(csvPath,chunksize=chunkRows,**readArgs):
+        numRows = numRows + chunk.shape[0]
+        numCols = chunk.shape[1]
+        chunkDtypes = chunkDtypes + list(chunk.dtypes)
+    if layout == 'singleFile' or len(chunkDtypes) == 0:
+        dtype = np.dtype(float)
+    else:
+        dtype = np.result_type(*chunkDtypes)
+    if layout == 'array':
+        columnNames = [str(colCtr) for colCtr in range(0,numCols)]
+
+    # Second pass: write the output one chunk at a time
+    chunkArrays = (chunk.to_numpy(dtype=dtype) for chunk in pd.read_csv(csvPath,chunksize=chunkRows,**readArgs))
+    if fileFormat in ['npy','npz']:
+        arrayPath = outputPath if fileFormat == 'npy' else outputPath.with_name(outputPath.name + '.tmp.npy')
+        array = np.lib.format.open_memmap(arrayPath,mode='w+',dtype=dtype,shape=(numRows,numCols))
+        rowCtr = 0
+        for chunkArray in chunkArrays:
+            array[rowCtr:rowCtr+chunkArray.shape[0],:] = chunkArray
+            rowCtr = rowCtr + chunkArray.shape[0]
+        array.flush()
+        del array
+        if fileFormat == 'npz':
+            # Stored uncompressed so the arrays can be memory mapped
+            with zipfile.ZipFile(outputPath,'w',compression=zipfile.ZIP_STORED,allowZip64=True) as npzFile:
+                if layout == 'singleFile':
+                    npzFile.write(arrayPath,'voltage.npy')
+                    for arrayName, arrayData in [('phaseLabels',phaseLabels),('custID',np.array(columnNames,dtype=str))]:
+                        buffer = io.BytesIO()
+                        np.save(buffer,arrayData)
+                        npzFile.writestr(arrayName + '.npy',buffer.getvalue())
+                else:
+                    npzFile.write(arrayPath,'data.npy')
+            os.remove(arrayPath)
+        return outputPath
+
+    # Parquet and Arrow IPC, the phase labels are the first row of the
+    #   singleFile layout
+    pa = ImportPyArrow(outputPath)
+    if layout == 'singleFile':
+        chunkArrays = itertools.chain([phaseLabels.reshape(1,-1).astype(dtype)],chunkArrays)
+    schema = pa.schema([(name,pa.from_numpy_dtype(dtype)) for name in columnNames])
+    if fileFormat == 'parquet':
+        sink = -1
+        writer = pa.parquet.ParquetWriter(str(outputPath),schema)
+    else:
+        sink = pa.OSFile(str(outputPath),'wb')
+        writer = pa.ipc.new_file(sink,schema)
+    try:
+        for chunkArray in chunkArrays:
+            batch = pa.RecordBatch.from_arrays([pa.array(chunkArray[:,colCtr]) for colCtr in range(0,numCols)],schema=schema)
+            writer.write_batch(batch)
+    finally:
+        writer.close()
+        if type(sink) != int:
+            sink.close()
+    return outputPath
+# End of ConvertInputFile
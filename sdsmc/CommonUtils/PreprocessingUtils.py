@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+
+ PreprocessingUtils.py
+
+This file contains the AMI voltage pre-processing functions that are shared by
+the phase identification, meter to transformer pairing, and online phase 
+changepoint detection algorithms.  PreprocessVoltage performs the complete
+pre-processing (per-unit conversion, bad data filtering, and the difference
+representation) in a single pass over blocks of measurements, writing into a
+preallocated output array.
+
+    Functions:
+        -  FindBaseVoltages
+        -  ConvertToPerUnit_Voltage
+        -  BadDataFiltering
+        -  PreprocessVoltage
+
+"""
+
+
+# Import - Python Libraries
+import numpy as np
+
+
+# The base voltages recognized by FindBaseVoltages
+DEFAULT_VOLTAGE_LEVELS = [120, 208, 277, 240, 480, 7200]
+
+
+
+###############################################################################
+#
+#                                  FindBaseVoltages
+#
+
+def FindBaseVoltages(timeseries,voltageLevels=DEFAULT_VOLTAGE_LEVELS,voltageMismatchThresh=0.8,blockElements=2**22):
+    """ This function finds the base voltage of each customer by rounding the
+        mean of the customer's measurements and choosing the closest of the 
+        known base voltages.  The means are accumulated over blocks of 
+        measurements so no full size temporary arrays are created.  A warning
+        is printed for customers with only NaN values, and their base voltage
+        is NaN.
+
+            Parameters
+            ---------
+                timeseries: numpy array of float (measurements,customers) - 
+                    the raw AMI voltage measurements
+                voltageLevels: list of float - the supported base voltages
+                voltageMismatchThresh: float - the largest allowed difference
+                    between the mean voltage and the closest base voltage, as
+                    a fraction of the base voltage
+                blockElements: int - the approximate number of values 
+                    processed at a time
+
+            Returns
+            -------
+                baseVoltages: numpy array of float (customers) - the base 
+                    voltage of each customer, or -1 if a customer's mean 
+                    voltage does not match any of the supported base voltages
+            """
+
+    voltageLevels = np.array(voltageLevels,dtype=float)
+    numMeas, numCust = timeseries.shape
+    sums = np.zeros((numCust,),dtype=float)
+    counts = np.zeros((numCust,),dtype=np.int64)
+    blockSize = max(1,blockElements // max(numCust,1))
+    for start in range(0,numMeas,blockSize):
+        block = np.asarray(timeseries[start:(start+blockSize),:],dtype=float)
+        valid = ~np.isnan(block)
+        sums += np.sum(block,axis=0,where=valid)
+        counts += np.sum(valid,axis=0)
+    allNaN = counts == 0
+    if np.any(allNaN):
+        print('Warning!  Customer indices ' + str(np.where(allNaN)[0].tolist()) + ' only had NaN values in the timeseries. ')
+    meanValues = np.round(sums / np.maximum(counts,1),decimals=0)
+    vDiff = np.abs(voltageLevels[np.newaxis,:] - meanValues[:,np.newaxis])
+    levelIndices = np.argmin(vDiff,axis=1)
+    baseVoltages = voltageLevels[levelIndices]
+    # Check for the case where the correct voltage level is not listed
+    mismatch = (vDiff[np.arange(numCust),levelIndices] > (voltageMismatchThresh*baseVoltages)) & ~allNaN
+    if np.any(mismatch):
+        custCtr = np.where(mismatch)[0][0]
+        print('Error!  Customer# ' + str(custCtr) + 'has a mean voltage value of ' + str(meanValues[custCtr]) + '.  This voltage level is not supported in the function.  Please add this voltage level to the source code of the function')
+        return -1
+    baseVoltages[allNaN] = np.nan
+    return baseVoltages
+# End of FindBaseVoltages
+
+
+
+###############################################################################
+#
+#                                  ConvertToPerUnit_Voltage
+#
+
+def ConvertToPerUnit_Voltage(timeseries,voltageLevels=DEFAULT_VOLTAGE_LEVELS,voltageMismatchThresh=0.8):
+    """ This function takes a voltage timeseries and converts it into a per
+        unit representation, using the base voltage of each customer from
+        FindBaseVoltages.  This allows for the case where some customers run
+        at 240V and some run at 120V in the same dataset.  Customers with only
+        NaN values will have only NaN values in the per-unit timeseries.
+
+            Parameters
+            ---------
+                timeseries: numpy array of float (measurements,customers) - 
+                    the raw AMI voltage measurements
+                voltageLevels: list of float - the supported base voltages
+                voltageMismatchThresh: float - see FindBaseVoltages
+
+            Returns
+            -------
+                voltagePU: numpy array of float (measurements,customers) -  
+                    the voltage timeseries converted into per-unit 
+                    representation, or -1 if a base voltage is not supported
+            """
+
+    baseVoltages = FindBaseVoltages(timeseries,voltageLevels,voltageMismatchThresh)
+    if type(baseVoltages) == int:
+        return -1
+    return np.divide(timeseries,baseVoltages[np.newaxis,:])
+# End of ConvertToPerUnit_Voltage
+
+
+
+###############################################################################
+#
+#                                  BadDataFiltering
+#
+
+def BadDataFiltering(timeseries,highValue=1.1,lowValue=0.8):
+    """ This function takes a array of timeseries with high and low thresholds
+        and any values outside of those thresholds become NaN.  The timeseries
+        values MUST be in per-unit if you use the default thresholds.
+
+            Parameters
+            ---------
+                timeseries: ndarray of float (measurements,customers) - the 
+                    timeseries to filter
+                highValue: float - the upper threshold, values greater than
+                    or equal to it are filtered
+                lowValue: float - the lower threshold, values less than or 
+                    equal to it are filtered
+
+            Returns
+            -------
+                filteredTimeseries: ndarray of float (measurements,customers) 
+                    the filtered timeseries.  Any values outside of the 
+                    thresholds replaced with NaN
+                nanCount: int - the total number of values filtered
+                nanCountPerCust: list of int - the number of values filtered 
+                    per customer
+            """
+
+    filteredTimeseries = np.array(timeseries,dtype=float)
+    filterMask = (filteredTimeseries >= highValue) | (filteredTimeseries <= lowValue)
+    filteredTimeseries[filterMask] = np.nan
+    nanCountPerCust = np.sum(filterMask,axis=0)
+    return filteredTimeseries, int(np.sum(nanCountPerCust)), [int(nans) for nans in nanCountPerCust]
+# End of BadDataFiltering
+
+
+
+###############################################################################
+#
+#                                  PreprocessVoltage
+#
+
+def PreprocessVoltage(timeseries,filterFlag=True,highValue=1.1,lowValue=0.8,deltaFlag=True,dtype=np.float64,outputArray=-1,voltageLevels=DEFAULT_VOLTAGE_LEVELS,voltageMismatchThresh=0.8,blockElements=2**22):
+    """ This function performs the AMI voltage pre-processing in a single pass
+        over blocks of measurements: conversion to per-unit using the base 
+        voltage of each customer, filtering of values outside of the 
+        thresholds, and conversion to the difference representation.  The 
+        result is the same as ConvertToPerUnit_Voltage, BadDataFiltering and 
+        CalcDeltaVoltage called in sequence, but only the output array is
+        allocated at full size.  The output can be float32 to halve its size,
+        and can be a preallocated array such as a numpy memmap.
+
+            Parameters
+            ---------
+                timeseries: numpy array of float (measurements,customers) - 
+                    the raw AMI voltage measurements, in volts
+                filterFlag: boolean - if True, per-unit values outside of the
+                    thresholds are replaced with NaN (see BadDataFiltering)
+                highValue: float - the upper per-unit threshold
+                lowValue: float - the lower per-unit threshold
+                deltaFlag: boolean - if True the output is the difference
+                    between adjacent measurements, with one less measurement 
+                    than the input
+                dtype: numpy dtype - the dtype of the output, used if 
+                    outputArray is not supplied
+                outputArray: numpy array of float - a preallocated output 
+                    array of the correct shape.  The default (-1) allocates it
+                voltageLevels: list of float - the supported base voltages
+                voltageMismatchThresh: float - see FindBaseVoltages
+                blockElements: int - the approximate number of values 
+                    processed at a time
+
+            Returns
+            -------
+                voltageOut: numpy array (measurements,customers) - the 
+                    pre-processed voltage, or -1 if a base voltage is not
+                    supported
+                nanCount: int - the total number of values filtered
+                nanCountPerCust: list of int - the number of values filtered 
+                    per customer
+            """
+
+    numMeas, numCust = timeseries.shape
+    baseVoltages = FindBaseVoltages(timeseries,voltageLevels,voltageMismatchThresh,blockElements)
+    if type(baseVoltages) == int:
+        return -1, -1, -1
+    if deltaFlag:
+        outputShape = (numMeas-1,numCust)
+    else:
+        outputShape = (numMeas,numCust)
+    if type(outputArray) == int:
+        outputArray = np.empty(outputShape,dtype=dtype)
+    elif outputArray.shape != outputShape:
+        print('Error!  The output array must have shape ' + str(outputShape))
+        return -1, -1, -1
+    nanCountPerCust = np.zeros((numCust,),dtype=np.int64)
+    blockSize = max(2,blockElements // max(numCust,1))
+    previousRow = None
+    for start in range(0,numMeas,blockSize):
+        end = min(start + blockSize,numMeas)
+        block = np.divide(timeseries[start:end,:],baseVoltages[np.newaxis,:],dtype=float)
+        if filterFlag:
+            filterMask = (block >= highValue) | (block <= lowValue)
+            block[filterMask] = np.nan
+            nanCountPerCust += np.sum(filterMask,axis=0)
+        if not deltaFlag:
+            outputArray[start:end,:] = block
+        elif previousRow is None:
+            outputArray[0:(end-1),:] = np.diff(block,n=1,axis=0)
+        else:
+            # The first difference in the block uses the last measurement of the previous block
+            outputArray[start-1,:] = block[0,:] - previousRow
+            outputArray[start:(end-1),:] = np.diff(block,n=1,axis=0)
+        previousRow = block[-1,:]
+    return outputArray, int(np.sum(nanCountPerCust)), [int(nans) for nans in nanCountPerCust]
+# End of PreprocessVoltage
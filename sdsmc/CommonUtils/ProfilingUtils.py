@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+
+ ProfilingUtils.py
+
+This file contains the stage-level instrumentation used by the run() functions.
+Each stage of a run is wrapped in ProfileStage, which records the wall time, 
+CPU time, and peak resident set size of the stage along with the sizes of the
+main arrays it produced.  The CPU time includes worker processes (for example
+a ProcessPoolExecutor) only once they have exited, see GetChildCPUTime.  The profile is a dict that is written to a JSON file
+by FinishRunProfile.  Passing -1 instead of a profile turns the 
+instrumentation off.  Optionally a function-level profiler (cProfile, or any 
+profiler with enable/disable or start/stop methods, such as a sampling 
+profiler) can run for the whole run.
+
+    Functions:
+        -  GetPeakRSS
+        -  GetChildCPUTime
+        -  GetArraySize
+        -  CreateRunProfile
+        -  ProfileStage
+        -  RecordArraySizes
+        -  FinishRunProfile
+
+"""
+
+
+# Import - Python Libraries
+import cProfile
+import datetime
+import json
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+
+# resource is not available on Windows, the peak RSS and worker CPU time are then reported as -1
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+
+##############################################################################
+#
+#       GetPeakRSS
+#
+
+def GetPeakRSS():
+    """ This function returns the peak resident set size of the current 
+        process in MB, or -1 if it is not available on this platform
+
+            Parameters
+            ---------
+                None
+
+            Returns
+            -------
+                peakRSS: float - the peak resident set size in MB
+            """
+
+    if resource is None:
+        return -1
+    peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peakRSS / 1024**2
+    return peakRSS / 1024
+# End of GetPeakRSS
+
+
+
+##############################################################################
+#
+#       GetChildCPUTime
+#
+
+def GetChildCPUTime():
+    """ This function returns the CPU time (user and system) in seconds used
+        by the child processes of the current process, or -1 if it is not 
+        available on this platform.  Only children that have exited and been
+        waited for are included, so the workers of a ProcessPoolExecutor are
+        counted once the pool has been shut down (as CAEnsemble does for the 
+        pools it creates), not while it is still running.
+
+            Parameters
+            ---------
+                None
+
+            Returns
+            -------
+                childCPUTime: float - the CPU time of the child processes
+            """
+
+    if resource is None:
+        return -1
+    childUsage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return childUsage.ru_utime + childUsage.ru_stime
+# End of GetChildCPUTime
+
+
+
+##############################################################################
+#
+#       GetArraySize
+#
+
+def GetArraySize(array):
+    """ This function describes the size of an array for the profile
+
+            Parameters
+            ---------
+                array: numpy array, scipy sparse matrix, pandas DataFrame, 
+                    list, or dict of numpy arrays (such as the packed 
+                    co-association storage)
+
+            Returns
+            -------
+                arraySize: dict - the shape, dtype, and size in MB where they
+                    apply
+            """
+
+    if sparse.issparse(array):
+        numBytes = array.data.nbytes + array.indices.nbytes + array.indptr.nbytes if hasattr(array,'indptr') else array.data.nbytes
+        return {'shape':list(array.shape),'dtype':str(array.dtype),'nnz':int(array.nnz),'sizeMB':numBytes / 1024**2}
+    if isinstance(array,np.ndarray):
+        return {'shape':list(array.shape),'dtype':str(array.dtype),'sizeMB':array.nbytes / 1024**2}
+    if hasattr(array,'memory_usage') and hasattr(array,'shape'):
+        # pandas DataFrame
+        return {'shape':list(array.shape),'sizeMB':float(np.sum(array.memory_usage(deep=False))) / 1024**2}
+    if isinstance(array,dict):
+        numBytes = sum([value.nbytes for value in array.values() if isinstance(value,np.ndarray)])
+        return {'keys':sorted([str(key) for key in array.keys()]),'sizeMB':numBytes / 1024**2}
+    if isinstance(array,(list,tuple)):
+        return {'length':len(array)}
+    return {'type':type(array).__name__}
+# End of GetArraySize
+
+
+
+##############################################################################
+#
+#       CreateRunProfile
+#
+
+def CreateRunProfile(runName,profilerHook=-1):
+    """ This function starts the profile of a run
+
+            Parameters
+            ---------
+                runName: str - the name of the run, recorded in the profile
+                profilerHook: str or object - 'cprofile' runs cProfile for the
+                    whole run.  Any other object with enable/disable or 
+                    start/stop methods (for example a sampling profiler) is 
+                    started here and stopped by FinishRunProfile.  The default
+                    (-1) does not use a function-level profiler
+
+            Returns
+            -------
+                profile: dict - the run profile, passed to ProfileStage and
+                    FinishRunProfile
+            """
+
+    if profilerHook == 'cprofile':
+        profilerHook = cProfile.Profile()
+    profile = {'runName':runName,
+               'startTime':datetime.datetime.now().isoformat(timespec='seconds'),
+               'platform':{'python':platform.python_version(),'machine':platform.machine(),'system':platform.system()},
+               'stages':[],
+               'profilerHook':profilerHook,
+               'wallStart':time.perf_counter(),
+               'cpuStart':time.process_time(),
+               'workerCPUStart':GetChildCPUTime()}
+    if hasattr(profilerHook,'enable'):
+        profilerHook.enable()
+    elif hasattr(profilerHook,'start'):
+        profilerHook.start()
+    return profile
+# End of CreateRunProfile
+
+
+
+##############################################################################
+#
+#       ProfileStage
+#
+
+@contextmanager
+def ProfileStage(profile,stageName):
+    """ This function is a context manager which records the wall time, CPU
+        time, and peak RSS of the code inside the with block as a stage of 
+        the profile.  The CPU time (cpuTime) includes the worker processes 
+        that exited during the stage, which are also recorded separately 
+        (workerCPUTime, -1 if not available), see GetChildCPUTime.  Workers of
+        a pool that is still running at the end of the stage are not 
+        included.  The peak RSS is for the whole process, so the increase
+        during the stage shows the memory the stage added over the previous
+        peak.  If profile is -1 nothing is recorded.
+
+            Parameters
+            ---------
+                profile: dict - the run profile from CreateRunProfile, or -1
+                stageName: str - the name of the stage, for example 'ingest',
+                    'preprocessing', 'clustering', 'scoring', 'plotting', or
+                    'output'
+
+            Yields
+            -------
+                stage: dict - the stage record, pass it to RecordArraySizes.
+                    -1 if profile is -1
+            """
+
+    if type(profile) == int:
+        yield -1
+        return
+    stage = {'name':stageName,'arrays':{}}
+    startRSS = GetPeakRSS()
+    wallStart = time.perf_counter()
+    cpuStart = time.process_time()
+    workerCPUStart = GetChildCPUTime()
+    try:
+        yield stage
+    finally:
+        stage['wallTime'] = time.perf_counter() - wallStart
+        stage['cpuTime'] = time.process_time() - cpuStart
+        if workerCPUStart == -1:
+            stage['workerCPUTime'] = -1
+        else:
+            stage['workerCPUTime'] = GetChildCPUTime() - workerCPUStart
+            stage['cpuTime'] = stage['cpuTime'] + stage['workerCPUTime']
+        stage['peakRSS'] = GetPeakRSS()
+        if startRSS == -1:
+            stage['peakRSSIncrease'] = -1
+        else:
+            stage['peakRSSIncrease'] = stage['peakRSS'] - startRSS
+        profile['stages'].append(stage)
+# End of ProfileStage
+
+
+
+##############################################################################
+#
+#       RecordArraySizes
+#
+
+def RecordArraySizes(stage,**arrays):
+    """ This function records the sizes of arrays in a stage of the profile,
+        see GetArraySize
+
+            Parameters
+            ---------
+                stage: dict - the stage record yielded by ProfileStage, or -1
+                arrays: the arrays to record, as keyword arguments with the 
+                    array name as the keyword
+
+            Returns
+            -------
+                None
+            """
+
+    if type(stage) == int:
+        return
+    for arrayName in arrays:
+        stage['arrays'][arrayName] = GetArraySize(arrays[arrayName])
+# End of RecordArraySizes
+
+
+
+##############################################################################
+#
+#       FinishRunProfile
+#
+
+def FinishRunProfile(profile,savePath=-1):
+    """ This function stops the profile of a run and writes it to a JSON file.
+        If cProfile was used its statistics are written next to the JSON 
+        file with the suffix .prof, which can be read with pstats or 
+        snakeviz.
+
+            Parameters
+            ---------
+                profile: dict - the run profile from CreateRunProfile, or -1
+                savePath: str or Path - the JSON file to write.  The default
+                    (-1) does not write a file
+
+            Returns
+            -------
+                runProfile: dict - the profile in the form written to the JSON
+                    file, or -1 if profile is -1
+            """
+
+    if type(profile) == int:
+        return -1
+    profilerHook = profile['profilerHook']
+    if hasattr(profilerHook,'disable'):
+        profilerHook.disable()
+    elif hasattr(profilerHook,'stop'):
+        profilerHook.stop()
+    runProfile = {'runName':profile['runName'],
+                  'startTime':profile['startTime'],
+                  'platform':profile['platform'],
+                  'totalWallTime':time.perf_counter() - profile['wallStart'],
+                  'totalCPUTime':time.process_time() - profile['cpuStart'],
+                  'totalWorkerCPUTime':-1,
+                  'peakRSS':GetPeakRSS(),
+                  'stages':profile['stages']}
+    # The worker CPU time only includes worker processes that have exited, see GetChildCPUTime
+    if profile['workerCPUStart'] != -1:
+        runProfile['totalWorkerCPUTime'] = GetChildCPUTime() - profile['workerCPUStart']
+        runProfile['totalCPUTime'] = runProfile['totalCPUTime'] + runProfile['totalWorkerCPUTime']
+    if type(savePath) != int:
+        savePath = Path(savePath)
+        if isinstance(profilerHook,cProfile.Profile):
+            statsPath = savePath.with_suffix('.prof')
+            profilerHook.dump_stats(str(statsPath))
+            runProfile['profilerStats'] = str(statsPath)
+        with open(savePath,'w') as file:
+            json.dump(runProfile,file,indent=2)
+    return runProfile
+# End of FinishRunProfile
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+ SpectralUtils.py
+
+This file contains spectral clustering helper functions that are shared by the
+phase identification and online phase changepoint detection algorithms.
+
+    Functions:
+        -  CheckEigenSolver
+        -  CreateKNNAffinity
+        -  SelectTopNeighbors
+        -  SparsifyAffinity
+        -  SPClustering_MultK
+        -  SPClustering_Sparse
+        -  SPClustering_Precomp_MultK
+        -  DiscretizeEmbedding
+        -  NystromEmbedding
+        -  SPClustering_Nystrom
+
+"""
+
+
+# Import - Python Libraries
+import numpy as np
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.manifold import spectral_embedding
+from sklearn.cluster import k_means
+from sklearn.utils import check_random_state
+from sklearn.cluster import SpectralClustering
+from sklearn.neighbors import kneighbors_graph
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+# The number of neighbors of the kNN affinity matrices, shared by every function that builds one so the same settings give the same graph (and cache key)
+DEFAULT_NUM_NEIGHBORS = 15
+
+
+###############################################################################
+#
+#                                  CheckEigenSolver
+#
+
+def CheckEigenSolver(eigenSolver):
+    """ This function checks that the requested sparse eigensolver is
+        available.  The 'amg' solver requires the optional pyamg package; if it
+        is not installed a warning is printed and 'arpack' is used instead.
+            
+            Parameters
+            ---------
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg'
+                
+            Returns
+            -------
+                eigenSolver: str - the eigensolver to use
+            """       
+
+    if eigenSolver not in ['arpack','lobpcg','amg']:
+        print('Warning!  Unknown eigenSolver ' + str(eigenSolver) + ', using arpack instead')
+        return 'arpack'
+    if eigenSolver == 'amg':
+        try:
+            import pyamg
+        except ImportError:
+            print('Warning!  The amg eigensolver requires the pyamg package, which is not installed.  Using arpack instead')
+            return 'arpack'
+    return eigenSolver
+# End of CheckEigenSolver
+
+
+
+###############################################################################
+#
+#                                  CreateKNNAffinity
+#
+
+def CreateKNNAffinity(features,numNeighbors,gamma=1.0):
+    """ This function builds a sparse, symmetric k-nearest-neighbor affinity
+        matrix for a window of timeseries data.  Each customer is connected to
+        its numNeighbors nearest customers (Euclidean distance) and the edges
+        are weighted with the same Radial Basis Function kernel used by the 
+        dense 'rbf' affinity, exp(-gamma*distance^2).  The memory required is
+        O(customers*numNeighbors) instead of O(customers^2).
+            
+            Parameters
+            ---------
+                features: numpy array of float (customers,measurments) - a 
+                    'window' of time series measurements with no NaN values
+                numNeighbors: int - the number of neighbors for each customer
+                gamma: float - the RBF kernel coefficient
+                
+            Returns
+            -------
+                affinity: scipy sparse csr matrix of float (customers,customers)
+                    - the symmetric kNN affinity matrix
+            """       
+
+    numNeighbors = min(numNeighbors,features.shape[0]-1)
+    distances = kneighbors_graph(features,n_neighbors=numNeighbors,mode='distance',include_self=False)
+    distances.data = np.exp(-gamma * (distances.data**2))
+    affinity = 0.5 * (distances + distances.T)
+    return affinity.tocsr()
+# End of CreateKNNAffinity
+
+
+
+###############################################################################
+#
+#                                  SelectTopNeighbors
+#
+
+def SelectTopNeighbors(block,blockRows,numNeighbors):
+    """ This function selects the numNeighbors largest off-diagonal entries
+        in each row of a block of rows from an affinity matrix.  Zero entries
+        are never selected.  The block is modified in place.
+            
+            Parameters
+            ---------
+                block: numpy array of float (block rows,customers) - rows of
+                    the affinity matrix
+                blockRows: numpy array of int (block rows) - the row index of
+                    each row of the block in the full affinity matrix, used to
+                    exclude the diagonal
+                numNeighbors: int - the number of entries to keep in each row
+                
+            Returns
+            -------
+                rows: numpy array of int - the row index of each kept entry
+                cols: numpy array of int - the column index of each kept entry
+                values: numpy array of float - the value of each kept entry
+            """       
+
+    numNeighbors = min(numNeighbors,block.shape[1]-1)
+    block[np.arange(block.shape[0]),blockRows] = -np.inf
+    topCols = np.argpartition(-block,numNeighbors-1,axis=1)[:,:numNeighbors]
+    topValues = np.take_along_axis(block,topCols,axis=1)
+    keep = topValues > 0
+    rows = np.repeat(blockRows,numNeighbors)[keep.ravel()]
+    return rows, topCols[keep], topValues[keep]
+# End of SelectTopNeighbors
+
+
+
+###############################################################################
+#
+#                                  SparsifyAffinity
+#
+
+def SparsifyAffinity(affinity,numNeighbors,blockSize=1000):
+    """ This function converts a dense affinity matrix, such as the 
+        normalized co-association matrix, into a sparse matrix by keeping the
+        numNeighbors largest off-diagonal entries in each row.  The rows are
+        processed in blocks so the only dense temporary is 
+        (blockSize,customers).  Zero entries are never kept.  The result is
+        symmetrized by taking the elementwise maximum with its transpose.
+            
+            Parameters
+            ---------
+                affinity: numpy array of float (customers,customers) - the 
+                    dense affinity matrix
+                numNeighbors: int - the number of entries to keep in each row
+                blockSize: int - the number of rows processed at a time
+                
+            Returns
+            -------
+                sparseAffinity: scipy sparse csr matrix of float 
+                    (customers,customers) - the sparsified, symmetric affinity
+            """       
+
+    numCust = affinity.shape[0]
+    allRows = []
+    allCols = []
+    allValues = []
+    for startIndex in range(0,numCust,blockSize):
+        endIndex = min(startIndex + blockSize,numCust)
+        block = np.array(affinity[startIndex:endIndex,:],dtype=float)
+        blockRows, blockCols, blockValues = SelectTopNeighbors(block,np.arange(startIndex,endIndex),numNeighbors)
+        allRows.append(blockRows)
+        allCols.append(blockCols)
+        allValues.append(blockValues)
+    sparseAffinity = sparse.csr_matrix((np.concatenate(allValues),(np.concatenate(allRows),np.concatenate(allCols))),shape=(numCust,numCust))
+    sparseAffinity = sparseAffinity.maximum(sparseAffinity.T)
+    return sparseAffinity.tocsr()
+# End of SparsifyAffinity
+
+
+
+###############################################################################
+#
+#                                  SPClustering_MultK
+#
+
+def SPClustering_MultK(features,kVector,randomState=None,affinityMode='rbf',numNeighbors=DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack'):
+    """ This function performs spectral clustering on a window of timeseries 
+        data for every value of k in kVector, sharing the affinity matrix and
+        the spectral embedding between all values of k.  The Radial Basis 
+        Function ('rbf') affinity matrix and the Laplacian eigenvectors are 
+        computed once, for the largest valid k, and the labels for each k are
+        found by running k-means on the leading k eigenvectors.  This matches
+        the steps of SpectralClustering(n_clusters=k,affinity='rbf') for each
+        k without repeating the affinity and eigendecomposition.
+            
+            Parameters
+            ---------
+                features: numpy array of float (customers,measurments) - a 
+                    'window' of time series measurements where customers with
+                    missing data are removed.  Any NaN values in this matrix
+                    will cause the clustering to fail.  
+                kVector: numpy array of int - the values of k (number of 
+                    clusters) to use
+                randomState: int or None - seed for the eigensolver and k-means.
+                    The default of None uses the numpy global random state
+                affinityMode: str - 'rbf' for the dense RBF affinity matrix 
+                    or 'knn' for the sparse kNN RBF affinity matrix
+                numNeighbors: int - the number of neighbors for the 'knn' mode.
+                    The default is DEFAULT_NUM_NEIGHBORS
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg' (requires pyamg)
+                
+            Returns
+            -------
+                allClusterLabels:  list - the cluster labels for each value of
+                    k, in kVector order.  Each entry is a numpy array of int
+                    (customers) with labels 0 to k-1, or -1 if k was not smaller
+                    than the number of customers and the clustering was skipped
+            """       
+
+    numCust = features.shape[0]
+    validK = [k for k in kVector if k < numCust]
+    allClusterLabels = [-1] * len(kVector)
+    if len(validK) == 0:
+        return allClusterLabels
+    randomState = check_random_state(randomState)
+    if affinityMode == 'knn':
+        affinity = CreateKNNAffinity(features,numNeighbors)
+    else:
+        affinity = rbf_kernel(features,gamma=1.0)
+    maps = spectral_embedding(affinity,n_components=max(validK),eigen_solver=CheckEigenSolver(eigenSolver),random_state=randomState,drop_first=False)
+    for kCtr in range(0,len(kVector)):
+        k = kVector[kCtr]
+        if k >= numCust:
+            continue
+        _, clusterLabels, _ = k_means(maps[:,:k],k,random_state=randomState,n_init=10)
+        allClusterLabels[kCtr] = clusterLabels
+    return allClusterLabels
+# End of SPClustering_MultK
+
+
+
+###############################################################################
+#
+#                                  SPClustering_Sparse
+#
+
+def SPClustering_Sparse(affinity,kFinal,eigenSolver='arpack',randomState=None):
+    """ This function performs the final clustering on a sparse precomputed
+        affinity matrix, for example the sparsified co-association matrix from
+        SparsifyAffinity.  The settings match SPClustering_Precomp, but a
+        sparse eigensolver is used so the dense (customers,customers) matrix
+        is never needed in the clustering.
+            
+            Parameters
+            ---------
+                affinity: scipy sparse matrix of float (customers,customers) - 
+                    the symmetric precomputed affinity matrix
+                kFinal: int - the number of final clusters
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg' (requires pyamg)
+                randomState: int or None - seed passed to SpectralClustering
+                
+            Returns
+            -------
+                clusterLabels:  numpy array of int - The resulting cluster 
+                    label of each customer
+            """       
+
+    sp = SpectralClustering(n_clusters=kFinal,n_init=10,assign_labels='discretize',affinity='precomputed',eigen_solver=CheckEigenSolver(eigenSolver),random_state=randomState)
+    clusterLabels = sp.fit_predict(affinity)
+    return clusterLabels
+# End of SPClustering_Sparse
+
+
+
+###############################################################################
+#
+#                                  SPClustering_Precomp_MultK
+#
+
+def SPClustering_Precomp_MultK(affinity,kVector,eigenSolver='arpack',randomState=None):
+    """ This function performs the final clustering on a precomputed affinity
+        matrix for every value of k in kVector, sharing one spectral embedding
+        between all of them.  The Laplacian eigenvectors are computed once,
+        for the largest valid k (plus one, for the eigengap), and the labels
+        for each k are assigned by discretizing the leading k eigenvectors,
+        matching the settings of SPClustering_Precomp and SPClustering_Sparse.
+        The eigenvalues of the normalized Laplacian are also returned so the
+        eigengap can be used to compare the values of k.
+            
+            Parameters
+            ---------
+                affinity: ndarray or scipy sparse matrix of float, shape 
+                    (customers,customers) - the symmetric precomputed affinity
+                    matrix
+                kVector: list of int - the values of k (number of clusters)
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg' (requires pyamg)
+                randomState: int or None - seed for the eigensolver and the
+                    discretization
+                
+            Returns
+            -------
+                allClusterLabels: list - the cluster labels for each value of
+                    k, in kVector order.  Each entry is a numpy array of int 
+                    (customers), or -1 if k was not smaller than the number of
+                    customers and the clustering was skipped
+                eigenvalues: numpy array of float - the smallest eigenvalues
+                    of the normalized Laplacian in ascending order, one more
+                    than the largest valid k when possible
+            """       
+
+    numCust = affinity.shape[0]
+    validK = [k for k in kVector if k < numCust]
+    allClusterLabels = [-1] * len(kVector)
+    if len(validK) == 0:
+        return allClusterLabels, np.array([])
+    randomState = check_random_state(randomState)
+    numComponents = min(max(validK) + 1, numCust - 1)
+    maps = spectral_embedding(affinity,n_components=numComponents,eigen_solver=CheckEigenSolver(eigenSolver),random_state=randomState,drop_first=False)
+    # spectral_embedding returns the Laplacian eigenvectors scaled by the 
+    #   inverse square root of the degree, so the eigenvalues are recovered 
+    #   from the Rayleigh quotient of the rescaled vectors
+    laplacian, degreeSqrt = csgraph.laplacian(affinity,normed=True,return_diag=True)
+    eigenvectors = maps * degreeSqrt[:,np.newaxis]
+    eigenvectors = eigenvectors / np.linalg.norm(eigenvectors,axis=0)
+    eigenvalues = np.sum(eigenvectors * (laplacian @ eigenvectors),axis=0)
+    for kCtr in range(0,len(kVector)):
+        k = kVector[kCtr]
+        if k >= numCust:
+            continue
+        allClusterLabels[kCtr] = DiscretizeEmbedding(maps[:,:k],randomState)
+    return allClusterLabels, np.asarray(eigenvalues).ravel()
+# End of SPClustering_Precomp_MultK
+
+
+
+###############################################################################
+#
+#                                  DiscretizeEmbedding
+#
+
+def DiscretizeEmbedding(vectors,randomState=None,maxSvdRestarts=30,numIterMax=20):
+    """ This function assigns cluster labels from a spectral embedding by 
+        searching for the discrete partition matrix closest to the embedding
+        (Yu and Shi, "Multiclass Spectral Clustering", 2003).  This is the 
+        same algorithm and random number usage as the assign_labels=
+        'discretize' option of sklearn's SpectralClustering, which is not 
+        part of sklearn's public API, so the labels match SPClustering_Precomp
+        and SPClustering_Sparse.
+            
+            Parameters
+            ---------
+                vectors: numpy array of float (customers,k) - the spectral
+                    embedding, one column per cluster
+                randomState: int, numpy RandomState, or None - seed for the
+                    initial rotation
+                maxSvdRestarts: int - the number of times the search is 
+                    restarted if the SVD does not converge
+                numIterMax: int - the maximum number of iterations of the 
+                    rotation and partition search
+                
+            Returns
+            -------
+                clusterLabels: numpy array of int (customers) - the cluster 
+                    label of each customer
+            """       
+
+    randomState = check_random_state(randomState)
+    vectors = np.array(vectors,dtype=float)
+    numSamples, numComponents = vectors.shape
+    # Scale each eigenvector to the length of a vector of ones, pointing in the negative direction of its first element
+    vectors = (vectors / np.linalg.norm(vectors,axis=0)[np.newaxis,:]) * np.sqrt(numSamples)
+    vectors = vectors * np.where(vectors[0,:] != 0,-np.sign(vectors[0,:]),1)[np.newaxis,:]
+    # Normalize the rows so the samples lie on the unit hypersphere
+    vectors = vectors / np.sqrt(np.sum(vectors**2,axis=1))[:,np.newaxis]
+    svdRestarts = 0
+    convergedFlag = False
+    while (svdRestarts < maxSvdRestarts) and not convergedFlag:
+        # The rotation starts from a random row and the rows most orthogonal to the rows already chosen
+        rotation = np.zeros((numComponents,numComponents))
+        rotation[:,0] = vectors[randomState.randint(numSamples),:]
+        orthogonality = np.zeros(numSamples)
+        for compCtr in range(1,numComponents):
+            orthogonality += np.abs(vectors @ rotation[:,compCtr-1])
+            rotation[:,compCtr] = vectors[orthogonality.argmin(),:]
+        lastObjective = 0.0
+        numIter = 0
+        while not convergedFlag:
+            numIter = numIter + 1
+            clusterLabels = np.argmax(vectors @ rotation,axis=1)
+            # The partition matrix transposed times the vectors, the sum of the rows in each cluster
+            partitionSums = np.zeros((numComponents,numComponents))
+            np.add.at(partitionSums,clusterLabels,vectors)
+            try:
+                U, S, Vh = np.linalg.svd(partitionSums)
+            except np.linalg.LinAlgError:
+                svdRestarts = svdRestarts + 1
+                print('SVD did not converge, randomizing and trying again')
+                break
+            ncutValue = 2.0 * (numSamples - np.sum(S))
+            if (abs(ncutValue - lastObjective) < np.finfo(float).eps) or (numIter > numIterMax):
+                convergedFlag = True
+            else:
+                lastObjective = ncutValue
+                rotation = Vh.T @ U.T
+    if not convergedFlag:
+        raise np.linalg.LinAlgError('SVD did not converge')
+    return clusterLabels
+# End of DiscretizeEmbedding
+
+
+
+###############################################################################
+#
+#                                  NystromEmbedding
+#
+
+def NystromEmbedding(affinityColumns,landmarkIndices,numComponents):
+    """ This function approximates the spectral embedding of a symmetric 
+        affinity matrix from only the columns of a set of landmark customers,
+        using the Nystrom method for the normalized affinity (Fowlkes et al., 
+        "Spectral Grouping Using the Nystrom Method", 2004).  The affinity is
+        approximated as C A^+ C', where C is the (customers,landmarks) block 
+        and A the (landmarks,landmarks) block, which gives approximate degrees
+        and orthogonal approximate eigenvectors from eigendecompositions of 
+        (landmarks,landmarks) matrices only.  The embedding is scaled in the
+        same way as sklearn's spectral_embedding.
+            
+            Parameters
+            ---------
+                affinityColumns: numpy array of float (customers,landmarks) -
+                    the affinity between every customer and each landmark
+                landmarkIndices: numpy array of int (landmarks) - the row of
+                    affinityColumns belonging to each landmark
+                numComponents: int - the number of eigenvectors to return
+                
+            Returns
+            -------
+                maps: numpy array of float (customers,numComponents) - the 
+                    approximate spectral embedding
+                eigenvalues: numpy array of float (numComponents) - the 
+                    approximate smallest eigenvalues of the normalized 
+                    Laplacian, in ascending order
+            """       
+
+    affinityColumns = np.asarray(affinityColumns,dtype=float)
+    landmarkBlock = affinityColumns[landmarkIndices,:]
+    landmarkBlock = 0.5 * (landmarkBlock + landmarkBlock.T)
+    # Approximate degrees, the row sums of C A^+ C'
+    blockValues, blockVectors = np.linalg.eigh(landmarkBlock)
+    keep = blockValues > (np.max(np.abs(blockValues)) * 1e-10)
+    blockPinv = (blockVectors[:,keep] / blockValues[keep]) @ blockVectors[:,keep].T
+    degrees = affinityColumns @ (blockPinv @ np.sum(affinityColumns,axis=0))
+    degrees = np.maximum(degrees,np.finfo(float).eps)
+    degreeInvSqrt = 1 / np.sqrt(degrees)
+    # Normalize the columns, D^-1/2 C D_L^-1/2, and orthogonalize (one-shot Nystrom)
+    normColumns = affinityColumns * degreeInvSqrt[:,np.newaxis] * degreeInvSqrt[landmarkIndices][np.newaxis,:]
+    normBlock = normColumns[landmarkIndices,:]
+    normBlock = 0.5 * (normBlock + normBlock.T)
+    blockValues, blockVectors = np.linalg.eigh(normBlock)
+    keep = blockValues > (np.max(np.abs(blockValues)) * 1e-10)
+    blockInvSqrt = (blockVectors[:,keep] / np.sqrt(blockValues[keep])) @ blockVectors[:,keep].T
+    projected = normColumns @ blockInvSqrt
+    innerMatrix = projected.T @ projected
+    innerValues, innerVectors = np.linalg.eigh(0.5 * (innerMatrix + innerMatrix.T))
+    # The largest eigenvalues of the normalized affinity are the smallest of the Laplacian
+    order = np.argsort(innerValues)[::-1][:numComponents]
+    innerValues = np.maximum(innerValues[order],np.finfo(float).eps)
+    eigenvectors = (projected @ innerVectors[:,order]) / np.sqrt(innerValues)[np.newaxis,:]
+    maps = eigenvectors * degreeInvSqrt[:,np.newaxis]
+    return maps, 1 - innerValues
+# End of NystromEmbedding
+
+
+
+###############################################################################
+#
+#                                  SPClustering_Nystrom
+#
+
+def SPClustering_Nystrom(affinityColumns,landmarkIndices,kFinal,randomState=None):
+    """ This function performs the final clustering from the Nystrom 
+        approximation of the spectral embedding (see NystromEmbedding), 
+        assigning the labels by discretization as in SPClustering_Precomp.
+        Only the (customers,landmarks) block of the affinity is needed.
+            
+            Parameters
+            ---------
+                affinityColumns: numpy array of float (customers,landmarks) -
+                    the affinity between every customer and each landmark
+                landmarkIndices: numpy array of int (landmarks) - the row of
+                    affinityColumns belonging to each landmark
+                kFinal: int - the number of final clusters
+                randomState: int or None - seed for the discretization
+                
+            Returns
+            -------
+                clusterLabels:  numpy array of int - The resulting cluster 
+                    label of each customer
+            """       
+
+    maps, _ = NystromEmbedding(affinityColumns,landmarkIndices,kFinal)
+    return DiscretizeEmbedding(maps,randomState)
+# End of SPClustering_Nystrom
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+
+ WindowCacheUtils.py
+
+This file contains an on-disk cache of the spectral clustering results for 
+windows of voltage data.  The CA ensemble phase identification and the online
+phase changepoint detection both cluster the same windows of the same 
+customers for several values of k, and every rerun with different final 
+settings repeats that work.  Each entry is the label vector for one window and
+one value of k, keyed by a hash of the window data, the customers in the 
+window, k, and the clustering settings, so any function clustering an 
+unchanged window with the same settings reuses the stored labels.  The labels
+are stored with the smallest integer type that holds them, and the cache is
+kept under a size limit by removing the least recently used entries.
+
+The cache is a dict, so it can be passed to worker processes.  Entries 
+written by any process are visible to all of them, the hit and miss counts 
+and the cache size are only tracked in the process that uses the dict.  Each 
+worker only sees the entries it wrote itself, so the process that owns the 
+pool calls CheckWindowCacheSize after each batch to enforce the size limit.
+
+    Functions:
+        -  CreateWindowCache
+        -  GetWindowCacheKey
+        -  LoadCachedLabels
+        -  SaveCachedLabels
+        -  EvictWindowCache
+        -  CheckWindowCacheSize
+        -  SPClustering_MultK_Cached
+
+"""
+
+
+# Import - Python Libraries
+import hashlib
+import os
+import numpy as np
+from pathlib import Path
+
+# Import - Custom Libraries
+if __package__ in [None, '']:
+    import SpectralUtils
+else:
+    from . import SpectralUtils
+
+
+
+##############################################################################
+#
+#       CreateWindowCache
+#
+
+def CreateWindowCache(cachePath,maxSizeMB=1024):
+    """ This function creates, or opens an existing, window clustering cache
+        in the directory cachePath
+
+            Parameters
+            ---------
+                cachePath: str or Path - the directory holding the cache 
+                    entries, created if it does not exist
+                maxSizeMB: float - the maximum size of the cache on disk in 
+                    MB.  The least recently used entries are removed when it
+                    is exceeded
+
+            Returns
+            -------
+                windowCache: dict - the cache, passed to the clustering 
+                    functions
+            """
+
+    cachePath = Path(cachePath)
+    cachePath.mkdir(parents=True,exist_ok=True)
+    windowCache = {'cachePath':cachePath,
+                   'maxBytes':int(maxSizeMB * 1024**2),
+                   'currentBytes':sum([entry.stat().st_size for entry in os.scandir(cachePath) if entry.name.endswith('.npy')]),
+                   'hits':0,
+                   'misses':0}
+    return windowCache
+# End of CreateWindowCache
+
+
+
+##############################################################################
+#
+#       GetWindowCacheKey
+#
+
+def GetWindowCacheKey(features,windowIDs,k,settings):
+    """ This function creates the cache key for the clustering of one window
+        for one value of k
+
+            Parameters
+            ---------
+                features: numpy array of float (customers,measurements) - the
+                    window which is clustered
+                windowIDs: list or numpy array of str (customers) - the 
+                    customers in the window, in row order
+                k: int - the number of clusters
+                settings: tuple - the remaining settings which change the 
+                    clustering result (random seed, affinity, etc.)
+
+            Returns
+            -------
+                key: str - a SHA-256 hex digest
+            """
+
+    features = np.ascontiguousarray(features,dtype=np.float64)
+    keyHash = hashlib.sha256()
+    keyHash.update(str(features.shape).encode())
+    keyHash.update(features.tobytes())
+    keyHash.update('\x1f'.join([str(custID) for custID in windowIDs]).encode())
+    keyHash.update(repr((int(k),) + tuple(settings)).encode())
+    return keyHash.hexdigest()
+# End of GetWindowCacheKey
+
+
+
+##############################################################################
+#
+#       LoadCachedLabels
+#
+
+def LoadCachedLabels(windowCache,key):
+    """ This function returns the stored cluster labels for a key and marks
+        the entry as recently used
+
+            Parameters
+            ---------
+                windowCache: dict - the cache from CreateWindowCache
+                key: str - the key from GetWindowCacheKey
+
+            Returns
+            -------
+                clusterLabels: numpy array of int - the cluster labels, or -1 
+                    if the key is not in the cache
+            """
+
+    entryPath = Path(windowCache['cachePath'],key + '.npy')
+    try:
+        clusterLabels = np.load(entryPath)
+    except (FileNotFoundError,ValueError,OSError):
+        # Missing, or removed or partially written by another process
+        windowCache['misses'] = windowCache['misses'] + 1
+        return -1
+    try:
+        os.utime(entryPath)
+    except OSError:
+        pass
+    windowCache['hits'] = windowCache['hits'] + 1
+    return clusterLabels.astype(int)
+# End of LoadCachedLabels
+
+
+
+##############################################################################
+#
+#       SaveCachedLabels
+#
+
+def SaveCachedLabels(windowCache,key,clusterLabels):
+    """ This function stores the cluster labels for a key, using the smallest
+        unsigned integer type that holds the labels.  The file is written 
+        under a temporary name and renamed so other processes never read a
+        partial entry.
+
+            Parameters
+            ---------
+                windowCache: dict - the cache from CreateWindowCache
+                key: str - the key from GetWindowCacheKey
+                clusterLabels: numpy array of int - the cluster labels
+
+            Returns
+            -------
+                None
+            """
+
+    clusterLabels = np.asarray(clusterLabels)
+    labelType = np.min_scalar_type(max(int(np.max(clusterLabels)),0)) if len(clusterLabels) != 0 else np.uint8
+    entryPath = Path(windowCache['cachePath'],key + '.npy')
+    tempPath = Path(windowCache['cachePath'],key + '.' + str(os.getpid()) + '.tmp')
+    with open(tempPath,'wb') as file:
+        np.save(file,clusterLabels.astype(labelType))
+    os.replace(tempPath,entryPath)
+    windowCache['currentBytes'] = windowCache['currentBytes'] + entryPath.stat().st_size
+    if windowCache['currentBytes'] > windowCache['maxBytes']:
+        EvictWindowCache(windowCache)
+# End of SaveCachedLabels
+
+
+
+##############################################################################
+#
+#       EvictWindowCache
+#
+
+def EvictWindowCache(windowCache,targetFraction=0.9):
+    """ This function removes the least recently used entries until the 
+        cache is below targetFraction of its maximum size.  The directory is
+        scanned, so entries written by other processes are included.
+
+            Parameters
+            ---------
+                windowCache: dict - the cache from CreateWindowCache
+                targetFraction: float - the fraction of the maximum size to 
+                    reduce the cache to
+
+            Returns
+            -------
+                numRemoved: int - the number of entries removed
+            """
+
+    allEntries = []
+    for entry in os.scandir(windowCache['cachePath']):
+        if entry.name.endswith('.npy'):
+            try:
+                entryStat = entry.stat()
+            except FileNotFoundError:
+                continue
+            allEntries.append((entryStat.st_mtime,entryStat.st_size,entry.path))
+    allEntries.sort()
+    currentBytes = sum([entry[1] for entry in allEntries])
+    targetBytes = windowCache['maxBytes'] * targetFraction
+    numRemoved = 0
+    for entryTime, entrySize, entryPath in allEntries:
+        if currentBytes <= targetBytes:
+            break
+        try:
+            os.remove(entryPath)
+        except FileNotFoundError:
+            pass
+        currentBytes = currentBytes - entrySize
+        numRemoved = numRemoved + 1
+    windowCache['currentBytes'] = currentBytes
+    return numRemoved
+# End of EvictWindowCache
+
+
+
+##############################################################################
+#
+#       CheckWindowCacheSize
+#
+
+def CheckWindowCacheSize(windowCache):
+    """ This function updates the cache size from a scan of the directory and
+        removes the least recently used entries if it is over the size limit.
+        The entries written by worker processes are not counted in the 
+        windowCache dict of the calling process, so this is called by the 
+        process which owns the pool after each batch of windows.
+
+            Parameters
+            ---------
+                windowCache: dict - the cache from CreateWindowCache
+
+            Returns
+            -------
+                numRemoved: int - the number of entries removed
+            """
+
+    currentBytes = 0
+    for entry in os.scandir(windowCache['cachePath']):
+        if entry.name.endswith('.npy'):
+            try:
+                currentBytes = currentBytes + entry.stat().st_size
+            except FileNotFoundError:
+                continue
+    windowCache['currentBytes'] = currentBytes
+    if currentBytes > windowCache['maxBytes']:
+        return EvictWindowCache(windowCache)
+    return 0
+# End of CheckWindowCacheSize
+
+
+
+##############################################################################
+#
+#       SPClustering_MultK_Cached
+#
+
+def SPClustering_MultK_Cached(features,kVector,windowCache,windowIDs=-1,randomState=None,affinityMode='rbf',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack'):
+    """ This function returns the same result as SpectralUtils.SPClustering_MultK
+        but first looks up each value of k in the window cache.  Only the 
+        values of k which are not in the cache are clustered, sharing the 
+        spectral embedding as in SPClustering_MultK, and the results are 
+        stored.  Entries are per value of k, so callers using different 
+        kVectors share the values of k they have in common.  A cached entry 
+        holds the labels from the first time that window was clustered, so 
+        with a random seed the labels can differ from an uncached run which 
+        used a different kVector.  A numpy RandomState cannot be part of the
+        key, in that case the cache is not used.
+
+            Parameters
+            ---------
+                features: numpy array of float (customers,measurements) - the
+                    window to cluster
+                kVector: list of int - the values of k
+                windowCache: dict - the cache from CreateWindowCache, or -1 to
+                    not use a cache
+                windowIDs: list or numpy array of str (customers) - the 
+                    customers in the window.  The default (-1) uses the row 
+                    indices
+                randomState: int or None - see SPClustering_MultK
+                affinityMode: str - see SPClustering_MultK
+                numNeighbors: int - see SPClustering_MultK
+                eigenSolver: str - see SPClustering_MultK
+
+            Returns
+            -------
+                allClusterLabels:  list - see SPClustering_MultK
+            """
+
+    if (type(windowCache) == int) or not ((randomState is None) or isinstance(randomState,(int,np.integer))):
+        return SpectralUtils.SPClustering_MultK(features,kVector,randomState,affinityMode,numNeighbors,eigenSolver)
+    numCust = features.shape[0]
+    if type(windowIDs) == int:
+        windowIDs = np.arange(numCust)
+    if randomState is None:
+        seedSetting = 'None'
+    else:
+        seedSetting = int(randomState)
+    # The number of neighbors only changes the result of the 'knn' affinity
+    if affinityMode == 'knn':
+        settings = (seedSetting,affinityMode,int(numNeighbors),eigenSolver)
+    else:
+        settings = (seedSetting,affinityMode,eigenSolver)
+    allClusterLabels = [-1] * len(kVector)
+    allKeys = [-1] * len(kVector)
+    missingK = []
+    for kCtr in range(0,len(kVector)):
+        if kVector[kCtr] >= numCust:
+            continue
+        allKeys[kCtr] = GetWindowCacheKey(features,windowIDs,kVector[kCtr],settings)
+        allClusterLabels[kCtr] = LoadCachedLabels(windowCache,allKeys[kCtr])
+        if type(allClusterLabels[kCtr]) == int:
+            missingK.append(kCtr)
+    if len(missingK) != 0:
+        missingLabels = SpectralUtils.SPClustering_MultK(features,[kVector[kCtr] for kCtr in missingK],randomState,affinityMode,numNeighbors,eigenSolver)
+        for kCtr, clusterLabels in zip(missingK,missingLabels):
+            allClusterLabels[kCtr] = clusterLabels
+            SaveCachedLabels(windowCache,allKeys[kCtr],clusterLabels)
+    return allClusterLabels
+# End of SPClustering_MultK_Cached
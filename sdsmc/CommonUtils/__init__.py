@@ -0,0 +1,12 @@
+if __package__ in [None, '']:
+    import SpectralUtils
+    import PreprocessingUtils
+    import ProfilingUtils
+    import WindowCacheUtils
+    import DataIOUtils
+else:
+    from . import SpectralUtils
+    from . import PreprocessingUtils
+    from . import ProfilingUtils
+    from . import WindowCacheUtils
+    from . import DataIOUtils
@@ -33,6 +33,7 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
 # Import Statements
+import sys
 import numpy as np
 import warnings
 from copy import deepcopy
@@ -46,6 +47,16 @@ import haversine as hs
 from haversine import Unit
 import pandas as pd
 
+# Import - Custom Libraries
+if __package__ in [None, '']:
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+else:
+    from ..CommonUtils import PreprocessingUtils
+
+# The base voltages supported by ConvertToPerUnit_Voltage
+VOLTAGE_LEVELS = [120,240,7200]
+
 
 ###############################################################################
 #
@@ -73,29 +84,8 @@ def ConvertToPerUnit_Voltage(timeseries):
                 timeseries converted into per unit representation
         '''
     
-    voltageMismatchThresh = .8
-    voltageLevels = np.array([120,240,7200])
-    voltagePU = np.zeros((timeseries.shape),dtype=float)
-    dataLength = timeseries.shape[0]
-    
-    for custCtr in range(0, timeseries.shape[1]):
-        currentCust = timeseries[:,custCtr]
-        # Check for the case a customer only has NaN values in the timeseries
-        if np.sum(np.isnan(currentCust)) == dataLength:
-            print('Warning!  Customer index ' + str(custCtr) + ' only had NaN values in the timeseries. ')
-            voltagePU[:,custCtr] = currentCust
-            continue
-        else:
-            meanValue = np.round(np.nanmean(currentCust),decimals=0)
-            vDiff = np.abs(voltageLevels - meanValue)
-            index = np.argmin(vDiff)
-            
-            # Check for the case where the correct voltage level is not listed
-            if np.abs(vDiff[index]) > (voltageMismatchThresh*voltageLevels[index]):
-                print('Error!  Customer# ' + str(custCtr) + 'has a mean voltage value of ' + str(meanValue) + '.  This voltage level is not supported in the function.  Please add this voltage level to the source code of the function')
-                return (-1)
-            voltagePU[:,custCtr] = np.divide(currentCust, voltageLevels[index])
-    return voltagePU
+    # The base voltage of every customer is found at once, see CommonUtils.PreprocessingUtils
+    return PreprocessingUtils.ConvertToPerUnit_Voltage(timeseries,voltageLevels=VOLTAGE_LEVELS)
 # End of ConvertToPerUnit_Voltage
 
 
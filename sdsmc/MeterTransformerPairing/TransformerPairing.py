@@ -46,9 +46,16 @@ import pandas as pd
 if __package__ is None or __package__ == '':
     import M2TUtils
     import M2TFuncs
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+    from CommonUtils import ProfilingUtils
+    from CommonUtils import DataIOUtils
 else:
     from . import M2TUtils
     from . import M2TFuncs
+    from ..CommonUtils import PreprocessingUtils
+    from ..CommonUtils import ProfilingUtils
+    from ..CommonUtils import DataIOUtils
  
 ###############################################################################
 
@@ -57,11 +64,17 @@ else:
 #
 #                           transformerPairing()
 #
-def run( voltageData_AMI: str, realPowerData_AMI: str, reactivePowerData_AMI: str, customerIDs_AMI: str, transLabelsErrors_csv: str, transLabelsTrue_csv: str, saveResultsPath: PosixPath, useTrueLabels: bool = True, ):
+def run( voltageData_AMI: str, realPowerData_AMI: str, reactivePowerData_AMI: str, customerIDs_AMI: str, transLabelsErrors_csv: str, transLabelsTrue_csv: str, saveResultsPath: PosixPath, useTrueLabels: bool = True, profilePath: str = -1, profilerHook = -1 ):
     """   This function is a wrapper for the MeterToTransPairingScript.py file.
 
           Note that the indexing of all variables above should match in the customer index, i.e. custIDInput[0], transLabelsInput[0,0], voltageInput[:,0], pDataInput[:,0], and qDataInput[:,0] should all be the same customer
 
+          Each input file may also be a .npy/.npz file, which is memory
+          mapped, or a Parquet or Arrow IPC (.arrow/.feather) file, chosen by
+          the file extension.  See DataIOUtils.ConvertInputFile to convert
+          the CSV files once.  Parquet and Arrow IPC require the pyarrow
+          package.
+
           Parameters
           ---------
             voltageData_AMI: path to CSV of float (measurements,customers) - the raw voltage AMI measurements for each customer in Volts
@@ -74,6 +87,14 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, reactivePowerData_AMI: st
             saveResultsPath: Pathlib Path
             useTrueLabels: boolean value
 
+            profilePath: str or Path - if supplied, the wall time, CPU time,
+                peak memory, and array sizes of each stage of the run are
+                written to this JSON file, see CommonUtils/ProfilingUtils.py.
+                The default (-1) does not profile the run
+            profilerHook: 'cprofile' or a profiler object with enable/disable
+                or start/stop methods, run for the whole run when profilePath
+                is supplied.  cProfile statistics are written next to the 
+                JSON file with the suffix .prof
           Returns
             Output files are prefixed with "outputs_"
             ---------
@@ -83,45 +104,59 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, reactivePowerData_AMI: st
             outputs_RankedFlaggedTransformers: CSV - TBD
             outputs_ChangedCustomers_M2T: CSV - TBD
     """
+    if type(profilePath) != int:
+        profile = ProfilingUtils.CreateRunProfile('TransformerPairing',profilerHook)
+    else:
+        profile = -1
+
     ###############################################################################
     # Data pre-processing
     # Convert CSV input files to numpy arrays
     # Open customerIDs file -> List
-    voltageInput = M2TUtils.ConvertCSVtoNPY( voltageData_AMI )
-    pDataInput = M2TUtils.ConvertCSVtoNPY( realPowerData_AMI )
-    qDataInput = M2TUtils.ConvertCSVtoNPY( reactivePowerData_AMI )
-    with open(customerIDs_AMI, 'r') as file:
-        custIDInput = [x.rstrip() for x in file]
 
-    transLabelsErrors = M2TUtils.ConvertCSVtoNPY( transLabelsErrors_csv )
+    with ProfilingUtils.ProfileStage(profile,'ingest') as stage:
+        voltageInput = DataIOUtils.LoadArray( voltageData_AMI )
+        pDataInput = DataIOUtils.LoadArray( realPowerData_AMI )
+        qDataInput = DataIOUtils.LoadArray( reactivePowerData_AMI )
+        custIDInput = DataIOUtils.LoadIDs(customerIDs_AMI)
+
+        transLabelsErrors = DataIOUtils.LoadArray( transLabelsErrors_csv )
 
-    if useTrueLabels:
-        transLabelsTrue = M2TUtils.ConvertCSVtoNPY(transLabelsTrue_csv)
+        if useTrueLabels:
+            transLabelsTrue = DataIOUtils.LoadArray(transLabelsTrue_csv)
+        ProfilingUtils.RecordArraySizes(stage,voltageInput=voltageInput,pDataInput=pDataInput,qDataInput=qDataInput)
 
     ###############################################################################
 
     ###############################################################################
     # Data pre-processing
     # Convert the raw voltage measurements into per unit and difference (delta voltage) representation
-    vPU = M2TUtils.ConvertToPerUnit_Voltage(voltageInput)
-    vDV = M2TUtils.CalcDeltaVoltage(vPU)
+
+    with ProfilingUtils.ProfileStage(profile,'preprocessing') as stage:
+        vDV = PreprocessingUtils.PreprocessVoltage(voltageInput,filterFlag=False,voltageLevels=M2TUtils.VOLTAGE_LEVELS)[0]
+        ProfilingUtils.RecordArraySizes(stage,vDV=vDV)
 
     ##############################################################################
     #
     #        Error Flagging Section - Correlation Coefficient Analysis
 
-    # Calculate CC Matrix
-    ccMatrix,noVotesIndex,noVotesIDs = M2TUtils.CC_EnsMedian(vDV,windowSize=384,custID=custIDInput)
+    with ProfilingUtils.ProfileStage(profile,'correlation') as stage:
+        # Calculate CC Matrix
+        ccMatrix,noVotesIndex,noVotesIDs = M2TUtils.CC_EnsMedian(vDV,windowSize=384,custID=custIDInput)
+
+        # The function CC_EnsMedian takes the median CC across windows in the dataset. 
+        # This is mainly done to deal with the issue of missing measurements in the dataset
+        # If your data does not have missing measurements you could use numpy.corrcoef directly
+        ProfilingUtils.RecordArraySizes(stage,ccMatrix=ccMatrix)
 
-    # The function CC_EnsMedian takes the median CC across windows in the dataset. 
-    # This is mainly done to deal with the issue of missing measurements in the dataset
-    # If your data does not have missing measurements you could use numpy.corrcoef directly
+    with ProfilingUtils.ProfileStage(profile,'flagging') as stage:
+        # Do a sweep of possible CC Thresholds and rank the flagged results
+        notMemberVector = [0.25,0.26,0.27,0.28,0.29,0.30,0.31,0.32,0.33,0.34,0.35,0.36,0.37,0.38,0.39,0.4,0.41,0.42,0.43,0.44,0.45,0.46,0.47,0.48,0.49,0.50,0.51,0.52,0.53,0.54,0.55,0.56,0.57,0.58,0.59,0.60,0.61,0.62,0.63,0.64,0.65,0.66,0.67,0.68,0.69,0.70,0.71,0.72,0.73,0.74,0.75,0.76,0.78,0.79,0.80,0.81,0.82,0.83,0.84,0.85,0.86,0.87,0.88,0.90,0.91]
+        allFlaggedTrans, allNumFlagged, rankedFlaggedTrans, rankedTransThresholds = M2TFuncs.RankFlaggingBySweepingThreshold(transLabelsErrors,notMemberVector,ccMatrix)
 
-    # Do a sweep of possible CC Thresholds and rank the flagged results
-    notMemberVector = [0.25,0.26,0.27,0.28,0.29,0.30,0.31,0.32,0.33,0.34,0.35,0.36,0.37,0.38,0.39,0.4,0.41,0.42,0.43,0.44,0.45,0.46,0.47,0.48,0.49,0.50,0.51,0.52,0.53,0.54,0.55,0.56,0.57,0.58,0.59,0.60,0.61,0.62,0.63,0.64,0.65,0.66,0.67,0.68,0.69,0.70,0.71,0.72,0.73,0.74,0.75,0.76,0.78,0.79,0.80,0.81,0.82,0.83,0.84,0.85,0.86,0.87,0.88,0.90,0.91]
-    allFlaggedTrans, allNumFlagged, rankedFlaggedTrans, rankedTransThresholds = M2TFuncs.RankFlaggingBySweepingThreshold(transLabelsErrors,notMemberVector,ccMatrix)
-    # Plot the number of flagged transformers for all threshold values
-    M2TUtils.PlotNumFlaggedTrans_ThresholdSweep(notMemberVector,allNumFlagged,transLabelsErrors,savePath=saveResultsPath)
+    with ProfilingUtils.ProfileStage(profile,'plotting') as stage:
+        # Plot the number of flagged transformers for all threshold values
+        M2TUtils.PlotNumFlaggedTrans_ThresholdSweep(notMemberVector,allNumFlagged,transLabelsErrors,savePath=saveResultsPath)
 
     # The main output from this Error Flagging section is rankedFlaggedTrans which
     # contains the list of flagged transformers ranked by correlation coefficient.
@@ -133,25 +168,29 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, reactivePowerData_AMI: st
     #             Transformer Assignment Section - Linear Regression Steps
     #
 
-    # Calculate the pairwise linear regression
-    #print('Starting regression calculation')
-    r2Affinity,rDist,xDist,regRDistIndiv,regXDistIndiv,mseMatrix = M2TUtils.ParamEst_LinearRegression(voltageInput,pDataInput,qDataInput,savePath=saveResultsPath)
+    with ProfilingUtils.ProfileStage(profile,'regression') as stage:
+        # Calculate the pairwise linear regression
+        #print('Starting regression calculation')
+        r2Affinity,rDist,xDist,regRDistIndiv,regXDistIndiv,mseMatrix = M2TUtils.ParamEst_LinearRegression(voltageInput,pDataInput,qDataInput,savePath=saveResultsPath)
+        ProfilingUtils.RecordArraySizes(stage,mseMatrix=mseMatrix,xDist=xDist)
 
-    additiveFactor = 0.02
-    minMSE, mseThreshold = M2TUtils.FindMinMSE(mseMatrix,additiveFactor)
-    #This sets the mse threshold based on adding a small amount to the smallest MSE value in the pairwise MSE matrix
-    # Alternatively you could set the mse threshold manually
-    #mseThreshold = 0.3
+    with ProfilingUtils.ProfileStage(profile,'assignment') as stage:
+        additiveFactor = 0.02
+        minMSE, mseThreshold = M2TUtils.FindMinMSE(mseMatrix,additiveFactor)
+        #This sets the mse threshold based on adding a small amount to the smallest MSE value in the pairwise MSE matrix
+        # Alternatively you could set the mse threshold manually
+        #mseThreshold = 0.3
 
-    # Plot CDF for adjusted reactance distance
-    replacementValue = np.max(np.max(xDist))
-    xDistAdjusted = M2TFuncs.AdjustDistFromThreshold(mseMatrix,xDist,mseThreshold, replacementValue)
+        # Plot CDF for adjusted reactance distance
+        replacementValue = np.max(np.max(xDist))
+        xDistAdjusted = M2TFuncs.AdjustDistFromThreshold(mseMatrix,xDist,mseThreshold, replacementValue)
 
-    # Select a particular set of ranked results using a correlation coefficient threshold
-    notMemberThreshold=0.7
-    flaggingIndex = np.where(np.array(notMemberVector)==notMemberThreshold)[0][0]
-    flaggedTrans = allFlaggedTrans[flaggingIndex]
-    predictedTransLabels,allChangedIndices,allChangedOrgTrans,allChangedPredTrans = M2TFuncs.CorrectFlaggedTransErrors(flaggedTrans,transLabelsErrors,custIDInput,ccMatrix,notMemberThreshold, mseMatrix,xDistAdjusted,reactanceThreshold=0.046)
+        # Select a particular set of ranked results using a correlation coefficient threshold
+        notMemberThreshold=0.7
+        flaggingIndex = np.where(np.array(notMemberVector)==notMemberThreshold)[0][0]
+        flaggedTrans = allFlaggedTrans[flaggingIndex]
+        predictedTransLabels,allChangedIndices,allChangedOrgTrans,allChangedPredTrans = M2TFuncs.CorrectFlaggedTransErrors(flaggedTrans,transLabelsErrors,custIDInput,ccMatrix,notMemberThreshold, mseMatrix,xDistAdjusted,reactanceThreshold=0.046)
+        ProfilingUtils.RecordArraySizes(stage,predictedTransLabels=predictedTransLabels)
 
 
     # predictedTransLabels: numpy array of int (1,customers) - the predicted labels 
@@ -171,36 +210,40 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, reactivePowerData_AMI: st
     # incorrectPairedIDs lists the customers from incorrect trans which allows us to define 
     # Customer Pairing Accuracy which is the number of customers in the correct groupings, i.e. no customers added or omitted from the grouping
 
-    if useTrueLabels:
-        M2TUtils.ImprovementAnalysis(saveResultsPath, predictedTransLabels, transLabelsErrors, transLabelsTrue, custIDInput)
+    with ProfilingUtils.ProfileStage(profile,'scoring') as stage:
+        if useTrueLabels:
+            M2TUtils.ImprovementAnalysis(saveResultsPath, predictedTransLabels, transLabelsErrors, transLabelsTrue, custIDInput)
+
+    with ProfilingUtils.ProfileStage(profile,'output') as stage:
+        # Write output to a csv file
+        if useTrueLabels:
+            df = pd.DataFrame()
+            df['customer ID'] = custIDInput
+            df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
+            df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
+            df['Actual Transformer Labels'] = transLabelsTrue[0,:]
+            df.to_csv(Path(saveResultsPath,'outputs_PredictedTransformerLabels.csv'))
+        else:
+            df = pd.DataFrame()
+            df['customer ID'] = custIDInput
+            df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
+            df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
+            df.to_csv(Path(saveResultsPath,'outputs_PredictedTransformerLabels.csv'))
+        #print('Predicted transformer labels written to outputs_PredictedTransformerLabels.csv')
 
-    # Write output to a csv file
-    if useTrueLabels:
         df = pd.DataFrame()
-        df['customer ID'] = custIDInput
-        df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
-        df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
-        df['Actual Transformer Labels'] = transLabelsTrue[0,:]
-        df.to_csv(Path(saveResultsPath,'outputs_PredictedTransformerLabels.csv'))
-    else:
+        df['Ranked Flagged Transformers'] = flaggedTrans
+        df.to_csv(Path(saveResultsPath,'outputs_RankedFlaggedTransformers.csv'))
+        #print('Flagged and ranked transformers written to outputs_RankedFlaggedTransformers.csv')
+
+        changedIndices = np.where(predictedTransLabels != transLabelsErrors)[1]
         df = pd.DataFrame()
-        df['customer ID'] = custIDInput
-        df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
-        df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
-        df.to_csv(Path(saveResultsPath,'outputs_PredictedTransformerLabels.csv'))
-    #print('Predicted transformer labels written to outputs_PredictedTransformerLabels.csv')
-
-    df = pd.DataFrame()
-    df['Ranked Flagged Transformers'] = flaggedTrans
-    df.to_csv(Path(saveResultsPath,'outputs_RankedFlaggedTransformers.csv'))
-    #print('Flagged and ranked transformers written to outputs_RankedFlaggedTransformers.csv')
-
-    changedIndices = np.where(predictedTransLabels != transLabelsErrors)[1]
-    df = pd.DataFrame()
-    df['customer ID'] = list(np.array(custIDInput)[changedIndices])
-    df['Original Transformer Labels (with Errors)'] = transLabelsErrors[0,changedIndices]
-    df['Predicted Transformer Labels'] = predictedTransLabels[0,changedIndices]
-    filename = 'outputs_ChangedCustomers_M2T.csv'
-    df.to_csv(Path(saveResultsPath,filename))
-    print('All customers with changed transformer labels written to ChangedCustomers_M2T.csv')
+        df['customer ID'] = list(np.array(custIDInput)[changedIndices])
+        df['Original Transformer Labels (with Errors)'] = transLabelsErrors[0,changedIndices]
+        df['Predicted Transformer Labels'] = predictedTransLabels[0,changedIndices]
+        filename = 'outputs_ChangedCustomers_M2T.csv'
+        df.to_csv(Path(saveResultsPath,filename))
+        print('All customers with changed transformer labels written to ChangedCustomers_M2T.csv')
+
+    ProfilingUtils.FinishRunProfile(profile,profilePath)
 # End transformerPairing
\ No newline at end of file
@@ -48,9 +48,16 @@ import pandas as pd
 if __package__ is None or __package__ == '':
     import M2TUtils
     import M2TFuncs
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+    from CommonUtils import ProfilingUtils
+    from CommonUtils import DataIOUtils
 else:
     from . import M2TUtils
     from . import M2TFuncs
+    from ..CommonUtils import PreprocessingUtils
+    from ..CommonUtils import ProfilingUtils
+    from ..CommonUtils import DataIOUtils
  
 ###############################################################################
 
@@ -76,11 +83,17 @@ else:
 #
 #               TransformerPairingWithDist()
 #
-def run( voltageData_AMI: str, realPowerData_AMI: str, customerIDs_AMI: str, transLabelsErrors_csv: str, customerLatLon_csv: str, transLabelsTrue_csv: str, saveResultsPath: PosixPath, useTrueLabels: bool = True, ):
+def run( voltageData_AMI: str, realPowerData_AMI: str, customerIDs_AMI: str, transLabelsErrors_csv: str, customerLatLon_csv: str, transLabelsTrue_csv: str, saveResultsPath: PosixPath, useTrueLabels: bool = True, profilePath: str = -1, profilerHook = -1 ):
     """   This function is a wrapper for the MeterToTransPairingScript_WithDistance.py file.
 
           Note that the indexing of all variables above should match in the customer index, i.e. custIDInput[0], transLabelsInput[0,0], voltageInput[:,0], pDataInput[:,0], and qDataInput[:,0] should all be the same customer
 
+          Each input file may also be a .npy/.npz file, which is memory
+          mapped, or a Parquet or Arrow IPC (.arrow/.feather) file, chosen by
+          the file extension.  See DataIOUtils.ConvertInputFile to convert
+          the CSV files once.  Parquet and Arrow IPC require the pyarrow
+          package.
+
           Parameters
           ---------
             voltageData_AMI: str - the path to the voltage data csv file
@@ -98,6 +111,14 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, customerIDs_AMI: str, tra
                 default is True as the ground truth labels are supplied with the
                 sample data
 
+            profilePath: str or Path - if supplied, the wall time, CPU time,
+                peak memory, and array sizes of each stage of the run are
+                written to this JSON file, see CommonUtils/ProfilingUtils.py.
+                The default (-1) does not profile the run
+            profilerHook: 'cprofile' or a profiler object with enable/disable
+                or start/stop methods, run for the whole run when profilePath
+                is supplied.  cProfile statistics are written next to the 
+                JSON file with the suffix .prof
           Returns
             Output files are prefixed with "outputs_"
             ---------
@@ -107,48 +128,61 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, customerIDs_AMI: str, tra
             outputs_RankedFlaggedTransformers: CSV - TBD
             outputs_ChangedCustomers_M2T_NoQ: CSV - TBD
     """    
-    voltageInput = M2TUtils.ConvertCSVtoNPY( voltageData_AMI )
-    pDataInput = M2TUtils.ConvertCSVtoNPY( realPowerData_AMI )
-    with open(customerIDs_AMI, 'r') as file:
-        custIDInput = [x.rstrip() for x in file]   
-    transLabelsErrors = M2TUtils.ConvertCSVtoNPY( transLabelsErrors_csv )    
-    latLonInput = M2TUtils.ConvertCSVtoNPY( customerLatLon_csv )
-
-    if useTrueLabels:
-        transLabelsTrue = M2TUtils.ConvertCSVtoNPY(transLabelsTrue_csv)       
-    
+    if type(profilePath) != int:
+        profile = ProfilingUtils.CreateRunProfile('TransformerPairingWithDist',profilerHook)
+    else:
+        profile = -1
+
+    with ProfilingUtils.ProfileStage(profile,'ingest') as stage:
+        voltageInput = DataIOUtils.LoadArray( voltageData_AMI )
+        pDataInput = DataIOUtils.LoadArray( realPowerData_AMI )
+        custIDInput = DataIOUtils.LoadIDs(customerIDs_AMI)   
+        transLabelsErrors = DataIOUtils.LoadArray( transLabelsErrors_csv )    
+        latLonInput = DataIOUtils.LoadArray( customerLatLon_csv )
+
+        if useTrueLabels:
+            transLabelsTrue = DataIOUtils.LoadArray(transLabelsTrue_csv)
+        ProfilingUtils.RecordArraySizes(stage,voltageInput=voltageInput,pDataInput=pDataInput)
+
     ###############################################################################
 
     ###############################################################################
     # Data pre-processing
     # Convert the raw voltage measurements into per unit and difference (delta voltage) representation
-    vPU = M2TUtils.ConvertToPerUnit_Voltage(voltageInput)
-    vDV = M2TUtils.CalcDeltaVoltage(vPU)
 
-    # Create lat/lon dictionary
-    custLatLon = {}
-    for custCtr in range(0,len(custIDInput)):
-        custLatLon[custIDInput[custCtr]] = [latLonInput[custCtr][0],latLonInput[custCtr][1]]
+    with ProfilingUtils.ProfileStage(profile,'preprocessing') as stage:
+        vDV = PreprocessingUtils.PreprocessVoltage(voltageInput,filterFlag=False,voltageLevels=M2TUtils.VOLTAGE_LEVELS)[0]
+
+        # Create lat/lon dictionary
+        custLatLon = {}
+        for custCtr in range(0,len(custIDInput)):
+            custLatLon[custIDInput[custCtr]] = [latLonInput[custCtr][0],latLonInput[custCtr][1]]
         
-    # Calulate pairwise distance matrix using the customer coordinates
-    distMatrix = M2TUtils.CreateDistanceMatrix(custLatLon, custIDInput, distTypeFlag='euclidean')
+        # Calulate pairwise distance matrix using the customer coordinates
+        distMatrix = M2TUtils.CreateDistanceMatrix(custLatLon, custIDInput, distTypeFlag='euclidean')
+        ProfilingUtils.RecordArraySizes(stage,vDV=vDV,distMatrix=distMatrix)
 
 
     ##############################################################################
     #
     #        Error Flagging Section - Correlation Coefficient Analysis
 
-    # Calculate CC Matrix
-    ccMatrix,noVotesIndex,noVotesIDs = M2TUtils.CC_EnsMedian(vDV,windowSize=384,custID=custIDInput)
-    # The function CC_EnsMedian takes the median CC across windows in the dataset. 
-    # This is mainly done to deal with the issue of missing measurements in the dataset
-    # If your data does not have missing measurements you could use numpy.corrcoef directly
+    with ProfilingUtils.ProfileStage(profile,'correlation') as stage:
+        # Calculate CC Matrix
+        ccMatrix,noVotesIndex,noVotesIDs = M2TUtils.CC_EnsMedian(vDV,windowSize=384,custID=custIDInput)
+        # The function CC_EnsMedian takes the median CC across windows in the dataset. 
+        # This is mainly done to deal with the issue of missing measurements in the dataset
+        # If your data does not have missing measurements you could use numpy.corrcoef directly
+        ProfilingUtils.RecordArraySizes(stage,ccMatrix=ccMatrix)
+
+    with ProfilingUtils.ProfileStage(profile,'flagging') as stage:
+        # Do a sweep of possible CC Thresholds and rank the flagged results
+        notMemberVector = [0.25,0.26,0.27,0.28,0.29,0.30,0.31,0.32,0.33,0.34,0.35,0.36,0.37,0.38,0.39,0.4,0.41,0.42,0.43,0.44,0.45,0.46,0.47,0.48,0.49,0.50,0.51,0.52,0.53,0.54,0.55,0.56,0.57,0.58,0.59,0.60,0.61,0.62,0.63,0.64,0.65,0.66,0.67,0.68,0.69,0.70,0.71,0.72,0.73,0.74,0.75,0.76,0.78,0.79,0.80,0.81,0.82,0.83,0.84,0.85,0.86,0.87,0.88,0.90,0.91]
+        allFlaggedTrans, allNumFlagged, rankedFlaggedTrans, rankedTransThresholds = M2TFuncs.RankFlaggingBySweepingThreshold(transLabelsErrors,notMemberVector,ccMatrix)
 
-    # Do a sweep of possible CC Thresholds and rank the flagged results
-    notMemberVector = [0.25,0.26,0.27,0.28,0.29,0.30,0.31,0.32,0.33,0.34,0.35,0.36,0.37,0.38,0.39,0.4,0.41,0.42,0.43,0.44,0.45,0.46,0.47,0.48,0.49,0.50,0.51,0.52,0.53,0.54,0.55,0.56,0.57,0.58,0.59,0.60,0.61,0.62,0.63,0.64,0.65,0.66,0.67,0.68,0.69,0.70,0.71,0.72,0.73,0.74,0.75,0.76,0.78,0.79,0.80,0.81,0.82,0.83,0.84,0.85,0.86,0.87,0.88,0.90,0.91]
-    allFlaggedTrans, allNumFlagged, rankedFlaggedTrans, rankedTransThresholds = M2TFuncs.RankFlaggingBySweepingThreshold(transLabelsErrors,notMemberVector,ccMatrix)
-    # Plot the number of flagged transformers for all threshold values
-    M2TUtils.PlotNumFlaggedTrans_ThresholdSweep(notMemberVector,allNumFlagged,transLabelsErrors,savePath=saveResultsPath)
+    with ProfilingUtils.ProfileStage(profile,'plotting') as stage:
+        # Plot the number of flagged transformers for all threshold values
+        M2TUtils.PlotNumFlaggedTrans_ThresholdSweep(notMemberVector,allNumFlagged,transLabelsErrors,savePath=saveResultsPath)
 
     # The main output from this Error Flagging section is rankedFlaggedTrans which
     # contains the list of flagged transformers ranked by correlation coefficient.
@@ -161,77 +195,85 @@ def run( voltageData_AMI: str, realPowerData_AMI: str, customerIDs_AMI: str, tra
     #             Transformer Assignment Section - Linear Regression Steps
     #
 
-    print('Starting regression calculation')
-    r2Affinity,regRDist,regRDistIndiv,mseMatrix = M2TUtils.ParamEst_LinearRegression_NoQ(voltageInput,pDataInput,savePath=saveResultsPath)
-
-    # Grab a particular set of ranked results
-    notMemberThreshold=0.7
-    flaggingIndex = np.where(np.array(notMemberVector)==notMemberThreshold)[0][0]
-    flaggedTrans = allFlaggedTrans[flaggingIndex]
-
-    distThresh = 300  # This is an important parameter - it specifies the allowed distance away that a customer may be re-assigned to a new transformer.  
-    # 300 meaning that only transformer groupings within distance 300 will be considered as possible new transformer groupings for a customer being re-assigned
-    predictedTransLabels, predictedTransStrLabels = M2TFuncs.CorrectFlaggedTransformers_WithDist(mseMatrix, 
-                                                                                                    ccMatrix,
-                                                                                                    notMemberThreshold,
-                                                                                                    flaggedTrans,
-                                                                                                    custIDInput,
-                                                                                                    transLabelsErrors,
-                                                                                                    useDistFlag=True,
-                                                                                                    distMatrix=distMatrix,
-                                                                                                    distThreshold = distThresh,
-                                                                                                    saveFlag=True)
-
-    print('')
-    print('')
-    print('Meter to Transformer Pairing Algorithm Results')
-    M2TUtils.PrettyPrintChangedCustomers(predictedTransLabels,transLabelsErrors,custIDInput)
-
-    # Calculate Error Metrics
-    if useTrueLabels:
-        incorrectTrans,incorrectPairedIndices, incorrectPairedIDs= M2TUtils.CalcTransPredErrors(predictedTransLabels,transLabelsTrue,custIDInput,singleCustMarker=-999)
-        incorrectTransOrg,incorrectPairedIndicesOrg, incorrectPairedIDsOrg= M2TUtils.CalcTransPredErrors(transLabelsErrors,transLabelsTrue,custIDInput, singleCustMarker=-999)
-        improvementNum = (len(incorrectTransOrg) - len(incorrectTrans))
-        improvementPercent = np.round(((improvementNum  / len(incorrectTransOrg)) * 100),decimals=2)
+    with ProfilingUtils.ProfileStage(profile,'regression') as stage:
+        print('Starting regression calculation')
+        r2Affinity,regRDist,regRDistIndiv,mseMatrix = M2TUtils.ParamEst_LinearRegression_NoQ(voltageInput,pDataInput,savePath=saveResultsPath)
+        ProfilingUtils.RecordArraySizes(stage,mseMatrix=mseMatrix)
+
+    with ProfilingUtils.ProfileStage(profile,'assignment') as stage:
+        # Grab a particular set of ranked results
+        notMemberThreshold=0.7
+        flaggingIndex = np.where(np.array(notMemberVector)==notMemberThreshold)[0][0]
+        flaggedTrans = allFlaggedTrans[flaggingIndex]
+
+        distThresh = 300  # This is an important parameter - it specifies the allowed distance away that a customer may be re-assigned to a new transformer.  
+        # 300 meaning that only transformer groupings within distance 300 will be considered as possible new transformer groupings for a customer being re-assigned
+        predictedTransLabels, predictedTransStrLabels = M2TFuncs.CorrectFlaggedTransformers_WithDist(mseMatrix, 
+                                                                                                        ccMatrix,
+                                                                                                        notMemberThreshold,
+                                                                                                        flaggedTrans,
+                                                                                                        custIDInput,
+                                                                                                        transLabelsErrors,
+                                                                                                        useDistFlag=True,
+                                                                                                        distMatrix=distMatrix,
+                                                                                                        distThreshold = distThresh,
+                                                                                                        saveFlag=True)
+        ProfilingUtils.RecordArraySizes(stage,predictedTransLabels=predictedTransLabels)
+
+    with ProfilingUtils.ProfileStage(profile,'scoring') as stage:
         print('')
-        print('There were originally ' + str(len(incorrectTransOrg)) + ' incorrect transformer groupings with the injected incorrect labels')
-        print('After running algorithm there are ' + str(len(incorrectTrans)) + ' incorrect transformer groupings')
-        print(str(improvementNum) + ' transformer groupings were corrected, which is an improvement of ' + str(improvementPercent) + '%')
-
-    # Write outputs to csv file
-    print('')
-    filename = 'outputsAll_M2T_NoQ.csv'
-    if useTrueLabels:
-        df = pd.DataFrame()
-        df['customer ID'] = custIDInput
-        df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
-        df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
-        df['Actual Transformer Labels'] = transLabelsTrue[0,:]
-        df.to_csv(Path(saveResultsPath,filename))
-        print('Predicted Transformer labels written to outputsAll_M2T_NoQ.csv')
-    else:
-        df = pd.DataFrame()
-        df['customer ID'] = custIDInput
-        df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
-        df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
-        df.to_csv(Path(saveResultsPath,filename))
-        print('Predicted Transformer labels written to outputsAll_M2T_NoQ.csv')
+        print('')
+        print('Meter to Transformer Pairing Algorithm Results')
+        M2TUtils.PrettyPrintChangedCustomers(predictedTransLabels,transLabelsErrors,custIDInput)
+
+        # Calculate Error Metrics
+        if useTrueLabels:
+            incorrectTrans,incorrectPairedIndices, incorrectPairedIDs= M2TUtils.CalcTransPredErrors(predictedTransLabels,transLabelsTrue,custIDInput,singleCustMarker=-999)
+            incorrectTransOrg,incorrectPairedIndicesOrg, incorrectPairedIDsOrg= M2TUtils.CalcTransPredErrors(transLabelsErrors,transLabelsTrue,custIDInput, singleCustMarker=-999)
+            improvementNum = (len(incorrectTransOrg) - len(incorrectTrans))
+            improvementPercent = np.round(((improvementNum  / len(incorrectTransOrg)) * 100),decimals=2)
+            print('')
+            print('There were originally ' + str(len(incorrectTransOrg)) + ' incorrect transformer groupings with the injected incorrect labels')
+            print('After running algorithm there are ' + str(len(incorrectTrans)) + ' incorrect transformer groupings')
+            print(str(improvementNum) + ' transformer groupings were corrected, which is an improvement of ' + str(improvementPercent) + '%')
+
+    with ProfilingUtils.ProfileStage(profile,'output') as stage:
+        # Write outputs to csv file
+        print('')
+        filename = 'outputsAll_M2T_NoQ.csv'
+        if useTrueLabels:
+            df = pd.DataFrame()
+            df['customer ID'] = custIDInput
+            df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
+            df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
+            df['Actual Transformer Labels'] = transLabelsTrue[0,:]
+            df.to_csv(Path(saveResultsPath,filename))
+            print('Predicted Transformer labels written to outputsAll_M2T_NoQ.csv')
+        else:
+            df = pd.DataFrame()
+            df['customer ID'] = custIDInput
+            df['Original Transformer Labels (with errors)'] = transLabelsErrors[0,:]
+            df['Predicted Transformer Labels'] = predictedTransLabels[0,:]
+            df.to_csv(Path(saveResultsPath,filename))
+            print('Predicted Transformer labels written to outputsAll_M2T_NoQ.csv')
 
 
-    df = pd.DataFrame()
-    df['Ranked Flagged Transformers'] = flaggedTrans
-    df.to_csv(Path(saveResultsPath,'outputs_RankedFlaggedTransformers.csv'))
-    print('Flagged and ranked transformers written to outputs_RankedFlaggedTransformers.csv')
+        df = pd.DataFrame()
+        df['Ranked Flagged Transformers'] = flaggedTrans
+        df.to_csv(Path(saveResultsPath,'outputs_RankedFlaggedTransformers.csv'))
+        print('Flagged and ranked transformers written to outputs_RankedFlaggedTransformers.csv')
+
 
+        changedIndices = np.where(predictedTransLabels != transLabelsErrors)[1]
+        df = pd.DataFrame()
+        df['customer ID'] = list(np.array(custIDInput)[changedIndices])
+        df['Original Transformer Labels (with Errors)'] = transLabelsErrors[0,changedIndices]
+        df['Predicted Transformer Labels'] = predictedTransLabels[0,changedIndices]
+        filename = 'outputs_ChangedCustomers_M2T_NoQ.csv'
+        df.to_csv(Path(saveResultsPath,filename))
+        print('All customers with changed transformer labels written to ChangedCustomers_M2T_NoQ.csv')
 
-    changedIndices = np.where(predictedTransLabels != transLabelsErrors)[1]
-    df = pd.DataFrame()
-    df['customer ID'] = list(np.array(custIDInput)[changedIndices])
-    df['Original Transformer Labels (with Errors)'] = transLabelsErrors[0,changedIndices]
-    df['Predicted Transformer Labels'] = predictedTransLabels[0,changedIndices]
-    filename = 'outputs_ChangedCustomers_M2T_NoQ.csv'
-    df.to_csv(Path(saveResultsPath,filename))
-    print('All customers with changed transformer labels written to ChangedCustomers_M2T_NoQ.csv')
+    ProfilingUtils.FinishRunProfile(profile,profilePath)
 
 # End of TransformerPairingWithDist
 
@@ -37,6 +37,8 @@ These functions perform tasks adjacent to the main algorithm
    Function List
      - AddGaussianNoise
      - MissingData_VarInt
+     - MissingData_VarInt_Vectorized
+     - CreateSyntheticFeederData
      - FindNewInterval
      - ConvertToPerUnit_Voltage
      - CalcDeltaVoltage
@@ -67,6 +69,8 @@ B. D. Peña, L. Blakely, M. J. Reno, “Data-Driven Detection of Phase Changes i
 ### Function List
 #  - AddGaussianNoise
 #  - MissingData_VarInt
+#  - MissingData_VarInt_Vectorized
+#  - CreateSyntheticFeederData
 #  - FindNewInterval
 #  - ConvertToPerUnit_Voltage
 #  - CalcDeltaVoltage
@@ -84,14 +88,27 @@ B. D. Peña, L. Blakely, M. J. Reno, “Data-Driven Detection of Phase Changes i
 ##############################################################################
 # Import Python Libraries
 import random
+import sys
 import numpy as np
 from copy import deepcopy
 from scipy.stats import mode
+from scipy.signal import lfilter
 import pandas as pd
+from pathlib import Path
 
+# Import - Custom Libraries
+if __package__ in [None, '']:
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+else:
+    from ..CommonUtils import PreprocessingUtils
 
+# The base voltages supported by ConvertToPerUnit_Voltage
+VOLTAGE_LEVELS = [120,240,7200]
 
-def AddGaussianNoise(voltageArray, meanValue,stdPercentValue, percentNoisyMeters):
+
+
+def AddGaussianNoise(voltageArray, meanValue,stdPercentValue, percentNoisyMeters, randomState=-1):
     ''' This function takes the original array of voltage time-series and 
         adds gaussian noise to each measurement, specified by the mean and 
         standard deviation for the percentage of meters specified.  If the
@@ -109,6 +126,9 @@ def AddGaussianNoise(voltageArray, meanValue,stdPercentValue, percentNoisyMeters
                 the meanValue.  THIS PARAMETER MUST BE A PERCENTAGE!
             percentNoisyMeters: percentage of meters to bias, 100 = all customers
             idealMean: the ideal mean of the values (240 for the original synthetic dataset)
+            randomState: numpy Generator - if supplied, the noisy meters and
+                the noise are drawn from this generator instead of the
+                global random state, making the result repeatable
             
         Returns
         -------
@@ -124,12 +144,15 @@ def AddGaussianNoise(voltageArray, meanValue,stdPercentValue, percentNoisyMeters
         stdInUnits = meanValue * stdValueDecimal
         newVoltageArray = deepcopy(voltageArray)
         noisyMetersDecimal = percentNoisyMeters / 100
-        custIndices = random.sample(range(voltageArray.shape[1]),int(voltageArray.shape[1]*noisyMetersDecimal))
-        
-        for custCtr in range(0,len(custIndices)):
-            #print('Starting' + str(custCtr) + '/' +str(len(custIndices)))
-            noise = np.random.normal(meanValue,stdInUnits,voltageArray.shape[0])
-            newVoltageArray[:,custIndices[custCtr]] = newVoltageArray[:,custIndices[custCtr]] + noise
+        numNoisy = int(voltageArray.shape[1]*noisyMetersDecimal)
+        # Draw the noise for all of the selected meters at once
+        if type(randomState) == int:
+            custIndices = np.array(random.sample(range(voltageArray.shape[1]),numNoisy),dtype=int)
+            noise = np.random.normal(meanValue,stdInUnits,(voltageArray.shape[0],numNoisy))
+        else:
+            custIndices = randomState.choice(voltageArray.shape[1],numNoisy,replace=False)
+            noise = randomState.normal(meanValue,stdInUnits,(voltageArray.shape[0],numNoisy))
+        newVoltageArray[:,custIndices] += noise
         
         return newVoltageArray    
 # End of AddGaussianNoise
@@ -229,6 +252,167 @@ def MissingData_VarInt(VoltageArray, percentMissing, minmissingDataInterval, max
 # End of MissingData_VarInt
 
 
+
+def MissingData_VarInt_Vectorized(voltageArray, percentMissing, minmissingDataInterval, maxmissingDataInterval, randomState=-1, blockSize=1000):
+    ''' This function is a vectorized version of MissingData_VarInt.  Each
+        customer receives exactly the specified percentage of missing data as
+        a set of non-overlapping intervals with lengths drawn uniformly between
+        minmissingDataInterval and maxmissingDataInterval (the last interval
+        is truncated to reach the exact percentage).  The intervals are placed
+        with random gaps between them and all customers in a block are handled
+        with array operations, so this is suitable for creating large
+        synthetic datasets.  Missing data already present in voltageArray is
+        not counted towards the percentage.
+        
+        Parameters
+        ---------
+            voltageArray: Numpy array of float (measurments,customers)  
+                The original voltage time series.
+            percentMissing: float 
+                 Percentage of data to remove from the time series.
+            minmissingDataInterval : int
+                The minimum length of each missing data interval
+            maxmissingDataInterval : int
+                The maximum length of each missing data interval
+            randomState: numpy Generator - the generator used for the interval
+                lengths and locations.  The default (-1) creates an unseeded
+                generator
+            blockSize: int - the number of customers processed at once
+            
+        Returns
+        -------
+            newVoltageArray: numpy array of float (measurements,customers) 
+                This array has nan's in the places with missing data.
+        '''
+    if (minmissingDataInterval <= 0) or (maxmissingDataInterval <= 0):
+        print("The value of the interval has to be greater than or equal to 0.")
+        return -1
+    if minmissingDataInterval > maxmissingDataInterval:
+        print("The minimum data interval must not be larger than the maximum data interval.")
+        return -1
+    if (percentMissing < 0) or (percentMissing > 100):
+        print("Percent missing has to be in the range from 0 to 100 inclusive.")
+        return -1
+    if type(randomState) == int:
+        randomState = np.random.default_rng()
+    newVoltageArray = np.array(voltageArray,dtype=float)
+    numMeas = newVoltageArray.shape[0]
+    numIndicesTotal = int(np.round((numMeas*percentMissing)/100, 0))
+    if numIndicesTotal == 0:
+        return newVoltageArray
+    if minmissingDataInterval > numIndicesTotal:
+        print("The minimum interval is greater than the percent data missing.")
+        return -1
+    # Enough intervals that even the shortest lengths reach the total
+    maxIntervals = int(np.ceil(numIndicesTotal / minmissingDataInterval))
+    numFree = numMeas - numIndicesTotal
+    for blockStart in range(0,newVoltageArray.shape[1],blockSize):
+        blockEnd = min(blockStart + blockSize, newVoltageArray.shape[1])
+        numBlock = blockEnd - blockStart
+        lengths = randomState.integers(minmissingDataInterval,maxmissingDataInterval+1,size=(numBlock,maxIntervals))
+        # Truncate the lengths so each customer has exactly numIndicesTotal missing points
+        lengthsBefore = np.cumsum(lengths,axis=1) - lengths
+        lengths = np.clip(numIndicesTotal - lengthsBefore,0,lengths)
+        # Split the remaining measurements into random gaps around the intervals
+        gapWeights = randomState.random((numBlock,maxIntervals+1))
+        gaps = np.floor(gapWeights / np.sum(gapWeights,axis=1,keepdims=True) * numFree).astype(int)
+        starts = np.cumsum(gaps[:,:-1],axis=1) + np.cumsum(lengths,axis=1) - lengths
+        # Mark the intervals with a difference array and a cumulative sum
+        custIndices = np.broadcast_to(np.arange(numBlock)[:,np.newaxis],starts.shape)
+        intervalDiff = np.zeros((numMeas+1,numBlock),dtype=np.int8)
+        np.add.at(intervalDiff,(starts.ravel(),custIndices.ravel()),1)
+        np.add.at(intervalDiff,((starts+lengths).ravel(),custIndices.ravel()),-1)
+        missingMask = np.cumsum(intervalDiff[:-1,:],axis=0,dtype=np.int8) > 0
+        blockVoltage = newVoltageArray[:,blockStart:blockEnd]
+        blockVoltage[missingMask] = np.nan
+    return newVoltageArray
+# End of MissingData_VarInt_Vectorized
+
+
+
+def CreateSyntheticFeederData(numCust, numMeas, numFeederPhases=3, percentMultiPhase=0, percentThreePhase=50, percentMissing=0, minmissingDataInterval=8, maxmissingDataInterval=96, stdPercentNoise=0.07, nominalVoltage=240, randomSeed=-1):
+    ''' This function creates a synthetic AMI voltage dataset for a single
+        feeder, for use in testing and benchmarking the phase identification
+        methods at arbitrary sizes.  The per-unit voltage deviation of each 
+        datastream is the sum of a daily profile and a slowly varying feeder
+        component shared by all customers, a component for the phase the
+        datastream is connected to, and a customer offset and local variation.
+        Measurement noise and the nominal voltage are then added with
+        AddGaussianNoise, and missing data is added with 
+        MissingData_VarInt_Vectorized.  Multi-phase customers have one 
+        datastream per phase, all sharing the same customer ID.
+        
+        Parameters
+        ---------
+            numCust: int - the number of customers
+            numMeas: int - the number of measurements for each datastream
+            numFeederPhases: int - the number of phases on the feeder
+            percentMultiPhase: float - the percentage of customers that are
+                2-phase or 3-phase
+            percentThreePhase: float - the percentage of the multi-phase 
+                customers that are 3-phase, the rest are 2-phase
+            percentMissing: float - the percentage of missing data for each
+                datastream
+            minmissingDataInterval: int - the minimum length of the missing
+                data intervals
+            maxmissingDataInterval: int - the maximum length of the missing
+                data intervals
+            stdPercentNoise: float - the standard deviation of the measurement
+                noise as a percentage of nominalVoltage
+            nominalVoltage: float - the nominal voltage in volts
+            randomSeed: int - the seed for the random generator.  The default
+                (-1) produces a different dataset each call
+            
+        Returns
+        -------
+            voltage: ndarray of float (measurements,datastreams) - the 
+                voltage timeseries in volts, with nan for missing data
+            custID: list of str (datastreams) - the customer ID of each 
+                datastream
+            phaseLabels: ndarray of int (1,datastreams) - the true phase of 
+                each datastream, from 1 to numFeederPhases
+            numPhases: ndarray of int (1,datastreams) - the number of phases
+                of the customer each datastream belongs to
+        '''
+    if randomSeed == -1:
+        rng = np.random.default_rng()
+    else:
+        rng = np.random.default_rng(randomSeed)
+    # Assign the number of phases to each customer
+    custPhaseCounts = np.ones((numCust,),dtype=int)
+    numMulti = int(np.round(numCust * percentMultiPhase / 100))
+    numThree = int(np.round(numMulti * percentThreePhase / 100))
+    multiIndices = rng.choice(numCust,numMulti,replace=False)
+    custPhaseCounts[multiIndices[:numThree]] = 3
+    custPhaseCounts[multiIndices[numThree:]] = 2
+    custPhaseCounts = np.minimum(custPhaseCounts,numFeederPhases)
+    # Expand customers into datastreams, consecutive phases for multi-phase customers
+    custIndices = np.repeat(np.arange(numCust),custPhaseCounts)
+    custStarts = np.cumsum(custPhaseCounts) - custPhaseCounts
+    phaseOffset = np.arange(custIndices.shape[0]) - custStarts[custIndices]
+    basePhase = rng.integers(0,numFeederPhases,size=numCust)
+    phaseLabels = ((basePhase[custIndices] + phaseOffset) % numFeederPhases + 1).reshape(1,-1)
+    numPhases = custPhaseCounts[custIndices].reshape(1,-1)
+    custID = list(np.char.add('cust',custIndices.astype(str)))
+    # Per-unit deviation from nominal: daily profile + feeder + phase + customer components
+    timeIndex = np.arange(numMeas)
+    feederComponent = 0.01*np.sin(2*np.pi*timeIndex/96) + lfilter([1],[1,-0.99],rng.normal(0,0.001,numMeas))
+    phaseComponent = lfilter([1],[1,-0.95],rng.normal(0,0.002,(numMeas,numFeederPhases)),axis=0)
+    voltage = rng.normal(0,0.0005,(numMeas,custIndices.shape[0]))
+    voltage += rng.normal(0,0.005,(1,custIndices.shape[0]))
+    voltage += feederComponent[:,np.newaxis]
+    voltage += phaseComponent[:,phaseLabels[0,:]-1]
+    voltage *= nominalVoltage
+    # The noise has a mean of the nominal voltage, converting the deviation into volts
+    voltage = AddGaussianNoise(voltage,nominalVoltage,stdPercentNoise,100,randomState=rng)
+    if stdPercentNoise == 0:
+        voltage += nominalVoltage
+    if percentMissing > 0:
+        voltage = MissingData_VarInt_Vectorized(voltage,percentMissing,minmissingDataInterval,maxmissingDataInterval,randomState=rng)
+    return voltage, custID, phaseLabels, numPhases
+# End of CreateSyntheticFeederData
+
+
 def FindNewInterval(minmissingDataInterval,maxmissingDataInterval):
     ''' This function takes the parameters of minmissingDataInterval and 
         maxmissingDataInterval and finds a random interval in the range 
@@ -288,27 +472,8 @@ def ConvertToPerUnit_Voltage(timeseries):
                 timeseries converted into per unit representation
         '''
     
-    voltageMismatchThresh = .8
-    voltageLevels = np.array([120,240,7200])
-    voltagePU = np.zeros((timeseries.shape),dtype=float)
-    dataLength = timeseries.shape[0]
-    
-    for custCtr in range(0, timeseries.shape[1]):
-        currentCust = timeseries[:,custCtr]
-        # Check for the case a customer only has NaN values in the timeseries
-        if np.sum(np.isnan(currentCust)) == dataLength:
-            print('Warning!  Customer index ' + str(custCtr) + ' only had NaN values in the timeseries. ')
-            voltagePU[:,custCtr] = currentCust
-            continue
-        else:
-            meanValue = np.round(np.nanmean(currentCust),decimals=0)
-            vDiff = np.abs(voltageLevels - meanValue)
-            index = np.argmin(vDiff)
-            if np.abs(vDiff[index]) > (voltageMismatchThresh*voltageLevels[index]):
-                print('Error!  Customer# ' + str(custCtr) + 'has a mean voltage value of ' + str(meanValue) + '.  This voltage level is not supported in the function.  Please add this voltage level to the source code of the function')
-                return (-1)
-            voltagePU[:,custCtr] = np.divide(currentCust, voltageLevels[index])
-    return voltagePU
+    # The base voltage of every customer is found at once, see CommonUtils.PreprocessingUtils
+    return PreprocessingUtils.ConvertToPerUnit_Voltage(timeseries,voltageLevels=VOLTAGE_LEVELS)
 # End of ConvertToPerUnit_Voltage
 
 
@@ -543,7 +708,7 @@ def UpdateAggKM(clusterLabels,custID,currentIDs,aggKM):
         custIndex = np.where(currentIDs[custCtr]==custIDStr)[0][0]
         allIndices.append(custIndex)
         updateIndices = np.where(clusterLabels==clusterLabels[custCtr])[0]
-        updateIndicesTrue = np.in1d(custIDStr,currentIDs[updateIndices])
+        updateIndicesTrue = np.isin(custIDStr,currentIDs[updateIndices])
         updateIndicesTrue = np.where(updateIndicesTrue==True)[0]
         aggKM[custIndex,updateIndicesTrue] = aggKM[custIndex,updateIndicesTrue] + 1
     # End of custCtr for loop
@@ -78,14 +78,21 @@ import warnings
 import scipy.optimize as opt
 import matplotlib.pyplot as plt
 from scipy import stats
+import sys
+from pathlib import Path
 
 # Import Custom Libraries
 if __package__ in [None, '']:
     import ChangepointUtils as CPUtils
     import OnlineChangepointFunctions as OCF
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import SpectralUtils
+    from CommonUtils import WindowCacheUtils
 else:
     from . import ChangepointUtils as CPUtils
     from . import OnlineChangepointFunctions as OCF
+    from ..CommonUtils import SpectralUtils
+    from ..CommonUtils import WindowCacheUtils
     
 def run_TDCMonteCarlo(phaseLabelsInput,phaseLabelErrors,newVoltage,custIDs,misLabeledCusts,windowSize=384,kVector=[3,6,12,15,30],savePath=-1):
     '''
@@ -184,7 +191,7 @@ def run_TDCMonteCarlo(phaseLabelsInput,phaseLabelErrors,newVoltage,custIDs,misLa
     return predictedPhasesAll, aggMatAll, possibleChangePointsAll, rankedPredictionsOverTime, misLabeledCusts, cTPPOverTime_Noise
 # End of run_IncorrectLabels function
 
-def runOnline_UpdatePredictions(voltageWindow, windowSize, kVector, custIDs, phaseLabelsCurrent, initAggMat, initWindowCtr, initPossibleChangePoints, initConfidenceScores, initPredictedPhases):
+def runOnline_UpdatePredictions(voltageWindow, windowSize, kVector, custIDs, phaseLabelsCurrent, initAggMat, initWindowCtr, initPossibleChangePoints, initConfidenceScores, initPredictedPhases, windowCache=-1):
     '''
     This functions implements the online version of the change point detection for 
     phase changes algorithm.
@@ -217,6 +224,8 @@ def runOnline_UpdatePredictions(voltageWindow, windowSize, kVector, custIDs, pha
         each window
     initPredictedPhases: ndarray of int (customers,windows) - the predicted
         phase for each customer in each window
+    windowCache: dict - a window clustering cache, see 
+        SpC_MultKWin_SingleWindow.  The default (-1) does not use a cache
     Returns
     -------
     possibleChangePoints : dictionary
@@ -259,7 +268,7 @@ def runOnline_UpdatePredictions(voltageWindow, windowSize, kVector, custIDs, pha
     kMeansVotes, \
     kMeansClusters, \
     aggKM, \
-    predictedPhaseClustering = SpC_MultKWin_SingleWindow(voltageWindow,kVector,custIDs,phaseLabelsCurrent)
+    predictedPhaseClustering = SpC_MultKWin_SingleWindow(voltageWindow,kVector,custIDs,phaseLabelsCurrent,windowCache)
     
     predictedPhaseClustering = predictedPhaseClustering.astype(int)
     windowVotes[:, :] = kMeansVotes
@@ -336,7 +345,7 @@ def runOnline_UpdatePredictions(voltageWindow, windowSize, kVector, custIDs, pha
 ## End runOnline_UpdatePredictions
 
 
-def SpC_MultKWin_SingleWindow(voltage,kVector,custID,phaseLabelsInput):
+def SpC_MultKWin_SingleWindow(voltage,kVector,custID,phaseLabelsInput,windowCache=-1):
     """ This function uses spectral clustering for a single window and produces 
         
             Parameters
@@ -349,6 +358,10 @@ def SpC_MultKWin_SingleWindow(voltage,kVector,custID,phaseLabelsInput):
                     list of customer ids
                 phaseLabelsInput: numpy array of int (1,customers) - the original 
                     phase labels for each customer          
+                windowCache: dict - a window clustering cache from 
+                    CommonUtils/WindowCacheUtils.py, shared with the CA 
+                    ensemble phase identification.  The default (-1) does not
+                    use a cache
                 
             Returns
             -------
@@ -377,14 +390,15 @@ def SpC_MultKWin_SingleWindow(voltage,kVector,custID,phaseLabelsInput):
     if not ((currentDistances.shape[0] == 1) and (currentDistances.shape[1] == 1)):
         currentDistances = currentDistances.transpose()
         
+        # Cluster the window for every value of k, sharing the affinity matrix and spectral embedding between them
+        allClusterLabels = WindowCacheUtils.SPClustering_MultK_Cached(np.asarray(currentDistances),kVector,windowCache,currentIDs)
         # Loop through each value of k (number of clusters) to use multiple numbers of clusters in each available window
         for kCtr in range(0,len(kVector)):
             k = kVector[kCtr]
+            clusterLabels = allClusterLabels[kCtr]
             #Check if the cleaning reduced the number of available customers to less than the number of clusters
-            if (currentDistances.shape[0] <= k):
+            if type(clusterLabels) == int:
                  continue
-            #Do the clustering
-            clusterLabels, affMatrix = SPClustering(currentDistances,k)
                  
             #Update kmeans weight matrix for just this window
             aggKM = CPUtils.UpdateAggKM(clusterLabels, custID, currentIDs, aggKM)            
@@ -931,7 +945,7 @@ def PlotTDC_SCATTERPLOT_EventWin2(noise_events_max,numWindows,numSims,td_curve,t
 
 def OnlineChangepointFunc(custIDs,voltageTimeseries,phaseLabelErrors,td_curve,\
                           kVector=[3,6,12,15,30],windowSize=384,\
-                              numInitialWindows=3):
+                              numInitialWindows=3,windowCache=-1):
     '''
     This is the primary function for the online phase changepoint detection
         algorithm.  The algorithm is initialized with a few windows to correct
@@ -965,6 +979,11 @@ def OnlineChangepointFunc(custIDs,voltageTimeseries,phaseLabelErrors,td_curve,\
         labeled customers in the initialization phase, but increase the amount 
         of required historical data.  Likewise, the initialization period 
         assumes that no customers have changed phase during that initial period.
+    windowCache: dict - an on-disk cache of the window clustering results 
+        from CommonUtils/WindowCacheUtils.py.  Windows which were already 
+        clustered, in a previous run or by the CA ensemble phase 
+        identification, are read from the cache.  The default (-1) does not
+        use a cache
     
 
     Returns
@@ -1012,7 +1031,7 @@ def OnlineChangepointFunc(custIDs,voltageTimeseries,phaseLabelErrors,td_curve,\
         # The initialization windows will be used to correct any initial phase mislabeling
     predictions = 0
     
-    possibleChangePoints, confidenceScores, windowVotes, aggMat, windowCtr, clusterLabels, predictedPhases = runOnline_Initialize(initVoltage, windowSize, kVector, custIDs, phaseLabelErrors)
+    possibleChangePoints, confidenceScores, windowVotes, aggMat, windowCtr, clusterLabels, predictedPhases = runOnline_Initialize(initVoltage, windowSize, kVector, custIDs, phaseLabelErrors, windowCache)
     predictions = getChangePointPredictions_CumulativeTPP(possibleChangePoints, confidenceScores, aggMat, predictedPhases, custIDs, phaseLabelErrors,predictions, td_curve = td_curve)
     
     ### Correct any phase label errors found within the initializtion windows - as long as the meet the time duration curve requirements
@@ -1049,7 +1068,7 @@ def OnlineChangepointFunc(custIDs,voltageTimeseries,phaseLabelErrors,td_curve,\
         startIndex = i*windowSize
         endIndex = startIndex + windowSize
         currVoltage = voltageTimeseries[startIndex:endIndex,:]
-        possibleChangePoints, confidenceScores, windowVotes, aggMat, windowCtr, clusterLabels, predictedPhases = runOnline_UpdatePredictions(currVoltage, windowSize, kVector, custIDs, phaseLabelsInputUpdated, aggMatAll, windowCtrAll, possibleChangePointsAll, confidenceScoresAll, predictedPhasesAll)
+        possibleChangePoints, confidenceScores, windowVotes, aggMat, windowCtr, clusterLabels, predictedPhases = runOnline_UpdatePredictions(currVoltage, windowSize, kVector, custIDs, phaseLabelsInputUpdated, aggMatAll, windowCtrAll, possibleChangePointsAll, confidenceScoresAll, predictedPhasesAll, windowCache)
         
         ### Update tracking 
         possibleChangePointsAll = possibleChangePoints
@@ -1067,7 +1086,7 @@ def OnlineChangepointFunc(custIDs,voltageTimeseries,phaseLabelErrors,td_curve,\
 
 
 ## Begin runOnline_Initialize 
-def runOnline_Initialize(voltageInit, windowSize, kVector, custID, phaseLabelsInput):
+def runOnline_Initialize(voltageInit, windowSize, kVector, custID, phaseLabelsInput, windowCache=-1):
     '''
     This function implements the online version of the change point detection for phase changes algorithm.
     This is used to initialize the algorithm and requires atleast five windows of data. 
@@ -1086,6 +1105,9 @@ def runOnline_Initialize(voltageInit, windowSize, kVector, custID, phaseLabelsIn
         List of customer ids.
     phaseLabelsInput : numpy array of int (1,customers)
         The original phase labels for each customer.
+    windowCache : dict
+        A window clustering cache, see SpC_MultKWin_SingleWindow.  The 
+        default (-1) does not use a cache
     
     Returns
     -------
@@ -1139,7 +1161,7 @@ def runOnline_Initialize(voltageInit, windowSize, kVector, custID, phaseLabelsIn
         kMeansVotes, \
         kMeansClusters, \
         aggKM, \
-        predictedPhase = SpC_MultKWin_SingleWindow(currentVoltage,kVector,custID,phaseLabelsInput)
+        predictedPhase = SpC_MultKWin_SingleWindow(currentVoltage,kVector,custID,phaseLabelsInput,windowCache)
         
         ### Update arrays tracking info        
         predictedPhase = predictedPhase.astype(int)
@@ -46,6 +46,7 @@ B. D. Peña, L. Blakely, M. J. Reno, “Data-Driven Detection of Phase Changes i
 ###############################################################
 #   Import Python Libraries
 
+import sys
 from pathlib import Path
 from pathlib import PosixPath
 import numpy as np
@@ -55,9 +56,16 @@ import pandas as pd
 if __package__ in [None, '']:
     import ChangepointUtils as CPUtils
     import OnlineChangepointFunctions as OCF
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+    from CommonUtils import ProfilingUtils
+    from CommonUtils import DataIOUtils
 else:
     from . import ChangepointUtils as CPUtils
     from . import OnlineChangepointFunctions as OCF
+    from ..CommonUtils import PreprocessingUtils
+    from ..CommonUtils import ProfilingUtils
+    from ..CommonUtils import DataIOUtils
 
 #           End of Imports
 ###############################################################################
@@ -67,11 +75,17 @@ else:
 #
 #                           PhaseChangepoint
 #
-def run( Changepoint_voltageData_csv: str, Changepoint_customerIDs_csv: str, Changepoint_AllCustomerIDs_csv: str, Changepoint_phaseLabels_csv: str,Changepoint_timesteps_csv: str, td_curve_path: str, saveResultsPath: PosixPath ):
+def run( Changepoint_voltageData_csv: str, Changepoint_customerIDs_csv: str, Changepoint_AllCustomerIDs_csv: str, Changepoint_phaseLabels_csv: str,Changepoint_timesteps_csv: str, td_curve_path: str, saveResultsPath: PosixPath, profilePath: str = -1, profilerHook = -1 ):
     """   This function is a wrapper for the CreateTimeDurationCurve_Script.py file.
 
           Note that the indexing of all variables above should match in the customer index, i.e. custIDInput[0], transLabelsInput[0,0], voltageInput[:,0], pDataInput[:,0], and qDataInput[:,0] should all be the same customer
 
+          Each input file may also be a .npy/.npz file, which is memory
+          mapped, or a Parquet or Arrow IPC (.arrow/.feather) file, chosen by
+          the file extension.  See DataIOUtils.ConvertInputFile to convert
+          the CSV files once.  Parquet and Arrow IPC require the pyarrow
+          package.
+
           Parameters
           ---------
             Changepoint_voltageData_csv: str - path to csv with customer data
@@ -85,52 +99,66 @@ def run( Changepoint_voltageData_csv: str, Changepoint_customerIDs_csv: str, Cha
            saveResultsPath: Pathlib Path
             useTrueLabels: boolean value
 
+            profilePath: str or Path - if supplied, the wall time, CPU time,
+                peak memory, and array sizes of each stage of the run are
+                written to this JSON file, see CommonUtils/ProfilingUtils.py.
+                The default (-1) does not profile the run
+            profilerHook: 'cprofile' or a profiler object with enable/disable
+                or start/stop methods, run for the whole run when profilePath
+                is supplied.  cProfile statistics are written next to the 
+                JSON file with the suffix .prof
           Returns
             ---------
             results.csv
     """
     
+    if type(profilePath) != int:
+        profile = ProfilingUtils.CreateRunProfile('PhaseChangepoint',profilerHook)
+    else:
+        profile = -1
+
     # Data loading and pre-processing
-    voltageInput = CPUtils.ConvertCSVtoNPY( Changepoint_voltageData_csv )
-    phaseLabelsInput = CPUtils.ConvertCSVtoNPY( Changepoint_phaseLabels_csv )
+
+    with ProfilingUtils.ProfileStage(profile,'ingest') as stage:
+        voltageInput = DataIOUtils.LoadArray( Changepoint_voltageData_csv )
+        phaseLabelsInput = DataIOUtils.LoadArray( Changepoint_phaseLabels_csv )
     
-    with open(Changepoint_customerIDs_csv, 'r') as file:
-        groundtruthIDs = [x.rstrip() for x in file]
+        groundtruthIDs = DataIOUtils.LoadIDs(Changepoint_customerIDs_csv)
     
-    with open(Changepoint_AllCustomerIDs_csv, 'r') as file:
-        custIDsInput = [x.rstrip() for x in file]
-    groundtruthTimesteps = CPUtils.ConvertCSVtoNPY(Changepoint_timesteps_csv)    
+        custIDsInput = DataIOUtils.LoadIDs(Changepoint_AllCustomerIDs_csv)
+        groundtruthTimesteps = DataIOUtils.LoadArray(Changepoint_timesteps_csv)    
     
     
     
-    # Format ground truth labels as dictionaries
-    realEventsIDs = {}
-    realEventsPhases = {}
-    for custCtr in range(0,len(groundtruthIDs)):
-        currCust = groundtruthIDs[custCtr]
-        realEventsIDs[currCust] = [groundtruthTimesteps[custCtr,0],]
-        realEventsPhases[currCust] = groundtruthTimesteps[custCtr,1]
-    custIDs = []
-    for custCtr in range(0,len(custIDsInput)):
-        custIDs.append(str(custIDsInput[custCtr]))
-    #saveResultsBasePath = currentDirectory
-
-
-    # Load Time Duration Curve Parameters from file - This would have been generated using the CreateTimeDurationCurve_Script.py
-    #td_curve_path = currentDirectory
-
-    # Try to use a newly generated time duration curve parameters (td_curve_params.npy), else use the provided parameters generated using the sample data (td_curve_params_SAMPLE.npy)
-    try:
-        filePath = str(td_curve_path) + '\\td_curve_params.npy'
-        td_curve_params = np.load(filePath)    
-    except:
-        filePath = str(td_curve_path) + '\\td_curve_params_SAMPLE.npy'
-        td_curve_params = np.load(filePath)     
-
-    # Time Duration Curve Definition - using the generated parameters
-    tdFlatlineCutoff = 0.5
-    funct = lambda x, a, b, c: a * np.exp(-b * x) + c
-    td_curve = lambda x : 0.99 if x == 2 else ( tdFlatlineCutoff if funct(x-1, *td_curve_params) <= tdFlatlineCutoff else funct(x-1, *td_curve_params))
+        # Format ground truth labels as dictionaries
+        realEventsIDs = {}
+        realEventsPhases = {}
+        for custCtr in range(0,len(groundtruthIDs)):
+            currCust = groundtruthIDs[custCtr]
+            realEventsIDs[currCust] = [groundtruthTimesteps[custCtr,0],]
+            realEventsPhases[currCust] = groundtruthTimesteps[custCtr,1]
+        custIDs = []
+        for custCtr in range(0,len(custIDsInput)):
+            custIDs.append(str(custIDsInput[custCtr]))
+        #saveResultsBasePath = currentDirectory
+
+
+        # Load Time Duration Curve Parameters from file - This would have been generated using the CreateTimeDurationCurve_Script.py
+        #td_curve_path = currentDirectory
+
+        # Try to use a newly generated time duration curve parameters (td_curve_params.npy), else use the provided parameters generated using the sample data (td_curve_params_SAMPLE.npy)
+        try:
+            filePath = str(td_curve_path) + '\\td_curve_params.npy'
+            td_curve_params = np.load(filePath)    
+        except:
+            filePath = str(td_curve_path) + '\\td_curve_params_SAMPLE.npy'
+            td_curve_params = np.load(filePath)     
+
+        # Time Duration Curve Definition - using the generated parameters
+        tdFlatlineCutoff = 0.5
+        funct = lambda x, a, b, c: a * np.exp(-b * x) + c
+        td_curve = lambda x : 0.99 if x == 2 else ( tdFlatlineCutoff if funct(x-1, *td_curve_params) <= tdFlatlineCutoff else funct(x-1, *td_curve_params))
+        ProfilingUtils.RecordArraySizes(stage,voltageInput=voltageInput)
 
     ###############################################################################
     #
@@ -160,35 +188,41 @@ def run( Changepoint_voltageData_csv: str, Changepoint_customerIDs_csv: str, Cha
     #                   Run the Online Algorithm
     #                   
 
-    # Add realistic data concerns to the synthetic sample data
-    if addNoiseFlag:
-        voltageNoise = CPUtils.AddGaussianNoise(voltageInput, perSTDNoise, meanValue, perNoiseCustomers)
-        print('Added Gaussian measurement noise to the sample data')
-    else:
-        voltageNoise = deepcopy(voltageInput)
-
-    missVoltage = CPUtils.MissingData_VarInt(voltageNoise, percentMissing=percentMissing, minmissingDataInterval=minMissingDataInterval, maxmissingDataInterval=maxMissingDataInterval)
-    print('Added missing data to the sample data')
-    newVoltage = CPUtils.ConvertToPerUnit_Voltage(missVoltage)
-    newVoltage = CPUtils.CalcDeltaVoltage(newVoltage)
-    print('Converted data into per-unit and delta voltage representation')
-
-    if perMislabeledPhases != 0:
-        phaseLabelErrors = CPUtils.AddMisLabeledPhases(phaseLabelsInput,perMislabeledPhases)
-        print('Injected ' + str(perMislabeledPhases) + ' % mislabeled phases')
-    else:
-        phaseLabelErrors = phaseLabelsInput
-
-    print('Beginning phase change detection algorithm')
-    # Call primary changepoint function
-    predictionsOverTime, aggMatAll, possibleChangePointsAll, \
-        confidenceScoresAll, predictedPhasesAll = OCF.OnlineChangepointFunc(custIDs,newVoltage,phaseLabelErrors,td_curve,)
-    print('Algorithm Complete')
-    #Save CSV results file
-    lastPred = predictionsOverTime[-1]
-    filePath = str(saveResultsPath) + '\\results.csv'
-    lastPred.to_csv(filePath)
-    print('Saved results from the last available window into results.csv ')
+    with ProfilingUtils.ProfileStage(profile,'preprocessing') as stage:
+        # Add realistic data concerns to the synthetic sample data
+        if addNoiseFlag:
+            voltageNoise = CPUtils.AddGaussianNoise(voltageInput, perSTDNoise, meanValue, perNoiseCustomers)
+            print('Added Gaussian measurement noise to the sample data')
+        else:
+            voltageNoise = deepcopy(voltageInput)
+
+        missVoltage = CPUtils.MissingData_VarInt(voltageNoise, percentMissing=percentMissing, minmissingDataInterval=minMissingDataInterval, maxmissingDataInterval=maxMissingDataInterval)
+        print('Added missing data to the sample data')
+        newVoltage = PreprocessingUtils.PreprocessVoltage(missVoltage,filterFlag=False,voltageLevels=CPUtils.VOLTAGE_LEVELS)[0]
+        print('Converted data into per-unit and delta voltage representation')
+
+        if perMislabeledPhases != 0:
+            phaseLabelErrors = CPUtils.AddMisLabeledPhases(phaseLabelsInput,perMislabeledPhases)
+            print('Injected ' + str(perMislabeledPhases) + ' % mislabeled phases')
+        else:
+            phaseLabelErrors = phaseLabelsInput
+        ProfilingUtils.RecordArraySizes(stage,newVoltage=newVoltage)
+
+    with ProfilingUtils.ProfileStage(profile,'clustering') as stage:
+        print('Beginning phase change detection algorithm')
+        # Call primary changepoint function
+        predictionsOverTime, aggMatAll, possibleChangePointsAll, \
+            confidenceScoresAll, predictedPhasesAll = OCF.OnlineChangepointFunc(custIDs,newVoltage,phaseLabelErrors,td_curve,)
+        print('Algorithm Complete')
+        ProfilingUtils.RecordArraySizes(stage,predictedPhasesAll=predictedPhasesAll)
+
+    with ProfilingUtils.ProfileStage(profile,'output') as stage:
+        #Save CSV results file
+        lastPred = predictionsOverTime[-1]
+        filePath = str(saveResultsPath) + '\\results.csv'
+        lastPred.to_csv(filePath)
+        print('Saved results from the last available window into results.csv ')
+        ProfilingUtils.RecordArraySizes(stage,lastPred=lastPred)
 
     #
     #               End of Online Changepoint Algorithm
@@ -199,16 +233,21 @@ def run( Changepoint_voltageData_csv: str, Changepoint_customerIDs_csv: str, Cha
     #               Results Analysis Section
     #   
             
-    ## Analyze results over time
-    resultsOverTime = OCF.getFP_FN_TP_Analysis(predictionsOverTime, realEventsIDs, windowSize)
-    timeToFlagged, timeToDecided = OCF.getTime_To_Detection_TP(predictionsOverTime, realEventsIDs,realEventsPhases, windowSize)
 
-    # Plot results figures
-    OCF.PlotFPOverTime_LINE(resultsOverTime,savePath=saveResultsPath)
+    with ProfilingUtils.ProfileStage(profile,'scoring') as stage:
+        ## Analyze results over time
+        resultsOverTime = OCF.getFP_FN_TP_Analysis(predictionsOverTime, realEventsIDs, windowSize)
+        timeToFlagged, timeToDecided = OCF.getTime_To_Detection_TP(predictionsOverTime, realEventsIDs,realEventsPhases, windowSize)
+
+    with ProfilingUtils.ProfileStage(profile,'plotting') as stage:
+        # Plot results figures
+        OCF.PlotFPOverTime_LINE(resultsOverTime,savePath=saveResultsPath)
+
+        OCF.plotTimeToFlaggedDecided_HIST(timeToFlagged,timeToDecided,savePath=saveResultsPath)
 
-    OCF.plotTimeToFlaggedDecided_HIST(timeToFlagged,timeToDecided,savePath=saveResultsPath)
+        OCF.plotTP_Flagged_Decided_LINE(realEventsIDs,predictedPhasesAll.shape[1],windowSize,timeToFlagged,timeToDecided,savePath=saveResultsPath)
 
-    OCF.plotTP_Flagged_Decided_LINE(realEventsIDs,predictedPhasesAll.shape[1],windowSize,timeToFlagged,timeToDecided,savePath=saveResultsPath)
+    ProfilingUtils.FinishRunProfile(profile,profilePath)
 
 # End of PhaseChangepoint
 
@@ -38,7 +38,23 @@ Ensemble Method for the phase identification task.
     Functions:
         -  SPClustering
         -  SPClustering_Precomp
+        -  ClusterVoltWindow
+        -  ClusterVoltWindow_Timed
+        -  MergeWindowLabels
+        -  UpdateEnsembleFromBatch
+        -  CreateEnsembleState
+        -  UpdateEnsembleCounts
+        -  CreateWindowOrder
+        -  GetCoAssociationSample
+        -  UpdateEnsembleState
+        -  SelectLandmarks
+        -  ClusterEnsembleState
+        -  SaveEnsembleState
+        -  LoadEnsembleState
         -  CAEnsemble
+        -  CAEnsemble_MultiWindowSize
+        -  SweepKFinal
+        -  EvaluateNystromApproximation
    
     
 Publications related to this method:
@@ -53,21 +69,34 @@ L. Blakely, M. J. Reno, and K. Ashok, “AMI Data Quality And Collection Method
 
 # Import - Python Libraries
 from sklearn.cluster import SpectralClustering
+from sklearn.metrics import adjusted_rand_score
 import numpy as np
 from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+import json
+import math
+import time
+from pathlib import Path
 
 # Import - Custom Libraries
 if __package__ in [None, '']:
     import PhaseIdent_Utils as PIUtils
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import SpectralUtils
+    from CommonUtils import WindowCacheUtils
 else:
     from . import PhaseIdent_Utils as PIUtils
+    from ..CommonUtils import SpectralUtils
+    from ..CommonUtils import WindowCacheUtils
 
 ###############################################################################
 #
 #                                  SPClustering
 #
 
-def SPClustering(features,k):
+def SPClustering(features,k,randomState=None):
     """ This function takes a window of timeseries data for the total number of
          customers and the number of desired clusters and performs the spectral 
          clustering algorithm on that data, returning the cluster labels for each 
@@ -84,6 +113,8 @@ def SPClustering(features,k):
                     missing data are removed.  Any NaN values in this matrix
                     will cause the SpectralClustering function to fail.  
                 k:  int - Number of clusters
+                randomState: int or None - seed passed to SpectralClustering.
+                    The default of None uses the numpy global random state
                 
             Returns
             -------
@@ -91,7 +122,7 @@ def SPClustering(features,k):
                     each customer (1-k)
             """       
     
-    sp = SpectralClustering(n_clusters=k,affinity='rbf')
+    sp = SpectralClustering(n_clusters=k,affinity='rbf',random_state=randomState)
     clusterLabels = sp.fit_predict(features)    
     return clusterLabels       
 # End of SPClustering
@@ -103,7 +134,7 @@ def SPClustering(features,k):
 #                                  SPClustering_Precomp
 #
 
-def SPClustering_Precomp(aggWM,kFinal):
+def SPClustering_Precomp(aggWM,kFinal,randomState=None):
     """ This function takes a precomputed affinity matrix, in the form
         of a co-association matrix generated by CAEnsemble and will
         use that to construct the final clusters representing the three-phases.
@@ -118,6 +149,8 @@ def SPClustering_Precomp(aggWM,kFinal):
                     parameter to 4 of 7 is a good place to start.  If the feeder
                     in question has voltage regulating devices a larger number 
                     of final clusters may be required.
+                randomState: int or None - seed passed to SpectralClustering.
+                    The default of None uses the numpy global random state
                 
             Returns
             -------
@@ -125,19 +158,828 @@ def SPClustering_Precomp(aggWM,kFinal):
                     each customer (1-k)
             """       
 
-    sp = SpectralClustering(n_clusters=kFinal,n_init=10,assign_labels='discretize',affinity='precomputed')
+    sp = SpectralClustering(n_clusters=kFinal,n_init=10,assign_labels='discretize',affinity='precomputed',random_state=randomState)
     clusterLabels = sp.fit_predict(aggWM)    
     return clusterLabels       
 # End of SPClustering_Precomp
 
 
 
+###############################################################################
+#
+#                       ClusterVoltWindow
+#
+
+def ClusterVoltWindow(currentDistances,kVector,randomState=None,affinityMode='rbf',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack',windowCache=-1,windowIDs=-1):
+    """ This function clusters a single cleaned window for each value of k in
+        kVector using a spectral embedding that is shared between the values
+        of k (see SpectralUtils.SPClustering_MultK).  It is the unit of work that CAEnsemble sends to the worker
+        processes, so it must remain a module-level function.
+
+            Parameters
+            ---------
+                currentDistances: numpy array of float (customers,measurements)
+                    - a window of measurements with customers with missing data
+                    already removed
+                kVector: numpy array of int - a vector of the possible values of
+                    k for the windows
+                randomState: int or None - seed for the spectral clustering.
+                    None uses the numpy global random state
+                affinityMode: str - 'rbf' for the dense RBF affinity or 'knn'
+                    for the sparse kNN affinity
+                numNeighbors: int - the number of neighbors for the 'knn' mode
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg'
+                windowCache: dict - a window clustering cache from 
+                    WindowCacheUtils.CreateWindowCache.  The default (-1) does
+                    not use a cache
+                windowIDs: numpy array of str - the customers in the window,
+                    part of the cache key
+
+            Returns
+            -------
+                windowLabels:  list of numpy array of int - the cluster labels
+                    for each value of k, in kVector order.  Values of k that 
+                    are not smaller than the number of customers in the window
+                    are skipped and have no entry in the list
+            """
+
+    # The affinity matrix and spectral embedding are shared between all values of k
+    allClusterLabels = WindowCacheUtils.SPClustering_MultK_Cached(currentDistances,kVector,windowCache,windowIDs,randomState,affinityMode,numNeighbors,eigenSolver)
+    windowLabels = [clusterLabels for clusterLabels in allClusterLabels if type(clusterLabels) != int]
+    return windowLabels
+# End of ClusterVoltWindow
+
+
+
+###############################################################################
+#
+#                       ClusterVoltWindow_Timed
+#
+
+def ClusterVoltWindow_Timed(currentDistances,kVector,randomState=None,affinityMode='rbf',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack',windowCache=-1,windowIDs=-1):
+    """ This function calls ClusterVoltWindow and also returns the time taken,
+        so the cost of each window can be measured inside worker processes
+
+            Parameters
+            ---------
+                See ClusterVoltWindow
+
+            Returns
+            -------
+                allClusterLabels: list of numpy array of int - see 
+                    ClusterVoltWindow
+                elapsedTime: float - the time taken in seconds
+            """
+
+    startTime = time.perf_counter()
+    allClusterLabels = ClusterVoltWindow(currentDistances,kVector,randomState,affinityMode,numNeighbors,eigenSolver,windowCache,windowIDs)
+    return allClusterLabels, time.perf_counter() - startTime
+# End of ClusterVoltWindow_Timed
+
+
+
+###############################################################################
+#
+#                       MergeWindowLabels
+#
+
+def MergeWindowLabels(windowLabels,currentIndices,aggWM,allClusterCounts):
+    """ This function adds the clusterings of one window, one for each value
+        of k, to the co-association matrix and the list of cluster sizes
+
+            Parameters
+            ---------
+                windowLabels: list of numpy array of int - the cluster labels
+                    for each valid value of k from ClusterVoltWindow
+                currentIndices: numpy array of int - the customer indices of
+                    the customers in the window
+                aggWM: ndarray of float, shape (customers,customers) - the 
+                    co-association matrix, or the packed storage dict from 
+                    PhaseIdent_Utils.CreatePackedAggWM
+                allClusterCounts: list of int - the cluster sizes from each
+                    window clustering, appended to in place
+
+            Returns
+            -------
+                aggWM: the updated co-association matrix
+            """
+
+    for clusterLabels in windowLabels:
+        #Update the weight matrix
+        if type(aggWM) == dict:
+            aggWM = PIUtils.UpdatePackedAggWM(clusterLabels,currentIndices,aggWM,updateWindowCtrFlag=False)
+        else:
+            aggWM, _ = PIUtils.UpdateAggWM_Indexed(clusterLabels,currentIndices,aggWM,-1)
+        #Update Cluster Sizes List
+        allClusterCounts.extend(np.atleast_1d(np.squeeze(PIUtils.CountClusterSizes(clusterLabels))))
+    return aggWM
+# End of MergeWindowLabels
+
+
+
+###############################################################################
+#
+#                       UpdateEnsembleFromBatch
+#
+
+def UpdateEnsembleFromBatch(batchDistances,batchIndices,batchSeeds,kVector,executor,aggWM,allClusterCounts,affinityMode='rbf',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack',windowCache=-1,batchIDs=-1):
+    """ This function clusters a batch of cleaned windows, either serially or
+        using a process pool, and merges the results into the co-association
+        matrix.  The merge is always done in the main process in window order
+        so the result does not depend on the number of workers.  The window
+        counts are not updated here, they are calculated for all windows at
+        once from the window validity matrix (see 
+        PhaseIdent_Utils.CalcWindowPairCounts).
+
+            Parameters
+            ---------
+                batchDistances: list of numpy array of float - the cleaned 
+                    windows (customers,measurements) in the batch
+                batchIndices: list of numpy array of int - the customer indices
+                    for each window in the batch
+                batchSeeds: list of int or None - the random seed for each window
+                kVector: numpy array of int - a vector of the possible values of
+                    k for the windows
+                executor: concurrent.futures.Executor or -1 - the pool used to
+                    cluster the windows.  If -1 the windows are clustered serially
+                aggWM: ndarray of float, shape (customers,customers) - the 
+                    co-association matrix, or the packed storage dict from 
+                    PhaseIdent_Utils.CreatePackedAggWM
+                allClusterCounts: list of int - the cluster sizes from each
+                    window clustering, appended to in place
+                affinityMode: str - the window affinity, 'rbf' or 'knn'
+                numNeighbors: int - the number of neighbors for the 'knn' mode
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg'
+                windowCache: dict - a window clustering cache, see 
+                    ClusterVoltWindow.  With a process pool the cache size 
+                    limit is enforced here after the batch, see
+                    WindowCacheUtils.CheckWindowCacheSize.  The default (-1) 
+                    does not use a cache
+                batchIDs: list of numpy array of str - the customer IDs for 
+                    each window in the batch, used with windowCache
+
+            Returns
+            -------
+                aggWM: ndarray of float, shape (customers,customers) - the
+                    updated co-association matrix
+            """
+
+    numWindows = len(batchDistances)
+    if type(batchIDs) == int:
+        batchIDs = [-1]*numWindows
+    settingsLists = [[kVector]*numWindows,batchSeeds,[affinityMode]*numWindows,[numNeighbors]*numWindows,[eigenSolver]*numWindows,[windowCache]*numWindows,batchIDs]
+    if type(executor) == int:
+        batchLabels = map(ClusterVoltWindow,batchDistances,*settingsLists)
+    else:
+        batchLabels = executor.map(ClusterVoltWindow,batchDistances,*settingsLists)
+    for windowLabels, currentIndices in zip(batchLabels,batchIndices):
+        aggWM = MergeWindowLabels(windowLabels,currentIndices,aggWM,allClusterCounts)
+    # The workers only update their own copy of the cache dict, so the size limit is enforced here
+    if type(windowCache) != int and type(executor) != int:
+        WindowCacheUtils.CheckWindowCacheSize(windowCache)
+    return aggWM
+# End of UpdateEnsembleFromBatch
+
+
+
+###############################################################################
+#
+#                       CreateEnsembleState
+#
+
+def CreateEnsembleState(custID,kVector,windowSize,numPhases=-1,randomSeed=-1,windowAffinityMode='rbf',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack',storageMode='dense',storagePath=-1,maxWindows=-1):
+    """ This function creates the state of an incremental co-association
+        matrix ensemble.  The state holds the co-association and window count
+        accumulators along with the settings of the ensemble, so new data can
+        be folded in with UpdateEnsembleState as it arrives and the final 
+        clustering rerun with ClusterEnsembleState, without reclustering the
+        windows that were already processed.  The state can be written to disk
+        with SaveEnsembleState and restored with LoadEnsembleState.  
+        CAEnsemble is a single pass of these functions over one dataset.
+
+            Parameters
+            ---------
+                custID: list of str - list of customer ids
+                kVector: numpy array of int - a vector of the possible values of
+                    k for the windows
+                windowSize:  int - The size (in number of measurements) of the 
+                    sliding window
+                numPhases: ndarray of int (1,customers) - the indicator for 
+                    each customer if it is a single-phase, 2-phase, or 3-phase
+                    customer.  If -1 all customers are treated as single-phase
+                randomSeed: int - if supplied, window number ensCtr is 
+                    clustered with the seed randomSeed+ensCtr and the final 
+                    clustering uses randomSeed.  The default (-1) uses the 
+                    numpy global random state
+                windowAffinityMode: str - 'rbf' or 'knn', see CAEnsemble
+                numNeighbors: int - the number of neighbors for the 'knn' modes
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg'
+                storageMode: str - 'dense' or 'packed', see CAEnsemble
+                storagePath: str or Path - directory for memory mapped packed
+                    storage.  The default (-1) keeps the storage in memory
+                maxWindows: int - the expected number of windows, used to 
+                    choose the integer type of the packed storage.  The counts
+                    are upcast to a larger type if more windows are added, see
+                    UpdateEnsembleCounts.  The default (-1) starts with the 
+                    smallest type (uint8)
+
+            Returns
+            -------
+                ensState: dict - the ensemble state
+            """
+
+    if type(numPhases) == int:
+        numPhases = np.ones((1,len(custID)),dtype=int)
+    ensState = {'custID':list(custID),
+                'kVector':list(kVector),
+                'windowSize':windowSize,
+                'numPhases':np.array(numPhases,dtype=int),
+                'randomSeed':randomSeed,
+                'windowAffinityMode':windowAffinityMode,
+                'numNeighbors':numNeighbors,
+                'eigenSolver':eigenSolver,
+                'storageMode':storageMode,
+                'numWindows':0,
+                'numWindowsClustered':0, # Fewer than numWindows if an update stopped early
+                'custWindowCounts':np.zeros((len(custID)),dtype=int), # This tracks the number of windows used for each customer
+                'allClusterCounts':[],
+                'voltageBuffer':np.zeros((0,len(custID)),dtype=float)} # Measurements that did not fill a complete window yet
+    if storageMode == 'packed':
+        # The co-association and window counts are held in packed upper-triangular integer arrays
+        if maxWindows == -1:
+            maxCount = 0
+        else:
+            maxCount = maxWindows * len(kVector)
+        ensState['aggWM'] = PIUtils.CreatePackedAggWM(len(custID),maxCount,storagePath)
+        ensState['windowCtr'] = -1
+    else:
+        ensState['aggWM'] = PIUtils.CreateAggWeightMatrix(custID) # This is the co-assocation matrix
+        ensState['windowCtr'] = PIUtils.CreateAggWeightMatrix(custID) # This tracks the number of windows where each pair of customers was included together
+    return ensState
+# End of CreateEnsembleState
+
+
+
+###############################################################################
+#
+#                       UpdateEnsembleCounts
+#
+
+def UpdateEnsembleCounts(ensState,validWindows):
+    """ This function adds the window counts for a set of windows to an 
+        ensemble state: the number of windows for each customer and the number
+        of window clusterings that included each pair of customers.  Packed
+        counts are upcast first if the new windows could overflow their 
+        integer type.  No count can exceed the largest window count of a 
+        customer with itself, so the current largest diagonal count plus the
+        number of new window clusterings bounds every count.
+
+            Parameters
+            ---------
+                ensState: dict - the ensemble state, updated in place
+                validWindows: numpy array of bool (windows,customers) - the 
+                    window validity matrix from 
+                    PhaseIdent_Utils.CreateWindowValidityMatrix
+
+            Returns
+            -------
+                ensState: dict - the updated ensemble state
+            """
+
+    numValid = np.sum(validWindows,axis=1)
+    windowWeights = np.sum(numValid[:,np.newaxis] > np.array(ensState['kVector'])[np.newaxis,:],axis=1) # The number of values of k clustered in each window
+    ensState['custWindowCounts'] += np.sum(validWindows,axis=0)
+    if type(ensState['aggWM']) == dict:
+        maxCount = int(np.max(ensState['aggWM']['windowCtr'][ensState['aggWM']['rowOffsets']],initial=0)) + int(np.sum(windowWeights))
+        ensState['aggWM'] = PIUtils.EnsurePackedCapacity(ensState['aggWM'],maxCount)
+        ensState['aggWM'] = PIUtils.AddPackedWindowCounts(ensState['aggWM'],validWindows,windowWeights)
+    else:
+        ensState['windowCtr'] += PIUtils.CalcWindowPairCounts(validWindows,windowWeights)
+    return ensState
+# End of UpdateEnsembleCounts
+
+
+
+###############################################################################
+#
+#                       CreateWindowOrder
+#
+
+def CreateWindowOrder(numWindows,windowOrder='sequential',randomSeed=-1):
+    """ This function returns the order in which the windows of an ensemble
+        update are clustered.  The order only matters if the update may stop
+        early, in which case the windows clustered first should represent the
+        whole dataset.
+
+            Parameters
+            ---------
+                numWindows: int - the number of windows
+                windowOrder: str - 'sequential' clusters the windows in time
+                    order.  'random' uses a random permutation.  'stratified'
+                    uses a low-discrepancy (van der Corput) ordering so every
+                    prefix of the order is spread evenly over the dataset
+                randomSeed: int - the seed for the 'random' order.  The 
+                    default (-1) uses the numpy global random state
+
+            Returns
+            -------
+                order: numpy array of int (windows) - the window indices in 
+                    the order they should be clustered
+            """
+
+    if windowOrder == 'random':
+        if randomSeed == -1:
+            return np.random.permutation(numWindows)
+        return np.random.default_rng(randomSeed).permutation(numWindows)
+    elif windowOrder == 'stratified':
+        # Reverse the bits of each index to get its position in the van der Corput sequence
+        indices = np.arange(numWindows)
+        numBits = max(1,int(np.ceil(np.log2(max(numWindows,2)))))
+        reversedIndices = np.zeros((numWindows,),dtype=np.int64)
+        for bitCtr in range(0,numBits):
+            reversedIndices |= ((indices >> bitCtr) & 1) << (numBits - 1 - bitCtr)
+        return np.argsort(reversedIndices,kind='stable')
+    return np.arange(numWindows)
+# End of CreateWindowOrder
+
+
+
+###############################################################################
+#
+#                       GetCoAssociationSample
+#
+
+def GetCoAssociationSample(ensState,monitorIndices):
+    """ This function returns the normalized co-association matrix of an
+        ensemble state for a subset of the customers, used to monitor the
+        convergence of the ensemble without forming the full normalized matrix
+
+            Parameters
+            ---------
+                ensState: dict - the ensemble state
+                monitorIndices: numpy array of int - the customer indices to
+                    include
+
+            Returns
+            -------
+                sample: numpy array of float (monitored,monitored) - the 
+                    co-association counts divided by the window counts, zero 
+                    for pairs that have not been in a window together
+            """
+
+    aggWM = ensState['aggWM']
+    if type(aggWM) == dict:
+        positions = PIUtils.GetPackedPositions(aggWM,monitorIndices,monitorIndices)
+        counts = np.asarray(aggWM['aggWM'][positions],dtype=float)
+        windowCounts = np.asarray(aggWM['windowCtr'][positions],dtype=float)
+    else:
+        sampleBlock = np.ix_(monitorIndices,monitorIndices)
+        counts = aggWM[sampleBlock]
+        windowCounts = ensState['windowCtr'][sampleBlock]
+    return np.divide(counts,np.maximum(windowCounts,1))
+# End of GetCoAssociationSample
+
+
+
+###############################################################################
+#
+#                       UpdateEnsembleState
+#
+
+def UpdateEnsembleState(ensState,voltage,numJobs=1,executor=-1,windowOrder='sequential',convergenceTol=-1,timeBudget=-1,checkInterval=-1,monitorSize=1000,windowCache=-1):
+    """ This function folds new measurements into an ensemble state.  The 
+        measurements are split into windows, each window is clustered for each
+        value of k, and the results are added to the co-association and window
+        count accumulators.  Measurements left over at the end that do not
+        fill a complete window are kept in the state and used at the start of
+        the next update.
+        The update can stop before all of the windows are clustered, either
+        when the co-association matrix has converged or when a time budget is
+        used up.  In that case the windows are clustered in chunks of 
+        checkInterval windows, in the order given by windowOrder, and the
+        accumulators only include the windows that were clustered.  
+        Convergence is measured on the normalized co-association matrix of a
+        random sample of monitorSize customers, as the mean absolute change
+        since the previous chunk; the update stops after the change is below
+        convergenceTol for two consecutive chunks.
+
+            Parameters
+            ---------
+                ensState: dict - the ensemble state from CreateEnsembleState 
+                    or LoadEnsembleState.  It is updated in place
+                voltage:  numpy array of float (measurements,customers) - the 
+                    new measurements, pre-processed in the same way as the 
+                    data for CAEnsemble (per-unit, difference representation)
+                    and continuing from the previous update
+                numJobs: int - the number of worker processes used to cluster
+                    the windows, see CAEnsemble
+                executor: concurrent.futures.Executor - an existing process
+                    pool, see CAEnsemble
+                windowOrder: str - 'sequential', 'random', or 'stratified', 
+                    see CreateWindowOrder
+                convergenceTol: float - the mean absolute change in the 
+                    normalized co-association values between chunks below 
+                    which the ensemble is considered converged, e.g. 0.005.
+                    The default (-1) disables the convergence check
+                timeBudget: float - the time in seconds after which no more 
+                    chunks are started.  The default (-1) has no time limit
+                checkInterval: int - the number of windows between checks.  
+                    The default (-1) checks about 20 times per update
+                monitorSize: int - the number of customers sampled for the
+                    convergence check
+                windowCache: dict - a window clustering cache, see 
+                    ClusterVoltWindow.  The default (-1) does not use a cache
+
+            Returns
+            -------
+                ensState: dict - the updated ensemble state
+            """
+
+    startTime = time.perf_counter()
+    kVector = ensState['kVector']
+    windowSize = ensState['windowSize']
+    voltage = np.concatenate((ensState['voltageBuffer'],np.asarray(voltage,dtype=float)),axis=0)
+    ensTotal = int(np.floor(voltage.shape[0] / windowSize))  # This determines the total number of windows based on available data and window size
+    ensState['voltageBuffer'] = voltage[(ensTotal*windowSize):,:]
+
+    # Find the customers with complete data in each window in a single pass, the window counts follow directly from this
+    validWindows = PIUtils.CreateWindowValidityMatrix(voltage,windowSize)
+
+    # Windows are clustered in batches, either serially or in a process pool, and merged in window order
+    ownExecutor = False
+    if type(executor) == int and numJobs != 1:
+        if numJobs < 1:
+            numJobs = os.cpu_count()
+        executor = ProcessPoolExecutor(max_workers=numJobs)
+        ownExecutor = True
+    if type(executor) == int:
+        batchSize = 1
+    elif ownExecutor:
+        batchSize = 4 * numJobs
+    else:
+        batchSize = 4 * os.cpu_count()
+
+    # Without a stopping rule all windows are a single chunk
+    earlyStopFlag = (convergenceTol != -1) or (timeBudget != -1)
+    if not earlyStopFlag:
+        chunkSize = max(ensTotal,1)
+    elif checkInterval == -1:
+        chunkSize = max(batchSize,int(np.ceil(ensTotal / 20)))
+    else:
+        chunkSize = max(1,checkInterval)
+    if ensState['randomSeed'] == -1:
+        orderSeed = -1
+        monitorRNG = np.random.default_rng()
+    else:
+        orderSeed = ensState['randomSeed'] + ensState['numWindows']
+        monitorRNG = np.random.default_rng(ensState['randomSeed'])
+    windowOrder = CreateWindowOrder(ensTotal,windowOrder,orderSeed)
+    if convergenceTol != -1:
+        monitorIndices = np.sort(monitorRNG.choice(len(ensState['custID']),min(monitorSize,len(ensState['custID'])),replace=False))
+        previousSample = GetCoAssociationSample(ensState,monitorIndices)
+    numConverged = 0
+    numClustered = 0
+
+    # The pool created here is shut down even if clustering a window fails
+    try:
+        for chunkStart in range(0,ensTotal,chunkSize):
+            chunkWindows = windowOrder[chunkStart:(chunkStart+chunkSize)]
+            ensState = UpdateEnsembleCounts(ensState,validWindows[chunkWindows,:])
+            batchDistances = []
+            batchIndices = []
+            batchSeeds = []
+            # Loop through each window in the chunk
+            for ensCtr in chunkWindows:
+                print('Ensemble Progress: ' + str(numClustered) + '/' + str(ensTotal))
+                numClustered = numClustered + 1
+                #Select the next time series window, keeping only the customers without missing data in that window
+                currentIndices = np.where(validWindows[ensCtr,:])[0]
+                # Check for the case where every customer has missing data in the window
+                if len(currentIndices) != 0:
+                    currentDistances = PIUtils.GetVoltWindow(voltage,windowSize,ensCtr)[:,validWindows[ensCtr,:]]
+                    batchDistances.append(currentDistances.transpose())
+                    batchIndices.append(currentIndices)
+                    if ensState['randomSeed'] == -1:
+                        batchSeeds.append(None)
+                    else:
+                        batchSeeds.append(ensState['randomSeed'] + ensState['numWindows'] + int(ensCtr))
+                if len(batchDistances) == batchSize or (ensCtr == chunkWindows[-1] and len(batchDistances) != 0):
+                    if type(windowCache) == int:
+                        batchIDs = -1
+                    else:
+                        batchIDs = [np.asarray(ensState['custID'])[currentIndices] for currentIndices in batchIndices]
+                    ensState['aggWM'] = UpdateEnsembleFromBatch(batchDistances,batchIndices,batchSeeds,kVector,executor,ensState['aggWM'],ensState['allClusterCounts'],
+                                                                ensState['windowAffinityMode'],ensState['numNeighbors'],ensState['eigenSolver'],windowCache,batchIDs)
+                    batchDistances = []
+                    batchIndices = []
+                    batchSeeds = []
+            # End of ensCtr for loop
+            if numClustered == ensTotal:
+                break
+            if convergenceTol != -1:
+                currentSample = GetCoAssociationSample(ensState,monitorIndices)
+                change = np.mean(np.abs(currentSample - previousSample))
+                previousSample = currentSample
+                if change < convergenceTol:
+                    numConverged = numConverged + 1
+                else:
+                    numConverged = 0
+                if numConverged == 2:
+                    print('The co-association matrix converged after ' + str(numClustered) + '/' + str(ensTotal) + ' windows (mean change ' + str(change) + ')')
+                    break
+            if timeBudget != -1 and (time.perf_counter() - startTime) > timeBudget:
+                print('The time budget of ' + str(timeBudget) + ' seconds was used after ' + str(numClustered) + '/' + str(ensTotal) + ' windows')
+                break
+        # End of chunk for loop
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+    ensState['numWindows'] = ensState['numWindows'] + ensTotal
+    ensState['numWindowsClustered'] = ensState['numWindowsClustered'] + numClustered
+    return ensState
+# End of UpdateEnsembleState
+
+
+
+###############################################################################
+#
+#                       SelectLandmarks
+#
+
+def SelectLandmarks(numCust,kFinal,numLandmarks=-1,randomSeed=-1):
+    """ This function chooses the landmark customers for the Nystrom final 
+        clustering, a uniform random sample of the customers
+
+            Parameters
+            ---------
+                numCust: int - the number of clustered customers
+                kFinal: int - the number of final clusters
+                numLandmarks: int - the number of landmarks.  The default (-1)
+                    uses the larger of 500 and 20*kFinal
+                randomSeed: int - seed for the sample.  The default (-1) uses
+                    a random sample
+
+            Returns
+            -------
+                landmarkIndices: numpy array of int - the sorted indices of 
+                    the landmark customers
+            """
+
+    if numLandmarks == -1:
+        numLandmarks = max(500,20*kFinal)
+    numLandmarks = min(max(numLandmarks,kFinal+1),numCust)
+    if randomSeed == -1:
+        landmarkRNG = np.random.default_rng()
+    else:
+        landmarkRNG = np.random.default_rng(randomSeed)
+    return np.sort(landmarkRNG.choice(numCust,numLandmarks,replace=False))
+# End of SelectLandmarks
+
+
+
+###############################################################################
+#
+#                       ClusterEnsembleState
+#
+
+def ClusterEnsembleState(ensState,kFinal,finalClusterMode='dense',lowWindowsThresh=4,printLowWinWarningFlag=True,numLandmarks=-1,returnPackedFlag=False):
+    """ This function runs the final clustering on the co-association matrix
+        accumulated in an ensemble state.  The accumulators are not modified,
+        so the state can continue to be updated afterwards.  The outputs are 
+        the same as CAEnsemble.
+
+            Parameters
+            ---------
+                ensState: dict - the ensemble state
+                kFinal:  int - Number of clusters for the final clustering
+                finalClusterMode: str - 'dense', 'knn', or 'nystrom', see
+                    CAEnsemble.  'nystrom' requires packed storage
+                lowWindowsThresh: int - the minimum number of windows before
+                    printing a warning that some customers had few windows 
+                    due to missing data
+                printLowWinWarningFlag: boolean - allows supression of the 
+                    printout if customer has only a few windows in the ensemble
+                numLandmarks: int - the number of landmarks for the 'nystrom'
+                    mode, see SelectLandmarks
+                returnPackedFlag: boolean - with packed storage, return the 
+                    packed storage dict instead of the dense normalized 
+                    co-association matrix, see CAEnsemble
+
+            Returns
+            -------
+                finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,
+                    aggWM_Norm,custWindowCounts - see CAEnsemble
+            """
+
+    if finalClusterMode == 'nystrom' and ensState['storageMode'] != 'packed':
+        print("Error!  finalClusterMode='nystrom' requires storageMode='packed'")
+        return (-1,-1,-1,-1,-1,-1)
+    custID = ensState['custID']
+    numPhases = ensState['numPhases']
+    custWindowCounts = ensState['custWindowCounts']
+    numNeighbors = ensState['numNeighbors']
+    eigenSolver = ensState['eigenSolver']
+    aggWM = ensState['aggWM']
+    windowCtr = ensState['windowCtr']
+
+    # Zero entries for 2-phase and 3-phase customers with themselves so they cannot be clustered together
+    # Note that 2-phase and 3-phase datastreams must be adjacent in the indexing!
+    multiPhasePairs = []
+    custCtr = 0
+    while custCtr < len(custID):
+        if numPhases[0,custCtr] == 2:
+            multiPhasePairs.append((custCtr,(custCtr+1)))
+            custCtr = custCtr + 2
+        elif numPhases[0,custCtr] == 3:
+            multiPhasePairs.extend([(custCtr,(custCtr+1)),(custCtr,(custCtr+2)),((custCtr+1),(custCtr+2))])
+            custCtr = custCtr + 3
+        else:
+            custCtr = custCtr + 1
+    if ensState['randomSeed'] == -1:
+        finalSeed = None
+    else:
+        finalSeed = ensState['randomSeed']
+
+    #Split customers into customers who had at least one window of data and those that did not
+    # If a customer had missing data in all windows then they are not included in the algorithm results
+    # A customer that was clustered in any window has a non-zero diagonal entry
+    if ensState['storageMode'] == 'packed':
+        diagonal = aggWM['aggWM'][aggWM['rowOffsets']]
+    else:
+        diagonal = np.diagonal(aggWM)
+    noVotesIndex = list(np.where(diagonal == 0)[0])
+    noVotesIDs = [custID[custCtr] for custCtr in noVotesIndex]
+    clusteredIDs = np.delete(custID,noVotesIndex)
+    clusteredIndices = np.delete(np.arange(len(custID)),noVotesIndex)
+    if len(clusteredIndices) == 0:
+        print('Error!  All customers were eliminated from all windows, and the algorithm could not continue.  This is due to missing data in the customers datastreams.  The distribution of missing data was such that there were instances of missing data in every window for every customer.  You could try reducing the window size, but beware that there still may not be many viable windows ')
+        return (-1,-1,-1,-1,-1,-1)
+
+    if ensState['storageMode'] == 'packed':
+        # The accumulators are shared, not copied.  The multi-phase pairs are recorded so they read as zero when the normalized values are built
+        pairPositions = np.array([PIUtils.GetPackedPositions(aggWM,np.array([pair[0]]),np.array([pair[1]]))[0,0] for pair in multiPhasePairs],dtype=np.int64)
+        aggWM = dict(aggWM)
+        aggWM['clusteredIndices'] = clusteredIndices
+        aggWM['zeroPositions'] = pairPositions
+        # The normalization is done blockwise from the packed counts
+        if finalClusterMode == 'knn':
+            aggWM_Sparse = PIUtils.SparsifyPackedAggWM(aggWM,clusteredIndices,numNeighbors)
+            finalClusterLabels = SpectralUtils.SPClustering_Sparse(aggWM_Sparse,kFinal,eigenSolver,finalSeed)
+        elif finalClusterMode == 'nystrom':
+            # Only the (customers,landmarks) columns are built
+            landmarkIndices = SelectLandmarks(len(clusteredIndices),kFinal,numLandmarks,ensState['randomSeed'])
+            landmarkColumns = PIUtils.UnpackAggWM_Norm(aggWM,clusteredIndices,colIndices=clusteredIndices[landmarkIndices])
+            landmarkColumns[landmarkColumns==0]=0.00001
+            finalClusterLabels = SpectralUtils.SPClustering_Nystrom(landmarkColumns,landmarkIndices,kFinal,finalSeed)
+            del landmarkColumns
+        else:
+            aggWM_Norm = PIUtils.UnpackAggWM_Norm(aggWM,clusteredIndices)
+            aggWM_Norm[aggWM_Norm==0]=0.00001
+            finalClusterLabels = SPClustering_Precomp(aggWM_Norm,kFinal,finalSeed)
+        # The same dense normalized matrix as the dense storage is returned, unless the packed storage was requested
+        if returnPackedFlag:
+            aggWM_Norm = aggWM
+        elif finalClusterMode in ['knn','nystrom']:
+            aggWM_Norm = PIUtils.UnpackAggWM_Norm(aggWM,clusteredIndices)
+            aggWM_Norm[aggWM_Norm==0]=0.00001
+    else:
+        clusteredBlock = np.ix_(clusteredIndices,clusteredIndices)
+        aggWM = aggWM[clusteredBlock]
+        windowCtr = windowCtr[clusteredBlock]
+        newIndices = np.zeros(len(custID),dtype=int) - 1
+        newIndices[clusteredIndices] = np.arange(len(clusteredIndices))
+        for pair in multiPhasePairs:
+            if (newIndices[pair[0]] != -1) and (newIndices[pair[1]] != -1):
+                aggWM[newIndices[pair[0]],newIndices[pair[1]]] = 0
+                aggWM[newIndices[pair[1]],newIndices[pair[0]]] = 0
+        #Normalize aggWM - This is done because each customer would have had different numbers of windows due to missing data, the normalization is done by dividing each cell by the number of windows that pair of customers was both present
+        windowCtr[windowCtr==0]=0.0001 #This prevents divide by zero, the aggWM should already be zero in the locations where windowCtr is 0, so 0 will be the end result in that case anway
+        aggWM_Norm = np.divide(aggWM,windowCtr)
+        aggWM_Norm[np.isnan(aggWM_Norm)] = 0
+        if finalClusterMode == 'knn':
+            # Only the strongest co-associations are kept, so the fully-connected requirement below does not apply
+            aggWM_Sparse = SpectralUtils.SparsifyAffinity(aggWM_Norm,numNeighbors)
+            aggWM_Norm[aggWM_Norm==0]=0.00001
+            finalClusterLabels = SpectralUtils.SPClustering_Sparse(aggWM_Sparse,kFinal,eigenSolver,finalSeed)
+        else:
+            aggWM_Norm[aggWM_Norm==0]=0.00001 # The spectral clustering function does not allow zeros (the precomputed matrix must be fully-connected), so any zeros are set to a very small value
+            finalClusterLabels = SPClustering_Precomp(aggWM_Norm,kFinal,finalSeed)
+    
+    # Few windows warning
+    numLowWindows = np.where(custWindowCounts <= lowWindowsThresh)[0]
+    if printLowWinWarningFlag:
+        if len(numLowWindows) != 0:
+            print('Warning!  ' + str(len(numLowWindows)) + ' customers had fewer than ' + str(lowWindowsThresh) + ' windows used in the phase identification ensemble.  The predictions for these customers should likely be considered low confidence predictions')
+            print('Customer IDs for customers with fewer than ' + str(lowWindowsThresh) + ' windows:')
+            for custCtr in range(0,len(numLowWindows)):
+                print('Customer ID: ' + str(custID[numLowWindows[custCtr]]) + ' - ' + str(custWindowCounts[numLowWindows[custCtr]]) + ' Windows')
+            print('')
+        
+    return finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,aggWM_Norm,deepcopy(custWindowCounts)
+# End of ClusterEnsembleState
+
+
+
+###############################################################################
+#
+#                       SaveEnsembleState
+#
+
+def SaveEnsembleState(ensState,savePath):
+    """ This function saves an ensemble state to a single .npz file so the
+        ensemble can be continued later with LoadEnsembleState
+
+            Parameters
+            ---------
+                ensState: dict - the ensemble state
+                savePath: str or Path - the .npz file to write
+
+            Returns
+            -------
+                None
+            """
+
+    settings = {}
+    for key in ['windowSize','randomSeed','windowAffinityMode','numNeighbors','eigenSolver','storageMode','numWindows','numWindowsClustered']:
+        # numpy scalars are converted to Python scalars for json
+        if isinstance(ensState[key],np.generic):
+            settings[key] = ensState[key].item()
+        else:
+            settings[key] = ensState[key]
+    arrays = {'settings':np.array(json.dumps(settings)),
+              'custID':np.array(ensState['custID'],dtype=str),
+              'kVector':np.array(ensState['kVector'],dtype=int),
+              'numPhases':ensState['numPhases'],
+              'custWindowCounts':ensState['custWindowCounts'],
+              'allClusterCounts':np.array(ensState['allClusterCounts'],dtype=int),
+              'voltageBuffer':ensState['voltageBuffer']}
+    if ensState['storageMode'] == 'packed':
+        arrays['aggWM'] = ensState['aggWM']['aggWM']
+        arrays['windowCtr'] = ensState['aggWM']['windowCtr']
+    else:
+        arrays['aggWM'] = ensState['aggWM']
+        arrays['windowCtr'] = ensState['windowCtr']
+    np.savez(savePath,**arrays)
+# End of SaveEnsembleState
+
+
+
+###############################################################################
+#
+#                       LoadEnsembleState
+#
+
+def LoadEnsembleState(loadPath,storagePath=-1):
+    """ This function loads an ensemble state saved by SaveEnsembleState
+
+            Parameters
+            ---------
+                loadPath: str or Path - the .npz file written by 
+                    SaveEnsembleState
+                storagePath: str or Path - for packed states, a directory used
+                    to back the packed storage with memory mapped files.  The
+                    default (-1) loads the storage into memory
+
+            Returns
+            -------
+                ensState: dict - the ensemble state
+            """
+
+    with np.load(loadPath) as stateFile:
+        settings = json.loads(str(stateFile['settings']))
+        custID = list(stateFile['custID'])
+        ensState = CreateEnsembleState(custID,list(stateFile['kVector']),settings['windowSize'],numPhases=stateFile['numPhases'],randomSeed=settings['randomSeed'],
+                                       windowAffinityMode=settings['windowAffinityMode'],numNeighbors=settings['numNeighbors'],eigenSolver=settings['eigenSolver'],
+                                       storageMode=settings['storageMode'],storagePath=storagePath,maxWindows=1)
+        ensState['numWindows'] = settings['numWindows']
+        ensState['numWindowsClustered'] = settings.get('numWindowsClustered',settings['numWindows'])
+        ensState['custWindowCounts'] = stateFile['custWindowCounts'].astype(int)
+        ensState['allClusterCounts'] = list(stateFile['allClusterCounts'])
+        ensState['voltageBuffer'] = stateFile['voltageBuffer']
+        if settings['storageMode'] == 'packed':
+            # The packed storage is recreated with the saved integer type
+            if type(storagePath) == int:
+                ensState['aggWM']['aggWM'] = np.array(stateFile['aggWM'])
+                ensState['aggWM']['windowCtr'] = np.array(stateFile['windowCtr'])
+            else:
+                for key in ['aggWM','windowCtr']:
+                    savedCounts = stateFile[key]
+                    ensState['aggWM'][key] = np.memmap(ensState['aggWM'][key].filename,dtype=savedCounts.dtype,mode='w+',shape=savedCounts.shape)
+                    ensState['aggWM'][key][:] = savedCounts
+        else:
+            ensState['aggWM'] = stateFile['aggWM']
+            ensState['windowCtr'] = stateFile['windowCtr']
+    return ensState
+# End of LoadEnsembleState
+
+
+
 ###############################################################################
 #
 #                       CAEnsemble
 #
 
-def CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=-1,lowWindowsThresh=4,printLowWinWarningFlag=True):
+def CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=-1,lowWindowsThresh=4,printLowWinWarningFlag=True,numJobs=1,executor=-1,randomSeed=-1,windowAffinityMode='rbf',finalClusterMode='dense',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack',storageMode='dense',storagePath=-1,windowOrder='sequential',convergenceTol=-1,timeBudget=-1,numLandmarks=-1,windowCache=-1,returnPackedFlag=False):
 
     """ This function implements the ensemble of Spectral Clustering  for the
         task of phase identification task.  The ensemble size is determined by 
@@ -149,6 +991,9 @@ def CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=-1,lowWindowsT
         clusters which represent phase groupings.  The original utility phase
         labels are not used in this function.  The mapping of the final clusters
         to particular phases is left to a subsequent step.  
+        The ensemble is built with CreateEnsembleState, UpdateEnsembleState,
+        and ClusterEnsembleState, which can also be used directly to fold new
+        data into an existing ensemble without reclustering the old windows.
         For more details, please see this paper:  
         L. Blakely and M. J. Reno, “Phase Identification Using Co-Association Matrix Ensemble Clustering,” IET Smart Grid, no. Machine Learning Special Issue, Jun. 2020.
             
@@ -182,7 +1027,81 @@ def CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=-1,lowWindowsT
                     affect other customers).  Thus results for customers with
                     few windows should be considered low confidence predictions
                     and likely discarded
-                
+                numJobs: int - the number of worker processes used to cluster
+                    the windows.  The default of 1 clusters the windows 
+                    serially in the calling process.  Values less than 1 use
+                    all available cores
+                executor: concurrent.futures.Executor - an existing process
+                    pool to use for the window clustering.  If supplied,
+                    numJobs is ignored and the pool is not shut down by this
+                    function.  The default (-1) creates a pool when numJobs
+                    is not 1
+                randomSeed: int - if supplied, window ensCtr is clustered with
+                    the seed randomSeed+ensCtr and the final clustering with
+                    randomSeed, making the results repeatable and independent
+                    of numJobs.  The default (-1) uses the
+                    numpy global random state
+                windowAffinityMode: str - the affinity used for the window
+                    clustering.  'rbf' (default) uses the dense RBF affinity 
+                    matrix, 'knn' uses a sparse k-nearest-neighbor RBF affinity
+                    which scales to a much larger number of customers
+                finalClusterMode: str - 'dense' (default) clusters the full
+                    normalized co-association matrix.  'knn' keeps only the 
+                    numNeighbors largest entries for each customer and uses a
+                    sparse eigensolver for the final clustering.  'nystrom' 
+                    approximates the spectral embedding from only the 
+                    co-association columns of numLandmarks randomly sampled
+                    customers (see SpectralUtils.NystromEmbedding), the 
+                    accuracy can be checked with EvaluateNystromApproximation.
+                    'nystrom' requires storageMode='packed', where the landmark
+                    columns are built directly from the packed counts.  The 
+                    dense storage already holds the full matrix, so 'nystrom'
+                    would save neither memory nor time and is rejected.  Use
+                    returnPackedFlag=True so the dense matrix is not built for
+                    the return value either
+                numNeighbors: int - the number of neighbors used by the 'knn'
+                    modes.  The default is 
+                    SpectralUtils.DEFAULT_NUM_NEIGHBORS (15)
+                eigenSolver: str - the eigensolver used by the spectral 
+                    embedding, 'arpack' (default), 'lobpcg', or 'amg'.  'amg'
+                    requires the optional pyamg package
+                storageMode: str - 'dense' (default) holds the co-association
+                    matrix and window counts as dense float matrices.  'packed'
+                    stores only the upper triangle of both as unsigned integer
+                    counts (see PhaseIdent_Utils.CreatePackedAggWM) and 
+                    normalizes blockwise.  Combined with finalClusterMode='knn'
+                    and returnPackedFlag=True the dense (customers,customers)
+                    matrix is never created
+                storagePath: str or Path - a directory used to back the packed
+                    storage with memory mapped files.  The default (-1) keeps 
+                    the packed arrays in memory.  Only used with 
+                    storageMode='packed'
+                windowOrder: str - the order the windows are clustered in, 
+                    'sequential' (default), 'random', or 'stratified'.  This
+                    only matters when the ensemble can stop early
+                convergenceTol: float - if supplied, the ensemble stops once
+                    the normalized co-association matrix changes by less than
+                    this (mean absolute change) between checks, see 
+                    UpdateEnsembleState.  The default (-1) clusters all windows
+                timeBudget: float - if supplied, the number of seconds after
+                    which no more windows are clustered; the final clustering
+                    uses the windows clustered so far.  The default (-1) has 
+                    no time limit
+                numLandmarks: int - the number of landmarks for 
+                    finalClusterMode='nystrom'.  The default (-1) uses the 
+                    larger of 500 and 20*kFinal
+                windowCache: dict - an on-disk cache of the window clustering
+                    results from CommonUtils/WindowCacheUtils.py.  Windows 
+                    that were already clustered with the same settings, by 
+                    this or another function, are read from the cache.  The
+                    default (-1) does not use a cache
+                returnPackedFlag: boolean - with storageMode='packed', return
+                    the packed storage dict in place of aggWM_Norm so the 
+                    dense matrix is not built.  SweepKFinal, 
+                    EvaluateNystromApproximation, and 
+                    PhaseIdent_Utils.Calculate_ModifiedSilhouetteCoefficients
+                    accept either form.  The default is False
+
             Returns
             -------
                 finalClusterLabels:  numpy array of int (1,customers) 
@@ -207,6 +1126,15 @@ def CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=-1,lowWindowsT
                     that were clustered during the ensemble.  The length of 
                     clusteredIDs plus the length of noVotesIDs should equal
                     the total number of customers
+                aggWM_Norm: numpy array of float (clustered customers,
+                    clustered customers) - the normalized co-association 
+                    matrix, for either storageMode.  With storageMode='packed'
+                    and returnPackedFlag=True this is instead the packed 
+                    storage dict from PhaseIdent_Utils.CreatePackedAggWM with
+                    an additional 'clusteredIndices' entry giving the index of
+                    each clustered customer and a 'zeroPositions' entry giving
+                    the packed positions of the pairs of datastreams from the
+                    same 2-phase or 3-phase customer, which read as zero
                 custWindowCounts: numpy array of int (customers) - the count,
                     for each customer, of the number of windows that were
                     included in the analysis, i.e. the number of windows that 
@@ -218,104 +1146,387 @@ def CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=-1,lowWindowsT
                     co-association matrix properly.  
             """       
     
-    ensTotal = int(np.floor(voltage.shape[0] / windowSize))  # This determines the total number of windows based on available data and window size
-    ensPredictedPhases = np.zeros((1,len(custID)),dtype=int)
-    aggWM = PIUtils.CreateAggWeightMatrix(custID) # This is the co-assocation matrix
-    windowCtr = PIUtils.CreateAggWeightMatrix(custID) # This tracks the number of windows where each pair of customers was included together
-    allClusterCounts = []
-    custWindowCounts = np.zeros((len(custID)),dtype=int) # This tracks the number of windows used for each customer
-
-    # Loop through each window in the available data
-    for ensCtr in range(0,ensTotal):
-        print('Ensemble Progress: ' + str(ensCtr) + '/' + str(ensTotal))
-        #Select the next time series window and remove customers with missing data in that window
-        windowDistances = PIUtils.GetVoltWindow(voltage,windowSize,ensCtr)
-        currentDistances,currentIDs = PIUtils.CleanVoltWindowNoLabels(deepcopy(windowDistances), deepcopy(custID))
-        custWindowCounts = PIUtils.UpdateCustWindowCounts(custWindowCounts,currentIDs,custID)
-       
-        # Check for the case where the entire distance matrix is nans
-        if ((currentDistances.shape[0] == 1) and (currentDistances.shape[1] == 1)):
+    if finalClusterMode == 'nystrom' and storageMode != 'packed':
+        print("Error!  finalClusterMode='nystrom' requires storageMode='packed'")
+        return (-1,-1,-1,-1,-1,-1)
+    if storageMode == 'packed':
+        maxWindows = int(np.floor(voltage.shape[0] / windowSize))
+    else:
+        maxWindows = -1
+    ensState = CreateEnsembleState(custID,kVector,windowSize,numPhases,randomSeed,windowAffinityMode,numNeighbors,eigenSolver,storageMode,storagePath,maxWindows)
+    ensState = UpdateEnsembleState(ensState,voltage,numJobs,executor,windowOrder,convergenceTol,timeBudget,windowCache=windowCache)
+    return ClusterEnsembleState(ensState,kFinal,finalClusterMode,lowWindowsThresh,printLowWinWarningFlag,numLandmarks,returnPackedFlag)
+# End of CAEnsemble
+
+
+
+###############################################################################
+#
+#                       CAEnsemble_MultiWindowSize
+#
+
+def CAEnsemble_MultiWindowSize(voltage,kVector,kFinal,custID,windowSizes,numPhases=-1,lowWindowsThresh=4,printLowWinWarningFlag=True,numJobs=1,executor=-1,randomSeed=-1,windowAffinityMode='rbf',finalClusterMode='dense',numNeighbors=SpectralUtils.DEFAULT_NUM_NEIGHBORS,eigenSolver='arpack',storageMode='dense',windowCache=-1):
+    """ This function runs CAEnsemble for several window sizes in a single 
+        pass over the data, for parameter studies of the windowSize parameter.
+        The missing data in the voltage is checked once, in blocks of the
+        greatest common divisor of the window sizes, and the window validity 
+        for each window size is found from those blocks.  The windows of all
+        window sizes are then clustered as one stream of batches, so a process
+        pool stays busy across window sizes, and each clustering is merged into
+        the co-association matrix for its window size.  The results for each
+        window size are the same as calling CAEnsemble with that windowSize
+        and the same randomSeed.
+
+            Parameters
+            ---------
+                voltage:  numpy array of float (measurements,customers) - 
+                    the pre-processed voltage, see CAEnsemble
+                kVector: numpy array of int - a vector of the possible values of
+                    k for the windows
+                kFinal:  int - Number of clusters for the final clustering
+                custID: list of str - list of customer ids
+                windowSizes: list of int - the window sizes (in number of 
+                    measurements) to run the ensemble with
+                numPhases: ndarray of int (1,customers) - the number of phases
+                    of each customer, see CAEnsemble
+                lowWindowsThresh: int - see CAEnsemble
+                printLowWinWarningFlag: boolean - see CAEnsemble
+                numJobs: int - the number of worker processes shared by all
+                    of the window sizes, see CAEnsemble
+                executor: concurrent.futures.Executor - an existing process
+                    pool, see CAEnsemble
+                randomSeed: int - see CAEnsemble
+                windowAffinityMode: str - see CAEnsemble
+                finalClusterMode: str - see CAEnsemble
+                numNeighbors: int - see CAEnsemble
+                eigenSolver: str - see CAEnsemble
+                storageMode: str - see CAEnsemble
+                windowCache: dict - a window clustering cache, see 
+                    CAEnsemble.  The window measurements are part of the cache
+                    key, so each window size has its own cache entries.  The
+                    default (-1) does not use a cache
+
+            Returns
+            -------
+                allResults: dict - keyed by window size.  Each entry is a dict
+                    with the CAEnsemble outputs (finalClusterLabels, 
+                    noVotesIndex, noVotesIDs, clusteredIDs, caMatrix, 
+                    custWindowCounts), the ensemble state (ensState) which can
+                    be updated or saved like one from CreateEnsembleState, 
+                    numWindows, windowClusteringTime (the total time spent 
+                    clustering the windows, summed over the worker processes)
+                    and finalClusteringTime, both in seconds
+                timing: dict - the wall time in seconds of the validity check
+                    (validity), the window clustering for all window sizes
+                    (ensemble), the final clusterings (finalClustering) and
+                    the total
+            """
+
+    totalStart = time.perf_counter()
+    if finalClusterMode == 'nystrom' and storageMode != 'packed':
+        print("Error!  finalClusterMode='nystrom' requires storageMode='packed'")
+        return -1, -1
+    windowSizes = [int(windowSize) for windowSize in windowSizes]
+    if len(windowSizes) == 0 or min(windowSizes) <= 0 or max(windowSizes) > voltage.shape[0]:
+        print('Error!  The window sizes must be between 1 and the number of measurements')
+        return -1, -1
+    timing = {}
+
+    # The missing data is checked once at the finest common block size
+    stageStart = time.perf_counter()
+    baseSize = windowSizes[0]
+    for windowSize in windowSizes[1:]:
+        baseSize = math.gcd(baseSize,windowSize)
+    baseValid = PIUtils.CreateWindowValidityMatrix(voltage,baseSize)
+    allStates = {}
+    allValid = {}
+    for windowSize in windowSizes:
+        if windowSize in allStates:
             continue
-        currentDistances = currentDistances.transpose()
-        
-        # Loop through each value of k (number of clusters) to use multiple numbers of clusters in each available window
-        for kCtr in range(0,len(kVector)):
-            k = kVector[kCtr]
-            #Check if the cleaning reduced the number of available customers to less than the number of clusters
-            if (currentDistances.shape[0] <= k):
-                 continue
-            #Do the clustering
-            clusterLabels = SPClustering(currentDistances,k)
-            #Update the weight matrix
-            aggWM, windowCtr = PIUtils.UpdateAggWM(clusterLabels,custID,currentIDs,aggWM,windowCtr)  
-            #Update Cluster Sizes List
-            clusterCounts=np.squeeze(PIUtils.CountClusterSizes(clusterLabels))
-            for kCtr2 in range(0,k):
-                allClusterCounts.append(clusterCounts[kCtr2])
-        #End of kCtr for loop
-    # End of ensCtr for loop
+        blocksPerWindow = windowSize // baseSize
+        ensTotal = int(np.floor(voltage.shape[0] / windowSize))
+        allValid[windowSize] = np.all(baseValid[:(ensTotal*blocksPerWindow),:].reshape(ensTotal,blocksPerWindow,-1),axis=1)
+        if storageMode == 'packed':
+            maxWindows = ensTotal
+        else:
+            maxWindows = -1
+        ensState = CreateEnsembleState(custID,kVector,windowSize,numPhases,randomSeed,windowAffinityMode,numNeighbors,eigenSolver,storageMode,-1,maxWindows)
+        ensState = UpdateEnsembleCounts(ensState,allValid[windowSize])
+        ensState['voltageBuffer'] = np.array(voltage[(ensTotal*windowSize):,:],dtype=float)
+        ensState['numWindows'] = ensTotal
+        ensState['numWindowsClustered'] = ensTotal
+        allStates[windowSize] = ensState
+    del baseValid
+    timing['validity'] = time.perf_counter() - stageStart
 
-    
-    # Zero entries for 2-phase and 3-phase customers with themselves so they cannot be clustered together
-    # Note that 2-phase and 3-phase datastreams must be adjacent in the indexing!
-    custCtr = 0
-    while custCtr < len(custID):
-        if numPhases[0,custCtr] == 2:
-            aggWM[custCtr,(custCtr+1)] = 0
-            aggWM[(custCtr+1),custCtr] = 0
-            custCtr = custCtr + 2
-        elif numPhases[0,custCtr] == 3:
-            aggWM[custCtr,(custCtr+1)] = 0
-            aggWM[custCtr,(custCtr+2)] = 0
-            aggWM[(custCtr+1),custCtr] = 0
-            aggWM[(custCtr+1),(custCtr+2)] = 0
-            aggWM[(custCtr+2),custCtr] = 0
-            aggWM[(custCtr+2),(custCtr+1)] = 0
-            custCtr = custCtr + 3
+    # The windows for all window sizes are clustered as one stream of batches
+    stageStart = time.perf_counter()
+    ownExecutor = False
+    if type(executor) == int and numJobs != 1:
+        if numJobs < 1:
+            numJobs = os.cpu_count()
+        executor = ProcessPoolExecutor(max_workers=numJobs)
+        ownExecutor = True
+    if type(executor) == int:
+        batchSize = 1
+    elif ownExecutor:
+        batchSize = 4 * numJobs
+    else:
+        batchSize = 4 * os.cpu_count()
+    clusterTimes = {windowSize:0.0 for windowSize in allStates}
+    allWindows = [(windowSize,ensCtr) for windowSize in allStates for ensCtr in range(0,allStates[windowSize]['numWindows'])]
+    # The pool created here is shut down even if clustering a window fails
+    try:
+        batch = []
+        for windowNum in range(0,len(allWindows)+1):
+            if windowNum < len(allWindows):
+                print('Ensemble Progress: ' + str(windowNum) + '/' + str(len(allWindows)))
+                windowSize, ensCtr = allWindows[windowNum]
+                currentIndices = np.where(allValid[windowSize][ensCtr,:])[0]
+                # Check for the case where every customer has missing data in the window
+                if len(currentIndices) != 0:
+                    batch.append((windowSize,ensCtr,currentIndices))
+            if len(batch) == 0 or (len(batch) < batchSize and windowNum < len(allWindows)):
+                continue
+            batchDistances = [PIUtils.GetVoltWindow(voltage,windowSize,ensCtr)[:,currentIndices].transpose() for windowSize,ensCtr,currentIndices in batch]
+            if randomSeed == -1:
+                batchSeeds = [None] * len(batch)
+            else:
+                batchSeeds = [randomSeed + ensCtr for windowSize,ensCtr,currentIndices in batch]
+            if type(windowCache) == int:
+                batchIDs = [-1] * len(batch)
+            else:
+                batchIDs = [np.asarray(custID)[currentIndices] for windowSize,ensCtr,currentIndices in batch]
+            settingsLists = [[kVector]*len(batch),batchSeeds,[windowAffinityMode]*len(batch),[numNeighbors]*len(batch),[eigenSolver]*len(batch),[windowCache]*len(batch),batchIDs]
+            if type(executor) == int:
+                batchResults = map(ClusterVoltWindow_Timed,batchDistances,*settingsLists)
+            else:
+                batchResults = executor.map(ClusterVoltWindow_Timed,batchDistances,*settingsLists)
+            # Merge in window order for each window size
+            for (windowSize,ensCtr,currentIndices), (windowLabels,elapsedTime) in zip(batch,batchResults):
+                ensState = allStates[windowSize]
+                ensState['aggWM'] = MergeWindowLabels(windowLabels,currentIndices,ensState['aggWM'],ensState['allClusterCounts'])
+                clusterTimes[windowSize] += elapsedTime
+            # The workers only update their own copy of the cache dict, so the size limit is enforced here
+            if type(windowCache) != int and type(executor) != int:
+                WindowCacheUtils.CheckWindowCacheSize(windowCache)
+            batch = []
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+    timing['ensemble'] = time.perf_counter() - stageStart
+
+    # Final clustering for each window size
+    stageStart = time.perf_counter()
+    allResults = {}
+    for windowSize in allStates:
+        finalStart = time.perf_counter()
+        finalResults = ClusterEnsembleState(allStates[windowSize],kFinal,finalClusterMode,lowWindowsThresh,printLowWinWarningFlag)
+        allResults[windowSize] = dict(zip(['finalClusterLabels','noVotesIndex','noVotesIDs','clusteredIDs','caMatrix','custWindowCounts'],finalResults))
+        allResults[windowSize]['ensState'] = allStates[windowSize]
+        allResults[windowSize]['numWindows'] = allStates[windowSize]['numWindows']
+        allResults[windowSize]['windowClusteringTime'] = clusterTimes[windowSize]
+        allResults[windowSize]['finalClusteringTime'] = time.perf_counter() - finalStart
+    timing['finalClustering'] = time.perf_counter() - stageStart
+    timing['total'] = time.perf_counter() - totalStart
+    return allResults, timing
+# End of CAEnsemble_MultiWindowSize
+
+
+
+###############################################################################
+#
+#                       SweepKFinal
+#
+
+def SweepKFinal(caMatrix,kFinalVector,clusteredIDs,clusteredPhaseLabels=-1,randomSeed=-1,eigenSolver='arpack'):
+    """ This function evaluates several candidate values of kFinal using the
+        co-association matrix from a single run of CAEnsemble.  The Laplacian
+        eigenvectors of the co-association matrix are computed once, for the
+        largest candidate, and the final cluster labels for each candidate are
+        found from the leading eigenvectors of that shared embedding.  For each
+        candidate the eigengap and the modified silhouette coefficients are 
+        calculated.  The eigengap is the difference between eigenvalues k+1 
+        and k of the normalized Laplacian; a large eigengap indicates k well
+        separated clusters, and the candidate with the largest eigengap is
+        recommended.  The modified silhouette coefficients only penalize
+        similarity to clusters of a different phase, so splitting a phase 
+        into more clusters does not lower them and they are not used for the
+        recommendation, but they show the confidence of each candidate.
+
+            Parameters
+            ---------
+                caMatrix: ndarray of float (customers,customers), scipy 
+                    sparse matrix, or packed co-association dict - the 
+                    normalized co-association matrix returned by CAEnsemble
+                    (or CAEnsemble_Partitioned)
+                kFinalVector: list of int - the candidate values of kFinal
+                clusteredIDs: ndarray of str (customers) - the customers 
+                    included in caMatrix, returned by CAEnsemble
+                clusteredPhaseLabels: ndarray of int (1,customers) - the 
+                    original utility phase labels of the clustered customers,
+                    used to assign the predicted phase of each final cluster
+                    for the silhouette coefficients.  If this is not supplied
+                    (-1) each final cluster is treated as a separate phase
+                randomSeed: int - seed for the eigensolver and the label 
+                    assignment.  The default (-1) uses the numpy global random
+                    state
+                eigenSolver: str - 'arpack', 'lobpcg', or 'amg' (requires pyamg)
+
+            Returns
+            -------
+                sweepResults: dict with the following keys
+                    kFinalVector: list of int - the candidates, in ascending
+                        order, with values not smaller than the number of
+                        customers removed
+                    finalClusterLabels: list of ndarray of int (customers) -
+                        the final cluster labels for each candidate
+                    predictedPhases: list of ndarray of int (1,customers) - 
+                        the predicted phases for each candidate
+                    allSC: list of list of float - the modified silhouette 
+                        coefficient of each customer for each candidate
+                    meanSC: ndarray of float - the mean modified silhouette
+                        coefficient for each candidate
+                    eigenvalues: ndarray of float - the smallest eigenvalues
+                        of the normalized Laplacian
+                    eigengaps: ndarray of float - the eigengap for each 
+                        candidate, nan if it could not be calculated
+                    recommendedK: int - the recommended value of kFinal,
+                        the candidate with the largest eigengap (the highest
+                        mean silhouette coefficient if no eigengap could be 
+                        calculated)
+            """
+
+    if randomSeed == -1:
+        finalSeed = None
+    else:
+        finalSeed = randomSeed
+    numCust = len(clusteredIDs)
+    kFinalVector = sorted([k for k in kFinalVector if k < numCust])
+    if len(kFinalVector) == 0:
+        print('Error!  All values of kFinal must be smaller than the number of clustered customers')
+        return -1
+    if type(caMatrix) == dict:
+        affinity = PIUtils.UnpackAggWM_Norm(caMatrix,caMatrix['clusteredIndices'])
+        affinity[affinity==0] = 0.00001
+    else:
+        affinity = caMatrix
+    allClusterLabels, eigenvalues = SpectralUtils.SPClustering_Precomp_MultK(affinity,kFinalVector,eigenSolver,finalSeed)
+    del affinity
+
+    allPredictedPhases = []
+    allSC = []
+    meanSC = np.zeros((len(kFinalVector),))
+    eigengaps = np.zeros((len(kFinalVector),)) + np.nan
+    for kCtr in range(0,len(kFinalVector)):
+        kFinal = kFinalVector[kCtr]
+        finalClusterLabels = allClusterLabels[kCtr]
+        if type(clusteredPhaseLabels) == int:
+            predictedPhases = finalClusterLabels.reshape(1,-1) + 1
         else:
-            custCtr = custCtr + 1
-    
-    
-    #Split customers into customers who had at least one window of data and those that did not
-    # If a customer had missing data in all windows then they are not included in the algorithm results
-    noVotesIndex = []
-    noVotesIDs = []
-    for custCtr in range(0,len(custID)):
-        if (np.sum(aggWM[custCtr,:]) == 0):
-            noVotesIndex.append(custCtr)
-            noVotesIDs.append(custID[custCtr])
-    clusteredIDs = np.delete(custID,noVotesIndex)
-    ensPredictedPhases = np.delete(ensPredictedPhases,noVotesIndex,axis=1)
-    aggWM = np.delete(aggWM,noVotesIndex,axis=0)
-    aggWM = np.delete(aggWM,noVotesIndex,axis=1)
-    windowCtr = np.delete(windowCtr,noVotesIndex,axis=0)
-    windowCtr = np.delete(windowCtr,noVotesIndex,axis=1)
-    
-    if aggWM.shape == (0,0):
-        print('Error!  All customers were eliminated from all windows, and the algorithm could not continue.  This is due to missing data in the customers datastreams.  The distribution of missing data was such that there were instances of missing data in every window for every customer.  You could try reducing the window size, but beware that there still may not be many viable windows ')
-        return (-1,-1,-1,-1,-1,-1)
-    #Normalize aggWM - This is done because each customer would have had different numbers of windows due to missing data, the normalization is done by dividing each cell by the number of windows that pair of customers was both present
-    windowCtr[windowCtr==0]=0.0001 #This prevents divide by zero, the aggWM should already be zero in the locations where windowCtr is 0, so 0 will be the end result in that case anway
-    aggWM_Norm = np.divide(aggWM,windowCtr)
-    aggWM_Norm[np.isnan(aggWM_Norm)] = 0
-    aggWM_Norm[aggWM_Norm==0]=0.00001 # The spectral clustering function does not allow zeros (the precomputed matrix must be fully-connected), so any zeros are set to a very small value
-    finalClusterLabels = SPClustering_Precomp(aggWM_Norm,kFinal)
-    
-    # Few windows warning
-    numLowWindows = np.where(custWindowCounts <= lowWindowsThresh)[0]
-    if printLowWinWarningFlag:
-        if len(numLowWindows) != 0:
-            print('Warning!  ' + str(len(numLowWindows)) + ' customers had fewer than ' + str(lowWindowsThresh) + ' windows used in the phase identification ensemble.  The predictions for these customers should likely be considered low confidence predictions')
-            print('Customer IDs for customers with fewer than ' + str(lowWindowsThresh) + ' windows:')
-            for custCtr in range(0,len(numLowWindows)):
-                print('Customer ID: ' + str(custID[numLowWindows[custCtr]]) + ' - ' + str(custWindowCounts[numLowWindows[custCtr]]) + ' Windows')
-            print('')
-        
-    return finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,aggWM_Norm,custWindowCounts
-# End of CAEnsemble
+            predictedPhases = PIUtils.CalcPredictedPhaseNoLabels(finalClusterLabels,clusteredPhaseLabels,np.array(clusteredIDs))
+        currentSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinal)
+        allPredictedPhases.append(predictedPhases)
+        allSC.append(currentSC)
+        meanSC[kCtr] = np.mean(currentSC)
+        if kFinal < len(eigenvalues):
+            eigengaps[kCtr] = eigenvalues[kFinal] - eigenvalues[kFinal-1]
+
+    sweepResults = {'kFinalVector':kFinalVector,
+                    'finalClusterLabels':allClusterLabels,
+                    'predictedPhases':allPredictedPhases,
+                    'allSC':allSC,
+                    'meanSC':meanSC,
+                    'eigenvalues':eigenvalues,
+                    'eigengaps':eigengaps,
+                    'recommendedK':-1}
+    if np.all(np.isnan(eigengaps)):
+        sweepResults['recommendedK'] = kFinalVector[int(np.argmax(meanSC))]
+    else:
+        sweepResults['recommendedK'] = kFinalVector[int(np.nanargmax(eigengaps))]
+    return sweepResults
+# End of SweepKFinal
 
 
 
+###############################################################################
+#
+#                       EvaluateNystromApproximation
+#
+
+def EvaluateNystromApproximation(caMatrix,kFinal,numLandmarks=-1,sampleSize=2000,randomSeed=-1):
+    """ This function estimates the error of the Nystrom final clustering 
+        (finalClusterMode='nystrom') by comparing it to the exact spectral 
+        clustering on a random subsample of the customers, small enough that
+        the exact path is cheap.  The landmarks are the same fraction of the 
+        subsample as numLandmarks is of all customers, so the reported error 
+        is a conservative estimate for the full problem.
+
+            Parameters
+            ---------
+                caMatrix: ndarray of float (customers,customers) or packed 
+                    co-association dict - the normalized co-association matrix
+                    returned by CAEnsemble
+                kFinal: int - the number of final clusters
+                numLandmarks: int - the number of landmarks used for all 
+                    customers, see SelectLandmarks
+                sampleSize: int - the number of customers in the subsample
+                randomSeed: int - seed for the subsample, landmarks and 
+                    clustering.  The default (-1) uses random values
 
+            Returns
+            -------
+                approxResults: dict with the following keys
+                    sampleSize: int - the number of customers compared
+                    numLandmarks: int - the number of landmarks used in the
+                        subsample
+                    affinityError: float - the relative Frobenius norm error
+                        of the Nystrom approximation of the co-association 
+                        matrix, ||W - C A^+ C'|| / ||W||
+                    eigenvalueError: ndarray of float (kFinal) - the absolute
+                        error of the kFinal smallest normalized Laplacian 
+                        eigenvalues
+                    labelAgreement: float - the adjusted Rand index between
+                        the exact and the Nystrom cluster labels, 1 is 
+                        identical up to relabeling
+            """
 
+    if type(caMatrix) == dict:
+        numCust = len(caMatrix['clusteredIndices'])
+    else:
+        numCust = caMatrix.shape[0]
+    if randomSeed == -1:
+        sampleRNG = np.random.default_rng()
+        finalSeed = None
+    else:
+        sampleRNG = np.random.default_rng(randomSeed)
+        finalSeed = randomSeed
+    sampleSize = min(sampleSize,numCust)
+    sampleIndices = np.sort(sampleRNG.choice(numCust,sampleSize,replace=False))
+    if type(caMatrix) == dict:
+        affinity = PIUtils.UnpackAggWM_Norm(caMatrix,caMatrix['clusteredIndices'][sampleIndices])
+    else:
+        affinity = np.array(caMatrix[np.ix_(sampleIndices,sampleIndices)],dtype=float)
+    affinity[affinity==0] = 0.00001
+    if numLandmarks == -1:
+        numLandmarks = max(500,20*kFinal)
+    numSampleLandmarks = int(round(min(numLandmarks,numCust) * sampleSize / numCust))
+    landmarkIndices = SelectLandmarks(sampleSize,kFinal,numSampleLandmarks,sampleRNG.integers(0,2**31))
+    
+    landmarkColumns = affinity[:,landmarkIndices]
+    landmarkBlock = landmarkColumns[landmarkIndices,:]
+    approxAffinity = landmarkColumns @ np.linalg.pinv(landmarkBlock,hermitian=True) @ landmarkColumns.T
+    affinityError = np.linalg.norm(affinity - approxAffinity) / np.linalg.norm(affinity)
+    del approxAffinity
 
+    exactLabels, exactEigenvalues = SpectralUtils.SPClustering_Precomp_MultK(affinity,[kFinal],randomState=finalSeed)
+    nystromLabels = SpectralUtils.SPClustering_Nystrom(landmarkColumns,landmarkIndices,kFinal,finalSeed)
+    _, nystromEigenvalues = SpectralUtils.NystromEmbedding(landmarkColumns,landmarkIndices,kFinal)
+    numCompare = min(kFinal,len(exactEigenvalues),len(nystromEigenvalues))
+    approxResults = {'sampleSize':sampleSize,
+                     'numLandmarks':len(landmarkIndices),
+                     'affinityError':affinityError,
+                     'eigenvalueError':np.abs(exactEigenvalues[:numCompare] - nystromEigenvalues[:numCompare]),
+                     'labelAgreement':adjusted_rand_score(exactLabels[0],nystromLabels)}
+    return approxResults
+# End of EvaluateNystromApproximation
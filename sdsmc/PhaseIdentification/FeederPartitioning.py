@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright 2021 National Technology & Engineering Solutions of Sandia, LLC (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains certain rights in this software.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+ FeederPartitioning.py
+
+This file contains functions that split a phase identification dataset into
+independent groups of customers, for example when one dataset contains 
+several feeders or substations, and run the Co-Association Matrix Ensemble 
+separately on each group.  Customers on different feeders share very little
+voltage information, so clustering each group on its own replaces one large
+(customers,customers) problem with several small ones that can be run
+concurrently.
+
+    Functions:
+        -  CreateCorrelationGroups
+        -  PartitionCustomers
+        -  RunGroupEnsemble
+        -  CAEnsemble_Partitioned
+
+"""
+
+
+# Import - Python Libraries
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+from pathlib import Path
+
+# Import - Custom Libraries
+if __package__ in [None, '']:
+    import CA_Ensemble_Funcs as CAE
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import SpectralUtils
+else:
+    from . import CA_Ensemble_Funcs as CAE
+    from ..CommonUtils import SpectralUtils
+
+
+
+###############################################################################
+#
+#                       CreateCorrelationGroups
+#
+
+def CreateCorrelationGroups(voltage,corrThresh=0.2,numNeighbors=10,maxMeasurements=2000,numPhases=-1,blockSize=1000):
+    """ This function groups customers using a cheap estimate of the 
+        correlation between their voltage timeseries.  The correlation is
+        calculated on a subset of at most maxMeasurements evenly spaced 
+        measurements, each customer is linked to its numNeighbors most 
+        correlated customers when that correlation is above corrThresh, and
+        the groups are the connected components of the resulting graph.  
+        Missing data is ignored in the correlation estimate.
+
+            Parameters
+            ---------
+                voltage: numpy array of float (measurements,customers) - the
+                    per-unit, difference (delta) voltage timeseries
+                corrThresh: float - the minimum correlation coefficient for
+                    two customers to be linked.  The default is 0.2
+                numNeighbors: int - the number of links considered for each
+                    customer.  The default is 10
+                maxMeasurements: int - the number of measurements used for the
+                    correlation estimate.  The default is 2000
+                numPhases: ndarray of int (1,customers) - the number of phases
+                    of each customer.  The datastreams of 2-phase and 3-phase
+                    customers are adjacent and are always kept in the same 
+                    group.  If -1 all customers are treated as single-phase
+                blockSize: int - the number of customers processed at a time
+
+            Returns
+            -------
+                groupLabels: numpy array of int (customers) - the group of
+                    each customer
+            """
+
+    numMeas, numCust = voltage.shape
+    sampleRows = np.unique(np.linspace(0,numMeas-1,min(maxMeasurements,numMeas)).astype(int))
+    sample = np.array(voltage[sampleRows,:],dtype=float)
+    missing = np.isnan(sample)
+    sample[missing] = 0
+    validCounts = np.maximum(np.sum(~missing,axis=0),1)
+    sample = sample - (np.sum(sample,axis=0) / validCounts)
+    sample[missing] = 0
+    stdDev = np.sqrt(np.sum(sample**2,axis=0) / validCounts)
+    stdDev[stdDev==0] = np.inf # Customers with constant or no data are not linked to any other customer
+    sample = sample / (stdDev * np.sqrt(validCounts))
+
+    allRows = []
+    allCols = []
+    for startIndex in range(0,numCust,blockSize):
+        endIndex = min(startIndex + blockSize,numCust)
+        blockCC = np.matmul(sample[:,startIndex:endIndex].transpose(),sample)
+        blockRows, blockCols, blockValues = SpectralUtils.SelectTopNeighbors(blockCC,np.arange(startIndex,endIndex),numNeighbors)
+        keep = blockValues > corrThresh
+        allRows.append(blockRows[keep])
+        allCols.append(blockCols[keep])
+    # Link the datastreams of each 2-phase and 3-phase customer
+    if type(numPhases) != int:
+        custCtr = 0
+        while custCtr < numCust:
+            phaseCount = max(int(numPhases[0,custCtr]),1)
+            for phaseCtr in range(1,phaseCount):
+                allRows.append(np.array([custCtr]))
+                allCols.append(np.array([custCtr+phaseCtr]))
+            custCtr = custCtr + phaseCount
+    allRows = np.concatenate(allRows)
+    allCols = np.concatenate(allCols)
+    graph = sparse.csr_matrix((np.ones(len(allRows)),(allRows,allCols)),shape=(numCust,numCust))
+    numGroups, groupLabels = connected_components(graph,directed=False)
+    return groupLabels
+# End of CreateCorrelationGroups
+
+
+
+###############################################################################
+#
+#                       PartitionCustomers
+#
+
+def PartitionCustomers(voltage,feederIDs=-1,numPhases=-1,corrThresh=0.2,numNeighbors=10,maxMeasurements=2000):
+    """ This function splits the customers into independent groups for the 
+        phase identification.  If the feeder (or substation) of each customer
+        is known it is used directly, otherwise the groups are found with
+        CreateCorrelationGroups.
+
+            Parameters
+            ---------
+                voltage: numpy array of float (measurements,customers) - the
+                    per-unit, difference (delta) voltage timeseries
+                feederIDs: numpy array (customers) - the feeder ID of each 
+                    customer.  If -1 (default) the groups are estimated from
+                    the voltage correlation
+                numPhases: ndarray of int (1,customers) - the number of phases
+                    of each customer, see CreateCorrelationGroups
+                corrThresh: float - see CreateCorrelationGroups
+                numNeighbors: int - see CreateCorrelationGroups
+                maxMeasurements: int - see CreateCorrelationGroups
+
+            Returns
+            -------
+                groupLabels: numpy array of int (customers) - the group of
+                    each customer
+            """
+
+    if type(feederIDs) != int:
+        uniqueFeeders, groupLabels = np.unique(np.asarray(feederIDs).ravel(),return_inverse=True)
+    else:
+        groupLabels = CreateCorrelationGroups(voltage,corrThresh,numNeighbors,maxMeasurements,numPhases)
+    print('The customers were split into ' + str(len(np.unique(groupLabels))) + ' groups')
+    return groupLabels
+# End of PartitionCustomers
+
+
+
+###############################################################################
+#
+#                       RunGroupEnsemble
+#
+
+def RunGroupEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases,lowWindowsThresh,printLowWinWarningFlag,randomSeed):
+    """ This function runs CAEnsemble on the data for one group of customers.
+        It is the unit of work that CAEnsemble_Partitioned sends to the worker
+        processes, so it must remain a module-level function.  The parameters
+        and outputs are the same as CAEnsemble.
+            """
+
+    return CAE.CAEnsemble(voltage,kVector,kFinal,custID,windowSize,numPhases=numPhases,lowWindowsThresh=lowWindowsThresh,printLowWinWarningFlag=printLowWinWarningFlag,randomSeed=randomSeed)
+# End of RunGroupEnsemble
+
+
+
+###############################################################################
+#
+#                       CAEnsemble_Partitioned
+#
+
+def CAEnsemble_Partitioned(voltage,kVector,kFinal,custID,windowSize,groupLabels,numPhases=-1,lowWindowsThresh=4,printLowWinWarningFlag=True,numJobs=1,randomSeed=-1,minGroupSize=-1):
+    """ This function runs the Co-Association Matrix Ensemble separately on 
+        each group of customers from PartitionCustomers and merges the results
+        into the same outputs as CAEnsemble.  The groups are run concurrently
+        in a process pool when numJobs is not 1.  Every group is clustered on
+        its own, with the values of kVector and kFinal limited to the size of
+        the group, and groups that are too small to cluster are left out of
+        the results rather than combined, since customers in different groups
+        should not be clustered together.  The final cluster
+        labels of each group are offset so they are unique across groups, and
+        the co-association matrix is returned as a sparse block diagonal 
+        matrix since customers in different groups are never associated.
+
+            Parameters
+            ---------
+                voltage:  numpy array of float (measurements,customers) -  
+                    voltage timeseries for each customer, pre-processed as for
+                    CAEnsemble
+                kVector: numpy array of int - a vector of the possible values of
+                    k for the windows
+                kFinal:  int or dict - Number of clusters for the final 
+                    clustering of each group.  A dict may be used to give a 
+                    different value for each group label; groups that are not
+                    in the dict use the largest value.  The value for a group
+                    is capped at one less than the number of customers in it
+                custID: list of str - list of customer ids
+                windowSize:  int - The size (in number of measurements) of the 
+                    sliding window
+                groupLabels: numpy array of int (customers) - the group of 
+                    each customer from PartitionCustomers
+                numPhases: ndarray of int (1,customers) - the number of phases
+                    of each customer, see CAEnsemble
+                lowWindowsThresh: int - see CAEnsemble
+                printLowWinWarningFlag: boolean - see CAEnsemble
+                numJobs: int - the number of groups run concurrently.  The 
+                    default of 1 runs the groups serially.  Values less than 1
+                    use all available cores
+                randomSeed: int - the seed used for the ensemble of every 
+                    group, see CAEnsemble.  The default (-1) is unseeded
+                minGroupSize: int - groups with fewer customers than this are 
+                    not clustered and are included in noVotesIndex.  The 
+                    default (-1) uses one more than the smallest value in 
+                    kVector, the smallest group that can be clustered
+
+            Returns
+            -------
+                finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs - see
+                    CAEnsemble.  Customers in groups that are too small to
+                    cluster are included in noVotesIndex
+                caMatrix: scipy sparse csr matrix of float (clustered 
+                    customers,clustered customers) - the block diagonal 
+                    normalized co-association matrix
+                custWindowCounts: numpy array of int (customers) - see 
+                    CAEnsemble
+            """
+
+    numCust = len(custID)
+    groupLabels = np.asarray(groupLabels).ravel()
+    if type(numPhases) == int:
+        numPhases = np.ones((1,numCust),dtype=int)
+    if type(kFinal) == dict:
+        kDefault = max(kFinal.values())
+    else:
+        kDefault = kFinal
+        kFinal = {}
+    if minGroupSize == -1:
+        minGroupSize = min(kVector) + 1
+
+    # Collect the groups.  Small groups are clustered on their own with the values of k limited to the group size
+    allGroupIndices = []
+    allGroupK = []
+    allGroupKVectors = []
+    numSmallCust = 0
+    for groupLabel in np.unique(groupLabels):
+        groupIndices = np.where(groupLabels == groupLabel)[0]
+        groupKVector = [k for k in kVector if k < len(groupIndices)]
+        if (len(groupIndices) < minGroupSize) or (len(groupKVector) == 0):
+            numSmallCust = numSmallCust + len(groupIndices)
+        else:
+            allGroupIndices.append(groupIndices)
+            allGroupK.append(min(kFinal.get(groupLabel,kDefault),len(groupIndices)-1))
+            allGroupKVectors.append(groupKVector)
+    if numSmallCust != 0:
+        print('Warning!  ' + str(numSmallCust) + ' customers were in groups that were too small to cluster and were not included in the results')
+
+    # Run the ensemble on each group
+    custIDArray = np.array(custID)
+    groupArgs = [[],[],[],[],[],[],[],[],[]]
+    for groupIndices, groupK, groupKVector in zip(allGroupIndices,allGroupK,allGroupKVectors):
+        for argList, argValue in zip(groupArgs,[voltage[:,groupIndices],groupKVector,groupK,list(custIDArray[groupIndices]),windowSize,numPhases[:,groupIndices],lowWindowsThresh,printLowWinWarningFlag,randomSeed]):
+            argList.append(argValue)
+    if numJobs == 1:
+        allResults = list(map(RunGroupEnsemble,*groupArgs))
+    else:
+        if numJobs < 1:
+            numJobs = os.cpu_count()
+        with ProcessPoolExecutor(max_workers=numJobs) as executor:
+            allResults = list(executor.map(RunGroupEnsemble,*groupArgs))
+
+    # Merge the group results, offsetting the cluster labels of each group
+    allLabels = np.zeros(numCust,dtype=int) - 1
+    custWindowCounts = np.zeros(numCust,dtype=int)
+    allBlocks = []
+    labelOffset = 0
+    for groupIndices, groupK, groupResults in zip(allGroupIndices,allGroupK,allResults):
+        groupLabelsFinal, groupNoVotesIndex, _, _, groupCAMatrix, groupWindowCounts = groupResults
+        if type(groupLabelsFinal) == int:
+            continue
+        custWindowCounts[groupIndices] = groupWindowCounts
+        clusteredIndices = np.delete(groupIndices,groupNoVotesIndex)
+        allLabels[clusteredIndices] = np.asarray(groupLabelsFinal) + labelOffset
+        labelOffset = labelOffset + groupK
+        allBlocks.append((clusteredIndices,groupCAMatrix))
+    clusteredIndices = np.where(allLabels != -1)[0]
+    if len(clusteredIndices) == 0:
+        print('Error!  No customers could be clustered in any group.')
+        return (-1,-1,-1,-1,-1,-1)
+    noVotesIndex = list(np.where(allLabels == -1)[0])
+    noVotesIDs = [custID[custCtr] for custCtr in noVotesIndex]
+    clusteredIDs = np.delete(custID,noVotesIndex)
+    finalClusterLabels = allLabels[clusteredIndices]
+    newIndices = np.zeros(numCust,dtype=int) - 1
+    newIndices[clusteredIndices] = np.arange(len(clusteredIndices))
+    blockRows = []
+    blockCols = []
+    blockValues = []
+    for blockIndices, blockMatrix in allBlocks:
+        blockPositions = newIndices[blockIndices]
+        blockRows.append(np.repeat(blockPositions,len(blockPositions)))
+        blockCols.append(np.tile(blockPositions,len(blockPositions)))
+        blockValues.append(np.asarray(blockMatrix).ravel())
+    caMatrix = sparse.csr_matrix((np.concatenate(blockValues),(np.concatenate(blockRows),np.concatenate(blockCols))),shape=(len(clusteredIndices),len(clusteredIndices)))
+    return finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts
+# End of CAEnsemble_Partitioned
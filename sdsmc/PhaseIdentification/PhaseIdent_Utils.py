@@ -36,6 +36,7 @@ This file contains misc helper functions for the phase identification task
 
 
 import sys
+import os
 import numpy as np
 import warnings
 from copy import deepcopy
@@ -44,8 +45,21 @@ import seaborn as sns
 from pathlib import Path
 import datetime
 from scipy import stats
+from scipy import sparse
 import pandas as pd
 
+# Import - Custom Libraries
+if __package__ in [None, '']:
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import SpectralUtils
+    from CommonUtils import PreprocessingUtils
+else:
+    from ..CommonUtils import SpectralUtils
+    from ..CommonUtils import PreprocessingUtils
+
+# The base voltages supported by ConvertToPerUnit_Voltage
+VOLTAGE_LEVELS = [120, 208, 277, 240, 480, 7200]
+
 ###############################################################################
 #
 # ConvertToPerUnit_Voltage
@@ -74,31 +88,8 @@ def ConvertToPerUnit_Voltage(timeseries):
                 
         '''
     
-    voltageMismatchThresh = .8
-    voltageLevels = np.array([120, 208, 277, 240, 480, 7200])
-    voltagePU = np.zeros((timeseries.shape),dtype=float)
-    dataLength = timeseries.shape[0]
-    
-    for custCtr in range(0, timeseries.shape[1]):
-        currentCust = timeseries[:,custCtr]
-        # Check for the case a customer only has NaN values in the timeseries
-        if np.sum(np.isnan(currentCust)) == dataLength:
-            print('Warning!  Customer index ' + str(custCtr) + ' only had NaN values in the timeseries. ')
-            voltagePU[:,custCtr] = currentCust
-            continue
-        else:
-            meanValue = np.round(np.nanmean(currentCust),decimals=0)
-            vDiff = np.abs(voltageLevels - meanValue)
-            index = np.argmin(vDiff)
-            
-            if index == 0:
-                print('Customer index ' + str(custCtr) + ' is a 120V customer')
-            # Check for the case where the correct voltage level is not listed
-            if np.abs(vDiff[index]) > (voltageMismatchThresh*voltageLevels[index]):
-                print('Error!  Customer# ' + str(custCtr) + 'has a mean voltage value of ' + str(meanValue) + '.  This voltage level is not supported in the function.  Please add this voltage level to the source code of the function')
-                return (-1)
-            voltagePU[:,custCtr] = np.divide(currentCust, voltageLevels[index])
-    return voltagePU
+    # The base voltage of every customer is found at once, see CommonUtils.PreprocessingUtils
+    return PreprocessingUtils.ConvertToPerUnit_Voltage(timeseries,voltageLevels=VOLTAGE_LEVELS)
 # End of ConvertToPerUnit_Voltage
 
 
@@ -191,16 +182,11 @@ def CleanVoltWindow(voltWindow,currentCustIDs,currentPhaseLabels):
                     of phase labels without the 'cleaned customers
             """
                               
-    badIndices = []
-    for custCtr in range(0,voltWindow.shape[1]):
-        temp = voltWindow[:,custCtr]
-        indices = np.where(np.isnan(temp))
-        if len(indices[0]) != 0:
-            badIndices.append(custCtr)
     voltWindow = np.array(voltWindow)
-    voltWindow = np.delete(voltWindow,badIndices,axis=1)
-    currentCustIDs = np.delete(currentCustIDs,badIndices)
-    currentPhaseLabels = np.delete(currentPhaseLabels,badIndices,axis=1)
+    goodColumns = ~np.any(np.isnan(voltWindow),axis=0)
+    voltWindow = voltWindow[:,goodColumns]
+    currentCustIDs = np.asarray(currentCustIDs)[goodColumns]
+    currentPhaseLabels = np.asarray(currentPhaseLabels)[:,goodColumns]
     #voltWindow = pd.DataFrame(voltWindow)
     return voltWindow,currentCustIDs,currentPhaseLabels
 # End of CleanVoltWindow
@@ -234,18 +220,84 @@ def CleanVoltWindowNoLabels(voltWindow,currentCustIDs):
                     during the window removed
             """
                               
-    badIndices = []
-    for custCtr in range(0,voltWindow.shape[1]):
-        temp = voltWindow[:,custCtr]
-        indices = np.where(np.isnan(temp))
-        if len(indices[0]) != 0:
-            badIndices.append(custCtr)
     voltWindow = np.array(voltWindow)
-    voltWindow = np.delete(voltWindow,badIndices,axis=1)
-    currentCustIDs = np.delete(currentCustIDs,badIndices)
+    goodColumns = ~np.any(np.isnan(voltWindow),axis=0)
+    voltWindow = voltWindow[:,goodColumns]
+    currentCustIDs = np.asarray(currentCustIDs)[goodColumns]
     #voltWindow = pd.DataFrame(voltWindow)
     return voltWindow,currentCustIDs
 # End of CleanVoltWindowNoLabels
+
+
+
+##############################################################################
+#
+# CreateWindowValidityMatrix
+#
+def CreateWindowValidityMatrix(voltage,windowSize,blockElements=2**24):
+    """ This function finds, for every window in the dataset, which 
+        customers have no missing data in that window.  This replaces calling
+        CleanVoltWindowNoLabels on every window; the cleaned window is simply
+        the window with the valid columns selected.  The windows are processed
+        in blocks of roughly blockElements measurements to bound the temporary
+        memory.
+            
+            Parameters
+            ---------
+                voltage: numpy array of float (measurements,customers) time 
+                    series voltage measurements
+                windowSize: int scalar representing the desired window size
+                blockElements: int - the approximate number of measurements
+                    processed at a time
+            
+            Returns
+            -------
+                validWindows: numpy array of bool (windows,customers) - True
+                    where the customer has no missing data in the window.  Only
+                    complete windows are included
+            """
+
+    numWindows = int(np.floor(voltage.shape[0] / windowSize))
+    numCust = voltage.shape[1]
+    validWindows = np.zeros((numWindows,numCust),dtype=bool)
+    blockSize = max(1,blockElements // max(windowSize*numCust,1))
+    for startWindow in range(0,numWindows,blockSize):
+        endWindow = min(startWindow + blockSize,numWindows)
+        block = voltage[(startWindow*windowSize):(endWindow*windowSize),:].reshape((endWindow-startWindow),windowSize,numCust)
+        validWindows[startWindow:endWindow,:] = ~np.any(np.isnan(block),axis=1)
+    return validWindows
+# End of CreateWindowValidityMatrix
+
+
+
+##############################################################################
+#
+# CalcWindowPairCounts
+#
+def CalcWindowPairCounts(validWindows,windowWeights):
+    """ This function calculates the window count matrix of the co-association
+        matrix ensemble directly from the window validity matrix.  Entry (i,j)
+        is the number of window clusterings that included both customer i and
+        customer j, which is validWindows' * diag(windowWeights) * validWindows.
+            
+            Parameters
+            ---------
+                validWindows: numpy array of bool (windows,customers) - from
+                    CreateWindowValidityMatrix
+                windowWeights: numpy array of int (windows) - the number of 
+                    clusterings done in each window, i.e. the number of values
+                    of k smaller than the number of valid customers
+            
+            Returns
+            -------
+                windowCtr: numpy array of float (customers,customers) - the 
+                    window count for each pair of customers
+            """
+
+    validFloat = validWindows.astype(float)
+    windowCtr = np.matmul((validFloat * np.asarray(windowWeights,dtype=float)[:,np.newaxis]).transpose(),validFloat)
+    return windowCtr
+# End of CalcWindowPairCounts
                          
 
 ##############################################################################
@@ -309,6 +361,53 @@ def CalcCorrCoef(voltageWin):
 
     return corrCoef,failFlag
 # End of CalcCorrCoef
+
+
+
+###############################################################################
+#
+# CalcCrossCorrCoef
+#
+def CalcCrossCorrCoef(voltageWinA,voltageWinB):
+    ''' This function takes two voltage windows with the same measurements
+        and calculates only the correlation coefficients between the 
+        datastreams in the first window and the datastreams in the second
+        window.  This is the off-diagonal block of CalcCorrCoef on the 
+        concatenated windows, without calculating the block of the first 
+        window with itself.  Both windows are centered and scaled to unit 
+        norm once and the block is a single matrix product.
+
+        Parameters
+        ----------
+            voltageWinA: numpy array of floats (measurements, customers), the
+                first window of voltage measurements, for example customers
+            voltageWinB: numpy array of floats (measurements, sensors), the
+                second window of voltage measurements, for example sensors
+
+        Returns:
+            crossCorr: numpy array of floats (customers, sensors), the
+                correlation coefficients between each datastream in 
+                voltageWinA and each datastream in voltageWinB
+            failFlag: boolean - true if any datastream has zero variance or 
+                non-finite values, in which case crossCorr is 0
+        '''
+
+    failFlag = 0
+    standardized = []
+    for voltageWin in [voltageWinA,voltageWinB]:
+        voltageWin = np.asarray(voltageWin,dtype=float)
+        centered = voltageWin - np.mean(voltageWin,axis=0)
+        norms = np.sqrt(np.einsum('ij,ij->j',centered,centered))
+        if np.any(norms == 0) or (not np.all(np.isfinite(norms))):
+            print('Zero variance or non-finite datastream caught in CalcCrossCorrCoef')
+            failFlag = 1
+            return 0, failFlag
+        standardized.append(centered / norms)
+    crossCorr = np.matmul(standardized[0].transpose(),standardized[1])
+    # Match np.corrcoef, which clips rounding errors to [-1,1]
+    np.clip(crossCorr,-1,1,out=crossCorr)
+    return crossCorr,failFlag
+# End of CalcCrossCorrCoef
                     
 
 ##############################################################################
@@ -347,7 +446,7 @@ def UpdateAggWM(clusterLabels,custID,currentIDs,aggWM,windowCtr):
         custIndex = np.where(currentIDs[custCtr]==custIDStr)[0][0]
         allIndices.append(custIndex)
         updateIndices = np.where(clusterLabels==clusterLabels[custCtr])[0]
-        updateIndicesTrue = np.in1d(custIDStr,currentIDs[updateIndices])
+        updateIndicesTrue = np.isin(custIDStr,currentIDs[updateIndices])
         updateIndicesTrue = np.where(updateIndicesTrue==True)[0]
         aggWM[custIndex,updateIndicesTrue] = aggWM[custIndex,updateIndicesTrue] + 1
     if len(custID) == len(currentIDs):
@@ -358,7 +457,486 @@ def UpdateAggWM(clusterLabels,custID,currentIDs,aggWM,windowCtr):
     # End of custCtr for loop
     return aggWM, windowCtr
 # End of UpdateAggWM function
-        
+
+
+
+##############################################################################
+#
+#       CreateCustIndexMap
+#
+def CreateCustIndexMap(custID):
+    """ This function takes the list of customer IDs and creates a dictionary
+        mapping each customer ID to its integer index in that list.  This
+        allows the index of a customer to be found without searching the
+        full list of customer IDs.
+
+            Parameters
+            ---------
+                custID: list of str - the complete list of customer IDs.  The
+                    IDs must be unique
+
+            Returns
+            -------
+                custIndexMap: dict - keyed by customer ID with the integer
+                    index of that customer in custID as the value
+            """
+
+    custIndexMap = {}
+    for custCtr in range(0,len(custID)):
+        custIndexMap[custID[custCtr]] = custCtr
+    return custIndexMap
+# End of CreateCustIndexMap
+
+
+
+##############################################################################
+#
+#       GetCustIndices
+#
+def GetCustIndices(currentIDs,custIndexMap):
+    """ This function takes a list of customer IDs and returns the integer
+        index of each customer using the mapping produced by CreateCustIndexMap
+
+            Parameters
+            ---------
+                currentIDs: list of str - the customer IDs to look up.  All
+                    entries must be contained in custIndexMap
+                custIndexMap: dict - the customer ID to index mapping produced
+                    by CreateCustIndexMap
+
+            Returns
+            -------
+                currentIndices: numpy array of int (current customers) - the
+                    index of each customer in currentIDs
+            """
+
+    currentIndices = np.array([custIndexMap[currID] for currID in currentIDs],dtype=int)
+    return currentIndices
+# End of GetCustIndices
+
+
+
+##############################################################################
+#
+#       UpdateAggWM_Indexed
+#
+def UpdateAggWM_Indexed(clusterLabels,currentIndices,aggWM,windowCtr):
+    """ This function is the vectorized version of UpdateAggWM.  Instead of
+        searching the customer ID list for every clustered customer, the
+        customers in the current window are passed as integer indices (see
+        CreateCustIndexMap and GetCustIndices).  The pairwise paired/unpaired
+        information for the window is built in a single comparison of the
+        cluster labels (equivalent to the product of the one-hot label matrix
+        with its transpose) and added to the block of aggWM belonging to the
+        current customers.  The resulting matrices are identical to those
+        produced by UpdateAggWM.
+
+            Parameters
+            ---------
+                clusterLabels: ndarray of int (current customers) representing
+                    the cluster labeling of each customer from the spectral
+                    clustering algorithm
+                currentIndices: ndarray of int (current customers) - the index
+                    of each clustered customer in the full list of customers.
+                    The indexing must match clusterLabels
+                aggWM: ndarray of float, shape (customers,customers) the
+                    aggregated weight matrix previously initialized
+                windowCtr: ndarray of float, shape (customers,customers) the
+                    count of how many windows each pair of customers was
+                    clustered together in.  If -1 is passed, the window counts
+                    are not updated.
+            Returns
+            -------
+                aggWM: ndarray of float the aggregated weight matrix previously
+                    initialized and updated with the new informaiton from this window.
+                windowCtr: ndarray of float, shape (customers,customers) the
+                    updated window counts, or -1 if -1 was passed
+            """
+
+    clusterLabels = np.asarray(clusterLabels)
+    currentIndices = np.asarray(currentIndices,dtype=int)
+    sameCluster = np.equal.outer(clusterLabels,clusterLabels)
+    # When every customer is present in the window (the common case) the whole matrix can be updated directly
+    if (len(currentIndices) == aggWM.shape[0]) and np.array_equal(currentIndices,np.arange(aggWM.shape[0])):
+        aggWM += sameCluster
+        if type(windowCtr) != int:
+            windowCtr += 1
+    else:
+        blockIndices = np.ix_(currentIndices,currentIndices)
+        aggWM[blockIndices] += sameCluster
+        if type(windowCtr) != int:
+            windowCtr[blockIndices] += 1
+    return aggWM, windowCtr
+# End of UpdateAggWM_Indexed function
+
+
+
+##############################################################################
+#
+#       CreatePackedAggWM
+#
+def CreatePackedAggWM(numCust,maxCount,storagePath=-1):
+    """ This function creates the compact storage for the co-association
+        matrix and the window counts.  Because both matrices are symmetric,
+        only the upper triangle (including the diagonal) is stored, packed row
+        by row into a 1D integer array.  The integer type is the smallest
+        unsigned type that can hold maxCount, see GetPackedCountType.  The
+        arrays can optionally be backed by np.memmap files so they do not need
+        to be held in memory.
+
+            Parameters
+            ---------
+                numCust: int - the number of customers
+                maxCount: int - the largest count that will be stored, i.e.
+                    the number of windows multiplied by the length of kVector
+                storagePath: str or Path - a directory for the memory mapped
+                    files.  If -1 (default) the arrays are held in memory
+
+            Returns
+            -------
+                packedWM: dict - the packed storage with the following keys
+                    'numCust': int - the number of customers
+                    'rowOffsets': numpy array of int (customers) - the position
+                        of the diagonal entry of each row in the packed arrays
+                    'aggWM': numpy array of uint - the packed co-association 
+                        counts
+                    'windowCtr': numpy array of uint - the packed window counts
+            """
+
+    countType = GetPackedCountType(maxCount)
+    numEntries = int(numCust * (numCust + 1) // 2)
+    rowIndices = np.arange(numCust,dtype=np.int64)
+    packedWM = {'numCust':numCust,'rowOffsets':(rowIndices * numCust) - (rowIndices * (rowIndices - 1) // 2)}
+    if type(storagePath) == int:
+        packedWM['aggWM'] = np.zeros(numEntries,dtype=countType)
+        packedWM['windowCtr'] = np.zeros(numEntries,dtype=countType)
+    else:
+        Path(storagePath).mkdir(parents=True,exist_ok=True)
+        packedWM['aggWM'] = np.memmap(Path(storagePath,'CoAssociation_Counts.dat'),dtype=countType,mode='w+',shape=(numEntries,))
+        packedWM['windowCtr'] = np.memmap(Path(storagePath,'CoAssociation_WindowCounts.dat'),dtype=countType,mode='w+',shape=(numEntries,))
+    return packedWM
+# End of CreatePackedAggWM
+
+
+
+##############################################################################
+#
+#       GetPackedCountType
+#
+def GetPackedCountType(maxCount):
+    """ This function returns the smallest unsigned integer type (uint8, 
+        uint16, uint32, or uint64) that can hold maxCount
+
+            Parameters
+            ---------
+                maxCount: int - the largest count that will be stored
+
+            Returns
+            -------
+                countType: numpy dtype - the unsigned integer type
+            """
+
+    for countType in [np.uint8,np.uint16,np.uint32]:
+        if maxCount <= np.iinfo(countType).max:
+            return countType
+    return np.uint64
+# End of GetPackedCountType
+
+
+
+##############################################################################
+#
+#       EnsurePackedCapacity
+#
+def EnsurePackedCapacity(packedWM,maxCount,blockElements=2**22):
+    """ This function upcasts the packed co-association and window counts to 
+        a larger integer type if maxCount does not fit in the current type, 
+        so the counts never wrap around.  Memory mapped arrays are rewritten
+        blockwise to a file of the new type that replaces the original file.
+
+            Parameters
+            ---------
+                packedWM: dict - the packed storage from CreatePackedAggWM
+                maxCount: int - the largest count that will be stored after
+                    the next update
+                blockElements: int - the number of entries copied at once for
+                    memory mapped arrays
+
+            Returns
+            -------
+                packedWM: dict - the packed storage, upcast if necessary
+            """
+
+    countType = GetPackedCountType(maxCount)
+    if np.iinfo(countType).max <= np.iinfo(packedWM['aggWM'].dtype).max:
+        return packedWM
+    for key in ['aggWM','windowCtr']:
+        oldCounts = packedWM[key]
+        if isinstance(oldCounts,np.memmap):
+            countPath = Path(oldCounts.filename)
+            tempPath = countPath.with_suffix('.upcast')
+            newCounts = np.memmap(tempPath,dtype=countType,mode='w+',shape=oldCounts.shape)
+            for startIndex in range(0,oldCounts.shape[0],blockElements):
+                newCounts[startIndex:(startIndex+blockElements)] = oldCounts[startIndex:(startIndex+blockElements)]
+            newCounts.flush()
+            del newCounts, oldCounts
+            packedWM[key] = -1
+            os.replace(tempPath,countPath)
+            packedWM[key] = np.memmap(countPath,dtype=countType,mode='r+',shape=(packedWM['rowOffsets'][-1]+1,))
+        else:
+            packedWM[key] = oldCounts.astype(countType)
+    return packedWM
+# End of EnsurePackedCapacity
+
+
+
+##############################################################################
+#
+#       GetPackedPositions
+#
+def GetPackedPositions(packedWM,rowIndices,colIndices):
+    """ This function returns the positions in the packed arrays of the
+        entries (rowIndices x colIndices) of the full symmetric matrix
+
+            Parameters
+            ---------
+                packedWM: dict - the packed storage from CreatePackedAggWM
+                rowIndices: numpy array of int - the customer index of each row
+                colIndices: numpy array of int - the customer index of each
+                    column
+
+            Returns
+            -------
+                positions: numpy array of int (rows,columns) - the position of
+                    each entry in the packed arrays
+            """
+
+    lowIndices = np.minimum(rowIndices[:,np.newaxis],colIndices[np.newaxis,:])
+    highIndices = np.maximum(rowIndices[:,np.newaxis],colIndices[np.newaxis,:])
+    positions = packedWM['rowOffsets'][lowIndices] + (highIndices - lowIndices)
+    return positions
+# End of GetPackedPositions
+
+
+
+##############################################################################
+#
+#       UpdatePackedAggWM
+#
+def UpdatePackedAggWM(clusterLabels,currentIndices,packedWM,blockElements=2**22,updateWindowCtrFlag=True):
+    """ This function is the packed storage version of UpdateAggWM_Indexed.  
+        The paired/unpaired information for the current window is added to the
+        packed co-association counts and the window counts are incremented for
+        every pair of customers in the window.  The rows are processed in
+        blocks of roughly blockElements entries to bound the temporary memory.
+
+            Parameters
+            ---------
+                clusterLabels: ndarray of int (current customers) representing
+                    the cluster labeling of each customer
+                currentIndices: ndarray of int (current customers) - the index
+                    of each clustered customer in the full list of customers
+                packedWM: dict - the packed storage from CreatePackedAggWM.
+                    It is updated in place
+                blockElements: int - the approximate number of matrix entries
+                    processed at a time
+                updateWindowCtrFlag: boolean - if False only the co-association
+                    counts are updated and the window counts are left to
+                    AddPackedWindowCounts.  The default is True
+
+            Returns
+            -------
+                packedWM: dict - the updated packed storage
+            """
+
+    clusterLabels = np.asarray(clusterLabels)
+    currentIndices = np.asarray(currentIndices,dtype=np.int64)
+    numCurrent = len(currentIndices)
+    allPresent = numCurrent == packedWM['numCust']
+    if allPresent and updateWindowCtrFlag:
+        packedWM['windowCtr'] += 1
+    blockSize = max(1,blockElements // max(numCurrent,1))
+    for startIndex in range(0,numCurrent,blockSize):
+        endIndex = min(startIndex + blockSize,numCurrent)
+        rowIndices = currentIndices[startIndex:endIndex]
+        upperMask = currentIndices[np.newaxis,:] >= rowIndices[:,np.newaxis]
+        positions = GetPackedPositions(packedWM,rowIndices,currentIndices)[upperMask]
+        sameCluster = np.equal.outer(clusterLabels[startIndex:endIndex],clusterLabels)[upperMask]
+        packedWM['aggWM'][positions] += sameCluster.astype(packedWM['aggWM'].dtype)
+        if (not allPresent) and updateWindowCtrFlag:
+            packedWM['windowCtr'][positions] += 1
+    return packedWM
+# End of UpdatePackedAggWM
+
+
+
+##############################################################################
+#
+#       AddPackedWindowCounts
+#
+def AddPackedWindowCounts(packedWM,validWindows,windowWeights,blockElements=2**22):
+    """ This function is the packed storage version of CalcWindowPairCounts.
+        The window counts for a set of windows are calculated from the window
+        validity matrix one block of rows at a time and added to the packed
+        window counts.
+
+            Parameters
+            ---------
+                packedWM: dict - the packed storage from CreatePackedAggWM.
+                    It is updated in place
+                validWindows: numpy array of bool (windows,customers) - from
+                    CreateWindowValidityMatrix
+                windowWeights: numpy array of int (windows) - the number of 
+                    clusterings done in each window
+                blockElements: int - the approximate number of matrix entries
+                    processed at a time
+
+            Returns
+            -------
+                packedWM: dict - the updated packed storage
+            """
+
+    numCust = packedWM['numCust']
+    validFloat = validWindows.astype(float)
+    weightedValid = validFloat * np.asarray(windowWeights,dtype=float)[:,np.newaxis]
+    allIndices = np.arange(numCust,dtype=np.int64)
+    blockSize = max(1,blockElements // max(numCust,1))
+    for startIndex in range(0,numCust,blockSize):
+        endIndex = min(startIndex + blockSize,numCust)
+        rowIndices = allIndices[startIndex:endIndex]
+        blockCounts = np.matmul(weightedValid[:,startIndex:endIndex].transpose(),validFloat)
+        upperMask = allIndices[np.newaxis,:] >= rowIndices[:,np.newaxis]
+        positions = GetPackedPositions(packedWM,rowIndices,allIndices)[upperMask]
+        packedWM['windowCtr'][positions] += np.rint(blockCounts[upperMask]).astype(packedWM['windowCtr'].dtype)
+    return packedWM
+# End of AddPackedWindowCounts
+
+
+
+##############################################################################
+#
+#       GetPackedRows_Norm
+#
+def GetPackedRows_Norm(packedWM,rowIndices,colIndices):
+    """ This function reconstructs a block of the normalized co-association
+        matrix (co-association counts divided by window counts) from the
+        packed storage.  The normalization matches CAEnsemble, entries with a
+        window count of zero are zero.  If the packed dict has a 
+        'zeroPositions' entry (added by ClusterEnsembleState for the pairs of
+        datastreams from the same 2-phase or 3-phase customer), those entries
+        are also zero.
+
+            Parameters
+            ---------
+                packedWM: dict - the packed storage from CreatePackedAggWM
+                rowIndices: numpy array of int - the customer index of each row
+                colIndices: numpy array of int - the customer index of each
+                    column
+
+            Returns
+            -------
+                normRows: numpy array of float (rows,columns) - the normalized
+                    co-association values
+            """
+
+    positions = GetPackedPositions(packedWM,np.asarray(rowIndices),np.asarray(colIndices))
+    windowCtr = packedWM['windowCtr'][positions].astype(float)
+    windowCtr[windowCtr==0] = 0.0001
+    normRows = np.divide(packedWM['aggWM'][positions].astype(float),windowCtr)
+    if ('zeroPositions' in packedWM) and (len(packedWM['zeroPositions']) != 0):
+        normRows[np.isin(positions,packedWM['zeroPositions'])] = 0
+    return normRows
+# End of GetPackedRows_Norm
+
+
+
+##############################################################################
+#
+#       UnpackAggWM_Norm
+#
+def UnpackAggWM_Norm(packedWM,keepIndices,blockElements=2**22,colIndices=-1):
+    """ This function builds the dense normalized co-association matrix for
+        the customers in keepIndices from the packed storage, one block of rows
+        at a time.  This is only needed when the final clustering uses the 
+        dense co-association matrix.
+
+            Parameters
+            ---------
+                packedWM: dict - the packed storage from CreatePackedAggWM
+                keepIndices: numpy array of int - the customers to include
+                blockElements: int - the approximate number of matrix entries
+                    processed at a time
+                colIndices: numpy array of int - if supplied, only the columns
+                    for these customers are built, giving a 
+                    (kept customers,columns) block.  The default (-1) uses
+                    keepIndices
+
+            Returns
+            -------
+                aggWM_Norm: numpy array of float (kept customers,kept customers)
+                    - the normalized co-association matrix
+            """
+
+    keepIndices = np.asarray(keepIndices,dtype=np.int64)
+    if type(colIndices) == int:
+        colIndices = keepIndices
+    else:
+        colIndices = np.asarray(colIndices,dtype=np.int64)
+    numKeep = len(keepIndices)
+    aggWM_Norm = np.zeros((numKeep,len(colIndices)),dtype=float)
+    blockSize = max(1,blockElements // max(len(colIndices),1))
+    for startIndex in range(0,numKeep,blockSize):
+        endIndex = min(startIndex + blockSize,numKeep)
+        aggWM_Norm[startIndex:endIndex,:] = GetPackedRows_Norm(packedWM,keepIndices[startIndex:endIndex],colIndices)
+    return aggWM_Norm
+# End of UnpackAggWM_Norm
+
+
+
+##############################################################################
+#
+#       SparsifyPackedAggWM
+#
+def SparsifyPackedAggWM(packedWM,keepIndices,numNeighbors,blockElements=2**22):
+    """ This function builds the sparse final affinity matrix directly from
+        the packed storage, keeping the numNeighbors largest normalized 
+        co-association values for each customer (see 
+        SpectralUtils.SparsifyAffinity).  The dense normalized matrix is never
+        created; only one block of rows is reconstructed at a time.
+
+            Parameters
+            ---------
+                packedWM: dict - the packed storage from CreatePackedAggWM
+                keepIndices: numpy array of int - the customers to include
+                numNeighbors: int - the number of entries to keep in each row
+                blockElements: int - the approximate number of matrix entries
+                    processed at a time
+
+            Returns
+            -------
+                sparseAffinity: scipy sparse csr matrix of float 
+                    (kept customers,kept customers) - the symmetric sparse
+                    normalized co-association matrix
+            """
+
+    keepIndices = np.asarray(keepIndices,dtype=np.int64)
+    numKeep = len(keepIndices)
+    blockSize = max(1,blockElements // max(numKeep,1))
+    allRows = []
+    allCols = []
+    allValues = []
+    for startIndex in range(0,numKeep,blockSize):
+        endIndex = min(startIndex + blockSize,numKeep)
+        normRows = GetPackedRows_Norm(packedWM,keepIndices[startIndex:endIndex],keepIndices)
+        blockRows, blockCols, blockValues = SpectralUtils.SelectTopNeighbors(normRows,np.arange(startIndex,endIndex),numNeighbors)
+        allRows.append(blockRows)
+        allCols.append(blockCols)
+        allValues.append(blockValues)
+    sparseAffinity = sparse.csr_matrix((np.concatenate(allValues),(np.concatenate(allRows),np.concatenate(allCols))),shape=(numKeep,numKeep))
+    sparseAffinity = sparseAffinity.maximum(sparseAffinity.T)
+    return sparseAffinity.tocsr()
+# End of SparsifyPackedAggWM
+
                
 
 ##############################################################################
@@ -431,7 +1009,7 @@ def CalcPredictedPhaseNoLabels(finalClusterLabels, clusteredPhaseLabelErrors,clu
         currentCluster = uniqueClusters[clustCtr]
         indices1 = np.where(finalClusterLabels==currentCluster)[0]     
         clusterPhases = clusteredPhaseLabelErrors[0,indices1]
-        pPhase = stats.mode(clusterPhases)[0][0]
+        pPhase = np.atleast_1d(stats.mode(clusterPhases)[0])[0]
         predictedPhases[0,indices1] = pPhase        
 
     return predictedPhases
@@ -505,9 +1083,8 @@ def UpdateCustWindowCounts(custWindowCounts,currentIDs,custIDInput):
                     with the new information in currentIDs
             """
     
-    for custCtr in range(0,len(currentIDs)):
-        index = np.where(np.array(custIDInput)==currentIDs[custCtr])[0][0]
-        custWindowCounts[index] = custWindowCounts[index] + 1
+    currentIndices = GetCustIndices(currentIDs,CreateCustIndexMap(custIDInput))
+    custWindowCounts[currentIndices] = custWindowCounts[currentIndices] + 1
     return custWindowCounts
 # End of UpdateCustWindowCounts function
                     
@@ -844,7 +1421,7 @@ def PlotHistogramOfCCSeparation(ccSeparation,xLim=0.2,savePath=-1):
 
 
 
-def Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinal):
+def Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinal,blockSize=-1):
     """ This function takes the results from running the Ensemble Spectral Cluster
         Phase Identification algorithm, calculates a modified version of the
         Silhouette Score for each customer.
@@ -862,6 +1439,13 @@ def Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterL
         coefficient, where the next nearest cluster for b is required to be a cluster
         predicted to be a different phase from the cluster of the current sample.  
         This provides a more informative coefficient for this use case.  
+        
+        The mean distance from every customer to every cluster is calculated
+        with one product of the co-association matrix and a sparse cluster
+        indicator matrix.  The b value is the smallest mean distance to a 
+        non-empty cluster with a different predicted phase, capped at 1.  The
+        rows can be processed in blocks (blockSize) to bound the memory used
+        for large numbers of customers.
             
 
     Parameters
@@ -869,7 +1453,9 @@ def Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterL
         caMatrix: ndarray of float (customers,customers) - the co-association
             matrix produced by the spectral clustering ensemble.  This is an
             affinity matrix.  Note that the indexing of all variables must
-            match in customer order.
+            match in customer order.  A scipy sparse matrix or the packed
+            storage dict returned by CAEnsemble with storageMode='packed' may
+            also be used
         clusteredIDs: list of str - the list of customer ids for which a predicted
             phase was produced
         finalClusterLabels: list of int - the integer cluster label for each 
@@ -877,6 +1463,9 @@ def Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterL
         predictedPhases: ndarray of int (1,customers) - the integer predicted
             phase label for each customer
         kFinal: int - the number of final clusters
+        blockSize: int - the number of customers processed at a time.  The
+            default (-1) processes all customers at once for a dense 
+            caMatrix and uses blocks of roughly 4 million entries otherwise
                 
     Returns
     -------
@@ -884,47 +1473,46 @@ def Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterL
                 
             """
         
-    aggWMDist = 1 - caMatrix   
+    finalClusterLabels = np.asarray(finalClusterLabels,dtype=int).ravel()
+    customerPhases = np.asarray(predictedPhases).reshape(-1)
+    numCust = len(finalClusterLabels)
+    clusterSizes = np.bincount(finalClusterLabels,minlength=kFinal)
+    clusterIndicator = sparse.csr_matrix((np.ones(numCust),(np.arange(numCust),finalClusterLabels)),shape=(numCust,kFinal))
+    # The predicted phase of each cluster is taken from its first customer
+    clusterPhases = np.zeros(kFinal,dtype=customerPhases.dtype)
+    usedClusters, firstIndices = np.unique(finalClusterLabels,return_index=True)
+    clusterPhases[usedClusters] = customerPhases[firstIndices]
+    if blockSize == -1:
+        if (type(caMatrix) == dict) or sparse.issparse(caMatrix):
+            blockSize = max(1,(2**22) // max(numCust,1))
+        else:
+            blockSize = numCust
     allSC = []
-    # Loop through each customer to calculate individual silhouette coefficients
-    for custCtr in range(0,len(clusteredIDs)):
-        currCluster = finalClusterLabels[custCtr]
-        clusterPhase = predictedPhases[0,custCtr]
-        # Find all customers in the same cluster as current customer and calculate the value for a
-        currInClustIndices = np.where(finalClusterLabels==currCluster)[0]
-        a = np.mean(aggWMDist[custCtr,currInClustIndices])
-        allBs = []
-        allBsAff = []
-        allClusterPhases = []
-        # Loop through the other clusters and calculate the value for b for each cluster, relative to the current customer
-        for clustCtr in range(0,kFinal):
-            if clustCtr == currCluster:
-                allBs.append(1)
-                allBsAff.append(0)
-                allClusterPhases.append(clusterPhase)
-            else:
-                indices = np.where(finalClusterLabels == clustCtr)[0]
-                if len(indices) == 0:
-                    continue
-                currB = np.mean(aggWMDist[custCtr,indices])
-                currBAff = np.mean(caMatrix[custCtr,indices])
-                allBs.append(currB)
-                allBsAff.append(currBAff)
-                currPhase = predictedPhases[0,indices[0]]
-                allClusterPhases.append(currPhase)
+    for startIndex in range(0,numCust,max(blockSize,1)):
+        endIndex = min(startIndex + blockSize,numCust)
+        if type(caMatrix) == dict:
+            clusteredIndices = caMatrix['clusteredIndices']
+            caRows = GetPackedRows_Norm(caMatrix,clusteredIndices[startIndex:endIndex],clusteredIndices)
+            caRows[caRows==0] = 0.00001
+        elif sparse.issparse(caMatrix):
+            caRows = caMatrix[startIndex:endIndex,:].toarray()
+        else:
+            caRows = caMatrix[startIndex:endIndex,:]
+        # Mean distance (1 - affinity) from each customer to each cluster
+        clusterSums = np.asarray(clusterIndicator.transpose().dot(caRows.transpose())).transpose()
+        with np.errstate(divide='ignore',invalid='ignore'):
+            meanDist = (clusterSizes[np.newaxis,:] - clusterSums) / clusterSizes[np.newaxis,:]
+        blockLabels = finalClusterLabels[startIndex:endIndex]
+        blockRows = np.arange(endIndex-startIndex)
+        a = meanDist[blockRows,blockLabels]
         # Find the next closest cluster predicted to be a different phase from the current customers cluster
-        sortedBs = np.sort(np.array(allBs))
-        argsortedBs = np.argsort(np.array(allBs))
-        argsortedPhases = np.array(allClusterPhases)[argsortedBs]
-        minCtr = 0
-        while (argsortedPhases[minCtr] == clusterPhase) and (sortedBs[minCtr] != 1):
-            minCtr = minCtr + 1
-        nextClosestDiffPhase = argsortedPhases[minCtr]
-        nextClosestDiffB = sortedBs[minCtr]
-        b = sortedBs[minCtr]
+        diffPhaseMask = (clusterPhases[np.newaxis,:] != customerPhases[startIndex:endIndex,np.newaxis]) & (clusterSizes[np.newaxis,:] != 0)
+        diffPhaseMask[blockRows,blockLabels] = False
+        b = np.minimum(np.min(np.where(diffPhaseMask,meanDist,np.inf),axis=1),1)
         # Calculate Silhouette Coefficient
-        s = (b-a) / max(a,b)
-        allSC.append(s)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            s = (b-a) / np.maximum(a,b)
+        allSC.extend(list(s))
 
     return allSC
 # End of Calculate_ModifiedSilhouetteCoefficients Function   
@@ -969,6 +1557,85 @@ def Plot_ModifiedSilhouetteCoefficients(allSC,savePath=-1):
 
 
 
+def CreateFullListIndex(custID,resultIDs):
+    """ This function finds the index of each customer in resultIDs in the 
+            complete list of customer ids.  The index is built with a single
+            pass over custID, so it replaces calling custID.index for each 
+            customer.  If an id is repeated in custID, the first occurrence is 
+            used, matching custID.index.
+
+    Parameters
+    ---------
+        custID: list of str - the complete list of customer ids
+        resultIDs: list of str - the customer ids to look up
+
+    Returns
+    -------
+        fullIndex: ndarray of int (resultIDs) - the index of each customer in
+            resultIDs in custID
+            
+            """
+            
+    custIndex = dict(zip(reversed(list(custID)),range(len(custID)-1,-1,-1)))
+    fullIndex = np.array([custIndex[currID] for currID in resultIDs],dtype=int)
+    return fullIndex
+# End of CreateFullListIndex
+
+
+
+def AssembleFullListResults(custID,clusteredIDs,noVotesIDs,fullFields,clusteredFields,omittedValue=-99):
+    """ This function assembles the results for the customers processed by a
+            phase identification method with the customers which were omitted
+            due to missing data.  The clustered customers are first, followed
+            by the omitted customers.  Fields indexed by the complete customer
+            list are reordered to match, and fields produced only for the 
+            clustered customers are given omittedValue for the omitted 
+            customers.  Each field is written into a preallocated array with
+            a single indexing operation.
+
+    Parameters
+    ---------
+        custID: list of str - the complete list of customer ids
+        clusteredIDs: list of str - the list of customer ids for which a 
+            predicted phase was produced
+        noVotesIDs: list of str - the list of customers ids which were omitted
+            due to missing data
+        fullFields: dict of ndarray of int (1,customers) - the fields indexed 
+            by custID, for example the original phase labels
+        clusteredFields: dict of list or ndarray (clustered customers) - the 
+            fields indexed by clusteredIDs, for example the predicted phase 
+            labels and confidence scores.  Arrays of shape (1,clustered 
+            customers) are flattened
+        omittedValue: int - the placeholder value for the omitted customers 
+            in the clusteredFields
+
+    Returns
+    -------
+        custID_FullList: list of str - the list of customer ids with customers
+            omitted due to missing data moved to the end of the list
+        assembledFields: dict of ndarray - the fullFields as ndarray of int
+            (1,customers) and the clusteredFields as ndarray (clustered + 
+            omitted customers), in the order of custID_FullList
+            
+            """
+            
+    numClusteredCust = len(clusteredIDs)
+    custID_FullList = list(clusteredIDs) + list(noVotesIDs)
+    fullIndex = CreateFullListIndex(custID,custID_FullList)
+    
+    assembledFields = {}
+    for fieldName, field in fullFields.items():
+        assembledFields[fieldName] = np.zeros((1,field.shape[1]),dtype=int)
+        assembledFields[fieldName][0,0:len(fullIndex)] = field[0,fullIndex]
+    for fieldName, field in clusteredFields.items():
+        field = np.ravel(np.asarray(field))
+        assembledFields[fieldName] = np.full(len(fullIndex),omittedValue,dtype=np.result_type(field.dtype,type(omittedValue)))
+        assembledFields[fieldName][0:numClusteredCust] = field
+    return custID_FullList, assembledFields
+# End of AssembleFullListResults
+
+
+
 def CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabelsOriginal,finalClusterLabels,clusteredIDs,custID,noVotesIDs,predictedPhases,allSC,phaseLabelsTrue=-1):
     """ This function takes the results from the co-association matrix ensemble
             and adds back the customers which were omitted due to missing data.
@@ -1027,51 +1694,30 @@ def CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabelsOriginal
             """
             
     if len(noVotesIDs) != 0: # Check if any customers were omitted
-        numCust = phaseLabelsOriginal.shape[1]
-        numClusteredCust = len(clusteredIDs)
+        fullFields = {'phaseLabelsOrg':phaseLabelsOriginal}
+        if type(phaseLabelsTrue) != int:
+            fullFields['phaseLabelsTrue'] = phaseLabelsTrue
+        clusteredFields = {'phaseLabelsPred':predictedPhases,'allSC':allSC,'finalClusterLabels':finalClusterLabels}
+        custID_FullList, assembledFields = AssembleFullListResults(custID,clusteredIDs,noVotesIDs,fullFields,clusteredFields)
         
-        phaseLabelsOrg_FullList = np.zeros((1,numCust),dtype=int)
-        phaseLabelsPred_FullList = np.zeros((1,numCust),dtype=int)
-        custID_FullList = list(deepcopy(clusteredIDs))
-        allSC_FullList = deepcopy(allSC)
-        allFinalClusterLabels = list(deepcopy(finalClusterLabels))
+        phaseLabelsOrg_FullList = assembledFields['phaseLabelsOrg']
+        phaseLabelsPred_FullList = np.zeros((1,phaseLabelsOriginal.shape[1]),dtype=int)
+        phaseLabelsPred_FullList[0,0:len(custID_FullList)] = assembledFields['phaseLabelsPred']
+        allSC_FullList = assembledFields['allSC'].tolist()
+        allFinalClusterLabels = assembledFields['finalClusterLabels'].tolist()
         if type(phaseLabelsTrue) != int:
-            phaseLabelsTrue_FullList = np.zeros((1,numCust),dtype=int)
+            phaseLabelsTrue_FullList = assembledFields['phaseLabelsTrue']
         else:
             phaseLabelsTrue_FullList = -1
-    
-    
-        phaseLabelsPred_FullList[0,0:numClusteredCust] = predictedPhases
-        
-        # Reshape customers included in the results
-        for custCtr in range(0,numClusteredCust):
-            currID = clusteredIDs[custCtr]
-            index = custID.index(currID)
-            phaseLabelsOrg_FullList[0,custCtr] = phaseLabelsOriginal[0,index]
-            if type(phaseLabelsTrue) != int:
-                phaseLabelsTrue_FullList[0,custCtr] = phaseLabelsTrue[0,index]
-            
-        # Add the omitted customers
-        for custCtr in range(0,len(noVotesIDs)):
-            currID = noVotesIDs[custCtr]
-            index = custID.index(currID)
-            phaseLabelsOrg_FullList[0,(custCtr+numClusteredCust)] = phaseLabelsOriginal[0,index]
-            if type(phaseLabelsTrue) != int:
-                phaseLabelsTrue_FullList[0,(custCtr+numClusteredCust)] = phaseLabelsTrue[0,index]
-            
-            phaseLabelsPred_FullList[0,(custCtr+numClusteredCust)] = -99
-            custID_FullList.append(currID)
-            allSC_FullList.append(-99)
-            allFinalClusterLabels.append(-99)
             
     else: # Copy the original fields and return them as-is
-        phaseLabelsOrg_FullList = deepcopy(phaseLabelsOriginal)
-        phaseLabelsPred_FullList = deepcopy(predictedPhases)
-        custID_FullList = deepcopy(clusteredIDs)
-        allSC_FullList = deepcopy(allSC)
-        allFinalClusterLabels = list(deepcopy(finalClusterLabels))
+        phaseLabelsOrg_FullList = np.copy(phaseLabelsOriginal)
+        phaseLabelsPred_FullList = np.copy(predictedPhases)
+        custID_FullList = list(clusteredIDs)
+        allSC_FullList = list(allSC)
+        allFinalClusterLabels = list(finalClusterLabels)
         if type(phaseLabelsTrue) != int:
-            phaseLabelsTrue_FullList = deepcopy(phaseLabelsTrue)
+            phaseLabelsTrue_FullList = np.copy(phaseLabelsTrue)
         else:
             phaseLabelsTrue_FullList = -1
         
@@ -1145,40 +1791,19 @@ def CreateFullListCustomerResults_SensMeth(clusteredPhaseLabels,phaseLabelsOrigi
                 
             """
         
-    numCust = phaseLabelsTrue.shape[1]
-    numClusteredCust = len(clusteredIDs)
+    fullFields = {'phaseLabelsOrg':phaseLabelsOriginal,'phaseLabelsTrue':phaseLabelsTrue}
+    clusteredFields = {'phaseLabelsPred':predictedPhases,'ccSep':ccSeparation,'winVotes':winVotesConf,
+                       'sensVotes':sensVotesConf,'combConf':confScoreCombined}
+    custID_FullList, assembledFields = AssembleFullListResults(custID,clusteredIDs,noVotesIDs,fullFields,clusteredFields)
     
-    phaseLabelsOrg_FullList = np.zeros((1,numCust),dtype=int)
-    phaseLabelsPred_FullList = np.zeros((1,numCust),dtype=int)
-    phaseLabelsTrue_FullList = np.zeros((1,numCust),dtype=int)
-    custID_FullList = list(deepcopy(clusteredIDs))
-    ccSep_FullList = deepcopy(ccSeparation)
-    winVotes_FullList = deepcopy(winVotesConf)
-    sensVotes_FullList = deepcopy(sensVotesConf)
-    combConf_FullList = deepcopy(confScoreCombined)
-
-    phaseLabelsPred_FullList[0,0:numClusteredCust] = predictedPhases
-    
-    # Reshape customers included in the results
-    for custCtr in range(0,numClusteredCust):
-        currID = clusteredIDs[custCtr]
-        index = custID.index(currID)
-        phaseLabelsOrg_FullList[0,custCtr] = phaseLabelsOriginal[0,index]
-        phaseLabelsTrue_FullList[0,custCtr] = phaseLabelsTrue[0,index]
-        
-    # Add the omitted customers
-    for custCtr in range(0,len(noVotesIDs)):
-        currID = noVotesIDs[custCtr]
-        index = custID.index(currID)
-        phaseLabelsOrg_FullList[0,(custCtr+numClusteredCust)] = phaseLabelsOriginal[0,index]
-        phaseLabelsTrue_FullList[0,(custCtr+numClusteredCust)] = phaseLabelsTrue[0,index]
-        
-        phaseLabelsPred_FullList[0,(custCtr+numClusteredCust)] = -99
-        custID_FullList.append(currID)
-        ccSep_FullList.append(-99)
-        winVotes_FullList.append(-99)
-        sensVotes_FullList.append(-99)
-        combConf_FullList.append(-99)
+    phaseLabelsOrg_FullList = assembledFields['phaseLabelsOrg']
+    phaseLabelsTrue_FullList = assembledFields['phaseLabelsTrue']
+    phaseLabelsPred_FullList = np.zeros((1,phaseLabelsTrue.shape[1]),dtype=int)
+    phaseLabelsPred_FullList[0,0:len(custID_FullList)] = assembledFields['phaseLabelsPred']
+    ccSep_FullList = assembledFields['ccSep'].tolist()
+    winVotes_FullList = assembledFields['winVotes'].tolist()
+    sensVotes_FullList = assembledFields['sensVotes'].tolist()
+    combConf_FullList = assembledFields['combConf'].tolist()
 
     return phaseLabelsOrg_FullList, phaseLabelsPred_FullList, phaseLabelsTrue_FullList,custID_FullList, ccSep_FullList, winVotes_FullList,sensVotes_FullList,combConf_FullList
 
@@ -1207,8 +1832,9 @@ def Ensure3PhaseCustHaveUniqueID(custIDOriginal,phaseLabelsInput,numPhasesInput
             other!  Meaning for a three phase customer the three datastreams
             must be contiguous in index, i.e. indices 2,3,4
             
-            This function will also print the customers which have been assigned
-            new IDs and save a csv with the alterations.
+            This function will also save a csv with the customers which have 
+            been assigned new IDs.  The IDs are grouped in a single pass, so
+            the runtime is linear in the number of datastreams.
 
     Parameters
     ---------
@@ -1236,7 +1862,10 @@ def Ensure3PhaseCustHaveUniqueID(custIDOriginal,phaseLabelsInput,numPhasesInput
     print('Check if all datastreams have a unique ID')
     
     
-    uniqueList = np.unique(custIDOriginal)
+    # Group the datastreams by ID in a single pass, inverseIndices maps each
+    #   datastream to its group and groupCounts gives the size of each group
+    uniqueList, inverseIndices, groupCounts = np.unique(np.array(custIDOriginal),return_inverse=True,return_counts=True)
+    inverseIndices = np.ravel(inverseIndices)
     # If there are no duplicates and numPhases is not supplied, then no action 
     #    is necessary and all customers are treated as single-phase
     if (len(uniqueList) == len(custIDOriginal)) and (type(numPhasesInput) == int):
@@ -1250,82 +1879,52 @@ def Ensure3PhaseCustHaveUniqueID(custIDOriginal,phaseLabelsInput,numPhasesInput
         return custIDOriginal, numPhasesNew
     
     else:
-                
-        custIDUnique = []
-        changedIndices = []
+        phaseLabels = phaseLabelsInput[0,:]
+        groupSize = groupCounts[inverseIndices]
         numPhasesNew = np.zeros((1,len(custIDOriginal)),dtype=int)
-        appendCtr = 0 # This is used to ensure that labels will definitely be unique
+        # Standard case, single phase, already has a unique id
+        numPhasesNew[0,groupSize == 1] = 1
         
-        # Loop through each original ID
-        for custCtr in range(0,len(custIDOriginal)):
-            currCust = custIDOriginal[custCtr]  
-            indices = np.where(np.array(custIDOriginal)==currCust)[0]
-            # Standard case, single phase, already has a unique id
-            if len(indices) == 1:  
-                numPhasesNew[0,custCtr] = 1
-                custIDUnique.append(currCust)
-            elif len(indices) == 2: 
-                # Only change the name if numPhases was supplied by the user
-                if type(numPhasesInput) != int:
-                    newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr]) + '_' + str(appendCtr)
-                    appendCtr = appendCtr + 1
-                    custIDUnique.append(newStr)
-                    changedIndices.append(custCtr)                    
-                # Otherwise create/estimate numPhases from the original phase labels
-                else:
-                    # This is the barn case -> two meters, same premise, probably the same phase
-                    if phaseLabelsInput[0,indices[0]] == phaseLabelsInput[0,indices[1]]:
-                        numPhasesNew[0,custCtr] = 1
-                        newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr]) + '_' + str(appendCtr)
-                        appendCtr = appendCtr + 1
-                        custIDUnique.append(newStr)
-                        changedIndices.append(custCtr)
-                    # This is the 2-phase case -> one meter, two datastreams, probably different phases
-                    else:
-                        numPhasesNew[0,custCtr] = 2
-                        newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr])
-                        custIDUnique.append(newStr)
-                        changedIndices.append(custCtr)
-            elif len(indices) == 3:
-                # Only change the name if numPhases was supplied by the user
-                if type(numPhasesInput) != int:                
-                    newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr]) + '_' + str(appendCtr)
-                    appendCtr = appendCtr + 1
-                    custIDUnique.append(newStr)
-                    changedIndices.append(custCtr)
-                
-                # Otherwise create/estimate numPhases from the original phase labels                
-                else:  
-                    # Allow for a possible barn case, although this seems less likely
-                    if phaseLabelsInput[0,indices[0]] == phaseLabelsInput[0,indices[1]] == phaseLabelsInput[0,indices[2]]:
-                        numPhasesNew[0,custCtr] = 1
-                        newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr]) + '_' + str(appendCtr)
-                        appendCtr = appendCtr + 1
-                        custIDUnique.append(newStr)
-                        changedIndices.append(custCtr)
-                    # Three-phase case
-                    else:
-                        numPhasesNew[0,custCtr] = 3
-                        newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr])
-                        custIDUnique.append(newStr)
-                        changedIndices.append(custCtr)                
-            else: # This would be an odd situation.  In this case, just assign a unique id and leave it alone
-                if type(numPhasesInput) != int:    
-                    numPhasesNew[0,custCtr] = 1
-                newStr = currCust + '_' + str(phaseLabelsInput[0,custCtr]) + '_' + str(appendCtr)
-                appendCtr = appendCtr + 1
-                custIDUnique.append(newStr)
-                changedIndices.append(custCtr)
-        # End of custCtr for loop
+        # Only change the name if numPhases was supplied by the user
+        if type(numPhasesInput) != int:
+            appendMask = groupSize > 1
+        # Otherwise create/estimate numPhases from the original phase labels
+        else:
+            # A group has matching phase labels if its smallest and largest 
+            #   labels are equal
+            groupMin = np.full(len(uniqueList),np.inf)
+            groupMax = np.full(len(uniqueList),-np.inf)
+            np.minimum.at(groupMin,inverseIndices,phaseLabels)
+            np.maximum.at(groupMax,inverseIndices,phaseLabels)
+            sameLabel = (groupMin == groupMax)[inverseIndices]
+            multiPhase = (groupSize == 2) | (groupSize == 3)
+            # This is the barn case -> multiple meters, same premise, probably the same phase
+            numPhasesNew[0,multiPhase & sameLabel] = 1
+            # This is the 2-phase or 3-phase case -> one meter, multiple datastreams, probably different phases
+            numPhasesNew[0,multiPhase & ~sameLabel] = groupSize[multiPhase & ~sameLabel]
+            # Groups of more than three datastreams are an odd situation.  In 
+            #   this case, just assign a unique id and leave it alone
+            appendMask = (multiPhase & sameLabel) | (groupSize > 3)
+        
+        # appendCtr is used to ensure that labels will definitely be unique, 
+        #   it counts the appended IDs in datastream order
+        appendCtr = np.cumsum(appendMask) - 1
+        changedIndices = np.where(groupSize > 1)[0]
+        custIDUnique = list(custIDOriginal)
+        for custCtr in changedIndices:
+            newStr = custIDUnique[custCtr] + '_' + str(phaseLabels[custCtr])
+            if appendMask[custCtr]:
+                newStr = newStr + '_' + str(appendCtr[custCtr])
+            custIDUnique[custCtr] = newStr
     # End of else statement
 
     # If numPhases was supplied by the user, this function will just return that as numPhasesNew
     if type(numPhasesInput) != int:
         numPhasesNew = numPhasesInput
         
-    indices1 = len(np.where(numPhasesInput[0,:] == 1)[0])
-    indices2 = len(np.where(numPhasesInput[0,:] == 2)[0])
-    indices3 = len(np.where(numPhasesInput[0,:] == 3)[0])
+    indices1 = len(np.where(numPhasesNew[0,:] == 1)[0])
+    indices2 = len(np.where(numPhasesNew[0,:] == 2)[0])
+    indices3 = len(np.where(numPhasesNew[0,:] == 3)[0])
     
     twoMod = np.mod(indices2,2)
     threeMod = np.mod(indices3,3)
@@ -1333,42 +1932,26 @@ def Ensure3PhaseCustHaveUniqueID(custIDOriginal,phaseLabelsInput,numPhasesInput
         print('Error!  The number of datastreams provided does not match the number of phases specified in the numPhases field.  You must fix this before proceeding.  See the pdf documentation for more details.')
         sys.exit()
 
-    # Print changed customers
+    # Report the changed customers, the individual IDs are only written to 
+    #   the csv file
     if len(changedIndices) > 0:
         print('#########')
         print('')
         print(str(len(changedIndices)) + ' customer IDs were changed to give them unique IDs')
         if type(numPhasesInput) == int:
             print('Repeated customer IDs with differing original phase labels are considered to be 2-phase or 3-phase customers, and those datastreams will not be allowed to cluster together in the phase identification algorithm.  Repeated customer IDs with multiple datastreams with matching original phase labels are considered to be single-phase, possibly multiple meters at a single premise.')
-            print('Please review the following printout of altered customer IDs or the saved csv file to ensure that this is the desired behavior for your customers.')
+            print('Please review the saved csv file of altered customer IDs to ensure that this is the desired behavior for your customers.')
             print('Further details are available in the pdf documentation file included in the repository')
         else:
             print('Repeated IDs were altered to be unique, but numPhases was supplied by the user')
         print('')
-        for changeCtr in range(0,len(changedIndices)):
-            print('Original ID:  ' + str(custIDOriginal[changedIndices[changeCtr]]))
-            print('Unique ID:  ' + str(custIDUnique[changedIndices[changeCtr]]))
-            print('Original Phase:  ' + str(phaseLabelsInput[0,changedIndices[changeCtr]]))
-            print('Number of Phases Label:  ' + str(numPhasesNew[0,changedIndices[changeCtr]]))
-            print('')                                             
-
-        # pretty print changed customer IDs
-        changedIDs = []
-        newIDs = []
-        changedPhases = []
-        changedNumPhases = []
-        for changeCtr in range(0,len(changedIndices)):
-            changedIDs.append(custIDOriginal[changedIndices[changeCtr]])
-            newIDs.append(custIDUnique[changedIndices[changeCtr]])
-            changedPhases.append(phaseLabelsInput[0,changedIndices[changeCtr]])
-            changedNumPhases.append(numPhasesNew[0,changedIndices[changeCtr]])
-    
+
         # Save changed customers to csv file
         df = pd.DataFrame()
-        df['Original Customer ID'] = changedIDs
-        df['Unique Customer ID'] = newIDs
-        df['Original Phase Label'] = changedPhases
-        df['Given Number of Phases'] = changedNumPhases
+        df['Original Customer ID'] = [custIDOriginal[custCtr] for custCtr in changedIndices]
+        df['Unique Customer ID'] = [custIDUnique[custCtr] for custCtr in changedIndices]
+        df['Original Phase Label'] = phaseLabelsInput[0,changedIndices]
+        df['Given Number of Phases'] = numPhasesNew[0,changedIndices]
         if type(savePath) == int:
             df.to_csv('ChangedCustomerIDs.csv')
         else:df.to_csv(Path(savePath,'ChangedCustomerIDs.csv'))
@@ -1422,21 +2005,7 @@ def BadDataFiltering(timeseries,highValue=1.1,lowValue=0.8):
                 customer
         '''
         
-    filteredTimeseries = deepcopy(timeseries)
-    nanCount = 0
-    nanCountPerCust = []
-    for custCtr in range(0,timeseries.shape[1]):
-        currCol = filteredTimeseries[:,custCtr]
-        indices = np.where(currCol>=highValue)[0]
-        indices2 = np.where(currCol<=lowValue)[0]
-        allIndices = np.concatenate((indices,indices2))
-        nans = len(allIndices)
-        currCol[allIndices] = np.nan
-        filteredTimeseries[:,custCtr] = currCol
-        nanCount = nanCount + nans
-        nanCountPerCust.append(nans)
-        
-    return filteredTimeseries, nanCount, nanCountPerCust
+    return PreprocessingUtils.BadDataFiltering(timeseries,highValue,lowValue)
 # End of BadDataFiltering
     
 
@@ -77,6 +77,7 @@ The indexing of each of the input data must match, i.e. voltageInput[:,1] must
 ##############################################################################
 
 # Import - Python Libraries
+import sys
 import numpy as np
 from pathlib import Path
 from pathlib import PosixPath
@@ -87,9 +88,20 @@ import pandas as pd
 if __package__ in [None, '']:
     import CA_Ensemble_Funcs as CAE
     import PhaseIdent_Utils as PIUtils
+    import FeederPartitioning as FP
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+    from CommonUtils import ProfilingUtils
+    from CommonUtils import DataIOUtils
+    from CommonUtils import WindowCacheUtils
 else:
     from . import CA_Ensemble_Funcs as CAE
     from . import PhaseIdent_Utils as PIUtils
+    from . import FeederPartitioning as FP
+    from ..CommonUtils import PreprocessingUtils
+    from ..CommonUtils import ProfilingUtils
+    from ..CommonUtils import DataIOUtils
+    from ..CommonUtils import WindowCacheUtils
 
 
 
@@ -97,13 +109,19 @@ else:
 #
 #                           PhaseIdentification_CAEnsemble
 #
-def run( mainInputData_AMI: str, phaseLabelsTrue_csv: str, numPhases_csv: str, saveResultsPath: PosixPath, kFinal: int=7, windowSize: int = 384, useTrueLabelsFlag: bool = True, useNumPhasesField: bool = True):
+def run( mainInputData_AMI: str, phaseLabelsTrue_csv: str, numPhases_csv: str, saveResultsPath: PosixPath, kFinal: int=7, windowSize: int = 384, useTrueLabelsFlag: bool = True, useNumPhasesField: bool = True, numJobs: int = 1, partitionFlag: bool = False, feederIDs_csv: str = -1, convergenceTol: float = -1, timeBudget: float = -1, profilePath: str = -1, profilerHook = -1, windowCachePath: str = -1):
     """   This function is a wrapper for the CA_Ensemble_SampleScripts.py file.
 
           Note that the indexing of all variables above should match in the 
           customer index, i.e. custIDInput[0], transLabelsInput[0,0], 
           voltageInput[:,0] should all be the same customer
 
+          Each input file may also be a .npy/.npz file, which is memory
+          mapped, or a Parquet or Arrow IPC (.arrow/.feather) file, chosen by
+          the file extension.  See DataIOUtils.ConvertInputFile to convert
+          the CSV files once, using layout='singleFile' for mainInputData_AMI.
+          Parquet and Arrow IPC require the pyarrow package.
+
           Parameters
           ---------
             mainInputData_AMI: ( TODO: Redo this comment as this will be redesigned to take one input and it'll get broken into the 3 in the function)
@@ -118,6 +136,38 @@ def run( mainInputData_AMI: str, phaseLabelsTrue_csv: str, numPhases_csv: str, s
                 ground truth labels in the sample dataset
             useNumPhasesField: boolean value. the default is true since
                 the number of phases was supplied in the sample dataset
+            numJobs: int value. the number of worker processes used to 
+                cluster the windows in the ensemble.  the default of 1 runs
+                serially, values less than 1 use all available cores
+            partitionFlag: boolean value. if true the customers are first
+                split into independent groups (feeders) and the ensemble is
+                run separately on each group, see FeederPartitioning.py.  
+                the default is false
+            feederIDs_csv: CSV (1,customers) - the feeder or substation ID
+                of each customer, used to form the groups when partitionFlag
+                is true.  if not supplied the groups are estimated from the 
+                voltage correlation between customers
+            convergenceTol: float value. if supplied the ensemble stops once
+                the co-association matrix has converged, see 
+                CA_Ensemble_Funcs.UpdateEnsembleState.  the default (-1) 
+                clusters every window
+            timeBudget: float value. if supplied, the number of seconds after
+                which the ensemble stops clustering windows and uses the 
+                windows clustered so far.  the default (-1) has no limit.
+                neither option is used with partitionFlag
+            profilePath: str or Path. if supplied, the wall time, CPU time,
+                peak memory, and array sizes of each stage of the run are
+                written to this JSON file, see CommonUtils/ProfilingUtils.py.
+                the default (-1) does not profile the run
+            profilerHook: 'cprofile' or a profiler object with enable/disable
+                or start/stop methods, run for the whole run when profilePath
+                is supplied.  cProfile statistics are written next to the 
+                JSON file with the suffix .prof
+            windowCachePath: str or Path. if supplied, the window clustering
+                results are cached in this directory, so a rerun on the same
+                data (for example with a different kFinal) reads them from 
+                the cache, see CommonUtils/WindowCacheUtils.py.  not used 
+                with partitionFlag
 
           Returns
             Output files are prefixed with "outputs_"
@@ -147,17 +197,20 @@ def run( mainInputData_AMI: str, phaseLabelsTrue_csv: str, numPhases_csv: str, s
     # Convert CSV input files to numpy arrays
     # Open customerIDs file -> List
 
-    raw_data = pd.read_csv( mainInputData_AMI )
+    if type(profilePath) != int:
+        profile = ProfilingUtils.CreateRunProfile('PhaseIdentification_CAEnsemble',profilerHook)
+    else:
+        profile = -1
 
-    voltageInputCust = raw_data.iloc[1:].to_numpy(dtype=float)
-    phaseLabelsErrors = raw_data.iloc[0].to_numpy(dtype=int).reshape(1,voltageInputCust.shape[1])
-    custIDInput = list(raw_data.columns)
+    with ProfilingUtils.ProfileStage(profile,'ingest') as stage:
+        voltageInputCust, phaseLabelsErrors, custIDInput = DataIOUtils.LoadSingleFileAMI( mainInputData_AMI )
 
-    if useTrueLabelsFlag:
-        phaseLabelsTrue = PIUtils.ConvertCSVtoNPY(phaseLabelsTrue_csv)    
+        if useTrueLabelsFlag:
+            phaseLabelsTrue = DataIOUtils.LoadArray(phaseLabelsTrue_csv)    
     
-    if useNumPhasesField:
-        numPhasesInput = PIUtils.ConvertCSVtoNPY(numPhases_csv)   
+        if useNumPhasesField:
+            numPhasesInput = DataIOUtils.LoadArray(numPhases_csv)
+        ProfilingUtils.RecordArraySizes(stage,voltageInputCust=voltageInputCust)
 
     ##############################################################################
     ###############################################################################
@@ -168,18 +221,19 @@ def run( mainInputData_AMI: str, phaseLabelsTrue_csv: str, numPhases_csv: str, s
     #
 
     # Data pre-processing steps
-    # This converts the original voltage timeseries (assumed to be in volts) into per-unit representation
-    vNorm = PIUtils.ConvertToPerUnit_Voltage(voltageInputCust)
+    # This converts the original voltage timeseries (assumed to be in volts) into per-unit representation, 
+    #   filters bad data, and takes the difference between adjacent measurements, converting the timeseries 
+    #   into a per-unit, change in voltage timeseries, all in a single pass over the data
 
-    vFilt,totalFilt,filtPerCust = PIUtils.BadDataFiltering(vNorm)
-    # This takes the difference between adjacent measurements, converting the timeseries into a per-unit, change in voltage timeseries
-    vNDV = PIUtils.CalcDeltaVoltage(vFilt)
+    with ProfilingUtils.ProfileStage(profile,'preprocessing') as stage:
+        vNDV,totalFilt,filtPerCust = PreprocessingUtils.PreprocessVoltage(voltageInputCust,voltageLevels=PIUtils.VOLTAGE_LEVELS)
 
-    # Check that all datastreams have unique IDs
-    if useNumPhasesField:
-        custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custIDInput,phaseLabelsErrors,numPhasesInput=numPhasesInput)
-    else:
-        custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custIDInput,phaseLabelsErrors)
+        # Check that all datastreams have unique IDs
+        if useNumPhasesField:
+            custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custIDInput,phaseLabelsErrors,numPhasesInput=numPhasesInput)
+        else:
+            custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custIDInput,phaseLabelsErrors)
+        ProfilingUtils.RecordArraySizes(stage,vNDV=vNDV)
 
     # kFinal is the number of final clusters produced by the algorithm.  Each 
     #   cluster will represent a phase grouping of customers.  Ideally, this value
@@ -199,69 +253,97 @@ def run( mainInputData_AMI: str, phaseLabelsTrue_csv: str, numPhases_csv: str, s
     else:
         windowSize = int(windowSize)
 
-    # This is the primary phase identification function - See documentation in CA_Ensemble_Funcs.py for details on the inputs/outputs
-    finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = CAE.CAEnsemble(vNDV,kVector,kFinal,custIDUnique,windowSize,numPhases=numPhases)
-
-    # Remove any omitted customers from the list of phase labels
-    if len(noVotesIndex) != 0:
-        clusteredPhaseLabels = np.delete(phaseLabelsErrors,noVotesIndex,axis=1)
-        custIDFound = list(np.delete(np.array(custIDUnique),noVotesIndex))
-        if useTrueLabelsFlag:
-            clusteredTruePhaseLabels = np.delete(phaseLabelsTrue,noVotesIndex,axis=1)
-
-    else:
-        clusteredPhaseLabels = phaseLabelsErrors
-        custIDFound = custIDUnique
-        if useTrueLabelsFlag:
-            clusteredTruePhaseLabels = phaseLabelsTrue
+    with ProfilingUtils.ProfileStage(profile,'clustering') as stage:
+        # This is the primary phase identification function - See documentation in CA_Ensemble_Funcs.py for details on the inputs/outputs
+        if partitionFlag:
+            # Split the customers into independent groups and run the ensemble on each group
+            if type(feederIDs_csv) != int:
+                feederIDs = DataIOUtils.LoadArray(feederIDs_csv)
+            else:
+                feederIDs = -1
+            groupLabels = FP.PartitionCustomers(vNDV,feederIDs=feederIDs,numPhases=numPhases)
+            finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = FP.CAEnsemble_Partitioned(vNDV,kVector,kFinal,custIDUnique,windowSize,groupLabels,numPhases=numPhases,numJobs=numJobs)
+            # The final cluster labels are offset for each group, so the total number of final clusters is larger than kFinal
+            kFinalTotal = int(np.max(finalClusterLabels)) + 1
+        else:
+            if type(windowCachePath) != int:
+                windowCache = WindowCacheUtils.CreateWindowCache(windowCachePath)
+            else:
+                windowCache = -1
+            # With a stopping rule the windows are clustered in a stratified order so the clustered windows cover the whole dataset
+            finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = CAE.CAEnsemble(vNDV,kVector,kFinal,custIDUnique,windowSize,numPhases=numPhases,numJobs=numJobs,
+                                                                                                               windowOrder='stratified',convergenceTol=convergenceTol,timeBudget=timeBudget,windowCache=windowCache)
+            kFinalTotal = kFinal
+        ProfilingUtils.RecordArraySizes(stage,caMatrix=caMatrix,finalClusterLabels=finalClusterLabels)
+
+    with ProfilingUtils.ProfileStage(profile,'scoring') as stage:
+        # Remove any omitted customers from the list of phase labels
+        if len(noVotesIndex) != 0:
+            clusteredPhaseLabels = np.delete(phaseLabelsErrors,noVotesIndex,axis=1)
+            custIDFound = list(np.delete(np.array(custIDUnique),noVotesIndex))
+            if useTrueLabelsFlag:
+                clusteredTruePhaseLabels = np.delete(phaseLabelsTrue,noVotesIndex,axis=1)
+
+        else:
+            clusteredPhaseLabels = phaseLabelsErrors
+            custIDFound = custIDUnique
+            if useTrueLabelsFlag:
+                clusteredTruePhaseLabels = phaseLabelsTrue
 
 
         
-    # Use the phase labels to assign final phase predictions based on the majority vote in the final clusters
-    # This assumes that phase labels are both available and believed to be reasonably accurate.
-    # In the case where phase labels are unavailable or believed to be highly innacurate, some other method of final phase prediction must be used.
-    predictedPhases = PIUtils.CalcPredictedPhaseNoLabels(finalClusterLabels, clusteredPhaseLabels,clusteredIDs)
+        # Use the phase labels to assign final phase predictions based on the majority vote in the final clusters
+        # This assumes that phase labels are both available and believed to be reasonably accurate.
+        # In the case where phase labels are unavailable or believed to be highly innacurate, some other method of final phase prediction must be used.
+        predictedPhases = PIUtils.CalcPredictedPhaseNoLabels(finalClusterLabels, clusteredPhaseLabels,clusteredIDs)
 
-    # This shows how many of the predicted phase labels are different from the original phase labels
-    diffIndices = np.where(predictedPhases!=clusteredPhaseLabels)[1]
+        # This shows how many of the predicted phase labels are different from the original phase labels
+        diffIndices = np.where(predictedPhases!=clusteredPhaseLabels)[1]
 
-    print('')
-    print('Spectral Clustering Ensemble Phase Identification Results')
-    print('There are ' + str(diffIndices.shape[0]) + ' customers with different phase labels compared to the original phase labeling.')
-    print('There are ' + str(len(noVotesIndex)) + ' customers not predicted due to missing data')
-    print('')
+        print('')
+        print('Spectral Clustering Ensemble Phase Identification Results')
+        print('There are ' + str(diffIndices.shape[0]) + ' customers with different phase labels compared to the original phase labeling.')
+        print('There are ' + str(len(noVotesIndex)) + ' customers not predicted due to missing data')
+        print('')
 
-    # If the ground-truth labels are available, this will calculate a true accuracy
-    if useTrueLabelsFlag:
-        accuracy, incorrectCustCount = PIUtils.CalcAccuracyPredwGroundTruth(predictedPhases, clusteredTruePhaseLabels,clusteredIDs)
-        accuracy = accuracy*100
+        # If the ground-truth labels are available, this will calculate a true accuracy
+        if useTrueLabelsFlag:
+            accuracy, incorrectCustCount = PIUtils.CalcAccuracyPredwGroundTruth(predictedPhases, clusteredTruePhaseLabels,clusteredIDs)
+            accuracy = accuracy*100
 
-        print('The accuracy of the predicted phase is ' + str(accuracy) + '% after comparing to the ground truth phase labels')
-        print('There are '+ str(incorrectCustCount) + ' incorrectly predicted customers')
+            print('The accuracy of the predicted phase is ' + str(accuracy) + '% after comparing to the ground truth phase labels')
+            print('There are '+ str(incorrectCustCount) + ' incorrectly predicted customers')
 
 
-    # Calculate and Plot the confidence scores - Modified Silhouette Coefficients
-    allSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinal)
-    PIUtils.Plot_ModifiedSilhouetteCoefficients(allSC, savePath=saveResultsPath.parent.resolve())
+        # Calculate and Plot the confidence scores - Modified Silhouette Coefficients
+        allSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinalTotal)
+        ProfilingUtils.RecordArraySizes(stage,allSC=allSC)
 
-    # Create output list which includes any customers omitted from the analysis due to missing data 
-    # Those customers will be at the end of the list and have a predicted phase and silhouette coefficient of -99 to indicate that they were not included in the analysis
-    if useTrueLabelsFlag:
-        phaseLabelsOrg_FullList, phaseLabelsPred_FullList,allFinalClusterLabels, phaseLabelsTrue_FullList,custID_FullList, allSC_FullList = PIUtils.CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabelsErrors,finalClusterLabels,clusteredIDs,custIDUnique,noVotesIDs,predictedPhases,allSC,phaseLabelsTrue=phaseLabelsTrue)
-    else:
-        phaseLabelsOrg_FullList, phaseLabelsPred_FullList,allFinalClusterLabels, phaseLabelsTrue_FullList,custID_FullList, allSC_FullList = PIUtils.CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabelsErrors,finalClusterLabels,clusteredIDs,custIDUnique,noVotesIDs,predictedPhases,allSC)
-    # Write outputs to csv file
-    df = pd.DataFrame()
-    df['customer ID'] = custID_FullList
-    df['Original Phase Labels (with errors)'] = phaseLabelsOrg_FullList[0,:]
-    df['Predicted Phase Labels'] = phaseLabelsPred_FullList[0,:]
-    if useTrueLabelsFlag:
-        df['Actual Phase Labels'] = phaseLabelsTrue_FullList[0,:]
-    df['Confidence Score'] = allSC_FullList
-    df['Final Cluster Label'] = allFinalClusterLabels
-    df.to_csv(saveResultsPath)
-    print('')
-    print(f'Predicted phase labels written to {saveResultsPath}')
+    with ProfilingUtils.ProfileStage(profile,'plotting') as stage:
+        PIUtils.Plot_ModifiedSilhouetteCoefficients(allSC, savePath=saveResultsPath.parent.resolve())
+
+    with ProfilingUtils.ProfileStage(profile,'output') as stage:
+        # Create output list which includes any customers omitted from the analysis due to missing data 
+        # Those customers will be at the end of the list and have a predicted phase and silhouette coefficient of -99 to indicate that they were not included in the analysis
+        if useTrueLabelsFlag:
+            phaseLabelsOrg_FullList, phaseLabelsPred_FullList,allFinalClusterLabels, phaseLabelsTrue_FullList,custID_FullList, allSC_FullList = PIUtils.CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabelsErrors,finalClusterLabels,clusteredIDs,custIDUnique,noVotesIDs,predictedPhases,allSC,phaseLabelsTrue=phaseLabelsTrue)
+        else:
+            phaseLabelsOrg_FullList, phaseLabelsPred_FullList,allFinalClusterLabels, phaseLabelsTrue_FullList,custID_FullList, allSC_FullList = PIUtils.CreateFullListCustomerResults_CAEns(clusteredPhaseLabels,phaseLabelsErrors,finalClusterLabels,clusteredIDs,custIDUnique,noVotesIDs,predictedPhases,allSC)
+        # Write outputs to csv file
+        df = pd.DataFrame()
+        df['customer ID'] = custID_FullList
+        df['Original Phase Labels (with errors)'] = phaseLabelsOrg_FullList[0,:]
+        df['Predicted Phase Labels'] = phaseLabelsPred_FullList[0,:]
+        if useTrueLabelsFlag:
+            df['Actual Phase Labels'] = phaseLabelsTrue_FullList[0,:]
+        df['Confidence Score'] = allSC_FullList
+        df['Final Cluster Label'] = allFinalClusterLabels
+        df.to_csv(saveResultsPath)
+        print('')
+        print(f'Predicted phase labels written to {saveResultsPath}')
+        ProfilingUtils.RecordArraySizes(stage,df=df)
+
+    ProfilingUtils.FinishRunProfile(profile,profilePath)
     
     
 # End of PhaseIdentification_CAEnsemble
\ No newline at end of file
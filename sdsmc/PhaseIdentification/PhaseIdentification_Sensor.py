@@ -96,9 +96,16 @@ import pandas as pd
 if __package__ in [None, '']:
     import PhaseIdent_Utils as PIUtils
     import SensorMethod_Funcs as SensMethod
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from CommonUtils import PreprocessingUtils
+    from CommonUtils import ProfilingUtils
+    from CommonUtils import DataIOUtils
 else:
     from . import PhaseIdent_Utils as PIUtils
     from . import SensorMethod_Funcs as SensMethod
+    from ..CommonUtils import PreprocessingUtils
+    from ..CommonUtils import ProfilingUtils
+    from ..CommonUtils import DataIOUtils
 
 
 
@@ -108,13 +115,19 @@ else:
 #
 #                           PhaseIdentification_Sensor
 #
-def run( voltageData_AMI: str, voltageData_Sensor: str, customerIDs_AMI: str, sensorIDs_csv: str, phaseLabelSensors_csv: str, phaseLabelErrors_csv: str, phaseLabelsTrue_csv: str, saveResultsPath: PosixPath, useTrueLabels: bool = True, ):
+def run( voltageData_AMI: str, voltageData_Sensor: str, customerIDs_AMI: str, sensorIDs_csv: str, phaseLabelSensors_csv: str, phaseLabelErrors_csv: str, phaseLabelsTrue_csv: str, saveResultsPath: PosixPath, useTrueLabels: bool = True, profilePath: str = -1, profilerHook = -1 ):
     """   This function is a wrapper for the MeterToTransPairingScript.py file.
 
           Note that the indexing of all variables above should match in the 
           customer index, i.e. custIDInput[0], transLabelsInput[0,0], 
           voltageInput[:,0] should all be the same customer
 
+          Each input file may also be a .npy/.npz file, which is memory
+          mapped, or a Parquet or Arrow IPC (.arrow/.feather) file, chosen by
+          the file extension.  See DataIOUtils.ConvertInputFile to convert
+          the CSV files once.  Parquet and Arrow IPC require the pyarrow
+          package.
+
           Parameters
           ---------
             voltageData_AMI: str - path for the csv of customer voltage data
@@ -132,6 +145,14 @@ def run( voltageData_AMI: str, voltageData_Sensor: str, customerIDs_AMI: str, se
             useTrueLabels: boolean value. The default is true since there are
                 ground truth labels in the sample dataset
 
+            profilePath: str or Path - if supplied, the wall time, CPU time,
+                peak memory, and array sizes of each stage of the run are
+                written to this JSON file, see CommonUtils/ProfilingUtils.py.
+                The default (-1) does not profile the run
+            profilerHook: 'cprofile' or a profiler object with enable/disable
+                or start/stop methods, run for the whole run when profilePath
+                is supplied.  cProfile statistics are written next to the 
+                JSON file with the suffix .prof
           Returns
             Output files are prefixed with "outputs_"
             ---------
@@ -142,20 +163,25 @@ def run( voltageData_AMI: str, voltageData_Sensor: str, customerIDs_AMI: str, se
     ##############################################################################
 
     
-    voltageInputCust = PIUtils.ConvertCSVtoNPY( voltageData_AMI )
-    voltageInputSens = PIUtils.ConvertCSVtoNPY( voltageData_Sensor )
-    sensPhases = PIUtils.ConvertCSVtoNPY( phaseLabelSensors_csv )
-    phaseLabelsErrors = PIUtils.ConvertCSVtoNPY( phaseLabelErrors_csv )
+    if type(profilePath) != int:
+        profile = ProfilingUtils.CreateRunProfile('PhaseIdentification_Sensor',profilerHook)
+    else:
+        profile = -1
+
+    with ProfilingUtils.ProfileStage(profile,'ingest') as stage:
+        voltageInputCust = DataIOUtils.LoadArray( voltageData_AMI )
+        voltageInputSens = DataIOUtils.LoadArray( voltageData_Sensor )
+        sensPhases = DataIOUtils.LoadArray( phaseLabelSensors_csv )
+        phaseLabelsErrors = DataIOUtils.LoadArray( phaseLabelErrors_csv )
     
-    with open(customerIDs_AMI, 'r') as file:
-        custIDInput = [x.rstrip() for x in file]
+        custIDInput = DataIOUtils.LoadIDs(customerIDs_AMI)
 
-    with open(sensorIDs_csv, 'r') as file:
-        sensIDs = [x.rstrip() for x in file]
+        sensIDs = DataIOUtils.LoadIDs(sensorIDs_csv)
+
+        #TODO Add flag to use/not use true labels
+        phaseLabelsTrue = DataIOUtils.LoadArray(phaseLabelsTrue_csv)
+        ProfilingUtils.RecordArraySizes(stage,voltageInputCust=voltageInputCust,voltageInputSens=voltageInputSens)
 
-    #TODO Add flag to use/not use true labels
-    phaseLabelsTrue = PIUtils.ConvertCSVtoNPY(phaseLabelsTrue_csv)    
-    
 
 
     ##############################################################################
@@ -164,12 +190,13 @@ def run( voltageData_AMI: str, voltageData_Sensor: str, customerIDs_AMI: str, se
 
 
     # Data pre-processing steps
-    # This converts the original voltage timeseries (assumed to be in volts) into per-unit representation
-    vNorm = PIUtils.ConvertToPerUnit_Voltage(voltageInputCust)
-    # This takes the difference between adjacent measurements, converting the timeseries into a per-unit, change in voltage timeseries
-    vNDV = PIUtils.CalcDeltaVoltage(vNorm)
-    vSensNorm = PIUtils.ConvertToPerUnit_Voltage(voltageInputSens)
-    sensNDV = PIUtils.CalcDeltaVoltage(vSensNorm)
+    # This converts the original voltage timeseries (assumed to be in volts) into per-unit representation and 
+    #   takes the difference between adjacent measurements, converting the timeseries into a per-unit, change in voltage timeseries
+
+    with ProfilingUtils.ProfileStage(profile,'preprocessing') as stage:
+        vNDV = PreprocessingUtils.PreprocessVoltage(voltageInputCust,filterFlag=False,voltageLevels=PIUtils.VOLTAGE_LEVELS)[0]
+        sensNDV = PreprocessingUtils.PreprocessVoltage(voltageInputSens,filterFlag=False,voltageLevels=PIUtils.VOLTAGE_LEVELS)[0]
+        ProfilingUtils.RecordArraySizes(stage,vNDV=vNDV,sensNDV=sensNDV)
 
 
 
@@ -184,106 +211,114 @@ def run( voltageData_AMI: str, voltageData_Sensor: str, customerIDs_AMI: str, se
     ccDropFilter = 0.06 
     ccDropFlag = True # Flag to use the correlation coefficient separation filtering or not
 
-    # Run Sensor-based Phase Identification Method - see function documentation in SensorMethod_Funcs.py
-    predictedPhaseLabels,custIDFound,noVotesIndex,noVotesIDs, omittedCust,\
-    confScoreCombined,sensVotesConfScore, ccSeparation,\
-    winVotesConfScore,custWindowCounts  = SensMethod.AssignPhasesUsingSensors(vNDV,sensNDV,
-                                                                custIDInput, sensIDs, 
-                                                                sensPhases,windowSize,
-                                                                dropLowCCSepFlag=ccDropFlag,
-                                                                numVotes=5,ccSepThresh=ccDropFilter)
-
-
-    # Remove customers which were omitted from analysis due to missing data
-    if predictedPhaseLabels.shape[1] != phaseLabelsTrue.shape[1]:
-        phaseLabelsFound = np.delete(phaseLabelsTrue,noVotesIndex,axis=1)
-        phaseLabelsErrorsFound = np.delete(phaseLabelsErrors,noVotesIndex,axis=1)
-    else:
-        phaseLabelsFound = phaseLabelsTrue
-        phaseLabelsErrorsFound = phaseLabelsErrors
-
-
-    # Determine customers with different predicted phase labels than predicted 
-    diffIndices = np.where(predictedPhaseLabels!=phaseLabelsErrorsFound)[1]
-    diffIDs = list(np.array(custIDFound)[diffIndices])
-    newPhaseLabels = np.expand_dims(predictedPhaseLabels[0,diffIndices],axis=0)
-    orgDiffPhaseLabels = np.expand_dims(phaseLabelsErrors[0,diffIndices],axis=0)
-    totalPredicted = len(diffIDs)
-
-
-    #Filter Results by confidence scores
-    filDiff,filNPL, filOrgDiff = PIUtils.FilterPredictedCustomersByConf(diffIDs,custIDFound,newPhaseLabels,orgDiffPhaseLabels,winVotesConfScore=winVotesConfScore,
-                                        ccSeparation=ccSeparation,sensVotesConfScore=sensVotesConfScore,combConfScore=confScoreCombined,winVotesThresh=0.75, 
-                                        ccSepThresh=-1,sensVotesThresh=0.75,combConfThresh=-1)        
-
-
-    # Compare predicted results to the ground-truth phase labels
-    orgDiff = np.where(predictedPhaseLabels!=phaseLabelsFound)[1]
-    accuracy = (((phaseLabelsFound.shape[1])-len(orgDiff)) / phaseLabelsFound.shape[1]) * 100
-
-
-    print('Sensor-based Phase Identification Results')
-    print('')
-    print('Results compared to the original phase labels:')
-    print('There were ' + str(len(diffIDs)) + ' customers whose predicted phase labels are different from the original phase labels')
-    print('Afer filtering using confidence scores, there are ' + str(len(filDiff)) + ' customers with different phase labels')
-
-    print('')
-
-    print('Results compared to the ground truth phase labels:')
-    print('There are ' + str(len(orgDiff)) + ' customers with incorrect phase labels')
-    print('The accuracy of the predicted labels compared to the ground truth is ' + str(accuracy) + '%')
-
-
-    # Create output list which includes any customers omitted from the analysis due to missing data 
-    # Those customers will be at the end of the list and have a predicted phase and silhouette coefficient of -99 to indicate that they were not included in the analysis
-    if len(noVotesIndex) !=0:
-            phaseLabelsOrg_FullList, phaseLabelsPred_FullList, \
-                phaseLabelsTrue_FullList,custID_FullList, \
-                    ccSep_FullList, winVotes_FullList, \
-                        sensVotes_FullList, combConf_FullList = PIUtils.CreateFullListCustomerResults_SensMeth(phaseLabelsErrorsFound, \
-                                                                                                            phaseLabelsErrors,\
-                                                                                                                phaseLabelsTrue, \
-                                                                                                                custIDFound, \
-                                                                                                                    custIDInput, \
-                                                                                                                    noVotesIDs,\
-                                                                                                                        predictedPhaseLabels,\
-                                                                                                                        ccSeparation,\
-                                                                                                                            winVotesConfScore,\
-                                                                                                                            sensVotesConfScore,\
-                                                                                                                                confScoreCombined)
-
-
-    else:
-        phaseLabelsOrg_FullList = phaseLabelsErrors
-        phaseLabelsPred_FullList = predictedPhaseLabels
-        phaseLabelsTrue_FullList = phaseLabelsTrue
-        custID_FullList = custIDInput
-        ccSep_FullList = ccSeparation
-        winVotes_FullList = winVotesConfScore
-        sensVotes_FullList = sensVotesConfScore
-        combConf_FullList = confScoreCombined
-
-
-
-    # Write outputs to csv file
-    df = pd.DataFrame()
-    df['customer ID'] = custID_FullList
-    df['Original Phase Labels (with errors)'] = phaseLabelsOrg_FullList[0,:]
-    df['Predicted Phase Labels'] = phaseLabelsPred_FullList[0,:]
-    df['Actual Phase Labels'] = phaseLabelsTrue_FullList[0,:]
-    df['Correlation Coefficient Separation Score'] = ccSep_FullList
-    df['Window Voting Confidence Score'] = winVotes_FullList
-    df['Sensor Voting Confidence Score'] = sensVotes_FullList
-    df['Combined Confidence Score'] = combConf_FullList
-    df.to_csv('outputs_SensorMethod.csv')
-    print('Predicted phase labels written to outputs_SensorMethod.csv')
-
-    # Confidence Score Plots
-    PIUtils.PlotHistogramOfWinVotesConfScore(winVotesConfScore)
-    PIUtils.PlotHistogramOfCombinedConfScore(confScoreCombined)
-    PIUtils.PlotHistogramOfSensVotesConfScore(sensVotesConfScore)
-    PIUtils.PlotHistogramOfCCSeparation(ccSeparation,xLim=-1)
+    with ProfilingUtils.ProfileStage(profile,'sensorVoting') as stage:
+        # Run Sensor-based Phase Identification Method - see function documentation in SensorMethod_Funcs.py
+        predictedPhaseLabels,custIDFound,noVotesIndex,noVotesIDs, omittedCust,\
+        confScoreCombined,sensVotesConfScore, ccSeparation,\
+        winVotesConfScore,custWindowCounts  = SensMethod.AssignPhasesUsingSensors(vNDV,sensNDV,
+                                                                    custIDInput, sensIDs, 
+                                                                    sensPhases,windowSize,
+                                                                    dropLowCCSepFlag=ccDropFlag,
+                                                                    numVotes=5,ccSepThresh=ccDropFilter)
+        ProfilingUtils.RecordArraySizes(stage,predictedPhaseLabels=predictedPhaseLabels,custWindowCounts=custWindowCounts)
+
+
+    with ProfilingUtils.ProfileStage(profile,'scoring') as stage:
+        # Remove customers which were omitted from analysis due to missing data
+        if predictedPhaseLabels.shape[1] != phaseLabelsTrue.shape[1]:
+            phaseLabelsFound = np.delete(phaseLabelsTrue,noVotesIndex,axis=1)
+            phaseLabelsErrorsFound = np.delete(phaseLabelsErrors,noVotesIndex,axis=1)
+        else:
+            phaseLabelsFound = phaseLabelsTrue
+            phaseLabelsErrorsFound = phaseLabelsErrors
+
+
+        # Determine customers with different predicted phase labels than predicted 
+        diffIndices = np.where(predictedPhaseLabels!=phaseLabelsErrorsFound)[1]
+        diffIDs = list(np.array(custIDFound)[diffIndices])
+        newPhaseLabels = np.expand_dims(predictedPhaseLabels[0,diffIndices],axis=0)
+        orgDiffPhaseLabels = np.expand_dims(phaseLabelsErrors[0,diffIndices],axis=0)
+        totalPredicted = len(diffIDs)
+
+
+        #Filter Results by confidence scores
+        filDiff,filNPL, filOrgDiff = PIUtils.FilterPredictedCustomersByConf(diffIDs,custIDFound,newPhaseLabels,orgDiffPhaseLabels,winVotesConfScore=winVotesConfScore,
+                                            ccSeparation=ccSeparation,sensVotesConfScore=sensVotesConfScore,combConfScore=confScoreCombined,winVotesThresh=0.75, 
+                                            ccSepThresh=-1,sensVotesThresh=0.75,combConfThresh=-1)        
+
+
+        # Compare predicted results to the ground-truth phase labels
+        orgDiff = np.where(predictedPhaseLabels!=phaseLabelsFound)[1]
+        accuracy = (((phaseLabelsFound.shape[1])-len(orgDiff)) / phaseLabelsFound.shape[1]) * 100
+
+
+        print('Sensor-based Phase Identification Results')
+        print('')
+        print('Results compared to the original phase labels:')
+        print('There were ' + str(len(diffIDs)) + ' customers whose predicted phase labels are different from the original phase labels')
+        print('Afer filtering using confidence scores, there are ' + str(len(filDiff)) + ' customers with different phase labels')
+
+        print('')
+
+        print('Results compared to the ground truth phase labels:')
+        print('There are ' + str(len(orgDiff)) + ' customers with incorrect phase labels')
+        print('The accuracy of the predicted labels compared to the ground truth is ' + str(accuracy) + '%')
+
+
+    with ProfilingUtils.ProfileStage(profile,'output') as stage:
+        # Create output list which includes any customers omitted from the analysis due to missing data 
+        # Those customers will be at the end of the list and have a predicted phase and silhouette coefficient of -99 to indicate that they were not included in the analysis
+        if len(noVotesIndex) !=0:
+                phaseLabelsOrg_FullList, phaseLabelsPred_FullList, \
+                    phaseLabelsTrue_FullList,custID_FullList, \
+                        ccSep_FullList, winVotes_FullList, \
+                            sensVotes_FullList, combConf_FullList = PIUtils.CreateFullListCustomerResults_SensMeth(phaseLabelsErrorsFound, \
+                                                                                                                phaseLabelsErrors,\
+                                                                                                                    phaseLabelsTrue, \
+                                                                                                                    custIDFound, \
+                                                                                                                        custIDInput, \
+                                                                                                                        noVotesIDs,\
+                                                                                                                            predictedPhaseLabels,\
+                                                                                                                            ccSeparation,\
+                                                                                                                                winVotesConfScore,\
+                                                                                                                                sensVotesConfScore,\
+                                                                                                                                    confScoreCombined)
+
+
+        else:
+            phaseLabelsOrg_FullList = phaseLabelsErrors
+            phaseLabelsPred_FullList = predictedPhaseLabels
+            phaseLabelsTrue_FullList = phaseLabelsTrue
+            custID_FullList = custIDInput
+            ccSep_FullList = ccSeparation
+            winVotes_FullList = winVotesConfScore
+            sensVotes_FullList = sensVotesConfScore
+            combConf_FullList = confScoreCombined
+
+
+
+        # Write outputs to csv file
+        df = pd.DataFrame()
+        df['customer ID'] = custID_FullList
+        df['Original Phase Labels (with errors)'] = phaseLabelsOrg_FullList[0,:]
+        df['Predicted Phase Labels'] = phaseLabelsPred_FullList[0,:]
+        df['Actual Phase Labels'] = phaseLabelsTrue_FullList[0,:]
+        df['Correlation Coefficient Separation Score'] = ccSep_FullList
+        df['Window Voting Confidence Score'] = winVotes_FullList
+        df['Sensor Voting Confidence Score'] = sensVotes_FullList
+        df['Combined Confidence Score'] = combConf_FullList
+        df.to_csv('outputs_SensorMethod.csv')
+        print('Predicted phase labels written to outputs_SensorMethod.csv')
+        ProfilingUtils.RecordArraySizes(stage,df=df)
+
+    with ProfilingUtils.ProfileStage(profile,'plotting') as stage:
+        # Confidence Score Plots
+        PIUtils.PlotHistogramOfWinVotesConfScore(winVotesConfScore)
+        PIUtils.PlotHistogramOfCombinedConfScore(confScoreCombined)
+        PIUtils.PlotHistogramOfSensVotesConfScore(sensVotesConfScore)
+        PIUtils.PlotHistogramOfCCSeparation(ccSeparation,xLim=-1)
+
+    ProfilingUtils.FinishRunProfile(profile,profilePath)
 
 
 
@@ -36,7 +36,12 @@ sensor data.
 
 Function List:
     - AssignPhasesUsingSensors
+    - CalcSensorCCBlock
+    - ReportSkippedWindows
+    - CalcSensorCCTensor
+    - AccumulateSensorCC
     - CCSensVoting
+    - CCSensVoting_Batch
     - CalcConfidenceScores4Sensors
     - AssignPhasesUsingSubstation
     
@@ -68,7 +73,8 @@ else:
 def AssignPhasesUsingSensors(voltageCust,voltageSens,custIDInput, sensIDInput, 
                              phaseLabelsSens,windowSize,numVotes=5,
                              dropLowCCSepFlag=False,ccSepThresh=-1,
-                             minWindowThreshold=7):
+                             minWindowThreshold=7,ccDtype=np.float32,
+                             blockElements=2**24,ccCubePath=-1):
     """ This function takes customer voltage timeseries and voltage timeseries
         from other sensors and assigns a phase label to the customer based on 
         votes from the highest correlated sensors.  For more details, see
@@ -112,6 +118,18 @@ def AssignPhasesUsingSensors(voltageCust,voltageSens,custIDInput, sensIDInput,
                 minWindowThreshold: int - the minimum number of windows that 
                     must be available for each customer.  If a customer has 
                     fewer windows then they are omitted from the analysis.  
+                ccDtype: numpy dtype - the dtype used for the correlation 
+                    coefficients of all windows.  The default is float32, 
+                    which halves the memory of the (customers,sensors,windows)
+                    array.  See CalcSensorCCTensor
+                blockElements: int - the approximate number of customer 
+                    voltage values processed at once.  See CalcSensorCCTensor
+                ccCubePath: str or Path - the path of a .npy file to save the
+                    correlation coefficients for every window 
+                    (customers,sensors,windows), with NaN where a customer 
+                    or window was excluded.  The default (-1) does not keep
+                    the per-window values, only their mean, so the memory 
+                    used does not grow with the number of windows
             Returns
             -------
                 newPhaseLabels: numpy array of int (1,customers) - the 
@@ -156,94 +174,29 @@ def AssignPhasesUsingSensors(voltageCust,voltageSens,custIDInput, sensIDInput,
         print('Error!  You have specified more votes than there are sensors in the system.  There are ' + str(int(len(sensIDInput) / 3)) + ' sensors in the system')
         return -1,-1,-1,-1,-1,-1,-1,-1,-1,-1,-1,-1,-1,-1
     
-    ensTotal = int(np.floor(voltageCust.shape[0] / windowSize))
-    ccMatrixAll = np.zeros((voltageCust.shape[1],voltageSens.shape[1],ensTotal),dtype=float)
-    ccMatrix = np.zeros((voltageCust.shape[1],voltageSens.shape[1]),dtype=float)
     newPhaseLabels = np.zeros((1,voltageCust.shape[1]),dtype=int)
     pairedSensIDs = []
     noVotesIndex = []
     noVotesIDs = []
     numSensProfiles = voltageSens.shape[1]
     numCust = len(custIDInput)
-    custWindowCounts = np.zeros((len(custIDInput)),dtype=int)
-    allWindowVotes = np.zeros((len(custIDInput),ensTotal),dtype=int)
-    allWindowVotes[:] = -999
     allSensVotes = []
     omittedCust = {}
     omittedCust['minWindows'] = []
     omittedCust['missDataOrFiltered'] = []
     omittedCust['sensVoteCriteria'] = []
     
-    # Calculate all correlation coefficients for all windows
-    for ensCtr in range(0,ensTotal):
-        #Customer Voltage - Select the next time series window and remove customers with missing data in that window
-        vWindow = PIUtils.GetVoltWindow(voltageCust,windowSize,ensCtr)
-        vWindow,currentIDs = PIUtils.CleanVoltWindowNoLabels(deepcopy(vWindow), deepcopy(custIDInput))
-        custWindowCounts = PIUtils.UpdateCustWindowCounts(custWindowCounts,currentIDs,custIDInput)
-        # Check if any customer has all zeros
-        allZerosCustFlag = False
-        for ctr in range(0,len(currentIDs)):
-            currV = np.array(vWindow)[:,ctr]
-            indices = np.where(currV==0)[0]
-            if len(indices) == windowSize:
-                allZerosCustFlag = True
-        
-        # Sensor Voltage - Select the next time series window and remove customers with missing data in that window
-        sensWindow = PIUtils.GetVoltWindow(voltageSens,windowSize,ensCtr)
-        # Check if any sensor datastream contains all zeros
-        sensSums = np.sum(sensWindow,axis=0)
-        sensSumFlags = np.where(sensSums==0)[0]
-        nanCount = np.sum(np.isnan(sensWindow))
-        if nanCount > 0:
-            print('The sensor data had ' + str(nanCount) + ' NaN values in this window (window: ' + str(ensCtr) + ').  This implementation skipped this window altogether.  I am assuming that the sensor data comes from SCADA and will have few missing values.')
-            continue
-        elif len(sensSumFlags) != 0:
-            print('The sensor data had at least one datastream where the delta voltage was all zeros for this window  This implementation skips this window because the correlation coefficient calculation fails in this case.')
-            continue
-        elif allZerosCustFlag:
-            print('The customer data had at least one customer where the delta voltage was all zeros for this window.  This implementation skips this window because the correlation coefficient calculation fails in this case.')
-        
-        # Calculate correlation coefficients
-        allWindow = np.concatenate((vWindow,sensWindow),axis=1)
-        ccMatrixWindow, failFlag = PIUtils.CalcCorrCoef(allWindow)
-        if failFlag:
-            print('The calculation of the correlation coefficient matrix failed!')
-        # Filter the resulting correlation coefficient values using a threshold on the correlation coefficient separation value
-        if dropLowCCSepFlag:
-            ccMatrixWindowDropped = PIUtils.DropCCUsingLowCCSep(ccMatrixWindow[0:len(currentIDs),len(currentIDs):],ccSepThresh,sensIDInput)
-        else:
-            ccMatrixWindowDropped = ccMatrixWindow[0:len(currentIDs),len(currentIDs):]
-        
-        # Get the individual window votes for each customer
-        currentPredictions = []
-        for custCtr in range(0,len(currentIDs)):
-            phasePrediction,votes,voteIndices,voteIDs = CCSensVoting(ccMatrixWindowDropped[custCtr,:], numVotes,phaseLabelsSens,sensIDInput)            
-            currentPredictions.append(phasePrediction)
-        
-        # Insert window cc results into full cc matrix
-        if len(currentIDs) == len(custIDInput): #If all customers are present in the window simply put the cc window into the full matrix
-            ccMatrixAll[:,:,ensCtr] = ccMatrixWindowDropped
-            allWindowVotes[:,ensCtr] = currentPredictions
-        else: # if some customers have been removed, match the cc window values to the correct positions in the full cc matrix
-            for rowCtr in range(0,len(currentIDs)):
-                index1=custIDInput.index(currentIDs[rowCtr])
-                numCurrentCust = len(currentIDs)
-                ccMatrixAll[index1,:,ensCtr] = ccMatrixWindowDropped[rowCtr,:]
-                allWindowVotes[index1,ensCtr] = currentPredictions[rowCtr]
-    # End of ensCtr for loop
-
-    # Change all zeros values to NaNs.  A zero value indicates that either the customer was missing for that slot or the window was skipped.
-        # These should not be included in the mean calculation
-    ccMatrixAll[ccMatrixAll == 0] = np.nan
-    # Calculate the mean of values over all the windows
-    for rowCtr in range(0,numCust):
-        for colCtr in range(0,numSensProfiles):
-            currentValues = ccMatrixAll[rowCtr,colCtr,:]
-            if np.sum(np.isnan(currentValues)) == ensTotal:
-                ccMatrix[rowCtr,colCtr] = np.nan
-            else:
-                ccMatrix[rowCtr,colCtr] = np.nanmean(currentValues)
-    maxCCs = []
+    # Calculate the correlation coefficients and the votes for all windows.
+    #   ccMatrix is the mean over the windows where each customer was 
+    #   included, NaN if the customer was not included in any window
+    ccMatrix, allWindowVotes, custWindowCounts, ccMatrixAll = AccumulateSensorCC(voltageCust,voltageSens,windowSize,
+                                                                                  phaseLabelsSens,sensIDInput,numVotes,
+                                                                                  dropLowCCSepFlag=dropLowCCSepFlag,
+                                                                                  ccSepThresh=ccSepThresh,ccDtype=ccDtype,
+                                                                                  blockElements=blockElements,
+                                                                                  ccCubePath=ccCubePath)
+    # Use voting methodology to determine the phase predictions
+    phasePredictions, sensVotes = CCSensVoting_Batch(ccMatrix,numVotes,phaseLabelsSens,sensIDInput)
     for custCtr in range(0,numCust):
         # If the ccMatrix row is all NaN then the customer was eliminated due to missing data or the CC Separation filter
         if (np.sum(np.isnan(ccMatrix[custCtr,:])) == numSensProfiles):
@@ -257,8 +210,8 @@ def AssignPhasesUsingSensors(voltageCust,voltageSens,custIDInput, sensIDInput,
             allSensVotes.append([-999,])
             omittedCust['minWindows'].append(custIDInput[custCtr])
         else:
-            # Use voting methodology to determine the phase predictions
-            phasePrediction,votes,voteIndices,voteIDs = CCSensVoting(ccMatrix[custCtr,:], numVotes,phaseLabelsSens,sensIDInput)            
+            phasePrediction = phasePredictions[custCtr]
+            votes = sensVotes[custCtr,sensVotes[custCtr,:] != -999]
             newPhaseLabels[0,custCtr] = phasePrediction
             # If the predicted phase labels = -999 then the customer was eliminated due to voting criteria not being met in CCSensVoting
             if phasePrediction == -999:
@@ -276,14 +229,10 @@ def AssignPhasesUsingSensors(voltageCust,voltageSens,custIDInput, sensIDInput,
                                                                                                                 phaseLabelsSens,noVotesIDs,
                                                                                                                 numVotes,allWindowVotes,
                                                                                                                 allSensVotes,newPhaseLabels)        
-    nanSum = np.sum(np.isnan(ccMatrixAll))
-    totalCC = voltageCust.shape[1] * voltageCust.shape[1] * ensTotal
-    nanDecimal = nanSum / totalCC
     # Remove customers which were not predicted due to missing data or not meeting the voting criteria
     if len(noVotesIndex) > 0:
          newPhaseLabels = np.delete(newPhaseLabels,noVotesIndex,axis=1)
          ccMatrix = np.delete(ccMatrix,noVotesIndex,axis=0)
-         ccMatrixAll = np.delete(ccMatrixAll,noVotesIndex,axis=0)
          custIDUsed = list(np.delete(np.array(custIDInput),noVotesIndex))
          confScoreCombined = list(np.delete(np.array(confScoreCombined),noVotesIndex))
          sensVotesConfScore = list(np.delete(np.array(sensVotesConfScore),noVotesIndex))
@@ -299,6 +248,289 @@ def AssignPhasesUsingSensors(voltageCust,voltageSens,custIDInput, sensIDInput,
     return newPhaseLabels,custIDUsed,noVotesIndex,noVotesIDs, omittedCust, \
         confScoreCombined, sensVotesConfScore,ccSeparation,winVotesConfScore, custWindowCounts
 # End of AssignPhasesUsingSensors
+
+
+
+###############################################################################
+#
+#                       CalcSensorCCBlock
+#
+def CalcSensorCCBlock(custBlock,sensBlock,ccDtype=np.float32,
+                      skipZeroSumSensors=True):
+    """ This function calculates the correlation coefficients between each 
+        customer and each sensor datastream for a group of windows, with one
+        batched matrix product.
+        
+        The customers and windows are handled the same way as the original
+        window loop in AssignPhasesUsingSensors.  Customers with missing data
+        in a window are removed from that window.  A window is skipped if the
+        sensor data contains NaN values, if a sensor datastream sums to zero,
+        or if any customer or sensor datastream has zero variance, since the 
+        correlation coefficients cannot be calculated.  Customers removed from
+        a window and skipped windows have correlation coefficients of 0.
+            
+            Parameters
+            ---------
+                custBlock:  numpy array of float (windows,windowSize,customers) 
+                    the customer voltage windows, in per-unit, difference 
+                    (delta) representation
+                sensBlock:  numpy array of float (windows,windowSize,sensors) 
+                    the sensor voltage windows, in per-unit, difference 
+                    (delta) representation
+                ccDtype: numpy dtype - the dtype of the correlation 
+                    coefficients.  The timeseries are centered and scaled in 
+                    float64 and the matrix product uses ccDtype
+                skipZeroSumSensors: boolean - if True, windows where a sensor
+                    datastream sums to zero are skipped
+            Returns
+            -------
+                ccBlock: numpy array of ccDtype (windows,customers,sensors) - 
+                    the correlation coefficients between each customer and
+                    each sensor datastream in each window
+                present: numpy array of bool (windows,customers) - True if 
+                    the customer had no missing data in the window
+                skipReasons: numpy array of int (windows) - 0 if the window
+                    was used, otherwise the reason it was skipped: 1 for 
+                    sensor NaN values, 2 for a sensor datastream summing to 
+                    zero, and 3 for a datastream with zero variance
+            """
+            
+    skipReasons = np.zeros(custBlock.shape[0],dtype=int)
+    if skipZeroSumSensors:
+        skipReasons[np.any(np.sum(sensBlock,axis=1) == 0,axis=1)] = 2
+    skipReasons[np.any(np.isnan(sensBlock),axis=(1,2))] = 1
+    
+    # Center and scale each datastream to unit norm in each window, the
+    #   customers with missing data are set to zero
+    present = ~np.any(np.isnan(custBlock),axis=1)
+    custBlock = np.where(present[:,np.newaxis,:],custBlock - np.mean(custBlock,axis=1,keepdims=True),0)
+    custNorms = np.sqrt(np.einsum('wtn,wtn->wn',custBlock,custBlock))
+    zeroVariance = np.any(present & (custNorms == 0),axis=1)
+    custNorms[custNorms == 0] = 1
+    custBlock = (custBlock / custNorms[:,np.newaxis,:]).astype(ccDtype)
+    
+    sensBlock = sensBlock - np.mean(sensBlock,axis=1,keepdims=True)
+    sensNorms = np.sqrt(np.einsum('wts,wts->ws',sensBlock,sensBlock))
+    zeroVariance = zeroVariance | np.any(~(sensNorms > 0),axis=1)
+    sensNorms[~(sensNorms > 0)] = 1
+    sensBlock = (sensBlock / sensNorms[:,np.newaxis,:]).astype(ccDtype)
+    skipReasons[(skipReasons == 0) & zeroVariance] = 3
+    
+    # (windows,customers,measurements) x (windows,measurements,sensors)
+    ccBlock = np.matmul(custBlock.transpose(0,2,1),sensBlock)
+    # Match np.corrcoef, which clips rounding errors to [-1,1]
+    np.clip(ccBlock,-1,1,out=ccBlock)
+    ccBlock[skipReasons != 0] = 0
+    return ccBlock, present, skipReasons
+# End of CalcSensorCCBlock
+
+
+
+
+###############################################################################
+#
+#                       ReportSkippedWindows
+#
+def ReportSkippedWindows(skipReasons):
+    """ This function prints the number of windows skipped for each reason
+        returned by CalcSensorCCBlock
+            
+            Parameters
+            ---------
+                skipReasons: numpy array of int (windows) - the skip reason
+                    for each window from CalcSensorCCBlock
+            Returns
+            -------
+                None
+            """
+            
+    if np.sum(skipReasons == 1) > 0:
+        print(str(np.sum(skipReasons == 1)) + ' windows were skipped because the sensor data had NaN values.  I am assuming that the sensor data comes from SCADA and will have few missing values.')
+    if np.sum(skipReasons == 2) > 0:
+        print(str(np.sum(skipReasons == 2)) + ' windows were skipped because at least one sensor datastream had a delta voltage which summed to zero.')
+    if np.sum(skipReasons == 3) > 0:
+        print(str(np.sum(skipReasons == 3)) + ' windows were skipped because at least one customer or sensor datastream had a constant voltage, the correlation coefficient calculation fails in this case.')
+# End of ReportSkippedWindows
+
+
+
+
+###############################################################################
+#
+#                       CalcSensorCCTensor
+#
+def CalcSensorCCTensor(voltageCust,voltageSens,windowSize,ccDtype=np.float32,
+                       blockElements=2**24):
+    """ This function calculates the correlation coefficients between each 
+        customer and each sensor datastream in every window.  The voltage 
+        timeseries are viewed as (windows,windowSize,datastreams) arrays and
+        each group of windows is processed by CalcSensorCCBlock.  The groups
+        are sized so that about blockElements customer voltage values are 
+        processed at once, bounding the memory used.  The result holds every
+        window, use AccumulateSensorCC when only the mean over the windows is
+        needed.
+            
+            Parameters
+            ---------
+                voltageCust:  numpy array of float (measurements,customers) 
+                    AMI voltage timeseries for each customer, in per-unit, 
+                    difference (delta) representation
+                voltageSens:  numpy array of float (measurements,sensors*phases*datastreams) 
+                    voltage timeseries for the sensor datastreams, in 
+                    per-unit, difference (delta) representation
+                windowSize: int - the number of samples to use in each window
+                ccDtype: numpy dtype - the dtype of the correlation 
+                    coefficients.  The default is float32
+                blockElements: int - the approximate number of customer 
+                    voltage values processed at once
+            Returns
+            -------
+                ccMatrixAll: numpy array of ccDtype (customers,sensors,windows)
+                    - the correlation coefficients between each customer and
+                    each sensor datastream in each window
+                custPresent: numpy array of bool (windows,customers) - True 
+                    if the customer had no missing data in the window.  This
+                    includes skipped windows
+                windowSkipped: numpy array of bool (windows) - True if the 
+                    window was skipped
+            """
+            
+    numCust = voltageCust.shape[1]
+    numSens = voltageSens.shape[1]
+    ensTotal = int(np.floor(voltageCust.shape[0] / windowSize))
+    custWindows = np.asarray(voltageCust)[0:ensTotal*windowSize,:].reshape(ensTotal,windowSize,numCust)
+    sensWindows = np.asarray(voltageSens)[0:ensTotal*windowSize,:].reshape(ensTotal,windowSize,numSens)
+    ccMatrixAll = np.zeros((numCust,numSens,ensTotal),dtype=ccDtype)
+    custPresent = np.zeros((ensTotal,numCust),dtype=bool)
+    skipReasons = np.zeros(ensTotal,dtype=int)
+    
+    windowBlock = max(1,int(blockElements // max(1,windowSize * numCust)))
+    for blockStart in range(0,ensTotal,windowBlock):
+        blockEnd = min(blockStart + windowBlock,ensTotal)
+        ccBlock, present, blockReasons = CalcSensorCCBlock(custWindows[blockStart:blockEnd],sensWindows[blockStart:blockEnd],ccDtype=ccDtype)
+        ccMatrixAll[:,:,blockStart:blockEnd] = ccBlock.transpose(1,2,0)
+        custPresent[blockStart:blockEnd,:] = present
+        skipReasons[blockStart:blockEnd] = blockReasons
+    # End of blockStart for loop
+    
+    ReportSkippedWindows(skipReasons)
+    return ccMatrixAll, custPresent, skipReasons != 0
+# End of CalcSensorCCTensor
+
+
+
+
+###############################################################################
+#
+#                       AccumulateSensorCC
+#
+def AccumulateSensorCC(voltageCust,voltageSens,windowSize,phaseLabelsSens,
+                       sensIDInput,numVotes,dropLowCCSepFlag=False,
+                       ccSepThresh=-1,ccDtype=np.float32,blockElements=2**24,
+                       ccCubePath=-1,skipZeroSumSensors=True):
+    """ This function calculates the mean correlation coefficient between 
+        each customer and each sensor datastream over all windows, and the 
+        phase vote of each customer in each window, without keeping the 
+        (customers,sensors,windows) array of correlation coefficients.  Each
+        group of windows is processed by CalcSensorCCBlock, and a running sum
+        and count of the correlation coefficients is updated, so the memory 
+        used is (customers,sensors) regardless of the number of windows.
+        
+        As in the original window loop, correlation coefficients of 0 (a 
+        customer removed from the window, a skipped window, or a value 
+        dropped by the CC Separation filter) are not included in the mean.
+            
+            Parameters
+            ---------
+                voltageCust:  numpy array of float (measurements,customers) 
+                    AMI voltage timeseries for each customer, in per-unit, 
+                    difference (delta) representation
+                voltageSens:  numpy array of float (measurements,sensors*phases*datastreams) 
+                    voltage timeseries for the sensor datastreams, in 
+                    per-unit, difference (delta) representation
+                windowSize: int - the number of samples to use in each window
+                phaseLabelsSens: numpy array of int (1,sensors*3) - the phase 
+                    labels for each sensor datastream
+                sensIDInput: list of str - the list of sensor IDs, matching 
+                    axis 1 of voltageSens
+                numVotes: int - the number of sensors voting in each window
+                dropLowCCSepFlag: boolean - if True, CC values in each window
+                    with a CC Separation below ccSepThresh are dropped
+                ccSepThresh: float - the CC Separation threshold
+                ccDtype: numpy dtype - the dtype of the per-window correlation
+                    coefficients.  The running sum is float64
+                blockElements: int - the approximate number of customer 
+                    voltage values processed at once
+                ccCubePath: str or Path - the path of a .npy file to save the
+                    per-window correlation coefficients (customers,sensors,
+                    windows), with NaN where they were not included in the 
+                    mean.  The file is memory mapped, so the array is not held
+                    in memory.  The default (-1) does not save them
+                skipZeroSumSensors: boolean - if True, windows where a sensor
+                    datastream sums to zero are skipped
+            Returns
+            -------
+                ccMatrix: numpy array of float (customers,sensors) - the mean 
+                    correlation coefficients over the windows, NaN if a 
+                    customer was not included in any window
+                allWindowVotes: numpy array of int16 (customers,windows) - the
+                    phase vote for each customer in each window, -999 where
+                    the customer was not included
+                custWindowCounts: numpy array of int (customers) - the number
+                    of windows where each customer had no missing data
+                ccMatrixAll: numpy memmap of ccDtype (customers,sensors,
+                    windows) - the per-window correlation coefficients if 
+                    ccCubePath was given, otherwise -1
+            """
+            
+    numCust = voltageCust.shape[1]
+    numSens = voltageSens.shape[1]
+    ensTotal = int(np.floor(voltageCust.shape[0] / windowSize))
+    custWindows = np.asarray(voltageCust)[0:ensTotal*windowSize,:].reshape(ensTotal,windowSize,numCust)
+    sensWindows = np.asarray(voltageSens)[0:ensTotal*windowSize,:].reshape(ensTotal,windowSize,numSens)
+    ccSum = np.zeros((numCust,numSens),dtype=float)
+    ccCount = np.zeros((numCust,numSens),dtype=np.int32)
+    # The phase votes are 1, 2, 3, or -999, int16 is the smallest type holding -999
+    allWindowVotes = np.full((numCust,ensTotal),-999,dtype=np.int16)
+    custWindowCounts = np.zeros(numCust,dtype=int)
+    skipReasons = np.zeros(ensTotal,dtype=int)
+    if type(ccCubePath) != int:
+        ccMatrixAll = np.lib.format.open_memmap(ccCubePath,mode='w+',dtype=ccDtype,shape=(numCust,numSens,ensTotal))
+    else:
+        ccMatrixAll = -1
+    
+    windowBlock = max(1,int(blockElements // max(1,windowSize * numCust)))
+    for blockStart in range(0,ensTotal,windowBlock):
+        blockEnd = min(blockStart + windowBlock,ensTotal)
+        ccBlock, present, blockReasons = CalcSensorCCBlock(custWindows[blockStart:blockEnd],sensWindows[blockStart:blockEnd],
+                                                           ccDtype=ccDtype,skipZeroSumSensors=skipZeroSumSensors)
+        custWindowCounts = custWindowCounts + np.sum(present,axis=0)
+        skipReasons[blockStart:blockEnd] = blockReasons
+        
+        # Filter the resulting correlation coefficient values using a threshold on the correlation coefficient separation value
+        if dropLowCCSepFlag:
+            for blockCtr in np.where(blockReasons == 0)[0]:
+                currentIndices = np.where(present[blockCtr,:])[0]
+                ccBlock[blockCtr,currentIndices,:] = PIUtils.DropCCUsingLowCCSep(ccBlock[blockCtr,currentIndices,:],ccSepThresh,sensIDInput)
+        # Get the individual window votes for each customer in all windows of 
+        #   the block.  Customers removed from a window and skipped windows 
+        #   have all zero CC and a vote of -999
+        phasePredictions, votes = CCSensVoting_Batch(ccBlock.reshape(-1,numSens),numVotes,phaseLabelsSens,sensIDInput)
+        allWindowVotes[:,blockStart:blockEnd] = phasePredictions.reshape(blockEnd-blockStart,numCust).transpose()
+        
+        ccSum = ccSum + np.sum(ccBlock,axis=0,dtype=float)
+        ccCount = ccCount + np.count_nonzero(ccBlock,axis=0)
+        if type(ccCubePath) != int:
+            ccMatrixAll[:,:,blockStart:blockEnd] = np.where(ccBlock == 0,np.nan,ccBlock).transpose(1,2,0)
+    # End of blockStart for loop
+    
+    ReportSkippedWindows(skipReasons)
+    if type(ccCubePath) != int:
+        ccMatrixAll.flush()
+    ccMatrix = np.full((numCust,numSens),np.nan)
+    np.divide(ccSum,ccCount,out=ccMatrix,where=ccCount > 0)
+    return ccMatrix, allWindowVotes, custWindowCounts, ccMatrixAll
+# End of AccumulateSensorCC
     
 
 
@@ -396,15 +628,121 @@ def CCSensVoting(ccRow, numVotes,phaseLabelsSens,sensIDInput):
         if votes.shape[0] == 0: # This means that all sensors were eliminated due to having repeated datastreams in the votes.  
             phasePrediction = -999 
         else:
-            phasePrediction = stats.mode(votes,axis=0,nan_policy='omit')[0][0]   
+            phasePrediction = np.ravel(stats.mode(votes,axis=0,nan_policy='omit')[0])[0]   
     else:
-        phasePrediction = stats.mode(votes,axis=0,nan_policy='omit')[0][0]   
+        phasePrediction = np.ravel(stats.mode(votes,axis=0,nan_policy='omit')[0])[0]   
     return phasePrediction,votes,voteIndices,voteIDs
 # End of CCSensVoting
 
 
 
 
+###############################################################################
+#
+#                       CCSensVoting_Batch
+#
+def CCSensVoting_Batch(ccMatrix,numVotes,phaseLabelsSens,sensIDInput):
+    """ This function applies the CCSensVoting rules to every row of a 
+        matrix of correlation coefficients at once.  The numVotes highest 
+        correlated datastreams in each row are found with np.argpartition,
+        sensors with repeated datastreams in the votes are found using the 
+        index of each datastream's sensor, and the prediction is the mode of
+        the remaining votes, the smallest phase label in the case of a tie, 
+        as with scipy.stats.mode.  NaN and zero values are excluded, 
+        customers with fewer sensors than numVotes use an odd number of 
+        votes, and rows where all votes are eliminated are given -999, all 
+        as in CCSensVoting.  The few rows with exactly tied CC among the 
+        votes are passed to CCSensVoting so that ties are broken the same 
+        way.
+            
+            Parameters
+            ---------
+                ccMatrix: numpy array of float (customers,numSensors) - the 
+                    correlation coefficients between each customer and the 
+                    set of sensors
+                numVotes: int - the number of votes to use in the prediction
+                phaseLabelsSens: numpy array of int (1,numSensors) - the phase 
+                    labels for each sensor.  The dimensions should match 
+                    axis 1 of ccMatrix
+                sensIDInput: list of str - the list of sensors IDs. The length
+                    of this should match axis 1 of ccMatrix
+            Returns
+            -------
+                phasePredictions: numpy array of int (customers) - the phase 
+                    prediction for each customer, -999 if the customer has no
+                    remaining votes
+                votes: numpy array of int (customers,votes) - the votes that 
+                    led to each prediction, in order of increasing CC.  
+                    Eliminated votes are -999
+            """
+            
+    ccMatrix = np.asarray(ccMatrix)
+    numCust, numSens = ccMatrix.shape
+    phaseLabelsSens = np.asarray(phaseLabelsSens).reshape(-1)
+    uniquePhases, phaseIndices = np.unique(phaseLabelsSens,return_inverse=True)
+    sensUnique, sensGroups = np.unique(np.array(sensIDInput),return_inverse=True)
+    numVoteSlots = min(numVotes,numSens)
+    
+    # Remove any NaNs and zeros from the correlation coefficients
+    valid = ~np.isnan(ccMatrix) & (ccMatrix != 0)
+    numValid = np.sum(valid,axis=1)
+    ccMasked = np.where(valid,ccMatrix,-np.inf)
+    # The number of sensors with at least one valid datastream
+    sensPresent = np.zeros((numCust,len(sensUnique)),dtype=bool)
+    sensPresent[np.repeat(np.arange(numCust),numSens)[valid.reshape(-1)],np.tile(sensGroups,numCust)[valid.reshape(-1)]] = True
+    totalSensors = np.sum(sensPresent,axis=1)
+    
+    # Select the numVotes highest CC, sorted by increasing CC.  Eliminated 
+    #   datastreams sort first and are marked invalid
+    voteIndices = np.argpartition(ccMasked,numSens-numVoteSlots,axis=1)[:,numSens-numVoteSlots:]
+    voteIndices = np.take_along_axis(voteIndices,np.argsort(np.take_along_axis(ccMasked,voteIndices,axis=1),axis=1,kind='stable'),axis=1)
+    active = np.take_along_axis(valid,voteIndices,axis=1)
+    voteGroups = sensGroups[voteIndices]
+    sameGroup = (voteGroups[:,:,np.newaxis] == voteGroups[:,np.newaxis,:])
+    
+    # Check for multiple votes from the same sensor, which can occur if the 
+    #   phase datastreams are extremely similar, sometimes near the substation
+    earlierSame = np.any(sameGroup & active[:,np.newaxis,:] & np.tri(numVoteSlots,k=-1,dtype=bool)[np.newaxis,:,:],axis=2)
+    numUniqueVotes = np.sum(active & ~earlierSame,axis=1)
+    repeatedFlag = (numValid > 0) & (numUniqueVotes < numVotes)
+    
+    # Reduce the number of votes to the number of available sensors, making 
+    #   the number of votes odd
+    reduceFlag = repeatedFlag & (totalSensors < numVotes)
+    newNumVotes = np.where(np.mod(totalSensors,2) == 0,totalSensors - 1,totalSensors)
+    slotPosition = np.arange(numVoteSlots)[np.newaxis,:]
+    active = np.where(reduceFlag[:,np.newaxis],slotPosition >= (numVoteSlots - newNumVotes)[:,np.newaxis],active)
+    
+    # Remove all votes from sensors with repeated datastreams in the votes
+    activeSameCount = np.sum(sameGroup & active[:,np.newaxis,:],axis=2)
+    keep = np.where(repeatedFlag[:,np.newaxis],active & (activeSameCount == 1),active)
+    
+    # The mode of the remaining votes, np.argmax returns the smallest phase 
+    #   label among ties
+    voteCounts = np.zeros((numCust,len(uniquePhases)),dtype=int)
+    np.add.at(voteCounts,(np.repeat(np.arange(numCust),numVoteSlots),phaseIndices[voteIndices].reshape(-1)),keep.reshape(-1).astype(int))
+    phasePredictions = uniquePhases[np.argmax(voteCounts,axis=1)].astype(int)
+    phasePredictions[np.sum(keep,axis=1) == 0] = -999
+    votes = np.where(keep,phaseLabelsSens[voteIndices],-999)
+    
+    # The order np.argsort gives to exactly equal CC is not defined, so rows 
+    #   with tied CC among the votes or at the cutoff use CCSensVoting 
+    voteCC = np.take_along_axis(ccMasked,voteIndices,axis=1)
+    cutoffCC = voteCC[:,0:1]
+    tiedFlag = np.any((voteCC[:,1:] == voteCC[:,:-1]) & np.isfinite(voteCC[:,1:]),axis=1)
+    tiedFlag = tiedFlag | (np.isfinite(cutoffCC[:,0]) & (np.sum(ccMasked == cutoffCC,axis=1) > 1))
+    for custCtr in np.where(tiedFlag)[0]:
+        phasePrediction,currVotes,currIndices,currIDs = CCSensVoting(ccMatrix[custCtr,:],numVotes,phaseLabelsSens[np.newaxis,:],sensIDInput)
+        phasePredictions[custCtr] = phasePrediction
+        votes[custCtr,:] = -999
+        if len(currVotes) > 0:
+            votes[custCtr,-len(currVotes):] = currVotes
+    return phasePredictions, votes
+# End of CCSensVoting_Batch
+
+
+
+
 ###############################################################################
 #
 #                    CalcConfidenceScores4Sensors
@@ -428,7 +766,12 @@ def CalcConfidenceScores4Sensors(ccMatrixAllWindows,meanCCMatrix,custIDList,
             will be recorded as 0 for those customers.  If sensPhasesInput
             only has three entries the function will omit the sensor agreement
             and combined score metrics, assuming that the substation was used
-            instead of the sensors.
+            instead of the sensors.  The scores are calculated for all 
+            customers at once, using a (sensors,datastreams) table of the 
+            datastream indices for each sensor for the ccSeparation.  
+            ccSeparation is NaN if the predicted phase has no datastream with
+            a mean CC or the sensor has fewer than two datastreams with a 
+            mean CC.
             
     Parameters
     ---------
@@ -436,7 +779,7 @@ def CalcConfidenceScores4Sensors(ccMatrixAllWindows,meanCCMatrix,custIDList,
             the correlation coefficient values between a particular customer and a set of
             sensors. The indexing of axis 0 must match the indexing for
             custIDList.  The indexing of axis 1 must match the indexing for 
-            sensIDInput
+            sensIDInput.  This is not used by the scores and may be -1
         meanCCMatrix: numpy array of float (num customers, number of sensors) -
             The mean correlation coefficients over all windows.  If any 
             customers were eliminated due to missing data, then the whole
@@ -486,91 +829,75 @@ def CalcConfidenceScores4Sensors(ccMatrixAllWindows,meanCCMatrix,custIDList,
             """
          
     numCust = len(custIDList)
-    numWindowsCount = []
-    sensVotesConfScore = []
-    winVotesConfScore = []
-    ccSeparation = []
+    sensPhases = np.asarray(sensPhasesInput).reshape(-1)
+    predictedPhases = np.asarray(newPhaseLabels).reshape(-1)
+    meanCCMatrix = np.asarray(meanCCMatrix,dtype=float)
+    noVotesFlag = np.isin(np.array(custIDList),np.array(noVotesIDs))
     
-    for custCtr in range(0,numCust):
-        currentCustID = custIDList[custCtr]
-        if len(noVotesIDs) > 0:
-            index = np.where(np.array(noVotesIDs)==currentCustID)[0]
-            if len(index) > 0:
-                sensVotesConfScore.append(0)
-                winVotesConfScore.append(0)
-                ccSeparation.append(0)
-                numWindowsCount.append(0)
-                continue
-        
-        #######  Calculate winVotesConfScore section
-        currWinVotes = allWindowVotes[custCtr,:]
-        nanMask = np.where(currWinVotes==-999)[0]
-        currWinVotes = np.delete(currWinVotes,nanMask)
-        # Calculate voting confidence score
-        #Check if all votes were eliminated
-        if len(currWinVotes) == 0 :
-            winVotesConfScore.append(0)
-        # Check of all votes are the same        
-        elif len(np.unique(currWinVotes)) == 1:
-            winVotesConfScore.append(1)
-        else:
-            modeValue = stats.mode(currWinVotes)[0]
-            # Check if votes are evenly split
-            if len(modeValue) > 1:
-                confValue = 1 / len(modeValue)
-                winVotesConfScore.append(confValue)
-            # Calculate voting confidence score using the mode and the total number of votes
-            else:
-                modeValue = modeValue[0]
-                indices = np.where(np.array(currWinVotes)==modeValue)[0]
-                confValue = len(indices) / len(currWinVotes)
-                winVotesConfScore.append(confValue)
-        numWindowsCount.append(len(currWinVotes))
-        
-        ###### Calculate sensVotesConfScore section
-        if sensPhasesInput.shape[1] > 3: # This is a quick and dirty way to omit this section for the substation version
-            currSensVotes = allSensVotes[custCtr]
-            # Calculate sensor votes confidence score for this customer
-            if len(currSensVotes) == 0: # All sensor votes were eliminated
-                sensVotesConfScore.append(0)
-            elif len(np.unique(currSensVotes))==1:
-                sensVotesConfScore.append(1)
-            else:
-                modeValue = stats.mode(currSensVotes)[0]
-                if len(modeValue) > 1:
-                    confValue = 1 / len(modeValue)
-                    sensVotesConfScore.append(confValue)
-                else:
-                    modeValue=modeValue[0]
-                    indices = np.where(np.array(currSensVotes)==modeValue)[0]
-                    confValue = len(indices) / len(currSensVotes)
-                    sensVotesConfScore.append(confValue)
+    #######  Calculate winVotesConfScore section
+    # The fraction of windows which voted for the mode of the window votes, 
+    #   windows where the customer was omitted are not counted
+    allWindowVotes = np.asarray(allWindowVotes)
+    winVoteValid = allWindowVotes != -999
+    numWindowsCount = np.sum(winVoteValid,axis=1)
+    winVoteLabels = np.unique(allWindowVotes[winVoteValid])
+    winModeCount = np.zeros(numCust,dtype=int)
+    for label in winVoteLabels:
+        winModeCount = np.maximum(winModeCount,np.sum(allWindowVotes == label,axis=1))
+    winVotesConfScore = np.where(numWindowsCount > 0,winModeCount / np.maximum(numWindowsCount,1),0)
+    winVotesConfScore[noVotesFlag] = 0
+    numWindowsCount[noVotesFlag] = 0
+    
+    ###### Calculate sensVotesConfScore section
+    if sensPhases.shape[0] > 3: # This is a quick and dirty way to omit this section for the substation version
+        # Pad the sensor votes for each customer into a (customers,votes) matrix
+        numSensVotes = np.array([len(currSensVotes) for currSensVotes in allSensVotes],dtype=int)
+        sensVoteMatrix = np.full((numCust,max(1,np.max(numSensVotes,initial=0))),-999)
+        sensVoteMatrix[np.arange(sensVoteMatrix.shape[1])[np.newaxis,:] < numSensVotes[:,np.newaxis]] = np.concatenate([np.ravel(currSensVotes) for currSensVotes in allSensVotes] + [np.zeros(0,dtype=int)])
+        sensModeCount = np.zeros(numCust,dtype=int)
+        for label in np.unique(sensVoteMatrix[sensVoteMatrix != -999]):
+            sensModeCount = np.maximum(sensModeCount,np.sum(sensVoteMatrix == label,axis=1))
+        sensVotesConfScore = np.where(numSensVotes > 0,sensModeCount / np.maximum(numSensVotes,1),0)
+        sensVotesConfScore[noVotesFlag] = 0
+        sensVotesConfScore = list(sensVotesConfScore)
+    else:
+        # The substation version keeps a single 0 followed by a 0 for each 
+        #   excluded customer after the last predicted customer
+        predictedIndices = np.where(~noVotesFlag)[0]
+        if len(predictedIndices) > 0:
+            sensVotesConfScore = [0,] * (numCust - predictedIndices[-1])
         else:
-            sensVotesConfScore = [0,]
+            sensVotesConfScore = [0,] * numCust
      
-        #### Calculate the ccSeparation section
-        currPredictedPhase = newPhaseLabels[0,custCtr]
-        currCC = meanCCMatrix[custCtr,:]
-        nans  = np.isnan(currCC)
-        nanIndices=np.where(nans==1)
-        currCC=np.delete(currCC,nanIndices)
-        sensIDNoNan=list(np.delete(np.array(sensIDInput),nanIndices))        
-        argsortedCC = np.argsort(currCC)
-        sortIndex = len(currCC) -1
-        while sensPhasesInput[0,argsortedCC[sortIndex]] != currPredictedPhase:
-            sortIndex = sortIndex - 1
-        currSensor = sensIDInput[argsortedCC[sortIndex]]
-        indices = np.where(np.array(sensIDInput)==currSensor)[0]
-        ccSet = np.sort(currCC[indices])
-        ccDiff = ccSet[-1] - ccSet[-2]
-        ccSeparation.append(ccDiff)
+    #### Calculate the ccSeparation section
+    # Group the sensor datastreams into a (sensors,datastreams) index table,
+    #   padded with -1 for sensors with fewer datastreams
+    sensUnique, sensGroups = np.unique(np.array(sensIDInput),return_inverse=True)
+    sensGroups = sensGroups.reshape(-1)
+    streamOrder = np.argsort(sensGroups,kind='stable')
+    streamCounts = np.bincount(sensGroups,minlength=len(sensUnique))
+    streamPosition = np.arange(len(sensGroups)) - np.repeat(np.cumsum(streamCounts) - streamCounts,streamCounts)
+    sensStreamTable = np.full((len(sensUnique),max(2,np.max(streamCounts))),-1,dtype=int)
+    sensStreamTable[sensGroups[streamOrder],streamPosition] = streamOrder
+    # The sensor with the highest CC datastream on the predicted phase
+    phaseMatch = (sensPhases[np.newaxis,:] == predictedPhases[:,np.newaxis]) & ~np.isnan(meanCCMatrix)
+    bestStream = np.argmax(np.where(phaseMatch,meanCCMatrix,-np.inf),axis=1)
+    streamIndices = sensStreamTable[sensGroups[bestStream],:]
+    # The difference between the highest and second highest CC of the 
+    #   datastreams from that sensor
+    ccSet = np.take_along_axis(meanCCMatrix,np.maximum(streamIndices,0),axis=1)
+    ccSet[(streamIndices == -1) | np.isnan(ccSet)] = -np.inf
+    ccSet = np.sort(ccSet,axis=1)
+    with np.errstate(invalid='ignore'):
+        ccSeparation = ccSet[:,-1] - ccSet[:,-2]
+    ccSeparation[~np.any(phaseMatch,axis=1) | np.isinf(ccSet[:,-2])] = np.nan
+    ccSeparation[noVotesFlag] = 0
        
-    # End of custCtr for loop
     confScoreCombined = []
     for ctr in range(0,len(sensVotesConfScore)):
         confScoreCombined.append(sensVotesConfScore[ctr] * winVotesConfScore[ctr])
     
-    return confScoreCombined,sensVotesConfScore, ccSeparation, winVotesConfScore,numWindowsCount    
+    return confScoreCombined,sensVotesConfScore, list(ccSeparation), list(winVotesConfScore),list(numWindowsCount)    
 # End of CalcConfidenceScores4Sensors
         
 
@@ -638,55 +965,18 @@ def AssignPhasesUsingSubstation(voltageCust,voltageSub,custIDInput,
                     windows.
             """    
         
-    ensTotal = int(np.floor(voltageCust.shape[0] / windowSize))
-    ccMatrixAll = np.zeros((voltageCust.shape[1],voltageSub.shape[1],ensTotal),dtype=float)
-    ccMatrix = np.zeros((voltageCust.shape[1],voltageSub.shape[1]),dtype=float)
     newPhaseLabels = np.zeros((1,voltageCust.shape[1]),dtype=int)
     noVotesIndex = []
     noVotesIDs = []
     numSubProfiles = voltageSub.shape[1]
     numCust = len(custIDInput)
     
-    # Calculate all correlation coefficients for all windows
-    for ensCtr in range(0,ensTotal):
-        #print('ensCtr = ' + str(ensCtr))
-        #Customer Voltage - Select the next time series window and remove customers with missing data in that window
-        vWindow = PIUtils.GetVoltWindow(voltageCust,windowSize,ensCtr)
-        vWindow,currentIDs = PIUtils.CleanVoltWindowNoLabels(deepcopy(vWindow), deepcopy(custIDInput))
-        # Sub Voltage - Select the next time series window and remove customers with missing data in that window
-        subWindow = PIUtils.GetVoltWindow(voltageSub,windowSize,ensCtr)
-        nanCount = np.sum(np.isnan(subWindow))
-        if nanCount > 0:
-            print('The substation data had ' + str(nanCount) + ' NaN values in this window (window: ' + str(ensCtr) + ').  This implementation skipped this window altogether.  I am assuming that this data comes from SCADA and will have few missing values.  If this becomes a problem -> Fix This!')
-            continue
-        # Calculate correlation coefficients
-        allWindow = np.concatenate((vWindow,subWindow),axis=1)
-        ccMatrixWindow, failFlag = PIUtils.CalcCorrCoef(allWindow)
-        if failFlag:
-            print('The calculation of the correlation coefficient matrix failed!')
-        
-        # Insert window cc results into full cc matrix
-        if len(currentIDs) == len(custIDInput): #If all customers are present in the window simply but the cc window into the full matrix
-            ccMatrixAll[:,:,ensCtr] = ccMatrixWindow[0:numCust,numCust:]
-        else: # if some customers have been removed, match the cc window values to the correct positions in the full cc matrix
-            for rowCtr in range(0,len(currentIDs)):
-                index1=custIDInput.index(currentIDs[rowCtr])
-                numCurrentCust = len(currentIDs)
-                #print(str(rowCtr) + ',' + str(index1))
-                ccMatrixAll[index1,:,ensCtr] = ccMatrixWindow[rowCtr,numCurrentCust:]
-    # End of ensCtr for loop
-
-    # Change all zeros values to NaNs.  A zero value indicates that either the customer was missing for that slot or the window was skipped.
-        # These should not be included in the mean calculation
-    ccMatrixAll[ccMatrixAll == 0] = np.nan       
-    # Calculate the mean of values over all the windows
-    for rowCtr in range(0,numCust):
-        for colCtr in range(0,numSubProfiles):
-            currentValues = ccMatrixAll[rowCtr,colCtr,:]
-            if np.sum(np.isnan(currentValues)) == ensTotal:
-                ccMatrix[rowCtr,colCtr] = np.nan
-            else:
-                ccMatrix[rowCtr,colCtr] = np.nanmean(currentValues)
+    # Calculate the mean correlation coefficients over all windows, and the
+    #   window votes, the vote in each window is the phase of the substation 
+    #   datastream with the highest CC
+    ccMatrix, allWindowVotes, custWindowCounts, ccMatrixAll = AccumulateSensorCC(voltageCust,voltageSub,windowSize,
+                                                                                  phaseLabelsSub,subIDInput,1,
+                                                                                  skipZeroSumSensors=False)
     for custCtr in range(0,numCust):
         if np.sum(np.isnan(ccMatrix[custCtr,:])) == numSubProfiles:
             noVotesIndex.append(custCtr)
@@ -698,12 +988,16 @@ def AssignPhasesUsingSubstation(voltageCust,voltageSub,custIDInput,
         #print('max value = ' + str(np.max(ccMatrix[custCtr,:])) + ', min value = ' + str(np.min(ccMatrix[custCtr,:])))
         newPhaseLabels[0,custCtr] = phaseLabelsSub[0,maxIndex]
 
-    # Calculate confidence score metrics    
-    confScoreCombined,sensVotesConfScore, ccSeparation, winVotesConfScore = CalcConfidenceScores4Sensors(ccMatrixAll,
+    # Calculate confidence score metrics, each customer has a single 
+    #   substation vote    
+    allSensVotes = [[newPhaseLabels[0,custCtr]] for custCtr in range(0,numCust)]
+    confScoreCombined,sensVotesConfScore, ccSeparation, winVotesConfScore,numWindows = CalcConfidenceScores4Sensors(ccMatrixAll,
                                                                                                                 ccMatrix,
                                                                                                                 custIDInput,
                                                                                                                 subIDInput,
-                                                                                                                phaseLabelsSub,noVotesIDs) 
+                                                                                                                phaseLabelsSub,noVotesIDs,
+                                                                                                                1,allWindowVotes,
+                                                                                                                allSensVotes,newPhaseLabels) 
 
 
     # Remove customers which were not predicted due to missing data
@@ -1,5 +1,6 @@
 if __package__ in [None, '']:
     import CA_Ensemble_Funcs
+    import FeederPartitioning
     import CA_Ensemble_SampleScripts
     import PhaseIdent_Utils
     import SensorMethod_Funcs
@@ -8,6 +9,7 @@ if __package__ in [None, '']:
     import PhaseIdentification_Sensor
 else:
     from . import CA_Ensemble_Funcs
+    from . import FeederPartitioning
     from . import CA_Ensemble_SampleScripts
     from . import PhaseIdent_Utils
     from . import SensorMethod_Funcs
@@ -1,8 +1,10 @@
 if __package__ in [None, '']:
+    import CommonUtils
     import MeterTransformerPairing
     import OnlinePhaseChangePoint
     import PhaseIdentification
 else:
+    from . import CommonUtils
     from . import MeterTransformerPairing
     from . import OnlinePhaseChangePoint
     from . import PhaseIdentification
@@ -0,0 +1,92 @@
+# Python Library Imports
+import unittest
+import tempfile
+import importlib.util
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Package Code
+from sdsmc.CommonUtils import DataIOUtils
+from sdsmc.PhaseIdentification import PhaseIdent_Utils as PIUtils
+
+
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+
+class TestingDataIOUtils( unittest.TestCase ):
+
+		def setUp( self ):
+			self.tempDir = tempfile.TemporaryDirectory()
+			self.path = Path(self.tempDir.name)
+			rng = np.random.default_rng(0)
+			self.voltage = rng.normal(240,2,(25,6))
+			self.labels = np.array([[1,2,3,1,2,3]])
+			self.custIDs = ['cust0','cust1','cust2','cust3','cust3.1','cust5']
+			pd.DataFrame(self.voltage).to_csv(self.path / 'voltage.csv',header=False,index=False)
+			pd.DataFrame(self.labels).to_csv(self.path / 'labels.csv',header=False,index=False)
+			with open(self.path / 'ids.csv','w') as file:
+				file.write('\n'.join(self.custIDs) + '\n')
+			singleFile = pd.DataFrame(np.vstack((self.labels,self.voltage)),columns=self.custIDs)
+			singleFile.to_csv(self.path / 'single.csv',index=False)
+
+		def tearDown( self ):
+			self.tempDir.cleanup()
+
+		def test_LoadArray_csv( self ):
+			voltage = DataIOUtils.LoadArray(self.path / 'voltage.csv')
+			labels = DataIOUtils.LoadArray(self.path / 'labels.csv')
+			self.assertTrue( np.array_equal(voltage,PIUtils.ConvertCSVtoNPY(self.path / 'voltage.csv')) )
+			self.assertTrue( np.array_equal(labels,self.labels) )
+			self.assertEqual( labels.dtype, PIUtils.ConvertCSVtoNPY(self.path / 'labels.csv').dtype )
+			self.assertEqual( DataIOUtils.LoadIDs(self.path / 'ids.csv'), self.custIDs )
+
+		def test_ConvertInputFile_numpy( self ):
+			csvVoltage = DataIOUtils.LoadArray(self.path / 'voltage.csv')
+			for suffix in ['.npy','.npz']:
+				outputPath = DataIOUtils.ConvertInputFile(self.path / 'voltage.csv',self.path / ('voltage' + suffix),chunkRows=7)
+				voltage = DataIOUtils.LoadArray(outputPath)
+				self.assertIsInstance( voltage, np.memmap )
+				self.assertTrue( np.array_equal(voltage,csvVoltage) )
+				# Copy-on-write, the file is not changed
+				voltage[0,0] = 0
+				self.assertTrue( np.array_equal(DataIOUtils.LoadArray(outputPath),csvVoltage) )
+			labels = DataIOUtils.LoadArray(DataIOUtils.ConvertInputFile(self.path / 'labels.csv',self.path / 'labels.npy'))
+			self.assertTrue( np.issubdtype(labels.dtype,np.integer) )
+			self.assertTrue( np.array_equal(labels,self.labels) )
+			idPath = DataIOUtils.ConvertInputFile(self.path / 'ids.csv',self.path / 'ids.npy',layout='ids')
+			self.assertEqual( DataIOUtils.LoadIDs(idPath), self.custIDs )
+
+		def test_LoadSingleFileAMI( self ):
+			csvVoltage, csvLabels, csvIDs = DataIOUtils.LoadSingleFileAMI(self.path / 'single.csv')
+			self.assertTrue( np.allclose(csvVoltage,self.voltage) )
+			self.assertTrue( np.array_equal(csvLabels,self.labels) )
+			self.assertEqual( csvIDs, self.custIDs )
+			outputPath = DataIOUtils.ConvertInputFile(self.path / 'single.csv',self.path / 'single.npz',layout='singleFile',chunkRows=10)
+			voltage, labels, custIDs = DataIOUtils.LoadSingleFileAMI(outputPath)
+			self.assertIsInstance( voltage, np.memmap )
+			self.assertTrue( np.array_equal(voltage,csvVoltage) )
+			self.assertTrue( np.array_equal(labels,csvLabels) )
+			self.assertEqual( custIDs, csvIDs )
+
+		@unittest.skipIf( not HAS_PYARROW, 'pyarrow is not installed' )
+		def test_ConvertInputFile_arrow( self ):
+			csvVoltage = DataIOUtils.LoadArray(self.path / 'voltage.csv')
+			csvSingle = DataIOUtils.LoadSingleFileAMI(self.path / 'single.csv')
+			for suffix in ['.parquet','.arrow']:
+				voltagePath = DataIOUtils.ConvertInputFile(self.path / 'voltage.csv',self.path / ('voltage' + suffix),chunkRows=7)
+				self.assertTrue( np.array_equal(DataIOUtils.LoadArray(voltagePath),csvVoltage) )
+				idPath = DataIOUtils.ConvertInputFile(self.path / 'ids.csv',self.path / ('ids' + suffix),layout='ids')
+				self.assertEqual( DataIOUtils.LoadIDs(idPath), self.custIDs )
+				singlePath = DataIOUtils.ConvertInputFile(self.path / 'single.csv',self.path / ('single' + suffix),layout='singleFile',chunkRows=10)
+				voltage, labels, custIDs = DataIOUtils.LoadSingleFileAMI(singlePath)
+				self.assertTrue( np.array_equal(voltage,csvSingle[0]) )
+				self.assertTrue( np.array_equal(labels,csvSingle[1]) )
+				self.assertEqual( custIDs, csvSingle[2] )
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# Python Library Imports
+import unittest
+import numpy as np
+
+# Package Code
+from sdsmc.CommonUtils import PreprocessingUtils
+
+
+# Reference implementation of the original per-customer pre-processing
+def ReferencePreprocess(timeseries,voltageLevels,highValue=1.1,lowValue=0.8):
+	voltagePU = np.zeros((timeseries.shape),dtype=float)
+	for custCtr in range(0,timeseries.shape[1]):
+		currentCust = timeseries[:,custCtr]
+		if np.all(np.isnan(currentCust)):
+			voltagePU[:,custCtr] = currentCust
+			continue
+		meanValue = np.round(np.nanmean(currentCust),decimals=0)
+		index = np.argmin(np.abs(np.array(voltageLevels) - meanValue))
+		voltagePU[:,custCtr] = currentCust / voltageLevels[index]
+	filtered = voltagePU.copy()
+	nanCountPerCust = []
+	for custCtr in range(0,filtered.shape[1]):
+		allIndices = np.where((filtered[:,custCtr] >= highValue) | (filtered[:,custCtr] <= lowValue))[0]
+		filtered[allIndices,custCtr] = np.nan
+		nanCountPerCust.append(len(allIndices))
+	return voltagePU, filtered, np.diff(filtered,n=1,axis=0), nanCountPerCust
+
+
+# Raw AMI voltage in volts with 240V and 120V customers, missing data and bad values
+def CreateRawVoltage(seed=0):
+	rng = np.random.default_rng(seed)
+	voltage = 240 + rng.normal(0,3,(500,30))
+	voltage[:,3] = 120 + rng.normal(0,1,500)
+	voltage[:,4] = np.nan
+	voltage[5:50,6] = np.nan
+	voltage[7,8] = 300
+	voltage[9,9] = 150
+	return voltage
+
+
+class TestingPreprocessingUtils( unittest.TestCase ):
+
+		def test_PreprocessVoltage_matches_reference( self ):
+			voltage = CreateRawVoltage()
+			voltagePU, filtered, deltaVoltage, nanCountPerCust = ReferencePreprocess(voltage,[120,240,7200])
+			# A small block size checks the differences across block boundaries
+			voltageOut, nanCount, outCountPerCust = PreprocessingUtils.PreprocessVoltage(voltage,voltageLevels=[120,240,7200],blockElements=30*7)
+			self.assertTrue( np.array_equal(voltageOut,deltaVoltage,equal_nan=True) )
+			self.assertEqual( outCountPerCust, nanCountPerCust )
+			self.assertEqual( nanCount, 2 )
+			voltageOut = PreprocessingUtils.PreprocessVoltage(voltage,filterFlag=False,deltaFlag=False,blockElements=30*3)[0]
+			self.assertTrue( np.array_equal(voltageOut,voltagePU,equal_nan=True) )
+			self.assertTrue( np.array_equal(PreprocessingUtils.ConvertToPerUnit_Voltage(voltage),voltagePU,equal_nan=True) )
+			filteredOut, nanCount, outCountPerCust = PreprocessingUtils.BadDataFiltering(voltagePU)
+			self.assertTrue( np.array_equal(filteredOut,filtered,equal_nan=True) )
+			self.assertEqual( outCountPerCust, nanCountPerCust )
+
+		def test_PreprocessVoltage_output_array( self ):
+			voltage = CreateRawVoltage(seed=1)
+			deltaVoltage = ReferencePreprocess(voltage,PreprocessingUtils.DEFAULT_VOLTAGE_LEVELS)[2]
+			outputArray = np.zeros((499,30),dtype=np.float32)
+			voltageOut = PreprocessingUtils.PreprocessVoltage(voltage,outputArray=outputArray,blockElements=30*11)[0]
+			self.assertIs( voltageOut, outputArray )
+			self.assertTrue( np.allclose(voltageOut,deltaVoltage,atol=1e-6,equal_nan=True) )
+			self.assertEqual( PreprocessingUtils.PreprocessVoltage(voltage,outputArray=np.zeros((500,30)))[0], -1 )
+			# Unsupported base voltage
+			self.assertEqual( PreprocessingUtils.FindBaseVoltages(voltage * 10), -1 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Python Library Imports
+import unittest
+import tempfile
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+
+# Package Code
+from sdsmc.CommonUtils import ProfilingUtils
+
+
+# CPU bound work for the worker processes
+def SumSquares(numValues):
+	return sum([value*value for value in range(0,numValues)])
+
+
+class TestingProfilingUtils( unittest.TestCase ):
+
+		def test_ProfileStage_disabled( self ):
+			with ProfilingUtils.ProfileStage(-1,'ingest') as stage:
+				ProfilingUtils.RecordArraySizes(stage,voltage=np.zeros((10,4)))
+			self.assertEqual( stage, -1 )
+			self.assertEqual( ProfilingUtils.FinishRunProfile(-1), -1 )
+
+		def test_RunProfile( self ):
+			profile = ProfilingUtils.CreateRunProfile('test','cprofile')
+			with ProfilingUtils.ProfileStage(profile,'preprocessing') as stage:
+				voltage = np.ones((100,20),dtype=np.float32)
+				ProfilingUtils.RecordArraySizes(stage,voltage=voltage,affinity=sparse.eye(20,format='csr'),custID=['a','b'])
+			with ProfilingUtils.ProfileStage(profile,'clustering') as stage:
+				np.linalg.eigh(np.eye(50))
+			with tempfile.TemporaryDirectory() as tempDir:
+				profilePath = Path(tempDir,'profile.json')
+				runProfile = ProfilingUtils.FinishRunProfile(profile,profilePath)
+				with open(profilePath,'r') as file:
+					savedProfile = json.load(file)
+				self.assertTrue( Path(tempDir,'profile.prof').exists() )
+			self.assertEqual( [stage['name'] for stage in savedProfile['stages']], ['preprocessing','clustering'] )
+			arrays = savedProfile['stages'][0]['arrays']
+			self.assertEqual( arrays['voltage']['shape'], [100,20] )
+			self.assertEqual( arrays['voltage']['dtype'], 'float32' )
+			self.assertAlmostEqual( arrays['voltage']['sizeMB'], 8000 / 1024**2 )
+			self.assertEqual( arrays['affinity']['nnz'], 20 )
+			self.assertEqual( arrays['custID']['length'], 2 )
+			for stage in savedProfile['stages']:
+				self.assertTrue( stage['wallTime'] >= 0 )
+				self.assertTrue( stage['cpuTime'] >= 0 )
+			self.assertTrue( runProfile['totalWallTime'] >= sum([stage['wallTime'] for stage in runProfile['stages']]) )
+
+		@unittest.skipIf(ProfilingUtils.resource is None,'resource is not available on this platform')
+		def test_ProfileStage_worker_cpu( self ):
+			profile = ProfilingUtils.CreateRunProfile('test')
+			with ProfilingUtils.ProfileStage(profile,'clustering') as stage:
+				# The workers are counted once the pool has been shut down
+				with ProcessPoolExecutor(max_workers=2) as executor:
+					list(executor.map(SumSquares,[2*10**6]*4))
+			runProfile = ProfilingUtils.FinishRunProfile(profile)
+			stage = runProfile['stages'][0]
+			self.assertTrue( stage['workerCPUTime'] > 0 )
+			self.assertTrue( stage['cpuTime'] >= stage['workerCPUTime'] )
+			self.assertTrue( runProfile['totalWorkerCPUTime'] >= stage['workerCPUTime'] )
+			self.assertTrue( runProfile['totalCPUTime'] >= runProfile['totalWorkerCPUTime'] )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Python Library Imports
+import unittest
+import numpy as np
+from sklearn.cluster import SpectralClustering
+from sklearn.manifold import spectral_embedding
+from sklearn.utils import check_random_state
+from sklearn.metrics import adjusted_rand_score
+from scipy.sparse import csgraph
+
+# Package Code
+from sdsmc.CommonUtils import SpectralUtils
+
+
+class TestingSpectralUtils( unittest.TestCase ):
+
+		def test_SPClustering_MultK_matches_SpectralClustering( self ):
+			rng = np.random.default_rng(0)
+			centers = rng.normal(0,1,(6,20))
+			groupLabels = np.arange(60) % 6
+			features = centers[groupLabels,:] + rng.normal(0,0.05,(60,20))
+			kVector = [3,6,80]
+			allClusterLabels = SpectralUtils.SPClustering_MultK(features,kVector,randomState=0)
+			# k larger than the number of customers is skipped
+			self.assertEqual( allClusterLabels[2], -1 )
+			for kCtr in range(0,2):
+				sp = SpectralClustering(n_clusters=kVector[kCtr],affinity='rbf',random_state=0)
+				self.assertEqual( len(np.unique(allClusterLabels[kCtr])), kVector[kCtr] )
+				self.assertAlmostEqual( adjusted_rand_score(sp.fit_predict(features),allClusterLabels[kCtr]), 1.0 )
+
+		def test_DiscretizeEmbedding_matches_SpectralClustering( self ):
+			rng = np.random.default_rng(4)
+			for numClusters in [2,3,5]:
+				features = rng.normal(0,1,(90,4)) + (np.arange(90) % numClusters)[:,np.newaxis] * 1.5
+				affinity = np.exp(-np.sum((features[:,np.newaxis,:] - features[np.newaxis,:,:])**2,axis=2))
+				sp = SpectralClustering(n_clusters=numClusters,assign_labels='discretize',affinity='precomputed',random_state=0)
+				randomState = check_random_state(0)
+				maps = spectral_embedding(affinity,n_components=numClusters,eigen_solver='arpack',random_state=randomState,drop_first=False)
+				self.assertTrue( np.array_equal(SpectralUtils.DiscretizeEmbedding(maps,randomState),sp.fit_predict(affinity)) )
+
+		def test_SparsifyAffinity( self ):
+			rng = np.random.default_rng(1)
+			affinity = rng.random((50,50))
+			affinity = 0.5 * (affinity + affinity.T)
+			sparseAffinity = SpectralUtils.SparsifyAffinity(affinity,5,blockSize=7)
+			self.assertEqual( (sparseAffinity != sparseAffinity.T).nnz, 0 )
+			self.assertTrue( np.all(sparseAffinity.diagonal() == 0) )
+			# Every row keeps at least its 5 largest off-diagonal entries with the original values
+			np.fill_diagonal(affinity,0)
+			for row in range(0,50):
+				topCols = np.argsort(-affinity[row,:])[:5]
+				self.assertTrue( np.allclose(sparseAffinity[row,topCols].toarray().ravel(),affinity[row,topCols]) )
+
+		def test_SPClustering_MultK_knn( self ):
+			rng = np.random.default_rng(2)
+			centers = rng.normal(0,1,(3,20))
+			groupLabels = np.arange(90) % 3
+			features = centers[groupLabels,:] + rng.normal(0,0.05,(90,20))
+			allClusterLabels = SpectralUtils.SPClustering_MultK(features,[3],randomState=0,affinityMode='knn',numNeighbors=8)
+			self.assertAlmostEqual( adjusted_rand_score(groupLabels,allClusterLabels[0]), 1.0 )
+
+		def test_SPClustering_Precomp_MultK( self ):
+			rng = np.random.default_rng(2)
+			groupLabels = np.arange(90) % 3
+			affinity = 0.05 + 0.9*(groupLabels[:,np.newaxis] == groupLabels[np.newaxis,:]) + rng.uniform(0,0.05,(90,90))
+			affinity = 0.5 * (affinity + affinity.T)
+			allClusterLabels, eigenvalues = SpectralUtils.SPClustering_Precomp_MultK(affinity,[3,4,95],randomState=0)
+			self.assertEqual( allClusterLabels[2], -1 )
+			sp = SpectralClustering(n_clusters=3,n_init=10,assign_labels='discretize',affinity='precomputed',random_state=0)
+			self.assertAlmostEqual( adjusted_rand_score(sp.fit_predict(affinity),allClusterLabels[0]), 1.0 )
+			# The eigenvalues match a full eigendecomposition of the normalized Laplacian
+			laplacian = csgraph.laplacian(affinity,normed=True)
+			self.assertTrue( np.allclose(eigenvalues,np.linalg.eigvalsh(laplacian)[:5],atol=1e-8) )
+
+		def test_SPClustering_Nystrom( self ):
+			rng = np.random.default_rng(3)
+			groupLabels = np.arange(300) % 3
+			affinity = 0.05 + 0.9*(groupLabels[:,np.newaxis] == groupLabels[np.newaxis,:]) + rng.uniform(0,0.05,(300,300))
+			affinity = 0.5 * (affinity + affinity.T)
+			np.fill_diagonal(affinity,0)
+			# With every customer as a landmark the embedding is exact
+			allIndices = np.arange(300)
+			_, eigenvalues = SpectralUtils.NystromEmbedding(affinity,allIndices,3)
+			laplacian = csgraph.laplacian(affinity,normed=True)
+			self.assertTrue( np.allclose(eigenvalues,np.linalg.eigvalsh(laplacian)[:3],atol=1e-6) )
+			landmarkIndices = np.sort(rng.choice(300,30,replace=False))
+			clusterLabels = SpectralUtils.SPClustering_Nystrom(affinity[:,landmarkIndices],landmarkIndices,3,randomState=0)
+			self.assertAlmostEqual( adjusted_rand_score(groupLabels,clusterLabels), 1.0 )
+
+if __name__ == '__main__':
+    unittest.main()
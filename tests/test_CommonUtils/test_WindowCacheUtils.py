@@ -0,0 +1,132 @@
+# Python Library Imports
+import unittest
+import tempfile
+import os
+import io
+import contextlib
+from pathlib import Path
+import numpy as np
+
+# Package Code
+from sdsmc.CommonUtils import SpectralUtils
+from sdsmc.CommonUtils import WindowCacheUtils
+from sdsmc.PhaseIdentification import CA_Ensemble_Funcs as CAE
+from sdsmc.OnlinePhaseChangePoint import OnlineChangepointFunctions as OCF
+
+
+
+class TestingWindowCacheUtils( unittest.TestCase ):
+
+		def test_SPClustering_MultK_Cached( self ):
+			rng = np.random.default_rng(0)
+			features = rng.normal(0,1,(3,50))[np.arange(30) % 3,:] + rng.normal(0,0.1,(30,50))
+			windowIDs = ['cust' + str(custCtr) for custCtr in range(0,30)]
+			with tempfile.TemporaryDirectory() as cachePath:
+				windowCache = WindowCacheUtils.CreateWindowCache(cachePath)
+				uncached = SpectralUtils.SPClustering_MultK(features,[3,6,40],randomState=0)
+				firstLabels = WindowCacheUtils.SPClustering_MultK_Cached(features,[3,6,40],windowCache,windowIDs,randomState=0)
+				self.assertEqual( (windowCache['hits'],windowCache['misses']), (0,2) )
+				secondLabels = WindowCacheUtils.SPClustering_MultK_Cached(features,[6,3,40],windowCache,windowIDs,randomState=0)
+				self.assertEqual( (windowCache['hits'],windowCache['misses']), (2,2) )
+				self.assertTrue( np.array_equal(firstLabels[0],uncached[0]) )
+				self.assertTrue( np.array_equal(firstLabels[1],uncached[1]) )
+				self.assertEqual( firstLabels[2], -1 )
+				self.assertTrue( np.array_equal(secondLabels[0],firstLabels[1]) )
+				self.assertTrue( np.array_equal(secondLabels[1],firstLabels[0]) )
+				# The labels are stored compactly
+				entries = sorted(Path(cachePath).glob('*.npy'))
+				self.assertEqual( len(entries), 2 )
+				self.assertEqual( np.load(entries[0]).dtype, np.uint8 )
+				# A different seed or customer set is a different entry
+				WindowCacheUtils.SPClustering_MultK_Cached(features,[3],windowCache,windowIDs,randomState=1)
+				WindowCacheUtils.SPClustering_MultK_Cached(features,[3],windowCache,windowIDs[::-1],randomState=0)
+				self.assertEqual( windowCache['misses'], 4 )
+
+		def test_cache_default_numNeighbors( self ):
+			rng = np.random.default_rng(7)
+			phaseLabels = np.arange(45) % 3
+			voltage = rng.normal(0,0.01,(96,3))[:,phaseLabels] + rng.normal(0,0.001,(96,45))
+			custID = ['cust' + str(custCtr) for custCtr in range(0,45)]
+			with tempfile.TemporaryDirectory() as cachePath:
+				windowCache = WindowCacheUtils.CreateWindowCache(cachePath)
+				with contextlib.redirect_stdout(io.StringIO()):
+					CAE.CAEnsemble(voltage,[6,12],3,custID,96,printLowWinWarningFlag=False,randomSeed=0,windowAffinityMode='knn',windowCache=windowCache)
+				self.assertEqual( windowCache['misses'], 2 )
+				# The window functions use the same default kNN graph as the ensemble, so the window is read from the cache
+				CAE.ClusterVoltWindow(voltage.transpose(),[6,12],0,'knn',windowCache=windowCache,windowIDs=np.array(custID))
+				self.assertEqual( (windowCache['hits'],windowCache['misses']), (2,2) )
+
+		def test_EvictWindowCache( self ):
+			with tempfile.TemporaryDirectory() as cachePath:
+				windowCache = WindowCacheUtils.CreateWindowCache(cachePath)
+				for entryCtr in range(0,5):
+					WindowCacheUtils.SaveCachedLabels(windowCache,'entry' + str(entryCtr),np.arange(100) % 3)
+					os.utime(Path(cachePath,'entry' + str(entryCtr) + '.npy'),(1000 + entryCtr,1000 + entryCtr))
+				entrySize = Path(cachePath,'entry0.npy').stat().st_size
+				self.assertEqual( windowCache['currentBytes'], 5 * entrySize )
+				# Reading an entry makes it the most recently used
+				self.assertTrue( np.array_equal(WindowCacheUtils.LoadCachedLabels(windowCache,'entry0'),np.arange(100) % 3) )
+				windowCache['maxBytes'] = 3 * entrySize
+				numRemoved = WindowCacheUtils.EvictWindowCache(windowCache,targetFraction=1.0)
+				self.assertEqual( numRemoved, 2 )
+				self.assertEqual( sorted([entry.stem for entry in Path(cachePath).glob('*.npy')]), ['entry0','entry3','entry4'] )
+				self.assertEqual( WindowCacheUtils.LoadCachedLabels(windowCache,'entry1'), -1 )
+
+		def test_cache_shared_between_subsystems( self ):
+			rng = np.random.default_rng(4)
+			phaseLabels = np.arange(45) % 3
+			voltage = rng.normal(0,0.01,(2*96,3))[:,phaseLabels] + rng.normal(0,0.001,(2*96,45))
+			custID = ['cust' + str(custCtr) for custCtr in range(0,45)]
+			with tempfile.TemporaryDirectory() as cachePath:
+				windowCache = WindowCacheUtils.CreateWindowCache(cachePath)
+				with contextlib.redirect_stdout(io.StringIO()):
+					CAE.CAEnsemble(voltage,[6,12],3,custID,96,printLowWinWarningFlag=False,windowCache=windowCache)
+				self.assertEqual( windowCache['misses'], 4 )
+				# The changepoint detection clusters the first window for k = 3, 6, and 12
+				OCF.SpC_MultKWin_SingleWindow(voltage[0:96,:],[3,6,12],custID,(phaseLabels + 1).reshape(1,-1),windowCache)
+				self.assertEqual( windowCache['hits'], 2 )
+				self.assertEqual( windowCache['misses'], 5 )
+
+		def test_cache_size_limit_with_workers( self ):
+			rng = np.random.default_rng(5)
+			phaseLabels = np.arange(45) % 3
+			voltage = rng.normal(0,0.01,(40*48,3))[:,phaseLabels] + rng.normal(0,0.001,(40*48,45))
+			custID = ['cust' + str(custCtr) for custCtr in range(0,45)]
+			for numJobs in [1,2]:
+				with tempfile.TemporaryDirectory() as cachePath:
+					windowCache = WindowCacheUtils.CreateWindowCache(cachePath,maxSizeMB=0.01)
+					with contextlib.redirect_stdout(io.StringIO()):
+						CAE.CAEnsemble(voltage,[6,12],3,custID,48,printLowWinWarningFlag=False,numJobs=numJobs,randomSeed=0,windowCache=windowCache)
+					cacheBytes = sum([entry.stat().st_size for entry in Path(cachePath).glob('*.npy')])
+					self.assertTrue( cacheBytes <= windowCache['maxBytes'] )
+					self.assertEqual( windowCache['currentBytes'], cacheBytes )
+					self.assertTrue( cacheBytes > 0 )
+
+		def test_cache_MultiWindowSize( self ):
+			rng = np.random.default_rng(6)
+			phaseLabels = np.arange(45) % 3
+			voltage = rng.normal(0,0.01,(4*48,3))[:,phaseLabels] + rng.normal(0,0.001,(4*48,45))
+			custID = ['cust' + str(custCtr) for custCtr in range(0,45)]
+			with tempfile.TemporaryDirectory() as cachePath:
+				windowCache = WindowCacheUtils.CreateWindowCache(cachePath)
+				with contextlib.redirect_stdout(io.StringIO()):
+					allResults, timing = CAE.CAEnsemble_MultiWindowSize(voltage,[6,12],3,custID,[48,96],printLowWinWarningFlag=False,randomSeed=0,windowCache=windowCache)
+				self.assertEqual( windowCache['misses'], 12 )
+				# The 48 measurement windows were already clustered with the same settings
+				with contextlib.redirect_stdout(io.StringIO()):
+					results = CAE.CAEnsemble(voltage,[6,12],3,custID,48,printLowWinWarningFlag=False,randomSeed=0,windowCache=windowCache)
+				self.assertEqual( windowCache['hits'], 8 )
+				self.assertEqual( windowCache['misses'], 12 )
+				self.assertTrue( np.array_equal(results[0],allResults[48]['finalClusterLabels']) )
+			# With worker processes the cache size limit is enforced after each batch
+			with tempfile.TemporaryDirectory() as cachePath:
+				windowCache = WindowCacheUtils.CreateWindowCache(cachePath,maxSizeMB=0.002)
+				with contextlib.redirect_stdout(io.StringIO()):
+					CAE.CAEnsemble_MultiWindowSize(voltage,[6,12],3,custID,[48,96],printLowWinWarningFlag=False,numJobs=2,randomSeed=0,windowCache=windowCache)
+				cacheBytes = sum([entry.stat().st_size for entry in Path(cachePath).glob('*.npy')])
+				self.assertTrue( cacheBytes <= windowCache['maxBytes'] )
+				self.assertEqual( windowCache['currentBytes'], cacheBytes )
+				self.assertTrue( cacheBytes > 0 )
+
+if __name__ == '__main__':
+    unittest.main()
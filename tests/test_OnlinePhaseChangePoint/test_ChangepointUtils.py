@@ -0,0 +1,37 @@
+# Python Library Imports
+import unittest
+import numpy as np
+
+# Package Code
+from sdsmc.OnlinePhaseChangePoint import ChangepointUtils as CPUtils
+
+
+class TestingChangepointUtils( unittest.TestCase ):
+
+		def test_MissingData_VarInt_Vectorized( self ):
+			voltage = np.ones((200,50))
+			missVoltage = CPUtils.MissingData_VarInt_Vectorized(voltage,10,3,8,randomState=np.random.default_rng(0),blockSize=16)
+			missingMask = np.isnan(missVoltage)
+			self.assertTrue( np.all(np.sum(missingMask,axis=0) == 20) )
+			self.assertFalse( np.any(np.isnan(voltage)) )
+			self.assertEqual( CPUtils.MissingData_VarInt_Vectorized(voltage,1,3,8), -1 )
+
+		def test_CreateSyntheticFeederData( self ):
+			voltage, custID, phaseLabels, numPhases = CPUtils.CreateSyntheticFeederData(100,500,percentMultiPhase=20,percentThreePhase=50,percentMissing=2,randomSeed=0)
+			self.assertEqual( voltage.shape, (500,130) )
+			self.assertEqual( len(custID), 130 )
+			self.assertEqual( phaseLabels.shape, (1,130) )
+			self.assertTrue( np.all(np.sum(np.isnan(voltage),axis=0) == 10) )
+			self.assertTrue( abs(np.nanmean(voltage) - 240) < 5 )
+			self.assertEqual( np.sum(numPhases == 3), 30 )
+			self.assertEqual( np.sum(numPhases == 2), 20 )
+			# Each datastream of a multi-phase customer is on a different phase
+			custIDArray = np.array(custID)
+			for currentID in np.unique(custIDArray[numPhases[0,:] > 1]):
+				custPhases = phaseLabels[0,custIDArray == currentID]
+				self.assertEqual( len(np.unique(custPhases)), len(custPhases) )
+			repeatVoltage = CPUtils.CreateSyntheticFeederData(100,500,percentMultiPhase=20,percentMissing=2,randomSeed=0)[0]
+			self.assertTrue( np.array_equal(voltage,repeatVoltage,equal_nan=True) )
+
+if __name__ == '__main__':
+    unittest.main()
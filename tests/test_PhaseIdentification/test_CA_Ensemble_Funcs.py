@@ -0,0 +1,354 @@
+# Python Library Imports
+import unittest
+import io
+import contextlib
+import tempfile
+import numpy as np
+
+# Package Code
+from sdsmc.PhaseIdentification import PhaseIdent_Utils as PIUtils
+from sdsmc.PhaseIdentification import CA_Ensemble_Funcs as CAE
+
+
+# Reference implementation of the original per-customer co-association update
+def ReferenceUpdateAggWM(clusterLabels,custID,currentIDs,aggWM,windowCtr):
+	allIndices = []
+	custIDStr = np.array(custID,dtype=str)
+	for custCtr in range(0,len(currentIDs)):
+		custIndex = np.where(currentIDs[custCtr]==custIDStr)[0][0]
+		allIndices.append(custIndex)
+		updateIndices = np.where(clusterLabels==clusterLabels[custCtr])[0]
+		updateIndicesTrue = np.where(np.isin(custIDStr,currentIDs[updateIndices]))[0]
+		aggWM[custIndex,updateIndicesTrue] = aggWM[custIndex,updateIndicesTrue] + 1
+	if len(custID) == len(currentIDs):
+		windowCtr = windowCtr + 1
+	else:
+		for custCtr in range(0,len(allIndices)):
+			windowCtr[allIndices[custCtr],allIndices] = windowCtr[allIndices[custCtr],allIndices] + 1
+	return aggWM, windowCtr
+
+
+# Synthetic per-unit delta voltage with three phase groups
+def CreateSyntheticVoltage(numCust,numMeas,seed=0):
+	rng = np.random.default_rng(seed)
+	phaseLabels = np.arange(numCust) % 3
+	phaseSignals = rng.normal(0,0.01,(numMeas,3))
+	voltage = phaseSignals[:,phaseLabels] + rng.normal(0,0.001,(numMeas,numCust))
+	return voltage, phaseLabels
+
+
+class TestingCAEnsemble( unittest.TestCase ):
+
+		def test_UpdateAggWM_Indexed_matches_reference( self ):
+			rng = np.random.default_rng(1)
+			numCust = 40
+			custID = ['cust' + str(custCtr) for custCtr in range(0,numCust)]
+			custIndexMap = PIUtils.CreateCustIndexMap(custID)
+			aggWM = PIUtils.CreateAggWeightMatrix(custID)
+			windowCtr = PIUtils.CreateAggWeightMatrix(custID)
+			aggWMRef = PIUtils.CreateAggWeightMatrix(custID)
+			windowCtrRef = PIUtils.CreateAggWeightMatrix(custID)
+			for windowCtrIter in range(0,10):
+				# Alternate between windows with all customers and windows with missing customers
+				if windowCtrIter % 2 == 0:
+					present = np.arange(numCust)
+				else:
+					present = np.sort(rng.choice(numCust,size=25,replace=False))
+				currentIDs = np.array(custID)[present]
+				clusterLabels = rng.integers(0,4,len(present))
+				currentIndices = PIUtils.GetCustIndices(currentIDs,custIndexMap)
+				aggWM, windowCtr = PIUtils.UpdateAggWM_Indexed(clusterLabels,currentIndices,aggWM,windowCtr)
+				aggWMRef, windowCtrRef = ReferenceUpdateAggWM(clusterLabels,custID,currentIDs,aggWMRef,windowCtrRef)
+			self.assertTrue( np.array_equal(aggWM,aggWMRef) )
+			self.assertTrue( np.array_equal(windowCtr,windowCtrRef) )
+
+		def test_CAEnsemble_synthetic( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(30,4*48)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,30)]
+			numPhases = np.ones((1,30),dtype=int)
+			# Customer 0 is missing data in every window and should receive no votes
+			voltage[::10,0] = np.nan
+			finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False)
+			self.assertEqual( noVotesIDs, ['cust0'] )
+			self.assertEqual( len(clusteredIDs), 29 )
+			self.assertEqual( caMatrix.shape, (29,29) )
+			self.assertTrue( np.array_equal(custWindowCounts[1:],np.ones(29,dtype=int)*4) )
+			# The three synthetic phase groups should be recovered exactly
+			for label in np.unique(finalClusterLabels):
+				self.assertEqual( len(np.unique(phaseLabels[1:][finalClusterLabels==label])), 1 )
+
+		def test_CAEnsemble_parallel_matches_serial( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(30,6*48,seed=2)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,30)]
+			numPhases = np.ones((1,30),dtype=int)
+			voltage[50:60,5] = np.nan
+			serialResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0)
+			parallelResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,numJobs=2,randomSeed=0)
+			self.assertTrue( np.array_equal(serialResults[4],parallelResults[4]) )
+			self.assertTrue( np.array_equal(serialResults[5],parallelResults[5]) )
+			self.assertTrue( np.array_equal(serialResults[0],parallelResults[0]) )
+
+		def test_CAEnsemble_knn_modes( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(60,4*48,seed=3)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			numPhases = np.ones((1,60),dtype=int)
+			results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,windowAffinityMode='knn',finalClusterMode='knn',numNeighbors=10)
+			finalClusterLabels = results[0]
+			self.assertEqual( len(np.unique(finalClusterLabels)), 3 )
+			for label in np.unique(finalClusterLabels):
+				self.assertEqual( len(np.unique(phaseLabels[finalClusterLabels==label])), 1 )
+
+		def test_CAEnsemble_packed_storage( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(30,4*48,seed=4)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,30)]
+			numPhases = np.ones((1,30),dtype=int)
+			numPhases[0,3:6] = 3
+			voltage[0,7] = np.nan
+			voltage[:,9] = np.nan
+			denseResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0)
+			packedResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,storageMode='packed',returnPackedFlag=True)
+			packedWM = packedResults[4]
+			self.assertEqual( packedWM['aggWM'].dtype, np.uint8 )
+			self.assertEqual( packedResults[2], ['cust9'] )
+			self.assertTrue( np.array_equal(denseResults[3],packedResults[3]) )
+			aggWM_Norm = PIUtils.UnpackAggWM_Norm(packedWM,packedWM['clusteredIndices'])
+			aggWM_Norm[aggWM_Norm==0] = 0.00001
+			self.assertTrue( np.array_equal(aggWM_Norm,denseResults[4]) )
+			self.assertTrue( np.array_equal(denseResults[0],packedResults[0]) )
+			# By default the packed storage returns the same dense matrix as the dense storage
+			for finalClusterMode in ['dense','knn']:
+				denseResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,finalClusterMode=finalClusterMode)
+				packedResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,finalClusterMode=finalClusterMode,storageMode='packed')
+				self.assertTrue( isinstance(packedResults[4],np.ndarray) )
+				self.assertTrue( np.allclose(packedResults[4],denseResults[4],rtol=0,atol=1e-12) )
+
+		def test_CAEnsemble_packed_memmap_knn( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(60,4*48,seed=5)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			numPhases = np.ones((1,60),dtype=int)
+			with tempfile.TemporaryDirectory() as storagePath:
+				results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,finalClusterMode='knn',numNeighbors=10,storageMode='packed',storagePath=storagePath,returnPackedFlag=True)
+				self.assertTrue( isinstance(results[4]['aggWM'],np.memmap) )
+				for label in np.unique(results[0]):
+					self.assertEqual( len(np.unique(phaseLabels[results[0]==label])), 1 )
+				del results
+
+		def test_EnsembleState_incremental_matches_CAEnsemble( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(30,6*48,seed=6)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,30)]
+			numPhases = np.ones((1,30),dtype=int)
+			numPhases[0,0:2] = 2
+			voltage[100:110,4] = np.nan
+			for storageMode in ['dense','packed']:
+				fullResults = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,storageMode=storageMode)
+				ensState = CAE.CreateEnsembleState(custID,[3,6],48,numPhases=numPhases,randomSeed=0,storageMode=storageMode)
+				# The first update ends part way through a window, the remainder is buffered
+				ensState = CAE.UpdateEnsembleState(ensState,voltage[:130,:])
+				self.assertEqual( ensState['numWindows'], 2 )
+				with tempfile.TemporaryDirectory() as tempDir:
+					statePath = tempDir + '/ensState.npz'
+					CAE.SaveEnsembleState(ensState,statePath)
+					ensState = CAE.LoadEnsembleState(statePath)
+				ensState = CAE.UpdateEnsembleState(ensState,voltage[130:,:])
+				incResults = CAE.ClusterEnsembleState(ensState,3,printLowWinWarningFlag=False)
+				self.assertEqual( ensState['numWindows'], 6 )
+				self.assertTrue( np.array_equal(fullResults[0],incResults[0]) )
+				self.assertTrue( np.array_equal(fullResults[5],incResults[5]) )
+				self.assertTrue( np.array_equal(fullResults[4],incResults[4]) )
+				# The final clustering does not modify the accumulators
+				repeatResults = CAE.ClusterEnsembleState(ensState,3,printLowWinWarningFlag=False)
+				self.assertTrue( np.array_equal(incResults[0],repeatResults[0]) )
+
+		def test_EnsembleState_packed_counts_upcast( self ):
+			custID = ['cust' + str(custCtr) for custCtr in range(0,12)]
+			validWindows = np.ones((300,12),dtype=bool)
+			validWindows[::3,5] = False
+			windowCtrRef = PIUtils.CalcWindowPairCounts(validWindows,np.ones(300,dtype=int))
+			with tempfile.TemporaryDirectory() as tempDir:
+				for storagePath in [-1,tempDir + '/storage']:
+					ensState = CAE.CreateEnsembleState(custID,[3],48,storageMode='packed',storagePath=storagePath,maxWindows=10)
+					self.assertEqual( ensState['aggWM']['windowCtr'].dtype, np.uint8 )
+					ensState = CAE.UpdateEnsembleCounts(ensState,validWindows[0:200,:])
+					# The numpy integer seed is saved, and the loaded state keeps the uint8 counts
+					ensState['randomSeed'] = np.int64(3)
+					statePath = tempDir + '/ensState.npz'
+					CAE.SaveEnsembleState(ensState,statePath)
+					ensState = CAE.LoadEnsembleState(statePath,storagePath)
+					self.assertEqual( ensState['randomSeed'], 3 )
+					self.assertEqual( ensState['aggWM']['windowCtr'].dtype, np.uint8 )
+					ensState = CAE.UpdateEnsembleCounts(ensState,validWindows[200:,:])
+					self.assertEqual( ensState['aggWM']['windowCtr'].dtype, np.uint16 )
+					self.assertEqual( ensState['aggWM']['aggWM'].dtype, np.uint16 )
+					if storagePath != -1:
+						self.assertTrue( isinstance(ensState['aggWM']['windowCtr'],np.memmap) )
+					positions = PIUtils.GetPackedPositions(ensState['aggWM'],np.arange(12),np.arange(12))
+					self.assertTrue( np.array_equal(ensState['aggWM']['windowCtr'][positions],windowCtrRef) )
+					del ensState
+			# Without maxWindows the counts start at the smallest type
+			ensState = CAE.CreateEnsembleState(custID,[3],48,storageMode='packed')
+			self.assertEqual( ensState['aggWM']['aggWM'].dtype, np.uint8 )
+
+		def test_EnsembleState_packed_multiphase_pairs( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(30,4*48,seed=6)
+			# Sorting by phase puts datastreams on the same phase next to each other, so the multi-phase pairs have non-zero counts
+			voltage = voltage[:,np.argsort(phaseLabels,kind='stable')]
+			custID = ['cust' + str(custCtr) for custCtr in range(0,30)]
+			numPhases = np.ones((1,30),dtype=int)
+			numPhases[0,0:2] = 2
+			numPhases[0,10:13] = 3
+			denseState = CAE.UpdateEnsembleState(CAE.CreateEnsembleState(custID,[3,6],48,numPhases=numPhases,randomSeed=0),voltage)
+			packedState = CAE.UpdateEnsembleState(CAE.CreateEnsembleState(custID,[3,6],48,numPhases=numPhases,randomSeed=0,storageMode='packed'),voltage)
+			countsBefore = np.array(packedState['aggWM']['aggWM'])
+			denseResults = CAE.ClusterEnsembleState(denseState,3,printLowWinWarningFlag=False)
+			packedResults = CAE.ClusterEnsembleState(packedState,3,printLowWinWarningFlag=False,returnPackedFlag=True)
+			packedWM = packedResults[4]
+			# The accumulators are unchanged and the returned dict is separate from the state
+			self.assertTrue( np.array_equal(packedState['aggWM']['aggWM'],countsBefore) )
+			self.assertFalse( 'clusteredIndices' in packedState['aggWM'] )
+			self.assertFalse( 'zeroPositions' in packedState['aggWM'] )
+			self.assertEqual( len(packedWM['zeroPositions']), 4 )
+			self.assertTrue( np.all(countsBefore[packedWM['zeroPositions']] > 0) )
+			aggWM_Norm = PIUtils.UnpackAggWM_Norm(packedWM,packedWM['clusteredIndices'])
+			self.assertEqual( aggWM_Norm[0,1], 0 )
+			self.assertEqual( aggWM_Norm[12,10], 0 )
+			aggWM_Norm[aggWM_Norm==0] = 0.00001
+			self.assertTrue( np.array_equal(aggWM_Norm,denseResults[4]) )
+			self.assertTrue( np.array_equal(denseResults[0],packedResults[0]) )
+
+		def test_SweepKFinal( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(60,4*48,seed=8)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			for storageMode in ['dense','packed']:
+				results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,printLowWinWarningFlag=False,randomSeed=0,storageMode=storageMode,returnPackedFlag=(storageMode=='packed'))
+				clusteredIDs, caMatrix = results[3], results[4]
+				sweepResults = CAE.SweepKFinal(caMatrix,[6,2,3,4,100],clusteredIDs,clusteredPhaseLabels=(phaseLabels+1).reshape(1,-1),randomSeed=0)
+				self.assertEqual( sweepResults['kFinalVector'], [2,3,4,6] )
+				self.assertEqual( sweepResults['recommendedK'], 3 )
+				self.assertEqual( len(sweepResults['eigenvalues']), 7 )
+				self.assertTrue( np.all(np.diff(sweepResults['eigenvalues']) > -1e-8) )
+				# Each cluster of the recommended k is a single true phase
+				kFinalLabels = sweepResults['finalClusterLabels'][1]
+				self.assertEqual( len(np.unique(kFinalLabels)), 3 )
+				for label in np.unique(kFinalLabels):
+					self.assertEqual( len(np.unique(phaseLabels[kFinalLabels==label])), 1 )
+				self.assertTrue( np.array_equal(sweepResults['predictedPhases'][1],(phaseLabels+1).reshape(1,-1)) )
+				self.assertEqual( len(sweepResults['allSC'][1]), 60 )
+
+		def test_SweepKFinal_multiphase_packed_matches_dense( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(60,4*48,seed=8)
+			# Sorting by phase puts datastreams on the same phase next to each other, so the multi-phase pairs have non-zero counts
+			sortIndices = np.argsort(phaseLabels,kind='stable')
+			voltage = voltage[:,sortIndices]
+			phaseLabels = phaseLabels[sortIndices]
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			numPhases = np.ones((1,60),dtype=int)
+			numPhases[0,0:2] = 2
+			numPhases[0,20:23] = 3
+			numPhases[0,40:42] = 2
+			allResults = {}
+			for storageMode in ['dense','packed']:
+				results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,numPhases=numPhases,printLowWinWarningFlag=False,randomSeed=0,storageMode=storageMode,returnPackedFlag=(storageMode=='packed'))
+				caMatrix = results[4]
+				sweepResults = CAE.SweepKFinal(caMatrix,[2,3,4],results[3],clusteredPhaseLabels=(phaseLabels+1).reshape(1,-1),randomSeed=0)
+				approxResults = CAE.EvaluateNystromApproximation(caMatrix,3,numLandmarks=20,sampleSize=40,randomSeed=0)
+				allResults[storageMode] = (sweepResults,approxResults)
+			denseSweep, denseApprox = allResults['dense']
+			packedSweep, packedApprox = allResults['packed']
+			self.assertEqual( denseSweep['recommendedK'], packedSweep['recommendedK'] )
+			self.assertTrue( np.allclose(denseSweep['eigenvalues'],packedSweep['eigenvalues']) )
+			for kCtr in range(0,3):
+				self.assertTrue( np.array_equal(denseSweep['finalClusterLabels'][kCtr],packedSweep['finalClusterLabels'][kCtr]) )
+				self.assertTrue( np.allclose(denseSweep['allSC'][kCtr],packedSweep['allSC'][kCtr]) )
+			self.assertTrue( np.allclose(denseSweep['meanSC'],packedSweep['meanSC']) )
+			self.assertAlmostEqual( denseApprox['labelAgreement'], packedApprox['labelAgreement'] )
+			self.assertAlmostEqual( denseApprox['affinityError'], packedApprox['affinityError'] )
+			self.assertTrue( np.allclose(denseApprox['eigenvalueError'],packedApprox['eigenvalueError']) )
+
+		def test_CAEnsemble_nystrom( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(80,4*48,seed=6)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,80)]
+			# The dense storage already holds the full matrix, so the Nystrom mode is rejected
+			with contextlib.redirect_stdout(io.StringIO()):
+				results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,printLowWinWarningFlag=False,randomSeed=0,finalClusterMode='nystrom',numLandmarks=20)
+			self.assertEqual( results, (-1,-1,-1,-1,-1,-1) )
+			for returnPackedFlag in [False,True]:
+				results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,printLowWinWarningFlag=False,randomSeed=0,finalClusterMode='nystrom',numLandmarks=20,storageMode='packed',returnPackedFlag=returnPackedFlag)
+				finalClusterLabels = results[0]
+				self.assertEqual( len(np.unique(finalClusterLabels)), 3 )
+				for label in np.unique(finalClusterLabels):
+					self.assertEqual( len(np.unique(phaseLabels[finalClusterLabels==label])), 1 )
+				approxResults = CAE.EvaluateNystromApproximation(results[4],3,numLandmarks=20,sampleSize=60,randomSeed=0)
+				self.assertEqual( approxResults['sampleSize'], 60 )
+				self.assertEqual( approxResults['numLandmarks'], 15 )
+				self.assertAlmostEqual( approxResults['labelAgreement'], 1.0 )
+				self.assertTrue( approxResults['affinityError'] < 0.2 )
+				self.assertTrue( np.all(approxResults['eigenvalueError'] < 0.1) )
+
+		def test_CAEnsemble_MultiWindowSize_matches_CAEnsemble( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(40,10*48+7,seed=3)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,40)]
+			voltage[100:130,5] = np.nan
+			voltage[:,7] = np.nan
+			allResults, timing = CAE.CAEnsemble_MultiWindowSize(voltage,[3,6],3,custID,[48,96,144],printLowWinWarningFlag=False,randomSeed=0)
+			self.assertEqual( sorted(allResults.keys()), [48,96,144] )
+			self.assertTrue( timing['total'] >= timing['ensemble'] )
+			for windowSize in [48,96,144]:
+				results = CAE.CAEnsemble(voltage,[3,6],3,custID,windowSize,printLowWinWarningFlag=False,randomSeed=0)
+				self.assertEqual( allResults[windowSize]['numWindows'], (10*48+7) // windowSize )
+				self.assertEqual( allResults[windowSize]['noVotesIDs'], ['cust7'] )
+				self.assertTrue( np.array_equal(allResults[windowSize]['finalClusterLabels'],results[0]) )
+				self.assertTrue( np.array_equal(allResults[windowSize]['caMatrix'],results[4]) )
+				self.assertTrue( np.array_equal(allResults[windowSize]['custWindowCounts'],results[5]) )
+
+		def test_EnsembleState_early_stopping( self ):
+			voltage, phaseLabels = CreateSyntheticVoltage(60,40*48,seed=2)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			self.assertEqual( list(CAE.CreateWindowOrder(8,'stratified')), [0,4,2,6,1,5,3,7] )
+			# The window order does not change the result when every window is clustered
+			fullState = CAE.UpdateEnsembleState(CAE.CreateEnsembleState(custID,[3,6],48,randomSeed=0),voltage)
+			randomState = CAE.UpdateEnsembleState(CAE.CreateEnsembleState(custID,[3,6],48,randomSeed=0),voltage,windowOrder='random')
+			self.assertTrue( np.array_equal(fullState['aggWM'],randomState['aggWM']) )
+			for storageMode in ['dense','packed']:
+				ensState = CAE.CreateEnsembleState(custID,[3,6],48,randomSeed=0,storageMode=storageMode)
+				ensState = CAE.UpdateEnsembleState(ensState,voltage,windowOrder='stratified',convergenceTol=0.01,checkInterval=4)
+				self.assertEqual( ensState['numWindows'], 40 )
+				self.assertTrue( ensState['numWindowsClustered'] < 40 )
+				self.assertEqual( ensState['numWindowsClustered'] % 4, 0 )
+				# The window counts only include the clustered windows
+				self.assertTrue( np.all(ensState['custWindowCounts'] == ensState['numWindowsClustered']) )
+				results = CAE.ClusterEnsembleState(ensState,3,printLowWinWarningFlag=False)
+				for label in np.unique(results[0]):
+					self.assertEqual( len(np.unique(phaseLabels[results[0]==label])), 1 )
+			# A zero time budget stops after the first chunk
+			results = CAE.CAEnsemble(voltage,[3,6],3,custID,48,printLowWinWarningFlag=False,randomSeed=0,timeBudget=0)
+			self.assertTrue( np.all(results[5] == 2) )
+
+		def test_WindowValidity_counts_match_reference( self ):
+			rng = np.random.default_rng(7)
+			numCust = 25
+			kVector = [3,6,12]
+			custID = ['cust' + str(custCtr) for custCtr in range(0,numCust)]
+			voltage = rng.normal(0,1,(10*20+7,numCust))
+			voltage[rng.random(voltage.shape) < 0.004] = np.nan
+			voltage[40:60,:18] = np.nan
+			validWindows = PIUtils.CreateWindowValidityMatrix(voltage,20,blockElements=900)
+			self.assertEqual( validWindows.shape, (10,numCust) )
+			windowCtrRef = PIUtils.CreateAggWeightMatrix(custID)
+			custWindowCountsRef = np.zeros(numCust,dtype=int)
+			for ensCtr in range(0,10):
+				currentDistances,currentIDs = PIUtils.CleanVoltWindowNoLabels(PIUtils.GetVoltWindow(voltage,20,ensCtr),custID)
+				self.assertTrue( np.array_equal(np.array(custID)[validWindows[ensCtr,:]],currentIDs) )
+				custWindowCountsRef = PIUtils.UpdateCustWindowCounts(custWindowCountsRef,currentIDs,custID)
+				for k in kVector:
+					if len(currentIDs) > k:
+						_, windowCtrRef = ReferenceUpdateAggWM(np.zeros(len(currentIDs)),custID,currentIDs,PIUtils.CreateAggWeightMatrix(custID),windowCtrRef)
+			windowWeights = np.sum(np.sum(validWindows,axis=1)[:,np.newaxis] > np.array(kVector)[np.newaxis,:],axis=1)
+			self.assertTrue( np.array_equal(np.sum(validWindows,axis=0),custWindowCountsRef) )
+			self.assertTrue( np.array_equal(PIUtils.CalcWindowPairCounts(validWindows,windowWeights),windowCtrRef) )
+			packedWM = PIUtils.CreatePackedAggWM(numCust,30)
+			packedWM = PIUtils.AddPackedWindowCounts(packedWM,validWindows,windowWeights,blockElements=100)
+			positions = PIUtils.GetPackedPositions(packedWM,np.arange(numCust),np.arange(numCust))
+			self.assertTrue( np.array_equal(packedWM['windowCtr'][positions],windowCtrRef) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Python Library Imports
+import unittest
+import io
+import contextlib
+import numpy as np
+from scipy import sparse
+
+# Package Code
+from sdsmc.PhaseIdentification import FeederPartitioning as FP
+
+
+# Synthetic per-unit delta voltage for several independent feeders with three phases each
+def CreateSyntheticFeeders(numFeeders,custPerFeeder,numMeas,seed=0):
+	rng = np.random.default_rng(seed)
+	allVoltage = []
+	allPhases = []
+	for feederCtr in range(0,numFeeders):
+		phaseLabels = np.arange(custPerFeeder) % 3
+		feederSignal = rng.normal(0,0.01,(numMeas,1))
+		phaseSignals = rng.normal(0,0.005,(numMeas,3))
+		allVoltage.append(feederSignal + phaseSignals[:,phaseLabels] + rng.normal(0,0.001,(numMeas,custPerFeeder)))
+		allPhases.append(phaseLabels + 3*feederCtr)
+	return np.concatenate(allVoltage,axis=1), np.concatenate(allPhases)
+
+
+class TestingFeederPartitioning( unittest.TestCase ):
+
+		def test_PartitionCustomers( self ):
+			voltage, truePhases = CreateSyntheticFeeders(3,30,500)
+			trueFeeders = truePhases // 3
+			voltage[10:20,5] = np.nan
+			groupLabels = FP.PartitionCustomers(voltage,corrThresh=0.3)
+			self.assertEqual( len(np.unique(groupLabels)), 3 )
+			for groupLabel in np.unique(groupLabels):
+				self.assertEqual( len(np.unique(trueFeeders[groupLabels==groupLabel])), 1 )
+			feederIDs = np.array(['feeder' + str(feeder) for feeder in trueFeeders])[np.newaxis,:]
+			self.assertTrue( np.array_equal(FP.PartitionCustomers(voltage,feederIDs=feederIDs),trueFeeders) )
+
+		def test_CAEnsemble_Partitioned( self ):
+			voltage, truePhases = CreateSyntheticFeeders(2,30,4*48,seed=1)
+			# A third group is too small to cluster and is left out of the results
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			groupLabels = truePhases // 3
+			groupLabels[:2] = 5
+			voltage[:,40] = np.nan
+			results = FP.CAEnsemble_Partitioned(voltage,[3,6],3,custID,48,groupLabels,printLowWinWarningFlag=False,randomSeed=0,minGroupSize=5,numJobs=2)
+			finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = results
+			self.assertEqual( noVotesIDs, ['cust0','cust1','cust40'] )
+			self.assertTrue( sparse.issparse(caMatrix) )
+			self.assertEqual( caMatrix.shape, (57,57) )
+			self.assertEqual( len(np.unique(finalClusterLabels)), 6 )
+			# Customers in different groups are never associated
+			self.assertEqual( caMatrix[:28,28:].nnz, 0 )
+			clusteredPhases = np.delete(truePhases,noVotesIndex)
+			for label in np.unique(finalClusterLabels):
+				self.assertEqual( len(np.unique(clusteredPhases[finalClusterLabels==label])), 1 )
+
+		def test_CAEnsemble_Partitioned_small_groups( self ):
+			voltage, truePhases = CreateSyntheticFeeders(3,30,4*48,seed=2)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,90)]
+			groupLabels = truePhases // 3
+			# Two small groups from different feeders are clustered separately, with k limited to the group size
+			groupLabels[0:5] = 3
+			groupLabels[30:34] = 4
+			# A group smaller than the smallest value of k cannot be clustered
+			groupLabels[60:62] = 5
+			with contextlib.redirect_stdout(io.StringIO()) as printOutput:
+				results = FP.CAEnsemble_Partitioned(voltage,[3,6],6,custID,48,groupLabels,printLowWinWarningFlag=False,randomSeed=0)
+			self.assertTrue( 'Warning!  2 customers' in printOutput.getvalue() )
+			finalClusterLabels,noVotesIndex,noVotesIDs,clusteredIDs,caMatrix,custWindowCounts = results
+			self.assertEqual( noVotesIDs, ['cust60','cust61'] )
+			# 6 clusters in each feeder group, 4 and 3 in the small groups
+			self.assertEqual( len(np.unique(finalClusterLabels)), 6*3 + 4 + 3 )
+			clusteredGroups = np.delete(groupLabels,noVotesIndex)
+			for label in np.unique(finalClusterLabels):
+				self.assertEqual( len(np.unique(clusteredGroups[finalClusterLabels==label])), 1 )
+			sameGroup = clusteredGroups[:,np.newaxis] == clusteredGroups[np.newaxis,:]
+			self.assertEqual( np.count_nonzero(caMatrix.toarray()[~sameGroup]), 0 )
+
+if __name__ == '__main__':
+    unittest.main()
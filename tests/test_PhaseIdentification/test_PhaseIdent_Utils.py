@@ -0,0 +1,183 @@
+# Python Library Imports
+import unittest
+import tempfile
+import io
+import contextlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Package Code
+from sdsmc.PhaseIdentification import PhaseIdent_Utils as PIUtils
+
+
+# Reference implementation of the original per-customer modified silhouette loop
+def ReferenceModifiedSilhouette(caMatrix,finalClusterLabels,predictedPhases,kFinal):
+	aggWMDist = 1 - caMatrix
+	allSC = []
+	for custCtr in range(0,len(finalClusterLabels)):
+		currCluster = finalClusterLabels[custCtr]
+		clusterPhase = predictedPhases[0,custCtr]
+		a = np.mean(aggWMDist[custCtr,np.where(finalClusterLabels==currCluster)[0]])
+		allBs = []
+		allClusterPhases = []
+		for clustCtr in range(0,kFinal):
+			if clustCtr == currCluster:
+				allBs.append(1)
+				allClusterPhases.append(clusterPhase)
+			else:
+				indices = np.where(finalClusterLabels == clustCtr)[0]
+				if len(indices) == 0:
+					continue
+				allBs.append(np.mean(aggWMDist[custCtr,indices]))
+				allClusterPhases.append(predictedPhases[0,indices[0]])
+		sortedBs = np.sort(np.array(allBs))
+		argsortedPhases = np.array(allClusterPhases)[np.argsort(np.array(allBs))]
+		minCtr = 0
+		while (argsortedPhases[minCtr] == clusterPhase) and (sortedBs[minCtr] != 1):
+			minCtr = minCtr + 1
+		b = sortedBs[minCtr]
+		allSC.append((b-a) / max(a,b))
+	return allSC
+
+
+# Reference implementation of the original per-customer unique ID loop
+def ReferenceUniqueIDs(custIDOriginal,phaseLabelsInput,numPhasesSupplied):
+	custIDUnique = []
+	numPhasesNew = np.zeros((1,len(custIDOriginal)),dtype=int)
+	appendCtr = 0
+	for custCtr in range(0,len(custIDOriginal)):
+		currCust = custIDOriginal[custCtr]
+		indices = np.where(np.array(custIDOriginal)==currCust)[0]
+		currLabels = phaseLabelsInput[0,indices]
+		if len(indices) == 1:
+			numPhasesNew[0,custCtr] = 1
+			custIDUnique.append(currCust)
+		elif (len(indices) <= 3) and (not numPhasesSupplied) and (len(np.unique(currLabels)) > 1):
+			numPhasesNew[0,custCtr] = len(indices)
+			custIDUnique.append(currCust + '_' + str(phaseLabelsInput[0,custCtr]))
+		else:
+			if (len(indices) <= 3) and (not numPhasesSupplied):
+				numPhasesNew[0,custCtr] = 1
+			custIDUnique.append(currCust + '_' + str(phaseLabelsInput[0,custCtr]) + '_' + str(appendCtr))
+			appendCtr = appendCtr + 1
+	return custIDUnique, numPhasesNew
+
+
+class TestingPhaseIdentUtils( unittest.TestCase ):
+
+		def test_ModifiedSilhouette_matches_reference( self ):
+			rng = np.random.default_rng(0)
+			numCust = 80
+			kFinal = 7
+			# Cluster 6 is left empty and clusters 0/3 share a phase
+			finalClusterLabels = rng.integers(0,6,numCust)
+			clusterToPhase = np.array([1,2,3,1,2,3,1])
+			predictedPhases = clusterToPhase[finalClusterLabels][np.newaxis,:]
+			caMatrix = rng.random((numCust,numCust))
+			caMatrix = 0.5 * (caMatrix + caMatrix.T)
+			caMatrix[finalClusterLabels[:,np.newaxis]==finalClusterLabels[np.newaxis,:]] += 0.5
+			caMatrix = caMatrix / np.max(caMatrix)
+			np.fill_diagonal(caMatrix,1)
+			clusteredIDs = ['cust' + str(custCtr) for custCtr in range(0,numCust)]
+			referenceSC = ReferenceModifiedSilhouette(caMatrix,finalClusterLabels,predictedPhases,kFinal)
+			allSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinal)
+			self.assertTrue( np.allclose(allSC,referenceSC,rtol=0,atol=1e-12) )
+			blockSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(caMatrix,clusteredIDs,finalClusterLabels,predictedPhases,kFinal,blockSize=9)
+			self.assertTrue( np.allclose(blockSC,referenceSC,rtol=0,atol=1e-12) )
+			sparseSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(sparse.csr_matrix(caMatrix),clusteredIDs,finalClusterLabels,predictedPhases,kFinal)
+			self.assertTrue( np.allclose(sparseSC,referenceSC,rtol=0,atol=1e-12) )
+
+		def test_ModifiedSilhouette_packed( self ):
+			rng = np.random.default_rng(1)
+			numCust = 30
+			packedWM = PIUtils.CreatePackedAggWM(numCust,20)
+			for windowCtr in range(0,20):
+				present = np.sort(rng.choice(numCust,size=25,replace=False))
+				packedWM = PIUtils.UpdatePackedAggWM(rng.integers(0,3,25),present,packedWM)
+			packedWM['clusteredIndices'] = np.arange(numCust)
+			caMatrix = PIUtils.UnpackAggWM_Norm(packedWM,np.arange(numCust))
+			caMatrix[caMatrix==0] = 0.00001
+			finalClusterLabels = rng.integers(0,4,numCust)
+			predictedPhases = np.array([1,2,3,1])[finalClusterLabels][np.newaxis,:]
+			clusteredIDs = list(range(0,numCust))
+			referenceSC = ReferenceModifiedSilhouette(caMatrix,finalClusterLabels,predictedPhases,4)
+			packedSC = PIUtils.Calculate_ModifiedSilhouetteCoefficients(packedWM,clusteredIDs,finalClusterLabels,predictedPhases,4,blockSize=7)
+			self.assertTrue( np.allclose(packedSC,referenceSC,rtol=0,atol=1e-12) )
+
+		def test_Ensure3PhaseCustHaveUniqueID_matches_reference( self ):
+			rng = np.random.default_rng(3)
+			custIDs = []
+			phaseLabels = []
+			for custCtr in range(0,200):
+				numStreams = int(rng.choice([1,1,1,2,3,4]))
+				currLabels = rng.integers(1,4,numStreams)
+				if rng.random() < 0.3:
+					currLabels[:] = currLabels[0]
+				custIDs = custIDs + ['cust' + str(custCtr)] * numStreams
+				phaseLabels = phaseLabels + list(currLabels)
+			phaseLabels = np.array([phaseLabels],dtype=float)
+			groupSizes = np.array([custIDs.count(custID) for custID in custIDs])
+			with tempfile.TemporaryDirectory() as savePath:
+				# numPhases estimated from the phase labels
+				output = io.StringIO()
+				with contextlib.redirect_stdout(output):
+					custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custIDs,phaseLabels,savePath=savePath)
+				referenceIDs, referenceNumPhases = ReferenceUniqueIDs(custIDs,phaseLabels,False)
+				self.assertEqual( custIDUnique, referenceIDs )
+				self.assertTrue( np.array_equal(numPhases,referenceNumPhases) )
+				changedIDs = pd.read_csv(Path(savePath,'ChangedCustomerIDs.csv'))
+				self.assertEqual( list(changedIDs['Unique Customer ID']), [custID for custID in custIDUnique if custID not in custIDs] )
+				# The changed IDs are only written to the csv file
+				self.assertNotIn( 'Original ID:', output.getvalue() )
+				# numPhases supplied by the user
+				numPhasesInput = np.where((groupSizes == 2) | (groupSizes == 3),groupSizes,1)[np.newaxis,:]
+				with contextlib.redirect_stdout(io.StringIO()):
+					custIDUnique, numPhases = PIUtils.Ensure3PhaseCustHaveUniqueID(custIDs,phaseLabels,numPhasesInput=numPhasesInput,savePath=savePath)
+				referenceIDs, referenceNumPhases = ReferenceUniqueIDs(custIDs,phaseLabels,True)
+				self.assertEqual( custIDUnique, referenceIDs )
+				self.assertIs( numPhases, numPhasesInput )
+
+		def test_CreateFullListCustomerResults_matches_reference( self ):
+			rng = np.random.default_rng(5)
+			custID = ['cust' + str(custCtr) for custCtr in range(0,60)]
+			omittedIndices = rng.choice(60,size=8,replace=False)
+			clusteredIndices = np.setdiff1d(np.arange(60),omittedIndices)
+			clusteredIDs = [custID[custCtr] for custCtr in clusteredIndices]
+			noVotesIDs = [custID[custCtr] for custCtr in omittedIndices]
+			phaseLabelsOriginal = rng.integers(1,4,(1,60))
+			phaseLabelsTrue = rng.integers(1,4,(1,60))
+			predictedPhases = rng.integers(1,4,(1,len(clusteredIDs)))
+			allSC = list(rng.random(len(clusteredIDs)))
+			finalClusterLabels = rng.integers(0,7,len(clusteredIDs))
+			results = PIUtils.CreateFullListCustomerResults_CAEns(phaseLabelsOriginal[:,clusteredIndices],phaseLabelsOriginal,finalClusterLabels,clusteredIDs,custID,noVotesIDs,predictedPhases,allSC,phaseLabelsTrue=phaseLabelsTrue)
+			phaseLabelsOrg_FullList, phaseLabelsPred_FullList, allFinalClusterLabels, phaseLabelsTrue_FullList, custID_FullList, allSC_FullList = results
+			referenceIndices = [custID.index(currID) for currID in clusteredIDs + noVotesIDs]
+			self.assertEqual( custID_FullList, clusteredIDs + noVotesIDs )
+			self.assertTrue( np.array_equal(phaseLabelsOrg_FullList,phaseLabelsOriginal[:,referenceIndices]) )
+			self.assertTrue( np.array_equal(phaseLabelsTrue_FullList,phaseLabelsTrue[:,referenceIndices]) )
+			self.assertTrue( np.array_equal(phaseLabelsPred_FullList[0,:],np.concatenate((predictedPhases[0,:],[-99]*8))) )
+			self.assertEqual( allSC_FullList, allSC + [-99]*8 )
+			self.assertEqual( allFinalClusterLabels, list(finalClusterLabels) + [-99]*8 )
+			sensResults = PIUtils.CreateFullListCustomerResults_SensMeth(phaseLabelsOriginal[:,clusteredIndices],phaseLabelsOriginal,phaseLabelsTrue,clusteredIDs,custID,noVotesIDs,predictedPhases,allSC,allSC,allSC,allSC)
+			self.assertTrue( np.array_equal(sensResults[0],phaseLabelsOrg_FullList) )
+			self.assertTrue( np.array_equal(sensResults[2],phaseLabelsTrue_FullList) )
+			self.assertEqual( sensResults[7], allSC + [-99]*8 )
+
+		def test_CalcCrossCorrCoef_matches_corrcoef( self ):
+			rng = np.random.default_rng(2)
+			custWindow = rng.normal(0,1,(96,40))
+			sensWindow = custWindow[:,0:6] + rng.normal(0,0.5,(96,6))
+			crossCorr, failFlag = PIUtils.CalcCrossCorrCoef(custWindow,sensWindow)
+			referenceCorr = np.corrcoef(np.concatenate((custWindow,sensWindow),axis=1).transpose())[0:40,40:]
+			self.assertEqual( failFlag, 0 )
+			self.assertEqual( crossCorr.shape, (40,6) )
+			self.assertTrue( np.allclose(crossCorr,referenceCorr,rtol=0,atol=1e-12) )
+			sensWindow[:,2] = 0
+			with contextlib.redirect_stdout(io.StringIO()):
+				crossCorr, failFlag = PIUtils.CalcCrossCorrCoef(custWindow,sensWindow)
+			self.assertEqual( failFlag, 1 )
+
+if __name__ == '__main__':
+    unittest.main()
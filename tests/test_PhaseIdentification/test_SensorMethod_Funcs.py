@@ -0,0 +1,164 @@
+# Python Library Imports
+import unittest
+import io
+import contextlib
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Package Code
+from sdsmc.PhaseIdentification import PhaseIdent_Utils as PIUtils
+from sdsmc.PhaseIdentification import SensorMethod_Funcs as SensMethod
+
+
+
+def CreateSensorData(seed=0,numCust=40,numSensors=3,numWindows=8,windowSize=48):
+	rng = np.random.default_rng(seed)
+	numMeasurements = numWindows * windowSize
+	phaseVoltage = rng.normal(0,1,(numMeasurements,3))
+	voltageSens = np.concatenate([phaseVoltage + rng.normal(0,0.5,(numMeasurements,3)) for sensCtr in range(0,numSensors)],axis=1)
+	custPhases = rng.integers(0,3,numCust)
+	voltageCust = phaseVoltage[:,custPhases] + rng.normal(0,0.8,(numMeasurements,numCust))
+	return voltageCust, voltageSens, custPhases + 1
+
+
+
+def ReferenceConfidenceScores(meanCCMatrix,custIDList,sensIDInput,sensPhasesInput,noVotesIDs,allWindowVotes,allSensVotes,newPhaseLabels):
+	sensVotesConfScore = []
+	winVotesConfScore = []
+	ccSeparation = []
+	numWindowsCount = []
+	for custCtr in range(0,len(custIDList)):
+		if custIDList[custCtr] in noVotesIDs:
+			sensVotesConfScore.append(0)
+			winVotesConfScore.append(0)
+			ccSeparation.append(0)
+			numWindowsCount.append(0)
+			continue
+		for currVotes, scoreList in [(allWindowVotes[custCtr,:],winVotesConfScore),(np.array(allSensVotes[custCtr]),sensVotesConfScore)]:
+			currVotes = currVotes[currVotes != -999]
+			if len(currVotes) == 0:
+				scoreList.append(0)
+			else:
+				scoreList.append(np.max(np.unique(currVotes,return_counts=True)[1]) / len(currVotes))
+		numWindowsCount.append(np.sum(allWindowVotes[custCtr,:] != -999))
+		currCC = meanCCMatrix[custCtr,:]
+		argsortedCC = np.argsort(currCC)
+		sortIndex = len(currCC) - 1
+		while sensPhasesInput[0,argsortedCC[sortIndex]] != newPhaseLabels[0,custCtr]:
+			sortIndex = sortIndex - 1
+		indices = np.where(np.array(sensIDInput) == sensIDInput[argsortedCC[sortIndex]])[0]
+		ccSet = np.sort(currCC[indices])
+		ccSeparation.append(ccSet[-1] - ccSet[-2])
+	return sensVotesConfScore, winVotesConfScore, ccSeparation, numWindowsCount
+
+
+class TestingSensorMethodFuncs( unittest.TestCase ):
+
+		def test_CalcSensorCCTensor_matches_window_loop( self ):
+			windowSize = 48
+			voltageCust, voltageSens, custPhases = CreateSensorData()
+			# Missing customer data, a sensor NaN, and a constant customer
+			voltageCust[10:20,3] = np.nan
+			voltageCust[100:250,7] = np.nan
+			voltageSens[200,4] = np.nan
+			voltageCust[6*windowSize:7*windowSize,9] = 0
+			with contextlib.redirect_stdout(io.StringIO()):
+				ccMatrixAll, custPresent, windowSkipped = SensMethod.CalcSensorCCTensor(voltageCust,voltageSens,windowSize,ccDtype=np.float64,blockElements=3*windowSize*40)
+				ccMatrix32 = SensMethod.CalcSensorCCTensor(voltageCust,voltageSens,windowSize)[0]
+			self.assertEqual( list(np.where(windowSkipped)[0]), [4,6] )
+			self.assertEqual( ccMatrix32.dtype, np.float32 )
+			self.assertTrue( np.allclose(ccMatrix32,ccMatrixAll,rtol=0,atol=1e-5) )
+			custIDs = ['cust' + str(custCtr) for custCtr in range(0,40)]
+			for ensCtr in range(0,8):
+				vWindow, currentIDs = PIUtils.CleanVoltWindowNoLabels(PIUtils.GetVoltWindow(voltageCust,windowSize,ensCtr),custIDs)
+				currentIndices = [custIDs.index(currID) for currID in currentIDs]
+				self.assertEqual( list(np.where(custPresent[ensCtr,:])[0]), currentIndices )
+				if windowSkipped[ensCtr]:
+					self.assertTrue( np.all(ccMatrixAll[:,:,ensCtr] == 0) )
+					continue
+				referenceCC, failFlag = PIUtils.CalcCrossCorrCoef(vWindow,PIUtils.GetVoltWindow(voltageSens,windowSize,ensCtr))
+				self.assertTrue( np.allclose(ccMatrixAll[currentIndices,:,ensCtr],referenceCC,rtol=0,atol=1e-12) )
+				missingIndices = np.setdiff1d(np.arange(40),currentIndices)
+				self.assertTrue( np.all(ccMatrixAll[missingIndices,:,ensCtr] == 0) )
+
+		def test_AccumulateSensorCC_matches_tensor_mean( self ):
+			windowSize = 48
+			voltageCust, voltageSens, custPhases = CreateSensorData(seed=1)
+			voltageCust[50:300,2] = np.nan
+			voltageSens[330,0] = np.nan
+			sensIDs = ['sens' + str(sensCtr // 3) for sensCtr in range(0,9)]
+			phaseLabelsSens = np.array([[1,2,3]*3])
+			with tempfile.TemporaryDirectory() as cubePath, contextlib.redirect_stdout(io.StringIO()):
+				ccMatrixAll = SensMethod.CalcSensorCCTensor(voltageCust,voltageSens,windowSize,ccDtype=np.float64)[0]
+				ccMatrix, allWindowVotes, custWindowCounts, ccCube = SensMethod.AccumulateSensorCC(voltageCust,voltageSens,windowSize,phaseLabelsSens,sensIDs,1,
+																								  ccDtype=np.float64,blockElements=2*windowSize*40,ccCubePath=Path(cubePath,'cc.npy'))
+				ccMatrixAll[ccMatrixAll == 0] = np.nan
+				self.assertTrue( np.allclose(ccMatrix,np.nanmean(ccMatrixAll,axis=2),rtol=0,atol=1e-12) )
+				self.assertTrue( np.array_equal(np.isnan(np.load(Path(cubePath,'cc.npy'))),np.isnan(ccMatrixAll)) )
+				del ccCube
+			self.assertEqual( allWindowVotes.dtype, np.int16 )
+			self.assertTrue( np.all(allWindowVotes[:,6] == -999) )
+			self.assertEqual( list(custWindowCounts[0:3]), [8,8,2] )
+			# The single vote in each window is the phase with the highest CC
+			usedWindows = ~np.isnan(ccMatrixAll[0,0,:])
+			self.assertTrue( np.array_equal(allWindowVotes[0,usedWindows],phaseLabelsSens[0,np.nanargmax(ccMatrixAll[0,:,usedWindows],axis=1)]) )
+
+		def test_CCSensVoting_Batch_matches_CCSensVoting( self ):
+			rng = np.random.default_rng(3)
+			sensIDs = ['sens' + str(sensCtr // 3) for sensCtr in range(0,12)]
+			for phaseLabelsSens in [np.array([[1,2,3]*4]), rng.integers(1,4,(1,12))]:
+				ccMatrix = rng.random((200,12))
+				# Missing and removed values, rows with no values, and tied CC
+				ccMatrix[rng.random((200,12)) < 0.3] = np.nan
+				ccMatrix[rng.random((200,12)) < 0.3] = 0
+				ccMatrix[0:5,:] = 0
+				ccMatrix[5:10,0:3] = 0.9
+				for numVotes in [1,2,3,5,7,15]:
+					phasePredictions, votes = SensMethod.CCSensVoting_Batch(ccMatrix,numVotes,phaseLabelsSens,sensIDs)
+					for custCtr in range(0,200):
+						phasePrediction, referenceVotes, voteIndices, voteIDs = SensMethod.CCSensVoting(ccMatrix[custCtr,:],numVotes,phaseLabelsSens,sensIDs)
+						self.assertEqual( phasePredictions[custCtr], phasePrediction )
+						self.assertEqual( sorted(votes[custCtr,votes[custCtr,:] != -999]), sorted(np.asarray(referenceVotes).tolist()) )
+
+		def test_CalcConfidenceScores4Sensors_matches_loop( self ):
+			rng = np.random.default_rng(4)
+			custIDs = ['cust' + str(custCtr) for custCtr in range(0,300)]
+			sensIDs = ['sens' + str(sensCtr // 3) for sensCtr in range(0,12)]
+			phaseLabelsSens = np.array([[1,2,3]*4])
+			meanCCMatrix = rng.random((300,12))
+			allWindowVotes = rng.integers(1,4,(300,20))
+			allWindowVotes[rng.random((300,20)) < 0.2] = -999
+			allWindowVotes[7,:] = -999
+			newPhaseLabels, sensVotes = SensMethod.CCSensVoting_Batch(meanCCMatrix,5,phaseLabelsSens,sensIDs)
+			newPhaseLabels = newPhaseLabels[np.newaxis,:]
+			allSensVotes = [sensVotes[custCtr,sensVotes[custCtr,:] != -999] for custCtr in range(0,300)]
+			noVotesIDs = [custIDs[custCtr] for custCtr in range(0,300) if (custCtr % 50 == 0) or (newPhaseLabels[0,custCtr] == -999)]
+			confScoreCombined, sensVotesConfScore, ccSeparation, winVotesConfScore, numWindows = SensMethod.CalcConfidenceScores4Sensors(-1,meanCCMatrix,custIDs,sensIDs,phaseLabelsSens,noVotesIDs,5,
+																																		 allWindowVotes,allSensVotes,newPhaseLabels)
+			reference = ReferenceConfidenceScores(meanCCMatrix,custIDs,sensIDs,phaseLabelsSens,noVotesIDs,allWindowVotes,allSensVotes,newPhaseLabels)
+			for result, referenceResult in zip([sensVotesConfScore,winVotesConfScore,ccSeparation,numWindows],reference):
+				self.assertTrue( np.allclose(result,referenceResult,rtol=0,atol=1e-12) )
+			self.assertTrue( np.allclose(confScoreCombined,np.array(reference[0]) * np.array(reference[1]),rtol=0,atol=1e-12) )
+			# The substation version omits the sensor agreement scores
+			subScores = SensMethod.CalcConfidenceScores4Sensors(-1,meanCCMatrix[:,0:3],custIDs,['sub']*3,phaseLabelsSens[:,0:3],noVotesIDs,1,allWindowVotes,
+															   [[phase] for phase in np.argmax(meanCCMatrix[:,0:3],axis=1) + 1],np.argmax(meanCCMatrix[:,0:3],axis=1)[np.newaxis,:] + 1)
+			self.assertEqual( subScores[1], [0,] )
+			self.assertTrue( np.allclose(subScores[3],reference[1],rtol=0,atol=1e-12) )
+
+		def test_AssignPhases_synthetic( self ):
+			voltageCust, voltageSens, custPhases = CreateSensorData(seed=2,numSensors=5,numWindows=10)
+			custIDs = ['cust' + str(custCtr) for custCtr in range(0,40)]
+			sensIDs = ['sens' + str(sensCtr // 3) for sensCtr in range(0,15)]
+			phaseLabelsSens = np.array([[1,2,3]*5])
+			with contextlib.redirect_stdout(io.StringIO()):
+				sensResults = SensMethod.AssignPhasesUsingSensors(voltageCust,voltageSens,custIDs,sensIDs,phaseLabelsSens,48,numVotes=3)
+				subResults = SensMethod.AssignPhasesUsingSubstation(voltageCust,voltageSens[:,0:3],custIDs,['sub']*3,phaseLabelsSens[:,0:3],48)
+			self.assertTrue( np.array_equal(sensResults[0][0,:],custPhases) )
+			self.assertEqual( len(sensResults[2]), 0 )
+			self.assertTrue( np.array_equal(subResults[4][0,:],custPhases) )
+			self.assertEqual( len(subResults[5]), 40 )
+			self.assertEqual( len(subResults[6]), 40 )
+
+if __name__ == '__main__':
+    unittest.main()